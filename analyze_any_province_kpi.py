@@ -9,12 +9,13 @@ Version: 1.0
 [TẠO THAY ĐỔI ĐỂ THỰC HÀNH GIT] - Bạn có thể xóa dòng này sau khi học xong
 """
 
+import argparse
 import pandas as pd
-import sys
 from datetime import datetime
 from typing import List
+# Chỉ import pipeline (pandas); matplotlib/visualization được import khi vẽ chart
 from kpi_decline_detection_pipeline import KPIDeclineDetector
-from visualization_module import KPIVisualization
+from data_backend import get_backend
 
 def _normalize_token(text: str) -> str:
     """Chuẩn hóa tên KPI để so khớp: bỏ khoảng trắng, dấu gạch, gạch dưới và viết hoa."""
@@ -62,12 +63,26 @@ def fuzzy_match_kpi(kpi_input: str, columns: list) -> tuple:
         return cont_sorted[0], cont
     return None, []
 
+def _get_detector(file_path: str, detector: KPIDeclineDetector = None,
+                  df: pd.DataFrame = None) -> KPIDeclineDetector:
+    """Dùng lại detector/DataFrame đã load nếu có, chỉ đọc file khi cần."""
+    if detector is not None and detector.df is not None:
+        return detector
+    if df is not None:
+        return KPIDeclineDetector.from_dataframe(df, file_path=file_path)
+    detector = KPIDeclineDetector(file_path)
+    detector.load_and_clean_data()
+    return detector
+
 def analyze_province_kpi(province_name: str, kpi_name: str, 
                          file_path: str = '1.Ngày.csv',
                          lookback_days: int = 7,
                          decline_threshold: float = 2.0,
                          start_date: str = None,
-                         end_date: str = None):
+                         end_date: str = None,
+                         detector: KPIDeclineDetector = None,
+                         df: pd.DataFrame = None,
+                         create_chart: bool = True):
     """
     Phân tích suy giảm KPI cho một tỉnh cụ thể
     
@@ -79,15 +94,18 @@ def analyze_province_kpi(province_name: str, kpi_name: str,
         decline_threshold: Ngưỡng suy giảm (%)
         start_date: Ngày bắt đầu so sánh (format: 'DD/MM/YYYY' hoặc 'YYYY-MM-DD') - ưu tiên hơn lookback_days
         end_date: Ngày kết thúc so sánh (format: 'DD/MM/YYYY' hoặc 'YYYY-MM-DD') - ưu tiên hơn lookback_days
+        detector: Detector đã load dữ liệu (ví dụ từ app.py) - dùng lại, không đọc lại file
+        df: DataFrame đã làm sạch - dùng khi không truyền detector
+        create_chart: Có tạo trend chart (PNG) ở Bước 5 không
     """
     print("="*60)
     print(f"🔍 PHÂN TÍCH: {province_name} - {kpi_name}")
     print("="*60)
     
-    # Step 1: Load data
+    # Step 1: Load data (dùng lại dữ liệu đã load nếu có)
     print("\n📖 Bước 1: Đang load dữ liệu...")
-    detector = KPIDeclineDetector(file_path)
-    df = detector.load_and_clean_data()
+    detector = _get_detector(file_path, detector, df)
+    df = detector.df
     
     # Step 2: Kiểm tra tỉnh có trong data không
     print(f"\n🔍 Bước 2: Kiểm tra tỉnh '{province_name}'...")
@@ -142,10 +160,9 @@ def analyze_province_kpi(province_name: str, kpi_name: str,
     
     # Step 4: Phân tích suy giảm
     print(f"\n🔍 Bước 4: Phân tích suy giảm...")
-    alerts = detector.detect_declines(kpi_name, lookback_days=lookback_days)
-    
-    # Lọc alerts cho tỉnh này
-    province_alerts = [a for a in alerts if a['province'] == matched_province]
+    # Chỉ tính cho tỉnh này thay vì quét tất cả tỉnh rồi lọc
+    province_alerts = detector.detect_declines(kpi_name, lookback_days=lookback_days,
+                                               provinces=[matched_province])
     
     if province_alerts:
         print(f"\n⚠️  PHÁT HIỆN SUY GIẢM!")
@@ -162,29 +179,32 @@ def analyze_province_kpi(province_name: str, kpi_name: str,
         print(f"   (có thể suy giảm < {decline_threshold}% hoặc không có dữ liệu đủ)")
     
     # Step 5: Tạo trend chart với lookback_days hoặc ngày cụ thể
-    if start_date and end_date:
+    if not create_chart:
+        print("\n📈 Bước 5: Bỏ qua trend chart (create_chart=False)")
+    elif start_date and end_date:
         print(f"\n📈 Bước 5: Tạo trend chart (highlight từ {start_date} đến {end_date})...")
     else:
         print(f"\n📈 Bước 5: Tạo trend chart (so sánh {lookback_days} ngày gần nhất)...")
-    try:
-        # Cập nhật config để dùng lookback_days đúng (nếu không có ngày cụ thể)
-        if not start_date or not end_date:
-            detector.config['days_lookback'] = lookback_days
+    if create_chart:
+        try:
+            # Cập nhật config để dùng lookback_days đúng (nếu không có ngày cụ thể)
+            if not start_date or not end_date:
+                detector.config['days_lookback'] = lookback_days
         
-        chart_path = detector.create_trend_charts(
-            kpi_name,
-            provinces=[matched_province],
-            lookback_days=lookback_days if not start_date or not end_date else None,
-            start_date=start_date,
-            end_date=end_date
-        )
-        print(f"✅ Đã tạo chart: {chart_path}")
-        if start_date and end_date:
-            print(f"   Chart highlight khoảng: {start_date} - {end_date}")
-        else:
-            print(f"   Chart highlight {lookback_days} ngày gần nhất")
-    except Exception as e:
-        print(f"⚠️  Lỗi khi tạo chart: {str(e)}")
+            chart_path = detector.create_trend_charts(
+                kpi_name,
+                provinces=[matched_province],
+                lookback_days=lookback_days if not start_date or not end_date else None,
+                start_date=start_date,
+                end_date=end_date
+            )
+            print(f"✅ Đã tạo chart: {chart_path}")
+            if start_date and end_date:
+                print(f"   Chart highlight khoảng: {start_date} - {end_date}")
+            else:
+                print(f"   Chart highlight {lookback_days} ngày gần nhất")
+        except Exception as e:
+            print(f"⚠️  Lỗi khi tạo chart: {str(e)}")
     
     # Step 6: Thống kê
     print(f"\n📊 Bước 6: Thống kê {kpi_name} của {matched_province}...")
@@ -223,20 +243,34 @@ def analyze_province_kpi(province_name: str, kpi_name: str,
     return detector, province_alerts, matched_province
 
 
+def list_provinces(file_path: str = '1.Ngày.csv') -> List[str]:
+    """Danh sách tỉnh trong dữ liệu (chỉ đọc cột CTKD7)."""
+    df = get_backend(file_path).read_raw(columns=['CTKD7'])
+    return sorted(str(p) for p in df['CTKD7'].dropna().unique())
+
+
+def list_kpis(file_path: str = '1.Ngày.csv') -> List[str]:
+    """Danh sách cột KPI (chỉ đọc header, bỏ cột ngày/tỉnh/STT)."""
+    skip = {'Ngay7', 'CTKD7', 'Textbox164', 'STT'}
+    return [c for c in get_backend(file_path).list_columns() if c not in skip]
+
+
 def analyze_all_provinces_for_kpi(kpi_name: str, 
                                   file_path: str = '1.Ngày.csv',
                                   lookback_days: int = 7,
                                   start_date: str = None,
-                                  end_date: str = None):
+                                  end_date: str = None,
+                                  detector: KPIDeclineDetector = None,
+                                  df: pd.DataFrame = None):
     """
-    Phân tích một KPI cho tất cả các tỉnh
+    Phân tích một KPI cho tất cả các tỉnh (dùng lại detector/df nếu đã load)
     """
     print("="*60)
     print(f"🔍 PHÂN TÍCH TẤT CẢ TỈNH - KPI: {kpi_name}")
     print("="*60)
     
-    detector = KPIDeclineDetector(file_path)
-    df = detector.load_and_clean_data()
+    detector = _get_detector(file_path, detector, df)
+    df = detector.df
     
     # Tìm KPI chính xác hoặc gần đúng (ưu tiên exact/normalized)
     matched_kpi, kpi_candidates = fuzzy_match_kpi(kpi_name, list(df.columns))
@@ -357,15 +391,43 @@ def interactive_menu():
         print("Lựa chọn không hợp lệ!")
 
 
+def parse_args(argv: List[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description='Phân tích suy giảm KPI cho một tỉnh (không có tham số → menu tương tác)')
+    parser.add_argument('province', nargs='?', help="Tên tỉnh, ví dụ 'Ninh thuan'")
+    parser.add_argument('kpi', nargs='?', help="Tên KPI (có thể viết gần đúng), ví dụ 'CSSR'")
+    parser.add_argument('lookback', nargs='?', type=int, default=7, help='Số ngày so sánh (mặc định 7)')
+    parser.add_argument('--file', default='1.Ngày.csv', help='File CSV hoặc SQLite (.db)')
+    parser.add_argument('--list-provinces', action='store_true', help='Liệt kê tỉnh rồi thoát')
+    parser.add_argument('--list-kpis', action='store_true', help='Liệt kê cột KPI rồi thoát')
+    parser.add_argument('--no-chart', action='store_true',
+                        help='Chỉ phát hiện suy giảm, không vẽ chart (không import matplotlib)')
+    parser.add_argument('--profile', nargs='?', const='cprofile', default=None,
+                        help='Profile lần chạy (cprofile|pyinstrument), ghi vào profiles/')
+    args = parser.parse_args(argv)
+    if args.province and not args.kpi and not (args.list_provinces or args.list_kpis):
+        parser.error('Cần cả <tỉnh> và <KPI>')
+    return args
+
+
 if __name__ == "__main__":
-    if len(sys.argv) >= 3:
-        # Chạy từ command line: python analyze_any_province_kpi.py <tỉnh> <KPI>
-        province = sys.argv[1]
-        kpi = sys.argv[2]
-        lookback = int(sys.argv[3]) if len(sys.argv) > 3 else 7
-        
-        analyze_province_kpi(province, kpi, lookback_days=lookback)
-    else:
-        # Chạy menu tương tác
-        interactive_menu()
+    from profiling import profile_run, profiling_mode
+    
+    args = parse_args()
+    # Profile tùy chọn: --profile[=pyinstrument] hoặc KPI_PROFILE=1
+    with profile_run('analyze', profiling_mode(args.profile)):
+        if args.list_provinces or args.list_kpis:
+            if args.list_provinces:
+                for p in list_provinces(args.file):
+                    print(p)
+            if args.list_kpis:
+                for k in list_kpis(args.file):
+                    print(k)
+        elif args.province and args.kpi:
+            # Chạy từ command line: python analyze_any_province_kpi.py <tỉnh> <KPI> [lookback]
+            analyze_province_kpi(args.province, args.kpi, file_path=args.file,
+                                 lookback_days=args.lookback, create_chart=not args.no_chart)
+        else:
+            # Chạy menu tương tác
+            interactive_menu()
 
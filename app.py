@@ -10,39 +10,20 @@ Cách chạy:
 """
 
 import streamlit as st
+import streamlit.components.v1 as components
 import pandas as pd
 import sys
 import os
 import glob
-import shutil
+import json
+import tempfile
 from datetime import datetime
 import matplotlib.pyplot as plt
 import matplotlib
 import unicodedata
-from matplotlib.dates import DayLocator, DateFormatter
-from matplotlib.ticker import MaxNLocator, FuncFormatter
 matplotlib.use('Agg')  # Backend cho Streamlit
 
-# ==== Tiện ích đọc/ghi và gộp dữ liệu (không ảnh hưởng flow hiện tại) ====
-CSV_ENCODINGS = ['utf-8-sig', 'utf-8', 'cp1258', 'latin1']
-DATA_FILE_PATH = '1.Ngày.csv'
-
-def _read_csv_any(path: str) -> pd.DataFrame:
-    last_err = None
-    for enc in CSV_ENCODINGS:
-        try:
-            return pd.read_csv(path, encoding=enc, low_memory=False)
-        except Exception as e:
-            last_err = e
-    raise RuntimeError(f"Không đọc được CSV: {path} ({last_err})")
-
-def _normalize_text(s: str) -> str:
-    if s is None:
-        return ''
-    s = unicodedata.normalize('NFD', str(s))
-    s = ''.join(ch for ch in s if unicodedata.category(ch) != 'Mn')
-    return s.upper().strip()
-
+# ==== Tiện ích hiển thị (đọc/ghi và gộp dữ liệu nằm trong data_backend) ====
 def format_dates_for_display(df: pd.DataFrame, date_cols=('Ngay7',)) -> pd.DataFrame:
     """
     Trả về bản sao DataFrame với các cột ngày được format DD/MM/YYYY để hiển thị (không ảnh hưởng dữ liệu gốc).
@@ -54,131 +35,16 @@ def format_dates_for_display(df: pd.DataFrame, date_cols=('Ngay7',)) -> pd.DataF
             df_display[col] = series.dt.strftime('%d/%m/%Y')
     return df_display
 
-def merge_into_current(old_path: str, new_path: str) -> dict:
-    """Gộp new_path vào old_path theo khóa (Ngay7 + CTKD7), cập nhật trùng, giữ thứ tự và đánh lại STT."""
-    if not os.path.exists(old_path):
-        df_new = _read_csv_any(new_path)
-        df_new.to_csv(old_path, index=False, encoding='utf-8-sig')
-        return {"rows_old": 0, "rows_new": len(df_new), "rows_added": len(df_new), "rows_updated": 0, "total_rows": len(df_new)}
-
-    df_old = _read_csv_any(old_path)
-    df_new = _read_csv_any(new_path)
-
-    # Chuẩn hóa tên cột
-    df_old.columns = [str(c).strip() for c in df_old.columns]
-    df_new.columns = [str(c).strip() for c in df_new.columns]
-
-    required = ['Ngay7', 'CTKD7']
-    for col in required:
-        if col not in df_old.columns or col not in df_new.columns:
-            raise ValueError(f"Thiếu cột bắt buộc '{col}' trong file cần gộp.")
-
-    # Chuẩn hóa ngày và khóa gộp
-    def _prep(df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
-        df['Ngay7_parsed'] = pd.to_datetime(df['Ngay7'], format='%d/%m/%Y', errors='coerce')
-        if df['Ngay7_parsed'].isna().all():
-            df['Ngay7_parsed'] = pd.to_datetime(df['Ngay7'], dayfirst=True, errors='coerce')
-        df['_key'] = df['Ngay7_parsed'].dt.strftime('%Y-%m-%d') + '||' + df['CTKD7'].astype(str).str.strip().str.upper()
-        return df
-
-    df_old_p = _prep(df_old)
-    df_new_p = _prep(df_new)
-
-    # Xử lý duplicate _key trong cùng file (giữ lại dòng cuối cùng nếu có duplicate)
-    # Điều này tránh lỗi "cannot reindex on an axis with duplicate labels"
-    if df_old_p['_key'].duplicated().any():
-        df_old_p = df_old_p.drop_duplicates(subset='_key', keep='last')
-    
-    if df_new_p['_key'].duplicated().any():
-        df_new_p = df_new_p.drop_duplicates(subset='_key', keep='last')
-
-    old_idx = df_old_p.set_index('_key')
-    new_idx = df_new_p.set_index('_key')
-
-    matching = old_idx.index.intersection(new_idx.index)
-    new_only = new_idx.index.difference(old_idx.index)
-
-    rows_updated = len(matching)
-    if rows_updated > 0:
-        # Cập nhật các dòng trùng: chỉ update các cột có trong file mới, giữ lại các cột cũ
-        old_idx.update(new_idx.loc[matching])
-    
-    # Lấy lại dữ liệu cũ đã được cập nhật (bao gồm cả các dòng không trùng)
-    df_old_u = old_idx.reset_index()
-    
-    # Lấy các dòng mới (chỉ những dòng không có trong file cũ)
-    df_new_only = new_idx.loc[new_only].reset_index()
-
-    # Đảm bảo tất cả các cột từ cả hai file đều có trong kết quả
-    # Lấy union của tất cả các cột (loại bỏ các cột phụ trợ tạm thời)
-    temp_cols = ['Ngay7_parsed', '_key']
-    all_columns = [c for c in df_old_u.columns if c not in temp_cols] + \
-                  [c for c in df_new_only.columns if c not in temp_cols and c not in df_old_u.columns]
-    
-    # Đảm bảo cả hai DataFrame có cùng các cột (thêm NaN cho cột thiếu)
-    for col in all_columns:
-        if col not in df_old_u.columns:
-            df_old_u[col] = None
-        if col not in df_new_only.columns:
-            df_new_only[col] = None
-    
-    # Sắp xếp lại cột theo thứ tự ban đầu của file cũ, sau đó thêm các cột mới
-    old_cols_order = [c for c in df_old.columns if c in all_columns]
-    new_cols = [c for c in all_columns if c not in old_cols_order]
-    final_cols_order = old_cols_order + new_cols
-    
-    # Chỉ lấy các cột cần thiết (loại bỏ cột phụ trợ)
-    df_old_u_clean = df_old_u[[c for c in all_columns if c in df_old_u.columns]]
-    df_new_only_clean = df_new_only[[c for c in all_columns if c in df_new_only.columns]]
-
-    # Hợp nhất, giữ thứ tự: cũ trước, mới thêm nối sau
-    df_merged = pd.concat([df_old_u_clean, df_new_only_clean], ignore_index=True, sort=False)
-
-    # Sắp xếp lại cột theo thứ tự đã định
-    df_merged = df_merged[final_cols_order]
-
-    # Làm sạch cột phụ trợ trước khi sắp xếp
-    for col in ['Ngay7_parsed', '_key']:
-        if col in df_merged.columns:
-            df_merged = df_merged.drop(columns=[col])
-
-    # Sắp xếp lại theo ngày (tăng dần) để đảm bảo thứ tự đúng
-    if 'Ngay7' in df_merged.columns:
-        # Chuyển đổi ngày về datetime để sắp xếp
-        df_merged['Ngay7_temp'] = pd.to_datetime(df_merged['Ngay7'], format='%d/%m/%Y', errors='coerce', dayfirst=True)
-        # Sắp xếp theo ngày tăng dần, sau đó theo CTKD7 nếu có
-        if 'CTKD7' in df_merged.columns:
-            df_merged = df_merged.sort_values(['Ngay7_temp', 'CTKD7'], na_position='last')
-        else:
-            df_merged = df_merged.sort_values('Ngay7_temp', na_position='last')
-        # Xóa cột tạm và reset index sau khi sắp xếp
-        df_merged = df_merged.drop(columns=['Ngay7_temp'])
-        df_merged = df_merged.reset_index(drop=True)
-
-    # Đánh lại STT nếu có cột liên quan (sau khi đã sắp xếp)
-    stt_candidates = [c for c in df_merged.columns if any(k in _normalize_text(c) for k in ['STT', 'SO THU TU', 'TEXTBOX164', 'TEXTBOX'])]
-    if stt_candidates:
-        stt_col = stt_candidates[0]
-        df_merged[stt_col] = range(1, len(df_merged) + 1)
-
-    # Chuẩn lại định dạng ngày (sau khi sắp xếp)
-    if 'Ngay7' in df_merged.columns:
-        df_merged['Ngay7'] = pd.to_datetime(df_merged['Ngay7'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y')
-
-    df_merged.to_csv(old_path, index=False, encoding='utf-8-sig')
-    return {
-        "rows_old": len(df_old),
-        "rows_new": len(df_new),
-        "rows_added": len(df_new_only),
-        "rows_updated": rows_updated,
-        "total_rows": len(df_merged),
-    }
-
 # Import các module hiện có
 try:
     from kpi_decline_detection_pipeline import KPIDeclineDetector
     from analyze_any_province_kpi import analyze_province_kpi, fuzzy_match_kpi
+    from snapshot_store import KPISnapshotStore
+    from data_backend import DATA_FILE_PATH, get_backend
+    from instrumentation import span, start_recording, stop_recording
+    from profiling import ProfileSession, profiling_mode
+    from chart_bundle import DASHBOARD_ALERT_KPIS, ChartBundle, alert_lines_figure, province_trend_figure
+    from web_chart import build_payload, chart_height, chart_options, payload_json, pivot_wide, render_html
 except ImportError as e:
     st.error(f"❌ Lỗi import: {e}")
     st.stop()
@@ -191,6 +57,23 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# Profile từng lần rerun (tùy chọn): KPI_PROFILE=1|pyinstrument hoặc bật trong "Chẩn đoán hiệu năng"
+_stale_profile = st.session_state.pop('_kpi_profile_session', None)
+if _stale_profile is not None and _stale_profile.running:
+    # Lần chạy trước kết thúc sớm (st.stop/st.rerun) → vẫn ghi lại profile của nó
+    _stale_profile.stop()
+profile_mode = profiling_mode() or ('cprofile' if st.session_state.get('kpi_profile_reruns') else None)
+profile_session = None
+if profile_mode:
+    profile_session = ProfileSession('app_rerun', profile_mode)
+    if profile_session.start():
+        st.session_state['_kpi_profile_session'] = profile_session
+    else:
+        profile_session = None
+
+# Đo thời gian từng bước của lần chạy (rerun) này - hiển thị ở mục "Chẩn đoán hiệu năng"
+perf_recorder = start_recording('app')
+
 # CSS tùy chỉnh
 st.markdown("""
 <style>
@@ -235,23 +118,72 @@ append_file = st.sidebar.file_uploader(
 )
 do_merge = st.sidebar.button("Gộp vào file hiện tại", help="Gộp file vừa chọn vào dữ liệu đang dùng")
 
-# Khởi tạo detector với cache nhưng có thể clear (ĐỊNH NGHĨA TRƯỚC)
-@st.cache_data(ttl=3600)  # Cache 1 giờ, nhưng có thể clear bằng button
-def load_data(file_path):
-    """Load và cache dữ liệu"""
-    detector = KPIDeclineDetector(file_path)
-    df = detector.load_and_clean_data()
-    
-    # Hiển thị thông tin dữ liệu
+# Một backend cho mỗi đường dẫn dữ liệu, dùng chung giữa các lần rerun/phiên
+# (khởi tạo backend không mở kết nối; đọc/version() SQLite mở chế độ chỉ đọc)
+@st.cache_resource(max_entries=8)
+def _data_backend(path):
+    return get_backend(path)
+
+# Cache dữ liệu đã làm sạch theo phiên bản dữ liệu (ĐỊNH NGHĨA TRƯỚC)
+# - cache_resource: một bản DataFrame dùng chung cho mọi phiên, không pickle/hash mỗi lần truy cập
+# - Khóa cache = (file_path, data_version): gộp dữ liệu → phiên bản mới → tự load lại đúng một lần,
+#   các phiên bản cũ bị đẩy ra theo max_entries, không cần TTL hay clear toàn cục
+@st.cache_resource(max_entries=2, show_spinner="Đang load dữ liệu...")
+def _load_clean_frame(file_path, data_version, last_days=None):
+    """Đọc + làm sạch dữ liệu một lần cho mỗi phiên bản dữ liệu (và khoảng ngày cần load)"""
+    detector = KPIDeclineDetector(file_path, backend=_data_backend(file_path))
+    df = detector.load_and_clean_data(last_days=last_days)
     date_col = 'Ngay7'
-    if date_col in df.columns:
+    if date_col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[date_col]):
         df[date_col] = pd.to_datetime(df[date_col], format='%d/%m/%Y', errors='coerce')
-        min_date = df[date_col].min()
-        max_date = df[date_col].max()
-        st.sidebar.info(f"📅 Khoảng thời gian: {min_date.strftime('%d/%m/%Y')} - {max_date.strftime('%d/%m/%Y')}")
-    
+    return df
+
+# pandas >= 3 luôn bật Copy-on-Write: bản sao nông không chép dữ liệu, sửa trong phiên tự tạo bản riêng.
+# pandas 1.5/2.x: bản sao nông dùng chung mảng với cache, sửa tại chỗ (df.loc[...] = ...) sẽ sửa luôn
+# DataFrame dùng chung của mọi phiên → phải sao chép sâu
+_SHALLOW_COPY_IS_SAFE = int(pd.__version__.split('.')[0]) >= 3
+
+def load_data(file_path, data_version, last_days=None):
+    """
+    Trả về (detector, df) cho phiên hiện tại từ DataFrame dùng chung trong cache.
+    df là bản sao riêng của phiên (nông với pandas >= 3, sâu với pandas cũ): gán/sửa dữ liệu
+    trong phiên không ảnh hưởng bản dùng chung.
+    """
+    shared_df = _load_clean_frame(file_path, data_version, last_days)
+    df = shared_df.copy(deep=not _SHALLOW_COPY_IS_SAFE)
+    detector = KPIDeclineDetector.from_dataframe(df, file_path=file_path)
     return detector, df
 
+# Backend SQLite (tùy chọn): đặt biến môi trường KPI_SQLITE_DB=đường_dẫn.db
+DATA_DB_PATH = os.environ.get('KPI_SQLITE_DB')
+# Thư mục/glob nhiều file export ngày/tháng (tùy chọn): KPI_DATA_DIR=data/daily hoặc "data/1.Ngày*.csv"
+DATA_DIR_PATH = os.environ.get('KPI_DATA_DIR')
+
+def _resolve_target_path() -> str:
+    """Tìm nơi lưu dữ liệu đích: SQLite nếu cấu hình, ưu tiên DATA_FILE_PATH, nếu không có thì tìm file 1.Ngày*.csv"""
+    if DATA_DB_PATH:
+        return DATA_DB_PATH
+    if DATA_DIR_PATH:
+        return DATA_DIR_PATH
+    if os.path.exists(DATA_FILE_PATH):
+        return DATA_FILE_PATH
+    # Tìm file có tên bắt đầu bằng "1.Ngày" và kết thúc bằng ".csv"
+    matching_files = glob.glob('1.Ngày*.csv')
+    if matching_files:
+        # Ưu tiên file "1.Ngày.csv", sau đó là file mới nhất
+        if '1.Ngày.csv' in matching_files:
+            return '1.Ngày.csv'
+        # Chọn file mới nhất dựa trên thời gian sửa đổi
+        return max(matching_files, key=os.path.getmtime)
+    return '1.Ngày.csv'
+
+def _save_upload_to_temp(uploaded) -> str:
+    """Ghi file upload ra file tạm riêng của phiên (không ghi vào thư mục làm việc chung)"""
+    fd, tmp_path = tempfile.mkstemp(prefix='kpi_upload_', suffix='.csv')
+    with os.fdopen(fd, 'wb') as ftmp:
+        ftmp.write(uploaded.getbuffer())
+    return tmp_path
+
 # Lưu file path và hash để detect thay đổi
 file_path = None
 file_changed = False
@@ -259,40 +191,20 @@ file_changed = False
 # Nếu bấm nút gộp
 if do_merge and append_file is not None:
     try:
-        tmp_path = f"__tmp_merge_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        with open(tmp_path, 'wb') as ftmp:
-            ftmp.write(append_file.getbuffer())
-        # Tìm file đích: ưu tiên DATA_FILE_PATH, nếu không có thì tìm file "1.Ngày*.csv"
-        target_path = None
-        if os.path.exists(DATA_FILE_PATH):
-            target_path = DATA_FILE_PATH
-        else:
-            # Tìm file có tên bắt đầu bằng "1.Ngày" và kết thúc bằng ".csv"
-            matching_files = glob.glob('1.Ngày*.csv')
-            if matching_files:
-                # Ưu tiên file "1.Ngày.csv", sau đó là file mới nhất
-                if '1.Ngày.csv' in matching_files:
-                    target_path = '1.Ngày.csv'
-                else:
-                    # Chọn file mới nhất dựa trên thời gian sửa đổi
-                    target_path = max(matching_files, key=os.path.getmtime)
-            else:
-                target_path = '1.Ngày.csv'
+        tmp_path = _save_upload_to_temp(append_file)
+        target_path = _resolve_target_path()
         
-        # Kiểm tra và thông báo file đích
-        if not os.path.exists(target_path):
+        # Kiểm tra và thông báo dữ liệu đích (file CSV, file .db hoặc thư mục/glob nhiều file)
+        if not _data_backend(target_path).exists():
             st.sidebar.warning(f"⚠️ File đích '{target_path}' chưa tồn tại. File mới sẽ được tạo.")
         else:
-            # Đọc file cũ để kiểm tra số dòng
-            try:
-                df_check = _read_csv_any(target_path)
-                st.sidebar.info(f"📄 Đang gộp vào file: {target_path} (có {len(df_check):,} dòng)")
-            except:
-                pass
+            # Số dòng cũ có trong thống kê gộp → không parse file đích thêm một lần chỉ để đếm dòng
+            st.sidebar.info(f"📄 Đang gộp vào: {target_path}")
         
-        stats = merge_into_current(target_path, tmp_path)
-        os.remove(tmp_path)
-        load_data.clear()
+        try:
+            stats = _data_backend(target_path).upsert(tmp_path)
+        finally:
+            os.remove(tmp_path)
         st.sidebar.success("✅ Đã gộp dữ liệu mới vào file hiện tại!")
         st.sidebar.info(
             f"""📊 Thống kê gộp:
@@ -309,62 +221,23 @@ if do_merge and append_file is not None:
         st.sidebar.error(traceback.format_exc())
 
 elif uploaded_file is not None:
-    # Tìm file đích: ưu tiên DATA_FILE_PATH, nếu không có thì tìm file "1.Ngày*.csv"
-    target_path = None
-    if os.path.exists(DATA_FILE_PATH):
-        target_path = DATA_FILE_PATH
-    else:
-        # Tìm file có tên bắt đầu bằng "1.Ngày" và kết thúc bằng ".csv"
-        matching_files = glob.glob('1.Ngày*.csv')
-        if matching_files:
-            # Ưu tiên file "1.Ngày.csv", sau đó là file mới nhất
-            if '1.Ngày.csv' in matching_files:
-                target_path = '1.Ngày.csv'
-            else:
-                # Chọn file mới nhất dựa trên thời gian sửa đổi
-                target_path = max(matching_files, key=os.path.getmtime)
-        else:
-            target_path = '1.Ngày.csv'
-    
+    target_path = _resolve_target_path()
     file_path = target_path
     
     try:
-        # Lưu file upload tạm thời
-        tmp_path = f"__tmp_upload_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        with open(tmp_path, 'wb') as ftmp:
-            ftmp.write(uploaded_file.getbuffer())
+        # Lưu file upload tạm thời (thư mục tạm của hệ thống, tên không trùng giữa các phiên)
+        tmp_path = _save_upload_to_temp(uploaded_file)
     
-        # Kiểm tra file đích
-        if not os.path.exists(target_path):
-            # Nếu file đích chưa tồn tại, chỉ cần copy file upload
-            shutil.copy2(tmp_path, target_path)
-            total_rows_old = 0
-            total_rows_new = len(_read_csv_any(tmp_path))
-            stats = {
-                "rows_old": 0,
-                "rows_new": total_rows_new,
-                "rows_added": total_rows_new,
-                "rows_updated": 0,
-                "total_rows": total_rows_new
-            }
-        else:
-            # Đọc file cũ để kiểm tra số dòng
-            try:
-                df_check = _read_csv_any(target_path)
-                total_rows_old = len(df_check)
-                st.sidebar.info(f"📄 File hiện tại có {total_rows_old:,} dòng, đang gộp dữ liệu mới...")
-            except:
-                total_rows_old = 0
-            
-            # 🔄 GỘP DỮ LIỆU thay vì thay thế
-            stats = merge_into_current(target_path, tmp_path)
-            total_rows_new = stats['rows_new']
+        if _data_backend(target_path).exists():
+            st.sidebar.info(f"📄 Đang gộp dữ liệu mới vào: {target_path}")
         
-        # Dọn dẹp file tạm
-        os.remove(tmp_path)
-        
-        # Clear cache
-        load_data.clear()
+        # 🔄 GỘP DỮ LIỆU thay vì thay thế (file đích chưa tồn tại → tạo mới).
+        # Gộp có khóa file + ghi nguyên tử; cache tự làm mới vì phiên bản dữ liệu thay đổi.
+        try:
+            stats = _data_backend(target_path).upsert(tmp_path)
+        finally:
+            # Dọn dẹp file tạm
+            os.remove(tmp_path)
         
         st.sidebar.success(f"✅ Đã gộp dữ liệu mới vào file! ({uploaded_file.size:,} bytes)")
         st.sidebar.info(f"📄 Tên file: {uploaded_file.name}")
@@ -380,6 +253,12 @@ elif uploaded_file is not None:
         st.sidebar.error(f"❌ Lỗi khi upload file: {e}")
         import traceback
         st.sidebar.error(traceback.format_exc())
+elif DATA_DB_PATH and _data_backend(DATA_DB_PATH).exists():
+    file_path = DATA_DB_PATH
+    st.sidebar.success(f"✅ Đang sử dụng SQLite: {DATA_DB_PATH}")
+elif DATA_DIR_PATH and _data_backend(DATA_DIR_PATH).exists():
+    file_path = DATA_DIR_PATH
+    st.sidebar.success(f"✅ Đang sử dụng {len(_data_backend(DATA_DIR_PATH).files())} file trong: {DATA_DIR_PATH}")
 elif os.path.exists('1.Ngày.csv'):
     file_path = '1.Ngày.csv'
     file_size = os.path.getsize(file_path)
@@ -392,17 +271,27 @@ else:
 st.sidebar.subheader("⚙️ Cấu hình phân tích")
 lookback_days = st.sidebar.slider("Số ngày so sánh", 1, 30, 7)
 decline_threshold = st.sidebar.slider("Ngưỡng suy giảm (%)", 0.1, 10.0, 2.0, 0.1)
+load_last_days = st.sidebar.number_input(
+    "Chỉ load N ngày gần nhất (0 = tất cả)", min_value=0, max_value=3650, value=0, step=7,
+    help="Với thư mục nhiều file (KPI_DATA_DIR) chỉ các file chứa khoảng ngày này được đọc. "
+         "Giá trị so sánh khi phát hiện suy giảm chỉ tính trên khoảng đã load."
+)
 
 # Nút reload data
 if st.sidebar.button("🔄 Reload dữ liệu", help="Tải lại dữ liệu từ file CSV"):
-    load_data.clear()
+    _load_clean_frame.clear()
     st.sidebar.success("✅ Đã reload dữ liệu!")
     st.rerun()
 
 try:
-    detector, df = load_data(file_path)
+    data_version = _data_backend(file_path).version()
+    with span('app.load_data', data_version=data_version) as load_span:
+        detector, df = load_data(file_path, data_version, int(load_last_days) or None)
+        load_span.set(rows=len(df))
     
     # Hiển thị thông tin dữ liệu đã load
+    if len(df) > 0:
+        st.sidebar.info(f"📅 Khoảng thời gian: {df['Ngay7'].min().strftime('%d/%m/%Y')} - {df['Ngay7'].max().strftime('%d/%m/%Y')}")
     st.sidebar.info(f"📊 Số dòng: {len(df):,} | Số tỉnh: {len(df['CTKD7'].dropna().unique())}")
     
 except Exception as e:
@@ -410,6 +299,52 @@ except Exception as e:
     st.exception(e)
     st.stop()
 
+# Bộ biểu đồ vẽ sẵn bởi pipeline: chỉ dùng khi đúng phiên bản + nguồn dữ liệu và load toàn bộ ngày
+chart_bundle = (ChartBundle.load(detector.config['charts_dir'], data_version, file_path)
+                if not load_last_days else None)
+
+def _is_full_view(excluded_dates, date_range) -> bool:
+    """Không loại ngày nào và khoảng ngày phủ toàn bộ dữ liệu (giống ảnh vẽ sẵn)"""
+    if excluded_dates:
+        return False
+    if not date_range or len(date_range) != 2 or len(df) == 0:
+        return True
+    return (pd.Timestamp(date_range[0]) <= df['Ngay7'].min().normalize()
+            and pd.Timestamp(date_range[1]) >= df['Ngay7'].max().normalize())
+
+# Biểu đồ tương tác trên trình duyệt: payload JSON (ngày × tỉnh) tính một lần cho mỗi
+# (phiên bản dữ liệu, KPI, tỉnh); các lần rerun sau chỉ lấy chuỗi từ cache và ghép HTML
+@st.cache_data(max_entries=64, show_spinner=False)
+def _web_chart_payload(file_path, data_version, last_days, kpi, provinces=None):
+    """Trả về (payload JSON, số tỉnh có dữ liệu)"""
+    shared_df = _load_clean_frame(file_path, data_version, last_days)
+    wide = pivot_wide(shared_df, kpi, provinces=provinces)
+    return payload_json(build_payload(wide, kpi)), wide.shape[1]
+
+def render_web_chart(kpi, provinces=None, title=None, excluded_dates=(), date_range=None,
+                     lookback_days=None) -> bool:
+    """
+    Vẽ biểu đồ chạy trên trình duyệt (hover, zoom, click loại ngày không gây Streamlit rerun).
+    excluded_dates/date_range từ bộ lọc chỉ là trạng thái ban đầu của biểu đồ.
+    Trả về False nếu KPI không có dữ liệu để vẽ.
+    """
+    if kpi not in df.columns:
+        return False
+    # Payload tất cả tỉnh có sẵn trong bộ biểu đồ của pipeline → không cần pivot lần đầu
+    bundled = chart_bundle.payload(kpi) if chart_bundle and not provinces else None
+    payload, n_series = bundled or _web_chart_payload(file_path, data_version, int(load_last_days) or None, kpi,
+                                                      tuple(provinces) if provinces else None)
+    if n_series == 0:
+        st.warning("⚠️ Không có dữ liệu để vẽ biểu đồ")
+        return False
+    options = chart_options(title or kpi, excluded_dates, date_range, lookback_days)
+    html = render_html(payload, options)
+    if hasattr(st, 'iframe'):
+        st.iframe(html, height=chart_height(options))
+    else:  # Streamlit cũ chưa có st.iframe
+        components.html(html, height=chart_height(options))
+    return True
+
 # Tab chính
 tab1, tab2, tab3, tab4 = st.tabs([
     "📊 Overview", 
@@ -651,12 +586,9 @@ with tab2:
                 kpi_data['Ngay7'] = pd.to_datetime(kpi_data['Ngay7'], format='%d/%m/%Y', errors='coerce')
                 kpi_data = kpi_data.sort_values('Ngay7')
                 
-                # Biểu đồ tương tác Streamlit (giữ định dạng YYYY-MM-DD như trước)
-                kpi_data_display = kpi_data.copy()
-                kpi_data_display['Ngay7'] = kpi_data_display['Ngay7'].dt.strftime('%Y-%m-%d')
-                chart_data = kpi_data_display.set_index('Ngay7')[kpi].to_frame()
-                chart_data.columns = [f'{kpi} - {province}']
-                st.line_chart(chart_data)
+                # Biểu đồ tương tác chạy trên trình duyệt (pivot đã cache, không rerun khi hover/zoom)
+                render_web_chart(kpi, provinces=[province], title=f'{kpi} - {province}',
+                                 excluded_dates=excluded_dates_province, date_range=date_range_province)
                 
                 # Thông báo nếu có ngày bị loại bỏ
                 if excluded_dates_province:
@@ -676,13 +608,16 @@ with tab2:
     if st.button("🚀 Phân tích chi tiết", type="primary", use_container_width=True):
         with st.spinner("Đang phân tích..."):
             try:
-                # Gọi hàm phân tích
+                # Gọi hàm phân tích (dùng lại detector đã cache, không đọc lại file,
+                # không vẽ PNG vì biểu đồ được hiển thị trực tiếp bên dưới)
                 result = analyze_province_kpi(
                     province, 
                     kpi, 
                     file_path=file_path,
                     lookback_days=lookback_days,
-                    decline_threshold=decline_threshold
+                    decline_threshold=decline_threshold,
+                    detector=detector,
+                    create_chart=False
                 )
                 
                 if result:
@@ -745,60 +680,20 @@ with tab2:
                         kpi_data['Ngay7'] = pd.to_datetime(kpi_data['Ngay7'], format='%d/%m/%Y', errors='coerce')
                         kpi_data = kpi_data.sort_values('Ngay7')
                         
-                        # Tạo biểu đồ
-                        fig, ax = plt.subplots(figsize=(14, 6))
-                        ax.plot(kpi_data['Ngay7'], kpi_data[kpi], marker='o', linewidth=2, markersize=4)
-                        ax.set_title(f'{kpi} - {matched_province}', fontsize=14, fontweight='bold')
-                        ax.set_xlabel('Ngày', fontsize=12)
-                        ax.set_ylabel('', fontsize=12)  # Bỏ label trục Y
-                        ax.grid(True, alpha=0.3)
-                        
-                        # Hiển thị tất cả các ngày trên trục x (bất kỳ khoảng ngày nào)
-                        ax.xaxis.set_major_locator(DayLocator(interval=1))  # Luôn hiển thị tất cả các ngày
-                        ax.xaxis.set_major_formatter(DateFormatter('%d/%m/%Y'))
-                        ax.tick_params(axis='x', rotation=45)
-                        
-                        # Đảm bảo trục Y luôn hiển thị đầy đủ số khi phóng to
-                        ax.tick_params(axis='y', which='both', labelsize=10)
-                        ax.yaxis.set_minor_locator(plt.NullLocator())  # Tắt minor ticks
-                        # Force hiển thị tối thiểu số tick trên trục Y
-                        ax.yaxis.set_major_locator(MaxNLocator(nbins=10, integer=False))
-                        # Format 2 chữ số thập phân cho trục Y
-                        ax.yaxis.set_major_formatter(FuncFormatter(lambda y, pos: f"{y:.2f}"))
-                        # Tăng margin bên trái để có chỗ hiển thị số
-                        fig.subplots_adjust(left=0.10, right=0.95, top=0.93, bottom=0.15)
-                        
-                        # Điều chỉnh layout để tránh nhãn bị cắt
-                        plt.setp(ax.xaxis.get_majorticklabels(), ha='right')
-                        
-                        # Tăng kích thước biểu đồ khi có nhiều ngày để hiển thị đầy đủ
-                        num_days = len(kpi_data)
-                        if num_days > 30:
-                            fig.set_size_inches(18, 6)
-                        elif num_days > 20:
-                            fig.set_size_inches(16, 6)
+                        # Ảnh vẽ sẵn bởi pipeline (cùng phiên bản dữ liệu, không lọc ngày) → không vẽ lại
+                        bundled = (chart_bundle.province_chart(kpi, matched_province, lookback_days)
+                                   if chart_bundle and _is_full_view(excluded_dates_province, date_range_province) else None)
+                        if bundled:
+                            st.image(bundled)
                         else:
-                            fig.set_size_inches(14, 6)
-                        
-                        # Highlight lookback days
-                        if lookback_days and len(kpi_data) >= lookback_days:
-                            latest_date = kpi_data['Ngay7'].iloc[-1]
-                            lookback_date = latest_date - pd.Timedelta(days=lookback_days)
-                            mask = kpi_data['Ngay7'] >= lookback_date
-                            ax.plot(kpi_data[mask]['Ngay7'], kpi_data[mask][kpi], 
-                                   marker='o', linewidth=3, markersize=6, 
-                                   color='red', label=f'{lookback_days} ngày gần nhất')
-                            ax.legend()
-                        
-                        plt.tight_layout()
-                        st.pyplot(fig)
-                        plt.close(fig)
+                            fig = province_trend_figure(kpi_data, kpi, matched_province, lookback_days)
+                            st.pyplot(fig)
+                            plt.close(fig)
                         
-                        # Thêm biểu đồ tương tác bằng Streamlit (YYYY-MM-DD)
+                        # Biểu đồ tương tác chạy trên trình duyệt (click điểm để loại ngày lỗi)
                         st.subheader("📊 Biểu đồ tương tác")
-                        kpi_data_display = kpi_data.copy()
-                        kpi_data_display['Ngay7'] = kpi_data_display['Ngay7'].dt.strftime('%Y-%m-%d')
-                        st.line_chart(kpi_data_display.set_index('Ngay7')[kpi])
+                        render_web_chart(kpi, provinces=[matched_province], title=f'{kpi} - {matched_province}',
+                                         lookback_days=lookback_days)
                     else:
                         st.warning("⚠️ Không có dữ liệu để vẽ biểu đồ")
                         
@@ -893,59 +788,15 @@ with tab3:
     if kpi_all:
         st.subheader("📊 Biểu đồ so sánh tất cả tỉnh")
         
-        # Lấy dữ liệu cho tất cả tỉnh
-        all_provinces_data = []
         provinces_list = sorted([p for p in df['CTKD7'].dropna().unique()])
-        
-        for province_name in provinces_list:
-            province_data = df[df['CTKD7'] == province_name].copy()
-            if len(province_data) > 0 and kpi_all in province_data.columns:
-                kpi_data = province_data[['Ngay7', kpi_all]].copy()
-                kpi_data = kpi_data[(kpi_data[kpi_all].notna()) & (kpi_data[kpi_all] != 0)]
-                
-                # Loại bỏ ngày được chọn
-                if excluded_dates:
-                    kpi_data = kpi_data[~kpi_data['Ngay7'].isin(excluded_dates)]
-                
-                # Lọc theo khoảng ngày nếu có
-                if date_range and len(date_range) == 2:
-                    kpi_data['Ngay7_dt'] = pd.to_datetime(kpi_data['Ngay7'], format='%d/%m/%Y', errors='coerce')
-                    start_date = pd.Timestamp(date_range[0])
-                    end_date = pd.Timestamp(date_range[1])
-                    kpi_data = kpi_data[
-                        (kpi_data['Ngay7_dt'] >= start_date) & 
-                        (kpi_data['Ngay7_dt'] <= end_date)
-                    ]
-                    kpi_data = kpi_data.drop('Ngay7_dt', axis=1)
-                
-                if len(kpi_data) > 0:
-                    kpi_data['Ngay7'] = pd.to_datetime(kpi_data['Ngay7'], format='%d/%m/%Y', errors='coerce')
-                    kpi_data = kpi_data.sort_values('Ngay7')
-                    kpi_data['Tỉnh'] = province_name
-                    all_provinces_data.append(kpi_data[['Ngay7', kpi_all, 'Tỉnh']])
+        # Biểu đồ chạy trên trình duyệt từ pivot đã cache: hover/zoom/click loại ngày không gây rerun
+        all_provinces_data = render_web_chart(kpi_all, excluded_dates=excluded_dates,
+                                              date_range=date_range, lookback_days=lookback_days)
         
         if all_provinces_data:
-            # Tạo DataFrame tổng hợp
-            combined_df = pd.concat(all_provinces_data, ignore_index=True)  # giữ datetime
-            
-            # Pivot để có mỗi tỉnh là một cột và vẽ bằng Streamlit
-            pivot_df = combined_df.pivot_table(
-                index='Ngay7', 
-                columns='Tỉnh', 
-                values=kpi_all,
-                aggfunc='first'
-            )
-            if len(pivot_df) > 0:
-                # Định dạng index về chuỗi YYYY-MM-DD như trước
-                pivot_df = pivot_df.copy()
-                pivot_df.index = pivot_df.index.strftime('%Y-%m-%d')
-                st.line_chart(pivot_df)
-                
-                # Thông báo nếu có ngày bị loại bỏ
-                if excluded_dates:
-                    st.info(f"⚠️ Đã loại bỏ {len(excluded_dates)} ngày: {', '.join(excluded_dates[:5])}{'...' if len(excluded_dates) > 5 else ''}")
-            else:
-                st.warning("⚠️ Không còn dữ liệu sau khi lọc. Vui lòng điều chỉnh bộ lọc.")
+            # Thông báo nếu có ngày bị loại bỏ
+            if excluded_dates:
+                st.info(f"⚠️ Đã loại bỏ {len(excluded_dates)} ngày: {', '.join(excluded_dates[:5])}{'...' if len(excluded_dates) > 5 else ''}")
             
             # Thống kê nhanh
             st.subheader("📊 Thống kê nhanh")
@@ -987,103 +838,20 @@ with tab3:
                         # Lấy danh sách tỉnh có vấn đề
                         provinces_with_issues = [a['province'] for a in alerts]
                         
-                        # Tạo biểu đồ matplotlib
-                        fig, ax = plt.subplots(figsize=(14, 8))
-                        
-                        for province_name in provinces_with_issues:
-                            province_data = df[df['CTKD7'] == province_name].copy()
-                            if len(province_data) > 0 and kpi_all in province_data.columns:
-                                kpi_data = province_data[['Ngay7', kpi_all]].copy()
-                                kpi_data = kpi_data[(kpi_data[kpi_all].notna()) & (kpi_data[kpi_all] != 0)]
-                                
-                                # Loại bỏ ngày được chọn
-                                if excluded_dates:
-                                    kpi_data = kpi_data[~kpi_data['Ngay7'].isin(excluded_dates)]
-                                
-                                # Lọc theo khoảng ngày nếu có
-                                if date_range and len(date_range) == 2:
-                                    kpi_data['Ngay7_dt'] = pd.to_datetime(kpi_data['Ngay7'], format='%d/%m/%Y', errors='coerce')
-                                    start_date = pd.Timestamp(date_range[0])
-                                    end_date = pd.Timestamp(date_range[1])
-                                    kpi_data = kpi_data[
-                                        (kpi_data['Ngay7_dt'] >= start_date) & 
-                                        (kpi_data['Ngay7_dt'] <= end_date)
-                                    ]
-                                    kpi_data = kpi_data.drop('Ngay7_dt', axis=1)
-                                
-                                if len(kpi_data) > 0:
-                                    kpi_data['Ngay7'] = pd.to_datetime(kpi_data['Ngay7'], format='%d/%m/%Y', errors='coerce')
-                                    kpi_data = kpi_data.sort_values('Ngay7')
-                                    
-                                    # Tìm mức độ nghiêm trọng
-                                    alert = next((a for a in alerts if a['province'] == province_name), None)
-                                    if alert:
-                                        severity = alert['severity']
-                                        if severity == 'Cực kỳ nghiêm trọng':
-                                            color = 'red'
-                                            linewidth = 3
-                                        elif severity == 'Nghiêm trọng':
-                                            color = 'orange'
-                                            linewidth = 2.5
-                                        elif severity == 'Cảnh báo':
-                                            color = 'yellow'
-                                            linewidth = 2
-                                        else:
-                                            color = 'blue'
-                                            linewidth = 1.5
-                                    else:
-                                        color = 'gray'
-                                        linewidth = 1.5
-                                    
-                                    ax.plot(kpi_data['Ngay7'], kpi_data[kpi_all], 
-                                           marker='o', linewidth=linewidth, markersize=3,
-                                           label=f"{province_name} ({severity if alert else 'OK'})",
-                                           color=color, alpha=0.7)
-                        
-                        ax.set_title(f'{kpi_all} - Các tỉnh có suy giảm', fontsize=16, fontweight='bold')
-                        ax.set_xlabel('Ngày', fontsize=12)
-                        ax.set_ylabel('', fontsize=12)  # Bỏ label trục Y
-                        ax.grid(True, alpha=0.3)
-                        ax.legend(bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=8)
-                        
-                        # Hiển thị tất cả các ngày trên trục x (bất kỳ khoảng ngày nào)
-                        ax.xaxis.set_major_locator(DayLocator(interval=1))  # Luôn hiển thị tất cả các ngày
-                        ax.xaxis.set_major_formatter(DateFormatter('%d/%m/%Y'))
-                        ax.tick_params(axis='x', rotation=45)
-                        plt.setp(ax.xaxis.get_majorticklabels(), ha='right')
-                        
-                        # Đảm bảo trục Y luôn hiển thị đầy đủ số khi phóng to
-                        ax.tick_params(axis='y', which='both', labelsize=10)
-                        ax.yaxis.set_minor_locator(plt.NullLocator())  # Tắt minor ticks
-                        # Force hiển thị tối thiểu số tick trên trục Y
-                        ax.yaxis.set_major_locator(MaxNLocator(nbins=10, integer=False))
-                        # Format 2 chữ số thập phân cho trục Y
-                        ax.yaxis.set_major_formatter(FuncFormatter(lambda y, pos: f"{y:.2f}"))
-                        # Tăng margin bên trái để có chỗ hiển thị số (đặc biệt khi có legend bên phải)
-                        fig.subplots_adjust(left=0.10, right=0.85, top=0.93, bottom=0.15)
-                        
-                        # Tính số ngày và tăng kích thước biểu đồ khi có nhiều ngày
-                        all_dates_in_chart = set()
-                        for province_name in provinces_with_issues:
-                            province_data_temp = df[df['CTKD7'] == province_name].copy()
-                            if len(province_data_temp) > 0 and kpi_all in province_data_temp.columns:
-                                kpi_data_temp = province_data_temp[['Ngay7', kpi_all]].copy()
-                                kpi_data_temp = kpi_data_temp[(kpi_data_temp[kpi_all].notna()) & (kpi_data_temp[kpi_all] != 0)]
-                                if excluded_dates:
-                                    kpi_data_temp = kpi_data_temp[~kpi_data_temp['Ngay7'].isin(excluded_dates)]
-                                all_dates_in_chart.update(kpi_data_temp['Ngay7'].unique())
-                        
-                        num_days = len(all_dates_in_chart)
-                        if num_days > 30:
-                            fig.set_size_inches(20, 8)
-                        elif num_days > 20:
-                            fig.set_size_inches(18, 8)
+                        bundled = (chart_bundle.alert_chart(kpi_all, provinces_with_issues, lookback_days)
+                                   if chart_bundle and _is_full_view(excluded_dates, date_range) else None)
+                        if bundled:
+                            st.image(bundled)
                         else:
-                            fig.set_size_inches(16, 8)
-                        
-                        plt.tight_layout()
-                        st.pyplot(fig)
-                        plt.close(fig)
+                            # Một bảng (ngày × tỉnh) cho mọi tỉnh có vấn đề thay vì lọc df từng tỉnh
+                            wide = pivot_wide(df, kpi_all, provinces=provinces_with_issues)
+                            if excluded_dates:
+                                wide = wide[~wide.index.isin(pd.to_datetime(list(excluded_dates), format='%d/%m/%Y', errors='coerce'))]
+                            if date_range and len(date_range) == 2:
+                                wide = wide.loc[pd.Timestamp(date_range[0]):pd.Timestamp(date_range[1])]
+                            fig = alert_lines_figure(wide, kpi_all, alerts)
+                            st.pyplot(fig)
+                            plt.close(fig)
                     
                     # Download CSV
                     csv = alerts_df.to_csv(index=False, encoding='utf-8-sig')
@@ -1099,41 +867,8 @@ with tab3:
                     # Vẫn hiển thị biểu đồ tất cả tỉnh (đã lọc)
                     st.subheader("📈 Biểu đồ tất cả tỉnh")
                     if all_provinces_data:
-                        # Rebuild với filter nếu cần
-                        filtered_all_provinces_data = []
-                        for province_name in provinces_list:
-                            province_data = df[df['CTKD7'] == province_name].copy()
-                            if len(province_data) > 0 and kpi_all in province_data.columns:
-                                kpi_data = province_data[['Ngay7', kpi_all]].copy()
-                                kpi_data = kpi_data[(kpi_data[kpi_all].notna()) & (kpi_data[kpi_all] != 0)]
-                                
-                                # Loại bỏ ngày được chọn
-                                if excluded_dates:
-                                    kpi_data = kpi_data[~kpi_data['Ngay7'].isin(excluded_dates)]
-                                
-                                # Lọc theo khoảng ngày nếu có
-                                if date_range and len(date_range) == 2:
-                                    kpi_data['Ngay7_dt'] = pd.to_datetime(kpi_data['Ngay7'], format='%d/%m/%Y', errors='coerce')
-                                    start_date = pd.Timestamp(date_range[0])
-                                    end_date = pd.Timestamp(date_range[1])
-                                    kpi_data = kpi_data[
-                                        (kpi_data['Ngay7_dt'] >= start_date) & 
-                                        (kpi_data['Ngay7_dt'] <= end_date)
-                                    ]
-                                    kpi_data = kpi_data.drop('Ngay7_dt', axis=1)
-                                
-                                if len(kpi_data) > 0:
-                                    kpi_data['Ngay7'] = pd.to_datetime(kpi_data['Ngay7'], format='%d/%m/%Y', errors='coerce')
-                                    kpi_data = kpi_data.sort_values('Ngay7')
-                                    kpi_data['Tỉnh'] = province_name
-                                    filtered_all_provinces_data.append(kpi_data[['Ngay7', kpi_all, 'Tỉnh']])
-                        
-                        if filtered_all_provinces_data:
-                            combined_df = pd.concat(filtered_all_provinces_data, ignore_index=True)  # giữ datetime
-                            pivot_df = combined_df.pivot_table(index='Ngay7', columns='Tỉnh', values=kpi_all, aggfunc='first')
-                            pivot_df = pivot_df.copy()
-                            pivot_df.index = pivot_df.index.strftime('%Y-%m-%d')
-                            st.line_chart(pivot_df)
+                        render_web_chart(kpi_all, excluded_dates=excluded_dates,
+                                         date_range=date_range, lookback_days=lookback_days)
                     
             except Exception as e:
                 st.error(f"❌ Lỗi: {str(e)}")
@@ -1154,7 +889,7 @@ with tab4:
     critical_kpis = st.multiselect(
         "Chọn KPI quan trọng cần giám sát",
         kpi_cols,
-        default=['MTCL_2024', 'CSSR', 'CDR', 'HOSR_4G_2024'] if all(k in kpi_cols for k in ['MTCL_2024', 'CSSR', 'CDR', 'HOSR_4G_2024']) else kpi_cols[:4]
+        default=DASHBOARD_ALERT_KPIS if all(k in kpi_cols for k in DASHBOARD_ALERT_KPIS) else kpi_cols[:4]
     )
     
     if st.button("🔍 Quét cảnh báo", type="primary"):
@@ -1194,6 +929,81 @@ with tab4:
                 st.dataframe(alerts_df_display, use_container_width=True)
             else:
                 st.success("✅ Không có cảnh báo nào!")
+            
+            # Tổng quan tỉnh × KPI trong một ảnh (một lượt tính cho mọi KPI đã chọn)
+            st.subheader("🗺️ Heatmap KPI × tỉnh")
+            bundled = chart_bundle.heatmap(critical_kpis, lookback_days) if chart_bundle else None
+            if bundled:
+                st.image(bundled)
+            else:
+                change_matrix = detector.compute_change_matrix(critical_kpis, lookback_days=lookback_days)
+                if change_matrix['signed_change_pct'].empty:
+                    st.info("ℹ️ Không đủ dữ liệu để vẽ heatmap")
+                else:
+                    from visualization_module import KPIVisualization
+                    fig, _ = KPIVisualization(output_dir=detector.config['charts_dir']).create_kpi_heatmap(
+                        change_matrix, threshold=detector.config['decline_threshold'])
+                    st.pyplot(fig)
+                    plt.close(fig)
+    
+    # Tra cứu snapshot đã lưu bởi pipeline (không cần đọc lại dữ liệu gốc)
+    snapshot_db = detector.config.get('snapshot_db')
+    if snapshot_db and os.path.exists(snapshot_db):
+        with st.expander("📅 Snapshot theo ngày (so sánh tuần trước)"):
+            store = KPISnapshotStore(snapshot_db)
+            col_snap1, col_snap2 = st.columns(2)
+            with col_snap1:
+                snap_kpi = st.selectbox("KPI", kpi_cols, key="snapshot_kpi")
+            latest_snap_date = store.latest_data_date(snap_kpi)
+            with col_snap2:
+                snap_date = st.date_input(
+                    "Giá trị tại ngày",
+                    value=latest_snap_date.date() if latest_snap_date is not None else datetime.now().date(),
+                    key="snapshot_date"
+                )
+            wow_df = store.week_over_week(snap_kpi, as_of=snap_date, days=7)
+            if len(wow_df) > 0:
+                wow_display = format_dates_for_display(wow_df, ('current_date', 'previous_date'))
+                wow_display.columns = ['Tỉnh', 'Ngày', 'Giá trị', 'Ngày (tuần trước)',
+                                       'Giá trị (tuần trước)', 'Thay đổi (%)']
+                st.dataframe(wow_display, use_container_width=True)
+            else:
+                st.info("ℹ️ Chưa có snapshot cho KPI này. Chạy pipeline để lưu snapshot.")
+
+# Chẩn đoán hiệu năng: thời gian/bộ nhớ từng bước của lần chạy này
+stop_recording()
+profile_path = None
+if profile_session is not None:
+    profile_path = profile_session.stop()
+    st.session_state.pop('_kpi_profile_session', None)
+with st.sidebar.expander("⏱️ Chẩn đoán hiệu năng"):
+    perf_info = perf_recorder.to_dict()
+    st.caption(f"Lần chạy này: {perf_info['total_wall_s'] * 1000:.0f} ms | Phiên bản dữ liệu: {data_version}")
+    perf_df = perf_recorder.summary()
+    if len(perf_df) > 0:
+        perf_df['name'] = ['  ' * int(d) + str(n) for d, n in zip(perf_df['depth'], perf_df['name'])]
+        perf_df['wall_ms'] = (perf_df['wall_s'] * 1000).round(1)
+        perf_df['cpu_ms'] = (perf_df['cpu_s'] * 1000).round(1)
+        st.dataframe(perf_df[['name', 'wall_ms', 'cpu_ms', 'rows', 'rss_mb', 'py_peak_mb']],
+                     use_container_width=True, hide_index=True)
+    else:
+        st.info("ℹ️ Không có bước nào được đo trong lần chạy này (dữ liệu lấy từ cache).")
+    st.caption("Đặt KPI_TRACE_MEMORY=1 trước khi chạy để đo thêm bộ nhớ Python (tracemalloc).")
+    st.download_button(
+        "⬇️ Tải JSON",
+        data=json.dumps(perf_info, ensure_ascii=False, indent=2),
+        file_name=f"perf_app_{perf_recorder.started_at.strftime('%Y%m%d_%H%M%S')}.json",
+        mime="application/json"
+    )
+    st.checkbox("🧪 Profile các lần chạy tiếp theo (ghi vào profiles/)", key='kpi_profile_reruns',
+                help="Mỗi lần rerun do thao tác widget sẽ được profile bằng cProfile "
+                     "(hoặc pyinstrument nếu đặt KPI_PROFILE=pyinstrument)")
+    if profile_path:
+        st.caption(f"🧪 Profile lần chạy này ({profile_mode}): {profile_path}")
+        with open(profile_path, 'rb') as f:
+            st.download_button("⬇️ Tải profile", data=f.read(),
+                               file_name=os.path.basename(profile_path),
+                               key='download_profile')
 
 # Footer
 st.markdown("---")
@@ -0,0 +1,264 @@
+"""
+BENCHMARK PIPELINE KPI
+======================
+Đo thời gian các bước chính trên dữ liệu giả lập (synthetic_kpi_data.py) ở nhiều kích thước:
+- load:  KPIDeclineDetector.load_and_clean_data
+- load_files: như load nhưng dữ liệu tách thành một file mỗi ngày (thư mục), đo 1 process
+              và --load-workers process (mặc định số CPU)
+- scan:  detect_declines cho tất cả KPI quan trọng
+- chart: KPIVisualization.create_pivot_line_chart (backend Agg, không lưu file)
+- merge: merge_into_current (gộp file mới có ngày trùng + ngày mới)
+
+Kết quả ghi ra JSON (kèm commit git, phiên bản Python/pandas) để so sánh giữa các commit.
+
+Sử dụng:
+    python benchmark_kpi.py                               # chạy small + medium
+    python benchmark_kpi.py --sizes small,medium,large --repeat 5
+    python benchmark_kpi.py --scenarios load,scan --compare benchmark_results/bench_old.json
+    python benchmark_kpi.py --sizes large --scenarios load_files --load-workers 8
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from synthetic_kpi_data import generate_kpi_dataset, write_kpi_csv
+
+# Kích thước dữ liệu: (số tỉnh, số ngày, số KPI)
+SIZES = {
+    'small': (20, 90, 6),
+    'medium': (63, 365, 6),
+    'large': (63, 1095, 8),
+}
+SCENARIOS = ['load', 'load_files', 'scan', 'chart', 'merge']
+RESULTS_DIR = 'benchmark_results'
+
+
+def _git_commit() -> Optional[str]:
+    """Commit hiện tại (None nếu không phải git repo)."""
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                             text=True, timeout=10,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return out.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _time_it(fn: Callable, repeat: int, setup: Callable = None) -> Dict:
+    """Chạy fn repeat lần (setup trước mỗi lần, không tính giờ) và trả về thống kê giây."""
+    timings = []
+    for _ in range(repeat):
+        arg = setup() if setup else None
+        start = time.perf_counter()
+        fn(arg) if setup else fn()
+        timings.append(time.perf_counter() - start)
+    return {
+        'min_s': round(min(timings), 6),
+        'median_s': round(statistics.median(timings), 6),
+        'mean_s': round(statistics.mean(timings), 6),
+        'runs': [round(t, 6) for t in timings],
+    }
+
+
+def run_size(size: str, scenarios: List[str], repeat: int, workdir: str,
+             load_workers: int = None) -> Dict:
+    """Chạy các kịch bản cho một kích thước dữ liệu."""
+    from kpi_decline_detection_pipeline import KPIDeclineDetector, CONFIG
+    from data_backend import merge_into_current
+
+    n_provinces, n_days, n_kpis = SIZES[size]
+    size_dir = os.path.join(workdir, size)
+    data_path = write_kpi_csv(os.path.join(size_dir, '1.Ngày.csv'),
+                              n_provinces=n_provinces, n_days=n_days, n_kpis=n_kpis)
+    result = {
+        'provinces': n_provinces, 'days': n_days, 'kpis': n_kpis,
+        'rows': n_provinces * n_days,
+        'file_mb': round(os.path.getsize(data_path) / 1e6, 3),
+        'scenarios': {},
+    }
+    print(f"\n📦 {size}: {result['rows']} dòng ({n_provinces} tỉnh × {n_days} ngày, {n_kpis} KPI)")
+
+    detector = KPIDeclineDetector(data_path)
+    detector.load_and_clean_data()
+    kpis = [k for k in CONFIG['critical_kpis'] if k in detector.df.columns]
+
+    def _quiet(fn: Callable) -> Callable:
+        # Các hàm pipeline in khá nhiều, tắt stdout để không ảnh hưởng thời gian đo
+        def wrapper(*args):
+            saved = sys.stdout
+            sys.stdout = open(os.devnull, 'w', encoding='utf-8')
+            try:
+                return fn(*args)
+            finally:
+                sys.stdout.close()
+                sys.stdout = saved
+        return wrapper
+
+    if 'load' in scenarios:
+        result['scenarios']['load'] = _time_it(
+            _quiet(lambda: KPIDeclineDetector(data_path).load_and_clean_data()), repeat)
+
+    if 'load_files' in scenarios:
+        # Một file mỗi ngày (giống backfill nhiều file export), manifest xóa trước mỗi lần đo = cold start
+        files_dir = os.path.join(size_dir, 'daily')
+        os.makedirs(files_dir, exist_ok=True)
+        raw = pd.read_csv(data_path, encoding='utf-8-sig')
+        for day, group in raw.groupby('Ngay7', sort=False):
+            group.to_csv(os.path.join(files_dir, day.replace('/', '-') + '.csv'), index=False, encoding='utf-8-sig')
+        manifest = os.path.join(files_dir, '.kpi_manifest.json')
+
+        def _cold():
+            if os.path.exists(manifest):
+                os.remove(manifest)
+
+        workers = load_workers or os.cpu_count() or 1
+        for label, n in [('load_files', 1)] + ([(f'load_files_w{workers}', workers)] if workers > 1 else []):
+            result['scenarios'][label] = _time_it(
+                _quiet(lambda _, n=n: KPIDeclineDetector(files_dir).load_and_clean_data(workers=n)),
+                repeat, setup=_cold)
+
+    if 'scan' in scenarios:
+        result['scenarios']['scan'] = _time_it(
+            _quiet(lambda: [detector.detect_declines(k) for k in kpis]), repeat)
+
+    if 'chart' in scenarios:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        from visualization_module import KPIVisualization
+
+        viz = KPIVisualization(output_dir=os.path.join(size_dir, 'charts'))
+
+        def _chart():
+            fig, _ = viz.create_pivot_line_chart(detector.df, kpis[0], lookback_days=7,
+                                                 enable_hover=False)
+            fig.canvas.draw()
+            plt.close(fig)
+
+        result['scenarios']['chart'] = _time_it(_quiet(_chart), repeat)
+
+    if 'merge' in scenarios:
+        # File mới: 30 ngày cuối (trùng, cập nhật) + 7 ngày tiếp theo (thêm mới)
+        last = pd.to_datetime(detector.df['Ngay7']).max()
+        new_df = generate_kpi_dataset(n_provinces=n_provinces, n_days=37, n_kpis=n_kpis,
+                                      start_date=(last - pd.Timedelta(days=29)).strftime('%Y-%m-%d'),
+                                      seed=7)
+        new_path = write_kpi_csv(os.path.join(size_dir, 'new.csv'), df=new_df)
+        target = os.path.join(size_dir, 'merge_target.csv')
+
+        def _setup():
+            shutil.copyfile(data_path, target)
+            for suffix in ('.version.json', '.lock'):
+                if os.path.exists(target + suffix):
+                    os.remove(target + suffix)
+
+        result['scenarios']['merge'] = _time_it(
+            _quiet(lambda _: merge_into_current(target, new_path)), repeat, setup=_setup)
+
+    for name, stats in result['scenarios'].items():
+        print(f"   {name:<14} median {stats['median_s'] * 1000:9.1f} ms   min {stats['min_s'] * 1000:9.1f} ms")
+    return result
+
+
+def compare_results(old: Dict, new: Dict) -> List[Dict]:
+    """So sánh median giữa 2 file kết quả. Trả về danh sách (size, scenario, old, new, ratio)."""
+    rows = []
+    for size, new_size in new.get('sizes', {}).items():
+        old_size = old.get('sizes', {}).get(size)
+        if not old_size:
+            continue
+        for scenario, stats in new_size['scenarios'].items():
+            old_stats = old_size['scenarios'].get(scenario)
+            if not old_stats:
+                continue
+            rows.append({
+                'size': size, 'scenario': scenario,
+                'old_median_s': old_stats['median_s'], 'new_median_s': stats['median_s'],
+                'ratio': round(stats['median_s'] / old_stats['median_s'], 3) if old_stats['median_s'] else None,
+            })
+    return rows
+
+
+def run_benchmarks(sizes: List[str], scenarios: List[str], repeat: int = 3,
+                   output_dir: str = RESULTS_DIR, keep_data: bool = False,
+                   load_workers: int = None) -> str:
+    """Chạy toàn bộ benchmark và ghi JSON. Trả về đường dẫn file kết quả."""
+    results = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'repeat': repeat,
+        'cpu_count': os.cpu_count(),
+        'sizes': {},
+    }
+    workdir = tempfile.mkdtemp(prefix='kpi_bench_')
+    try:
+        for size in sizes:
+            results['sizes'][size] = run_size(size, scenarios, repeat, workdir, load_workers)
+    finally:
+        if keep_data:
+            print(f"\n📁 Dữ liệu benchmark giữ tại: {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    out_path = os.path.join(output_dir, f"bench_{stamp}_{results['commit'] or 'nogit'}.json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 Đã lưu kết quả: {out_path}")
+    return out_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark pipeline phát hiện suy giảm KPI')
+    parser.add_argument('--sizes', default='small,medium',
+                        help=f"Danh sách kích thước, phân tách bằng dấu phẩy ({', '.join(SIZES)})")
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f"Danh sách kịch bản ({', '.join(SCENARIOS)})")
+    parser.add_argument('--repeat', type=int, default=3, help='Số lần lặp mỗi kịch bản')
+    parser.add_argument('--output-dir', default=RESULTS_DIR, help='Thư mục ghi kết quả JSON')
+    parser.add_argument('--compare', help='File JSON kết quả cũ để so sánh')
+    parser.add_argument('--keep-data', action='store_true', help='Giữ lại dữ liệu giả lập sau khi chạy')
+    parser.add_argument('--load-workers', type=int, default=None,
+                        help='Số process cho kịch bản load_files (mặc định số CPU)')
+    args = parser.parse_args()
+
+    sizes = [s.strip() for s in args.sizes.split(',') if s.strip()]
+    scenarios = [s.strip() for s in args.scenarios.split(',') if s.strip()]
+    unknown = [s for s in sizes if s not in SIZES] + [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"Không hỗ trợ: {', '.join(unknown)}")
+
+    out_path = run_benchmarks(sizes, scenarios, repeat=args.repeat,
+                              output_dir=args.output_dir, keep_data=args.keep_data,
+                              load_workers=args.load_workers)
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        with open(out_path, encoding='utf-8') as f:
+            new = json.load(f)
+        print(f"\n📊 So sánh với {args.compare} (commit {old.get('commit')}):")
+        for row in compare_results(old, new):
+            ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else 'n/a'
+            print(f"   {row['size']:<7} {row['scenario']:<6} "
+                  f"{row['old_median_s'] * 1000:9.1f} ms → {row['new_median_s'] * 1000:9.1f} ms  ({ratio})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,443 @@
+"""
+CHART BUNDLE - BỘ BIỂU ĐỒ VẼ SẴN CHO DASHBOARD
+==============================================
+Mỗi sáng vài người mở dashboard đầu tiên đều tự vẽ lại cùng các biểu đồ ở tab 2–4.
+Pipeline (main) vẽ sẵn các biểu đồ được xem nhiều nhất ở độ phân giải preview:
+- Payload biểu đồ trình duyệt (tất cả tỉnh) của mỗi KPI quan trọng
+- Biểu đồ các tỉnh có suy giảm của mỗi KPI (tab "Tất cả tỉnh")
+- Biểu đồ xu hướng của max_province_charts (KPI, tỉnh) có cảnh báo nặng nhất (tab "Phân tích tỉnh";
+  mỗi ảnh ~0.4 s nên không vẽ hết mọi cảnh báo, cặp khác app vẽ trực tiếp khi được xem)
+- Heatmap KPI × tỉnh (tab "Alerts")
+kèm manifest.json ghi phiên bản dữ liệu, nguồn và số ngày so sánh đã dùng. App chỉ lấy ảnh
+từ bộ này khi các thông tin đó khớp với phiên hiện tại, ngược lại vẽ trực tiếp như cũ.
+
+Bố cục: charts/bundle/manifest.json + charts/bundle/<phiên bản>-<giờ tạo>/...
+Mỗi lần build ghi vào một thư mục mới rồi mới thay manifest (ghi nguyên tử) → phiên app
+đang đọc không bao giờ thấy bộ dở dang. Sau khi thay manifest chỉ dọn các bộ cũ hơn bộ liền
+trước, nên phiên vừa nạp manifest trước đó vẫn đọc được ảnh của nó.
+
+Hai hàm vẽ province_trend_figure/alert_lines_figure được app dùng chung để ảnh vẽ sẵn
+và ảnh vẽ trực tiếp giống hệt nhau.
+
+Sử dụng:
+    from chart_bundle import ChartBundle, build_chart_bundle
+
+    build_chart_bundle(detector, data_version, all_alerts)          # trong pipeline
+
+    bundle = ChartBundle.load('charts', data_version, file_path)      # trong app
+    path = bundle.province_chart('CSSR', 'Tinh 01', lookback_days=7) if bundle else None
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+import unicodedata
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import matplotlib.pyplot as plt
+import pandas as pd
+from matplotlib.ticker import FuncFormatter, MaxNLocator
+
+from chart_lod import SeriesLOD, downsample, draw_line_batch, marker_kwargs, set_adaptive_date_axis
+from instrumentation import span
+from web_chart import build_payload, payload_json, pivot_wide
+
+BUNDLE_DIRNAME = 'bundle'
+MANIFEST_NAME = 'manifest.json'
+BUNDLE_FORMAT = 1
+BUNDLE_DPI = 100  # Preview: st.pyplot lưu 200 dpi, ảnh hiển thị co theo bề rộng cột nên 100 dpi là đủ
+# Tổng số ảnh xu hướng (KPI, tỉnh) vẽ sẵn, ưu tiên cảnh báo có % suy giảm nặng nhất
+BUNDLE_MAX_PROVINCE_CHARTS = 10
+# KPI mặc định của tab Alerts (heatmap của tập này được vẽ sẵn cùng critical_kpis trong config)
+DASHBOARD_ALERT_KPIS = ['MTCL_2024', 'CSSR', 'CDR', 'HOSR_4G_2024']
+
+# Màu/độ dày đường theo mức độ nghiêm trọng (biểu đồ các tỉnh có suy giảm)
+SEVERITY_STYLE = {
+    'Cực kỳ nghiêm trọng': ('red', 3),
+    'Nghiêm trọng': ('orange', 2.5),
+    'Cảnh báo': ('yellow', 2),
+}
+
+
+def province_trend_figure(kpi_data: pd.DataFrame, kpi: str, province: str, lookback_days: int = None):
+    """
+    Biểu đồ xu hướng KPI của một tỉnh (tab "Phân tích tỉnh")
+
+    Vẽ với style mặc định của matplotlib: visualization_module đổi style toàn cục khi được import,
+    không cố định style thì ảnh vẽ sẵn và ảnh vẽ trực tiếp khác nhau tùy module nào đã import.
+
+    Args:
+        kpi_data: DataFrame cột Ngay7 (datetime, tăng dần) và cột KPI (đã bỏ null/0)
+        kpi: Tên cột KPI
+        province: Tên tỉnh (tiêu đề)
+        lookback_days: Tô đỏ N ngày gần nhất (None = không tô)
+    """
+    with plt.style.context('default'):
+        fig, ax = plt.subplots(figsize=(14, 6))
+        # Khoảng ngày dài: giảm mẫu (giữ các điểm trũng) và thu nhỏ/bỏ marker
+        x_plot, y_plot = downsample(kpi_data['Ngay7'], kpi_data[kpi])
+        ax.plot(x_plot, y_plot, linewidth=2, **marker_kwargs(len(y_plot), markersize=4))
+        ax.set_title(f'{kpi} - {province}', fontsize=14, fontweight='bold')
+        ax.set_xlabel('Ngày', fontsize=12)
+        ax.set_ylabel('', fontsize=12)  # Bỏ label trục Y
+        ax.grid(True, alpha=0.3)
+
+        # Trục x: mỗi ngày một tick khi khoảng ~1 tháng, dài hơn thì giãn theo tuần/tháng
+        set_adaptive_date_axis(ax)
+        ax.tick_params(axis='x', rotation=45)
+
+        # Đảm bảo trục Y luôn hiển thị đầy đủ số khi phóng to
+        ax.tick_params(axis='y', which='both', labelsize=10)
+        ax.yaxis.set_minor_locator(plt.NullLocator())  # Tắt minor ticks
+        # Force hiển thị tối thiểu số tick trên trục Y
+        ax.yaxis.set_major_locator(MaxNLocator(nbins=10, integer=False))
+        # Format 2 chữ số thập phân cho trục Y
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda y, pos: f"{y:.2f}"))
+        # Tăng margin bên trái để có chỗ hiển thị số
+        fig.subplots_adjust(left=0.10, right=0.95, top=0.93, bottom=0.15)
+
+        # Điều chỉnh layout để tránh nhãn bị cắt
+        plt.setp(ax.xaxis.get_majorticklabels(), ha='right')
+
+        # Tăng kích thước biểu đồ khi có nhiều ngày để hiển thị đầy đủ
+        num_days = len(kpi_data)
+        if num_days > 30:
+            fig.set_size_inches(18, 6)
+        elif num_days > 20:
+            fig.set_size_inches(16, 6)
+        else:
+            fig.set_size_inches(14, 6)
+
+        # Highlight lookback days
+        if lookback_days and len(kpi_data) >= lookback_days:
+            latest_date = kpi_data['Ngay7'].iloc[-1]
+            lookback_date = latest_date - pd.Timedelta(days=lookback_days)
+            mask = kpi_data['Ngay7'] >= lookback_date
+            ax.plot(kpi_data[mask]['Ngay7'], kpi_data[mask][kpi],
+                    marker='o', linewidth=3, markersize=6,
+                    color='red', label=f'{lookback_days} ngày gần nhất')
+            ax.legend()
+
+        plt.tight_layout()
+    return fig
+
+
+def alert_lines_figure(wide: pd.DataFrame, kpi: str, alerts: List[Dict]):
+    """
+    Biểu đồ các tỉnh có suy giảm của một KPI (tab "Tất cả tỉnh")
+
+    Args:
+        wide: Bảng ngày × tỉnh (pivot_wide) của các tỉnh có cảnh báo
+        kpi: Tên cột KPI
+        alerts: Cảnh báo của detect_declines (màu/độ dày đường theo mức độ)
+    """
+    with plt.style.context('default'):
+        fig, ax = plt.subplots(figsize=(14, 8))
+
+        alert_by_province = {a['province']: a for a in alerts}
+        drawn = [a['province'] for a in alerts if a['province'] in wide.columns]
+        colors, widths, labels = [], [], []
+        for province_name in drawn:
+            alert = alert_by_province.get(province_name)
+            color, linewidth = SEVERITY_STYLE.get(alert['severity'], ('blue', 1.5)) if alert else ('gray', 1.5)
+            colors.append(color)
+            widths.append(linewidth)
+            labels.append(f"{province_name} ({alert['severity'] if alert else 'OK'})")
+
+        # Tất cả đường: một LineCollection + một scatter (giảm mẫu LTTB khi khoảng ngày dài)
+        series = SeriesLOD(wide).arrays(drawn)
+        _, _, legend_handles = draw_line_batch(ax, series, colors, labels=labels,
+                                               linewidths=widths, markersize=3, alpha=0.7)
+
+        ax.set_title(f'{kpi} - Các tỉnh có suy giảm', fontsize=16, fontweight='bold')
+        ax.set_xlabel('Ngày', fontsize=12)
+        ax.set_ylabel('', fontsize=12)  # Bỏ label trục Y
+        ax.grid(True, alpha=0.3)
+        ax.legend(handles=legend_handles, bbox_to_anchor=(1.05, 1), loc='upper left', fontsize=8)
+
+        # Trục x: mỗi ngày một tick khi khoảng ~1 tháng, dài hơn thì giãn theo tuần/tháng
+        set_adaptive_date_axis(ax)
+        ax.tick_params(axis='x', rotation=45)
+        plt.setp(ax.xaxis.get_majorticklabels(), ha='right')
+
+        # Đảm bảo trục Y luôn hiển thị đầy đủ số khi phóng to
+        ax.tick_params(axis='y', which='both', labelsize=10)
+        ax.yaxis.set_minor_locator(plt.NullLocator())  # Tắt minor ticks
+        # Force hiển thị tối thiểu số tick trên trục Y
+        ax.yaxis.set_major_locator(MaxNLocator(nbins=10, integer=False))
+        # Format 2 chữ số thập phân cho trục Y
+        ax.yaxis.set_major_formatter(FuncFormatter(lambda y, pos: f"{y:.2f}"))
+        # Tăng margin bên trái để có chỗ hiển thị số (đặc biệt khi có legend bên phải)
+        fig.subplots_adjust(left=0.10, right=0.85, top=0.93, bottom=0.15)
+
+        # Tính số ngày và tăng kích thước biểu đồ khi có nhiều ngày
+        num_days = len(wide.index)
+        if num_days > 30:
+            fig.set_size_inches(20, 8)
+        elif num_days > 20:
+            fig.set_size_inches(18, 8)
+        else:
+            fig.set_size_inches(16, 8)
+
+        plt.tight_layout()
+    return fig
+
+
+def province_kpi_frames(df: pd.DataFrame, kpi: str, provinces: Iterable[str]) -> Dict[str, pd.DataFrame]:
+    """
+    (Ngay7, KPI) đã bỏ null/0 và sắp xếp theo ngày của từng tỉnh - cùng dữ liệu tab "Phân tích tỉnh"
+    vẽ khi không lọc ngày, lấy cho mọi tỉnh trong một lần groupby
+    """
+    data = df.loc[df['CTKD7'].isin(list(provinces)), ['Ngay7', 'CTKD7', kpi]]
+    data = data[data[kpi].notna() & (data[kpi] != 0)]
+    return {province: part[['Ngay7', kpi]].sort_values('Ngay7')
+            for province, part in data.groupby('CTKD7', sort=False)}
+
+
+def bundle_root(charts_dir: str) -> str:
+    return os.path.join(charts_dir, BUNDLE_DIRNAME)
+
+
+def _slug(text) -> str:
+    """Tên file an toàn (bỏ dấu, chỉ giữ chữ/số)"""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^0-9A-Za-z]+', '_', text).strip('_') or 'x'
+
+
+def _write_manifest(root: str, manifest: Dict):
+    """Ghi manifest nguyên tử (file tạm + os.replace)"""
+    fd, tmp_path = tempfile.mkstemp(prefix='.manifest_', suffix='.json', dir=root)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+        os.replace(tmp_path, os.path.join(root, MANIFEST_NAME))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_chart_bundle(detector, data_version: str, alerts_by_kpi: Dict[str, List[Dict]] = None,
+                       kpis: List[str] = None, heatmap_kpi_sets: Sequence[Sequence[str]] = None,
+                       charts_dir: str = None, dpi: int = BUNDLE_DPI,
+                       max_province_charts: int = None,
+                       heatmap_images: Dict[Tuple[str, ...], str] = None) -> Optional[Dict]:
+    """
+    Vẽ sẵn bộ biểu đồ cho dashboard từ detector đã load dữ liệu
+
+    Args:
+        detector: KPIDeclineDetector đã load_and_clean_data (load toàn bộ ngày như app mặc định)
+        data_version: Phiên bản dữ liệu đọc TRƯỚC khi load (dữ liệu đổi trong lúc chạy →
+                      phiên bản mới không khớp → app tự vẽ trực tiếp)
+        alerts_by_kpi: Kết quả analyze_all_kpis (None = tự chạy detect_declines cho từng KPI)
+        kpis: Các KPI (None = critical_kpis trong config)
+        heatmap_kpi_sets: Các tập KPI cần heatmap (None = critical_kpis và DASHBOARD_ALERT_KPIS)
+        charts_dir: Thư mục charts (None = charts_dir trong config)
+        dpi: Độ phân giải ảnh
+        max_province_charts: Tổng số ảnh xu hướng (KPI, tỉnh) tối đa (None = bundle_max_province_charts
+                             trong config, 0 = không vẽ ảnh tỉnh)
+        heatmap_images: Heatmap đã vẽ ở bước trước theo tập KPI → đường dẫn PNG (sao chép, không vẽ lại)
+
+    Returns:
+        Manifest đã ghi (None nếu chưa có dữ liệu)
+    """
+    df = detector.df
+    if df is None or len(df) == 0:
+        return None
+    config = detector.config
+    lookback_days = config['days_lookback']
+    kpis = [k for k in (kpis or config['critical_kpis']) if k in df.columns]
+    if alerts_by_kpi is None:
+        alerts_by_kpi = {kpi: detector.detect_declines(kpi) for kpi in kpis}
+    if heatmap_kpi_sets is None:
+        heatmap_kpi_sets = [config['critical_kpis'], DASHBOARD_ALERT_KPIS]
+    if max_province_charts is None:
+        max_province_charts = config.get('bundle_max_province_charts', BUNDLE_MAX_PROVINCE_CHARTS)
+    heatmap_images = heatmap_images or {}
+    # Các (KPI, tỉnh) nặng nhất trên mọi KPI (decline_pct âm hơn = xấu hơn)
+    ranked = sorted(((a['decline_pct'], kpi, a['province']) for kpi in kpis
+                     for a in alerts_by_kpi.get(kpi) or []), key=lambda t: t[0])
+    province_charts = {(kpi, province) for _, kpi, province in ranked[:max(max_province_charts, 0)]}
+
+    print("\n📦 Đang vẽ sẵn bộ biểu đồ cho dashboard...")
+    root = bundle_root(charts_dir or config['charts_dir'])
+    dirname = f"{_slug(data_version)}-{datetime.now().strftime('%Y%m%d_%H%M%S_%f')}"
+    out_dir = os.path.join(root, dirname)
+    os.makedirs(out_dir, exist_ok=True)
+
+    charts = []
+    used_names = set()
+
+    def _name(stem: str, ext: str) -> str:
+        name, n = f"{stem}{ext}", 1
+        while name in used_names:
+            n += 1
+            name = f"{stem}_{n}{ext}"
+        used_names.add(name)
+        return name
+
+    def _save(fig, stem: str) -> str:
+        name = _name(stem, '.png')
+        fig.savefig(os.path.join(out_dir, name), dpi=dpi, bbox_inches='tight')
+        plt.close(fig)
+        return name
+
+    with span('chart_bundle', kpis=len(kpis)) as s:
+        for kpi in kpis:
+            # Biểu đồ trình duyệt tất cả tỉnh: chỉ lưu payload, HTML được ghép theo bộ lọc của phiên
+            wide_all = pivot_wide(df, kpi)
+            if wide_all.shape[1] > 0:
+                name = _name(f"payload_{_slug(kpi)}", '.json')
+                with open(os.path.join(out_dir, name), 'w', encoding='utf-8') as f:
+                    f.write(payload_json(build_payload(wide_all, kpi)))
+                charts.append({'kind': 'payload', 'kpi': kpi, 'file': name, 'n_series': int(wide_all.shape[1])})
+
+            alerts = alerts_by_kpi.get(kpi) or []
+            if not alerts:
+                continue
+            provinces = [a['province'] for a in alerts]
+            wide = pivot_wide(df, kpi, provinces=provinces)
+            charts.append({'kind': 'alerts', 'kpi': kpi, 'provinces': provinces,
+                           'file': _save(alert_lines_figure(wide, kpi, alerts), f"alerts_{_slug(kpi)}")})
+
+            selected = [p for p in provinces if (kpi, p) in province_charts]
+            for province, kpi_data in province_kpi_frames(df, kpi, selected).items():
+                if len(kpi_data) == 0:
+                    continue
+                fig = province_trend_figure(kpi_data, kpi, province, lookback_days)
+                charts.append({'kind': 'province', 'kpi': kpi, 'province': province,
+                               'file': _save(fig, f"trend_{_slug(kpi)}_{_slug(province)}")})
+
+        KPIVisualization = None
+        seen_sets = set()
+        for kpi_set in heatmap_kpi_sets:
+            kpi_set = [k for k in kpi_set if k in df.columns]
+            if not kpi_set or tuple(kpi_set) in seen_sets:
+                continue
+            seen_sets.add(tuple(kpi_set))
+            reuse = heatmap_images.get(tuple(kpi_set))
+            if reuse and os.path.exists(reuse):
+                name = _name(f"heatmap_{len(seen_sets)}", os.path.splitext(reuse)[1])
+                shutil.copyfile(reuse, os.path.join(out_dir, name))
+                charts.append({'kind': 'heatmap', 'kpis': kpi_set, 'file': name})
+                continue
+            matrix = detector.compute_change_matrix(kpi_set, lookback_days=lookback_days)
+            if matrix['signed_change_pct'].empty:
+                continue
+            if KPIVisualization is None:
+                from visualization_module import KPIVisualization
+            fig, _ = KPIVisualization(output_dir=out_dir).create_kpi_heatmap(
+                matrix, threshold=config['decline_threshold'])
+            charts.append({'kind': 'heatmap', 'kpis': kpi_set,
+                           'file': _save(fig, f"heatmap_{len(seen_sets)}")})
+        s.set(charts=len(charts))
+
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'data_version': data_version,
+        'source': os.path.abspath(detector.file_path) if detector.file_path else None,
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'lookback_days': lookback_days,
+        'decline_threshold': config['decline_threshold'],
+        'dpi': dpi,
+        'dir': dirname,
+        'charts': charts,
+    }
+    try:
+        with open(os.path.join(root, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            previous_dir = json.load(f).get('dir')
+    except (OSError, ValueError):
+        previous_dir = None
+    _write_manifest(root, manifest)
+
+    # Dọn các bộ cũ sau khi manifest đã trỏ sang bộ mới; giữ bộ liền trước cho phiên đang đọc
+    for entry in os.scandir(root):
+        if entry.is_dir() and entry.name not in (dirname, previous_dir):
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+    n_images = sum(1 for c in charts if c['kind'] != 'payload')
+    print(f"✅ Đã vẽ sẵn {n_images} ảnh + {len(charts) - n_images} payload: {out_dir}")
+    return manifest
+
+
+class ChartBundle:
+    """
+    Đọc bộ biểu đồ vẽ sẵn; mọi hàm tra cứu trả None khi không có ảnh phù hợp (→ vẽ trực tiếp)
+    """
+
+    def __init__(self, root: str, manifest: Dict):
+        self.manifest = manifest
+        self.dir = os.path.join(root, manifest['dir'])
+        self._index = {}
+        for chart in manifest.get('charts', []):
+            kind = chart['kind']
+            if kind == 'province':
+                key = (kind, chart['kpi'], chart['province'])
+            elif kind == 'heatmap':
+                key = (kind, tuple(chart['kpis']))
+            else:
+                key = (kind, chart['kpi'])
+            self._index[key] = chart
+
+    @classmethod
+    def load(cls, charts_dir: str, data_version: str, source: str = None) -> Optional['ChartBundle']:
+        """
+        Bộ biểu đồ của đúng phiên bản dữ liệu (và đúng nguồn dữ liệu nếu truyền source)
+
+        Returns:
+            ChartBundle hoặc None nếu chưa có bộ nào / bộ hiện có thuộc phiên bản dữ liệu khác
+        """
+        root = bundle_root(charts_dir)
+        try:
+            with open(os.path.join(root, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get('format') != BUNDLE_FORMAT or manifest.get('data_version') != data_version:
+            return None
+        if source and manifest.get('source') and os.path.abspath(source) != manifest['source']:
+            return None
+        return cls(root, manifest)
+
+    def _path(self, chart: Optional[Dict]) -> Optional[str]:
+        if chart is None:
+            return None
+        path = os.path.join(self.dir, chart['file'])
+        return path if os.path.exists(path) else None
+
+    def _lookback_matches(self, lookback_days) -> bool:
+        return lookback_days is None or lookback_days == self.manifest.get('lookback_days')
+
+    def payload(self, kpi: str) -> Optional[Tuple[str, int]]:
+        """(payload JSON, số tỉnh) của biểu đồ trình duyệt tất cả tỉnh"""
+        chart = self._index.get(('payload', kpi))
+        path = self._path(chart)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return f.read(), chart['n_series']
+        except OSError:
+            return None
+
+    def province_chart(self, kpi: str, province: str, lookback_days: int = None) -> Optional[str]:
+        """Ảnh xu hướng (KPI, tỉnh) - chỉ có cho các tỉnh có cảnh báo lúc chạy pipeline"""
+        if not self._lookback_matches(lookback_days):
+            return None
+        return self._path(self._index.get(('province', kpi, province)))
+
+    def alert_chart(self, kpi: str, provinces: Sequence[str], lookback_days: int = None) -> Optional[str]:
+        """Ảnh các tỉnh có suy giảm - chỉ dùng khi danh sách tỉnh cảnh báo giống hệt lúc vẽ sẵn"""
+        chart = self._index.get(('alerts', kpi))
+        if chart is None or not self._lookback_matches(lookback_days) or chart['provinces'] != list(provinces):
+            return None
+        return self._path(chart)
+
+    def heatmap(self, kpis: Sequence[str], lookback_days: int = None) -> Optional[str]:
+        """Heatmap KPI × tỉnh của đúng tập KPI (cùng thứ tự)"""
+        if not self._lookback_matches(lookback_days):
+            return None
+        return self._path(self._index.get(('heatmap', tuple(kpis))))
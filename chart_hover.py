@@ -0,0 +1,193 @@
+"""
+CHART HOVER - TÌM ĐƯỜNG/ĐIỂM GẦN CON TRỎ NHANH
+===============================================
+Handler motion_notify_event cũ duyệt từng Line2D và gọi contains(event) (kèm date2num lại dữ liệu)
+mỗi lần rê chuột → với 60+ tỉnh hover bị giật. Module này:
+- Chuyển toàn bộ điểm sang toạ độ màn hình (pixel) một lần, chỉ tính lại khi zoom/pan/resize
+- Nối x-pixel (đã sắp xếp) của mọi đường thành một mảng tăng dần (mỗi đường cộng một độ lệch)
+  → một lần np.searchsorted tìm đoạn gần con trỏ của TẤT CẢ đường, O(số đường × log số điểm)
+- Khoảng cách con trỏ → đoạn thẳng tính vectorized, chọn đường gần nhất trong bán kính pixel
+- throttle(): bỏ bớt sự kiện chuột dồn dập (mặc định tối đa ~30 lần/giây)
+
+Sử dụng:
+    from chart_hover import LineHoverIndex, throttle
+
+    index = LineHoverIndex(ax)
+    index.set_series('Tinh 01', mdates.date2num(dates), values)
+
+    @throttle
+    def on_move(event):
+        hit = index.query(event.x, event.y)
+        if hit is not None:
+            print(hit.label, mdates.num2date(hit.x), hit.y)
+    fig.canvas.mpl_connect('motion_notify_event', on_move)
+"""
+
+import functools
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+HOVER_RADIUS_PX = 8.0        # Giống pickradius của các line trong chart
+HOVER_MIN_INTERVAL_S = 0.03  # Khoảng cách tối thiểu giữa hai lần xử lý motion event
+
+
+class HoverHit(NamedTuple):
+    """Kết quả tra cứu: đường gần nhất và điểm dữ liệu gần con trỏ nhất theo trục x."""
+    label: str
+    index: int          # Chỉ số điểm trong chuỗi đã truyền vào set_series
+    x: float            # Toạ độ dữ liệu (date2num với trục ngày)
+    y: float
+    distance_px: float  # Khoảng cách con trỏ tới đường (pixel)
+
+
+class LineHoverIndex:
+    """
+    Chỉ mục toạ độ màn hình của các đường trên một Axes
+
+    Dữ liệu giữ ở toạ độ dữ liệu; bản pixel được tính lại (một lần transform cho mọi điểm)
+    khi giới hạn trục hoặc kích thước figure thay đổi, hoặc khi set_series/remove_series.
+    """
+
+    def __init__(self, ax, radius_px: float = HOVER_RADIUS_PX):
+        self.ax = ax
+        self.radius_px = radius_px
+        self._series: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._dirty = True
+        self._labels: List[str] = []
+        ax.callbacks.connect('xlim_changed', self._invalidate)
+        ax.callbacks.connect('ylim_changed', self._invalidate)
+        ax.figure.canvas.mpl_connect('resize_event', self._invalidate)
+
+    def _invalidate(self, *_args):
+        self._dirty = True
+
+    def set_series(self, label: str, x, y):
+        """Thêm/cập nhật một đường (x tăng dần, ví dụ date2num của ngày); bỏ các điểm NaN."""
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        valid = np.isfinite(x) & np.isfinite(y)
+        x, y = x[valid], y[valid]
+        if len(x) > 1 and np.any(np.diff(x) < 0):
+            order = np.argsort(x, kind='stable')
+            x, y = x[order], y[order]
+        if len(x) == 0:
+            self._series.pop(label, None)
+        else:
+            self._series[label] = (x, y)
+        self._dirty = True
+
+    def remove_series(self, label: str):
+        if self._series.pop(label, None) is not None:
+            self._dirty = True
+
+    def _refresh(self):
+        self._dirty = False
+        self._labels = list(self._series)
+        if not self._labels:
+            self._keys = np.empty(0)
+            return
+        xs = [self._series[label][0] for label in self._labels]
+        ys = [self._series[label][1] for label in self._labels]
+        lengths = np.array([len(x) for x in xs])
+        self._starts = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+        self._ends = self._starts + lengths
+        self._x = np.concatenate(xs)
+        self._y = np.concatenate(ys)
+        pixels = self.ax.transData.transform(np.column_stack([self._x, self._y]))
+        self._px, self._py = pixels[:, 0], pixels[:, 1]
+        # Độ lệch lớn hơn toàn bộ bề rộng pixel → các đường nối tiếp nhau thành một mảng tăng dần
+        width = float(np.nanmax(self._px) - np.nanmin(self._px)) if len(self._px) else 0.0
+        self._offset = width + 1.0
+        self._rows = np.arange(len(self._labels)) * self._offset
+        # Trục x đảo chiều: pixel giảm dần theo dữ liệu → đảo dấu để vẫn tăng dần
+        self._sign = -1.0 if self.ax.xaxis_inverted() else 1.0
+        self._keys = self._sign * self._px + np.repeat(self._rows, lengths)
+
+    def query(self, x_px: float, y_px: float) -> Optional[HoverHit]:
+        """Đường gần (x_px, y_px) nhất trong bán kính radius_px, None nếu không có."""
+        if self._dirty:
+            self._refresh()
+        if len(self._keys) == 0:
+            return None
+        # Mọi đoạn có khoảng x giao [x - r, x + r] đều có thể nằm trong bán kính (kể cả đoạn dốc
+        # bên cạnh đoạn chứa con trỏ, ví dụ bước nhảy/điểm trũng) → xét hết các đoạn đó
+        key = self._sign * x_px + self._rows
+        last = self._ends - 1
+        first = np.clip(np.searchsorted(self._keys, key - self.radius_px, 'left') - 1, self._starts, last)
+        stop = np.clip(np.searchsorted(self._keys, key + self.radius_px, 'right'), self._starts, last)
+        counts = np.maximum(stop - first, 1)
+        offsets = np.cumsum(counts) - counts
+        line = np.repeat(np.arange(len(counts)), counts)
+        lo = np.repeat(first, counts) + np.arange(int(counts.sum())) - np.repeat(offsets, counts)
+        hi = np.minimum(lo + 1, last[line])
+
+        # Khoảng cách từ con trỏ tới từng đoạn [lo, hi]
+        ax_, ay = self._px[lo], self._py[lo]
+        dx, dy = self._px[hi] - ax_, self._py[hi] - ay
+        seg2 = dx * dx + dy * dy
+        t = np.divide((x_px - ax_) * dx + (y_px - ay) * dy, seg2,
+                      out=np.zeros_like(seg2), where=seg2 > 0).clip(0.0, 1.0)
+        dist = np.hypot(ax_ + t * dx - x_px, ay + t * dy - y_px)
+        best = int(np.argmin(dist))
+        if not dist[best] <= self.radius_px:
+            return None
+
+        row, i_lo, i_hi = line[best], lo[best], hi[best]
+        idx = i_lo if abs(self._px[i_lo] - x_px) <= abs(self._px[i_hi] - x_px) else i_hi
+        return HoverHit(self._labels[row], int(idx - self._starts[row]),
+                        float(self._x[idx]), float(self._y[idx]), float(dist[best]))
+
+def throttle(handler: Callable = None, min_interval: float = HOVER_MIN_INTERVAL_S) -> Callable:
+    """
+    Decorator bỏ qua sự kiện đến sớm hơn min_interval giây kể từ lần xử lý trước
+    (và sự kiện trùng đúng vị trí pixel vừa xử lý)
+
+    Sự kiện cuối cùng bị bỏ qua được xử lý lại khi hết min_interval (timer một lần của canvas),
+    để vị trí con trỏ dừng lại luôn được cập nhật.
+
+    Dùng: @throttle hoặc @throttle(min_interval=0.05)
+    """
+    def decorator(fn: Callable) -> Callable:
+        state = {'t': 0.0, 'xy': None, 'pending': None, 'timer': None}
+
+        def run(event, xy):
+            state['t'], state['xy'] = time.perf_counter(), xy
+            return fn(event)
+
+        def flush():
+            state['timer'] = None
+            event, state['pending'] = state['pending'], None
+            if event is not None:
+                xy = (getattr(event, 'x', None), getattr(event, 'y', None))
+                if xy != state['xy']:
+                    run(event, xy)
+
+        @functools.wraps(fn)
+        def wrapper(event):
+            now = time.perf_counter()
+            xy = (getattr(event, 'x', None), getattr(event, 'y', None))
+            if xy == state['xy']:
+                state['pending'] = None
+                return None
+            wait = min_interval - (now - state['t'])
+            if wait <= 0:
+                state['pending'] = None
+                return run(event, xy)
+            state['pending'] = event
+            canvas = getattr(event, 'canvas', None)
+            if state['timer'] is None and canvas is not None:
+                timer = canvas.new_timer(interval=max(1, int(wait * 1000)))
+                timer.single_shot = True
+                timer.add_callback(flush)
+                timer.start()
+                state['timer'] = timer
+            return None
+
+        wrapper.flush = flush
+        return wrapper
+
+    if handler is not None:
+        return decorator(handler)
+    return decorator
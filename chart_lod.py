@@ -0,0 +1,336 @@
+"""
+CHART LOD - MỨC CHI TIẾT (LEVEL OF DETAIL) CHO BIỂU ĐỒ THEO NGÀY
+================================================================
+Khi khoảng ngày dài (vài tháng → vài năm), vẽ từng điểm ngày với marker to và
+một tick cho mỗi ngày làm biểu đồ vừa chậm vừa không đọc được. Module này:
+- Tính trước các mức: ngày ('D'), tuần ('W'), tháng ('M') từ bảng pivot (ngày × tỉnh)
+- Chọn mức theo khoảng đang hiển thị để mỗi đường có tối đa max_points điểm
+- Hoặc giảm mẫu kiểu LTTB (Largest-Triangle-Three-Buckets) trên dữ liệu ngày:
+  giữ nguyên hình dạng và các điểm trũng (ngày suy giảm) thay vì làm mượt như trung bình tuần
+- Locator/formatter trục ngày thích ứng: khoảng ~1 tháng vẫn hiển thị từng ngày như cũ,
+  dài hơn thì tự giãn tick (tuần/tháng/năm)
+- draw_line_batch(): vẽ mọi tỉnh bằng một LineCollection + một scatter cho marker
+  (số artist O(1) thay vì một Line2D mỗi tỉnh) → vẽ và encode PNG nhanh hơn
+
+Sử dụng:
+    from chart_lod import SeriesLOD, set_adaptive_date_axis, marker_kwargs
+
+    lod = SeriesLOD.from_long(pivot_data, 'Ngay7', 'CTKD7', kpi)
+    x, y = lod.series('Tinh 01')                 # tự chọn mức theo toàn bộ khoảng ngày
+    x, y = lod.series('Tinh 01', start, end)     # theo khoảng đang zoom
+    ax.plot(x, y, **marker_kwargs(len(x), markersize=12))
+    set_adaptive_date_axis(ax)
+
+    series = lod.arrays()                        # [(x date2num, y), ...] theo thứ tự cột
+    draw_line_batch(ax, series, colors, labels=list(lod.daily.columns))
+"""
+
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+from matplotlib.collections import LineCollection
+from matplotlib.dates import AutoDateLocator, DayLocator, date2num, num2date
+from matplotlib.lines import Line2D
+from matplotlib.ticker import Formatter
+
+DEFAULT_MAX_POINTS = 180     # Số điểm tối đa mỗi đường (≈ nửa năm theo ngày)
+DAILY_TICK_MAX_DAYS = 35     # Khoảng ≤ 1 tháng (kể cả lề trục): mỗi ngày một tick như trước
+MARKER_FULL_MAX_POINTS = 45  # Đường ≤ 45 điểm: marker đầy đủ
+MARKER_SMALL_MAX_POINTS = 120  # Đường ≤ 120 điểm: marker nhỏ, dài hơn thì bỏ marker
+LOD_METHODS = ('lttb', 'mean')
+
+# Mức tổng hợp: tên → tần suất resample của pandas
+LOD_LEVELS = {
+    'W': 'W-MON',  # Tuần (nhãn theo thứ Hai đầu tuần)
+    'M': 'MS',     # Tháng (nhãn theo ngày đầu tháng)
+}
+_LEVEL_DAYS = {'D': 1, 'W': 7, 'M': 30}
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Chỉ số các điểm giữ lại theo Largest-Triangle-Three-Buckets
+
+    Luôn giữ điểm đầu và điểm cuối; mỗi bucket giữ điểm tạo tam giác lớn nhất với
+    điểm đã chọn trước đó và trung bình bucket kế tiếp → đỉnh/đáy (ngày suy giảm) được giữ.
+
+    Args:
+        x: Trục x dạng số, tăng dần (ví dụ date2num)
+        y: Giá trị (không có NaN)
+        n_out: Số điểm muốn giữ
+
+    Returns:
+        Mảng chỉ số tăng dần (toàn bộ nếu n_out >= len(x))
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # n_out - 2 bucket chia đều các điểm giữa (bỏ điểm đầu/cuối)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    keep = np.empty(n_out, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < len(edges):
+            next_lo, next_hi = edges[i + 1], edges[i + 2]
+        else:
+            next_lo, next_hi = n - 1, n
+        avg_x = x[next_lo:next_hi].mean()
+        avg_y = y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def choose_level(n_days: int, max_points: Optional[int] = DEFAULT_MAX_POINTS) -> str:
+    """Mức chi tiết nhỏ nhất ('D', 'W', 'M') mà khoảng n_days ngày có ≤ max_points điểm (None = luôn 'D')."""
+    if max_points is None:
+        return 'D'
+    for level in ('D', 'W'):
+        if n_days / _LEVEL_DAYS[level] <= max_points:
+            return level
+    return 'M'
+
+
+class SeriesLOD:
+    """
+    Các mức chi tiết của bảng pivot rộng (index = ngày, cột = tỉnh)
+
+    Mức tuần/tháng được tính một lần khi cần và giữ lại cho các lần zoom sau.
+    max_points=None: không giảm mẫu (vẽ đủ mọi điểm ngày).
+    """
+
+    def __init__(self, wide: pd.DataFrame, max_points: Optional[int] = DEFAULT_MAX_POINTS,
+                 method: str = 'lttb'):
+        if method not in LOD_METHODS:
+            raise ValueError(f"method phải là một trong {LOD_METHODS}, nhận '{method}'")
+        self.max_points = max_points
+        self.method = method
+        self._levels: Dict[str, pd.DataFrame] = {'D': wide.sort_index()}
+
+    @classmethod
+    def from_long(cls, df: pd.DataFrame, date_column: str, group_by: str, value_column: str,
+                  **kwargs) -> 'SeriesLOD':
+        """Tạo từ bảng dạng dài (ngày, tỉnh, giá trị) như pivot_data của create_pivot_line_chart."""
+        wide = df.pivot_table(index=date_column, columns=group_by, values=value_column,
+                              aggfunc='mean', observed=True)
+        wide.columns.name = None
+        return cls(wide, **kwargs)
+
+    @property
+    def daily(self) -> pd.DataFrame:
+        return self._levels['D']
+
+    def level(self, name: str) -> pd.DataFrame:
+        """Bảng ở mức 'D'/'W'/'M' (trung bình các ngày hợp lệ trong kỳ)."""
+        if name not in self._levels:
+            self._levels[name] = self.daily.resample(LOD_LEVELS[name], label='left',
+                                                     closed='left').mean()
+        return self._levels[name]
+
+    def span_days(self, start=None, end=None) -> int:
+        """Số ngày của khoảng [start, end] (mặc định toàn bộ dữ liệu)."""
+        index = self.daily.index
+        if len(index) == 0:
+            return 0
+        start = pd.Timestamp(start) if start is not None else index[0]
+        end = pd.Timestamp(end) if end is not None else index[-1]
+        return max(int((end - start).days) + 1, 0)
+
+    def resolution(self, start=None, end=None) -> str:
+        """Mức được dùng cho khoảng đang hiển thị ('D' nghĩa là đủ điểm ngày, không cần giảm)."""
+        return choose_level(self.span_days(start, end), self.max_points)
+
+    def series(self, column, start=None, end=None) -> Tuple[pd.DatetimeIndex, np.ndarray]:
+        """
+        Dữ liệu (x, y) của một tỉnh trong khoảng [start, end] ở mức chi tiết phù hợp
+
+        - method='lttb': giữ điểm ngày gốc, giảm còn ≤ max_points bằng LTTB
+        - method='mean': dùng trung bình tuần/tháng đã tính trước
+        """
+        level = self.resolution(start, end)
+        if level != 'D' and self.method == 'mean':
+            values = self.level(level)[column]
+        else:
+            values = self.daily[column]
+        if start is not None or end is not None:
+            values = values.loc[start:end]
+        values = values.dropna()
+        x, y = values.index, values.to_numpy(dtype=float)
+        if self.max_points is not None and len(y) > self.max_points:
+            keep = lttb_indices(x.asi8.astype(float), y, self.max_points)
+            x, y = x[keep], y[keep]
+        return x, y
+
+    def arrays(self, columns: Optional[Sequence] = None, start=None,
+               end=None) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """
+        (x dạng date2num, y) của nhiều tỉnh một lần, cùng quy tắc với series()
+
+        Lấy một mảng numpy (ngày × tỉnh) từ bảng pivot rồi cắt theo cột bằng mask,
+        không lọc/sắp xếp DataFrame cho từng tỉnh. Tỉnh không có cột → mảng rỗng.
+        """
+        level = self.resolution(start, end)
+        table = self.level(level) if level != 'D' and self.method == 'mean' else self.daily
+        if start is not None or end is not None:
+            table = table.loc[start:end]
+        columns = list(table.columns) if columns is None else list(columns)
+        present = [c for c in columns if c in table.columns]
+        values = table[present].to_numpy(dtype=float)
+        x_all = date2num(table.index)
+        position = {c: j for j, c in enumerate(present)}
+        result = []
+        for column in columns:
+            if column not in position:
+                result.append((np.empty(0), np.empty(0)))
+                continue
+            y = values[:, position[column]]
+            valid = np.isfinite(y)
+            x, y = x_all[valid], y[valid]
+            if self.max_points is not None and len(y) > self.max_points:
+                keep = lttb_indices(x, y, self.max_points)
+                x, y = x[keep], y[keep]
+            result.append((x, y))
+        return result
+
+
+def downsample(x, y, max_points: Optional[int] = DEFAULT_MAX_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    """Giảm mẫu một chuỗi (x là ngày, tăng dần) bằng LTTB; trả nguyên nếu đã đủ ít điểm hoặc max_points=None."""
+    y = np.asarray(y, dtype=float)
+    if max_points is None or len(y) <= max_points:
+        return x, y
+    xs = pd.DatetimeIndex(x)
+    valid = ~xs.isna() & np.isfinite(y)
+    xs, y = xs[valid], y[valid]
+    keep = lttb_indices(xs.asi8.astype(float), y, max_points)
+    return xs[keep], y[keep]
+
+
+def marker_kwargs(n_points: int, markersize: float = 12, **style) -> Dict:
+    """
+    Tham số marker cho ax.plot theo số điểm của đường
+
+    Ít điểm: giữ marker như cũ; nhiều điểm: thu nhỏ rồi bỏ marker (vẽ hàng nghìn marker rất chậm).
+    Các tham số style (markerfacecolor, markeredgewidth, ...) chỉ được truyền khi còn marker.
+    """
+    if n_points <= MARKER_FULL_MAX_POINTS:
+        return {'marker': 'o', 'markersize': markersize, **style}
+    if n_points <= MARKER_SMALL_MAX_POINTS:
+        small = dict(style)
+        if 'markeredgewidth' in small:
+            small['markeredgewidth'] = min(small['markeredgewidth'], 1.0)
+        return {'marker': 'o', 'markersize': max(2.0, markersize / 3), **small}
+    return {'marker': None}
+
+
+def draw_line_batch(ax, series: Sequence[Tuple[np.ndarray, np.ndarray]], colors: Sequence,
+                    labels: Optional[Sequence[str]] = None, linewidths=2.0, markersize: float = 12,
+                    markerfacecolor: Optional[str] = None, markeredgewidth: float = 1.0,
+                    alpha: float = 0.9, zorder: float = 3) -> Tuple[LineCollection, object, List[Line2D]]:
+    """
+    Vẽ nhiều đường bằng một LineCollection và một scatter cho marker (thay cho ax.plot từng tỉnh)
+
+    Args:
+        ax: Axes có trục X là ngày
+        series: List (x dạng date2num, y) mỗi đường; đường rỗng được bỏ qua
+        colors: Màu từng đường
+        labels: Tên từng đường (để tạo legend handle; None = không tạo)
+        linewidths: Độ dày chung hoặc list theo từng đường
+        markersize, markerfacecolor, markeredgewidth: Như ax.plot; marker to/nhỏ/bỏ theo marker_kwargs
+            (markerfacecolor=None: marker tô cùng màu đường)
+
+    Returns:
+        (LineCollection, PathCollection của marker hoặc None, list Line2D proxy cho ax.legend(handles=...))
+    """
+    widths = np.broadcast_to(np.asarray(linewidths, dtype=float), (len(series),))
+    segments, seg_colors, seg_widths = [], [], []
+    mx, my, m_colors = [], [], []
+    handles = []
+    longest = max((len(y) for _, y in series), default=0)
+    style = marker_kwargs(longest, markersize=markersize, markeredgewidth=markeredgewidth)
+    for i, (x, y) in enumerate(series):
+        if len(y) == 0:
+            continue
+        segments.append(np.column_stack([x, y]))
+        seg_colors.append(colors[i])
+        seg_widths.append(widths[i])
+        if style['marker'] is not None:
+            mx.append(x)
+            my.append(y)
+            m_colors.extend([colors[i]] * len(y))
+        if labels is not None:
+            handles.append(Line2D([], [], color=colors[i], linewidth=widths[i], alpha=alpha,
+                                  label=labels[i], marker=style['marker'],
+                                  markersize=style.get('markersize'),
+                                  markerfacecolor=markerfacecolor or colors[i],
+                                  markeredgecolor=colors[i],
+                                  markeredgewidth=style.get('markeredgewidth')))
+
+    # Trục X dạng ngày cho dữ liệu date2num (LineCollection không tự đăng ký đơn vị ngày)
+    ax.xaxis_date()
+    lines = LineCollection(segments, colors=seg_colors, linewidths=seg_widths, alpha=alpha,
+                           zorder=zorder)
+    ax.add_collection(lines)
+    markers = None
+    if mx:
+        x_all, y_all = np.concatenate(mx), np.concatenate(my)
+        face = markerfacecolor if markerfacecolor is not None else m_colors
+        markers = ax.scatter(x_all, y_all, s=style['markersize'] ** 2, c=face, edgecolors=m_colors,
+                             linewidths=style['markeredgewidth'], alpha=alpha, zorder=zorder + 0.1)
+    ax.autoscale_view()
+    return lines, markers, handles
+
+
+class AdaptiveDateLocator(AutoDateLocator):
+    """
+    AutoDateLocator giữ mỗi ngày một tick khi khoảng hiển thị ≤ daily_max_days,
+    dài hơn thì để AutoDateLocator chọn bước tuần/tháng/năm (tối đa maxticks tick)
+    """
+
+    def __init__(self, daily_max_days: int = DAILY_TICK_MAX_DAYS, maxticks: int = 14, **kwargs):
+        super().__init__(minticks=4, maxticks=maxticks, interval_multiples=True, **kwargs)
+        self.daily_max_days = daily_max_days
+
+    def get_locator(self, dmin, dmax):
+        if abs((dmax - dmin).days) <= self.daily_max_days:
+            locator = DayLocator(interval=1, tz=self.tz)
+            locator.set_axis(self.axis)
+            return locator
+        return super().get_locator(dmin, dmax)
+
+
+class AdaptiveDateFormatter(Formatter):
+    """Nhãn ngày theo độ dài khoảng hiển thị: DD/MM/YYYY → MM/YYYY → YYYY."""
+
+    def __init__(self, day_fmt: str = '%d/%m/%Y', month_fmt: str = '%m/%Y', year_fmt: str = '%Y',
+                 month_after_days: int = 180, year_after_days: int = 3 * 365):
+        self.day_fmt = day_fmt
+        self.month_fmt = month_fmt
+        self.year_fmt = year_fmt
+        self.month_after_days = month_after_days
+        self.year_after_days = year_after_days
+
+    def __call__(self, x, pos=None):
+        span_days = 0.0
+        if self.axis is not None:
+            vmin, vmax = self.axis.get_view_interval()
+            span_days = abs(vmax - vmin)
+        if span_days > self.year_after_days:
+            fmt = self.year_fmt
+        elif span_days > self.month_after_days:
+            fmt = self.month_fmt
+        else:
+            fmt = self.day_fmt
+        return num2date(x).strftime(fmt)
+
+
+def set_adaptive_date_axis(ax, daily_max_days: int = DAILY_TICK_MAX_DAYS, maxticks: int = 14,
+                           day_fmt: str = '%d/%m/%Y'):
+    """Gắn locator/formatter thích ứng cho trục X (thay cho DayLocator(interval=1) cố định)."""
+    ax.xaxis.set_major_locator(AdaptiveDateLocator(daily_max_days=daily_max_days, maxticks=maxticks))
+    ax.xaxis.set_major_formatter(AdaptiveDateFormatter(day_fmt=day_fmt))
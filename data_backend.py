@@ -0,0 +1,1059 @@
+"""
+DATA BACKEND - LỚP LƯU TRỮ DỮ LIỆU KPI
+======================================
+Trừu tượng hóa nơi lưu dữ liệu KPI ngày phía sau KPIDeclineDetector:
+- CSVBackend: file 1.Ngày.csv như trước (đọc toàn bộ, gộp = ghi lại toàn bộ)
+- SQLiteBackend: SQLite (WAL) với khóa (Ngay7, CTKD7), gộp bằng
+  INSERT ... ON CONFLICT và truy vấn khoảng ngày có tham số
+- MultiFileBackend: thư mục/glob nhiều file export ngày/tháng, manifest khoảng ngày
+  từng file → chỉ đọc các file giao với khoảng ngày cần phân tích
+"""
+
+import codecs
+import fnmatch
+import glob
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unicodedata
+from contextlib import contextmanager
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from urllib.request import pathname2url
+
+import pandas as pd
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:  # Windows
+    import msvcrt
+    HAS_FCNTL = False
+
+CSV_ENCODINGS = ['utf-8-sig', 'utf-8', 'cp1258', 'latin1']
+DATA_FILE_PATH = '1.Ngày.csv'
+# Số byte đọc ở đầu (và giữa/cuối với file lớn) để đoán encoding
+SNIFF_BYTES = 64 * 1024
+# Số process đọc song song nhiều file (MultiFileBackend): số nguyên, 'auto' = số CPU
+LOAD_WORKERS_ENV = 'KPI_LOAD_WORKERS'
+
+# Encoding đã phát hiện theo file: đường dẫn tuyệt đối → (mtime_ns, size, encoding)
+_encoding_cache: Dict[str, Tuple[int, int, str]] = {}
+_encoding_lock = threading.Lock()
+
+
+def _sniff_encoding(samples: List[bytes]) -> str:
+    """Đoán encoding từ BOM của mẫu đầu file, sau đó thử giải mã chặt các mẫu."""
+    head = samples[0] if samples else b''
+    if head.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return 'utf-16'
+    for encoding in ('utf-8', 'cp1258'):
+        try:
+            for i, sample in enumerate(samples):
+                if i > 0 and encoding == 'utf-8':
+                    # Mẫu giữa/cuối file có thể bắt đầu giữa một ký tự nhiều byte
+                    sample = sample.lstrip(bytes(range(0x80, 0xC0)))
+                # final=False: bỏ qua ký tự bị cắt dở ở cuối mẫu
+                codecs.getincrementaldecoder(encoding)(errors='strict').decode(sample, final=False)
+            return encoding
+        except UnicodeDecodeError:
+            continue
+    return 'latin1'
+
+
+def detect_encoding(path: str) -> str:
+    """
+    Encoding của file CSV từ BOM + mẫu byte giới hạn (không parse cả file).
+    Kết quả được cache theo (đường dẫn, mtime, kích thước).
+    """
+    key = os.path.abspath(path)
+    st = os.stat(path)
+    with _encoding_lock:
+        cached = _encoding_cache.get(key)
+    if cached and cached[:2] == (st.st_mtime_ns, st.st_size):
+        return cached[2]
+    with open(path, 'rb') as f:
+        samples = [f.read(SNIFF_BYTES)]
+        if st.st_size > 2 * SNIFF_BYTES:
+            # File lớn: thêm mẫu ở giữa và cuối (ký tự có dấu có thể chỉ xuất hiện ở các dòng sau)
+            for offset in (st.st_size // 2, st.st_size - SNIFF_BYTES // 4):
+                f.seek(offset)
+                samples.append(f.read(SNIFF_BYTES // 4))
+    encoding = _sniff_encoding(samples)
+    _remember_encoding(path, encoding, st)
+    return encoding
+
+
+def _remember_encoding(path: str, encoding: str, st: os.stat_result = None):
+    st = st or os.stat(path)
+    with _encoding_lock:
+        _encoding_cache[os.path.abspath(path)] = (st.st_mtime_ns, st.st_size, encoding)
+
+
+def read_csv_any(path: str, encoding: str = None, **kwargs) -> pd.DataFrame:
+    """
+    Đọc CSV với encoding phát hiện một lần (parse cả file đúng một lần trong trường hợp thường gặp)
+
+    Nếu mẫu byte toàn ASCII nhưng phần còn lại của file không phải UTF-8, đọc lại với
+    cp1258 → latin1 và ghi nhớ encoding đúng cho các lần sau.
+    """
+    encoding = encoding or detect_encoding(path)
+    fallbacks = [encoding] + [e for e in CSV_ENCODINGS[2:] if e != encoding]
+    last_err = None
+    for enc in fallbacks:
+        try:
+            df = pd.read_csv(path, encoding=enc, **kwargs)
+        except UnicodeDecodeError as e:
+            last_err = e
+            continue
+        except Exception as e:
+            raise RuntimeError(f"Không đọc được CSV: {path} ({e})") from e
+        if enc != encoding:
+            _remember_encoding(path, enc)
+        return df
+    raise RuntimeError(f"Không đọc được CSV: {path} ({last_err})")
+
+
+def _normalize_text(s: str) -> str:
+    if s is None:
+        return ''
+    s = unicodedata.normalize('NFD', str(s))
+    s = ''.join(ch for ch in s if unicodedata.category(ch) != 'Mn')
+    return s.upper().strip()
+
+
+def _try_lock_fd(fd: int):
+    """Khóa độc quyền không chờ trên fd; ném OSError nếu tiến trình/luồng khác đang giữ."""
+    if HAS_FCNTL:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+
+
+def _unlock_fd(fd: int):
+    if HAS_FCNTL:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def file_lock(path: str, timeout: float = 120.0, poll: float = 0.2):
+    """
+    Khóa liên tiến trình trên file '<path>.lock' (flock trên Linux, msvcrt.locking trên Windows)
+
+    Khóa do hệ điều hành giữ nên tự nhả khi tiến trình chết → không cần đoán khóa "bị bỏ lại".
+    File khóa được giữ nguyên sau khi nhả (xóa file trong lúc tiến trình khác đang chờ sẽ cho
+    hai bên cùng vào); nội dung chỉ ghi pid/thời điểm của người đang giữ để tiện chẩn đoán.
+
+    Args:
+        path: File dữ liệu cần khóa
+        timeout: Số giây tối đa chờ lấy khóa
+        poll: Chu kỳ thử lại (giây)
+    """
+    lock_path = f"{path}.lock"
+    deadline = time.monotonic() + timeout
+    fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        while True:
+            try:
+                _try_lock_fd(fd)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Không lấy được khóa {lock_path} sau {timeout:.0f}s (có phiên khác đang gộp?)")
+                time.sleep(poll)
+        try:
+            os.ftruncate(fd, 0)
+            os.lseek(fd, 0, os.SEEK_SET)
+            os.write(fd, f"{os.getpid()} {datetime.now().isoformat()}".encode())
+            yield lock_path
+        finally:
+            _unlock_fd(fd)
+    finally:
+        os.close(fd)
+
+
+def _atomic_write_csv(df: pd.DataFrame, path: str, encoding: str = 'utf-8-sig', retries: int = 5):
+    """Ghi CSV ra file tạm cùng thư mục rồi os.replace → người đọc không bao giờ thấy file ghi dở."""
+    target_dir = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.csv', dir=target_dir)
+    try:
+        with os.fdopen(fd, 'w', encoding=encoding, newline='') as f:
+            df.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        for attempt in range(retries):
+            try:
+                os.replace(tmp_path, path)
+                break
+            except PermissionError:
+                # Windows: file đích đang được mở (Excel / phiên đọc khác) → thử lại
+                if attempt == retries - 1:
+                    raise
+                time.sleep(0.5 * (attempt + 1))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _version_pointer_path(path: str) -> str:
+    return f"{path}.version.json"
+
+
+def bump_data_version(path: str) -> str:
+    """Tăng con trỏ phiên bản dữ liệu sau mỗi lần ghi thành công. Trả về chuỗi phiên bản mới."""
+    pointer = _version_pointer_path(path)
+    current = 0
+    if os.path.exists(pointer):
+        try:
+            with open(pointer, 'r', encoding='utf-8') as f:
+                current = int(json.load(f).get('version', 0))
+        except (ValueError, OSError):
+            current = 0
+    st = os.stat(path)
+    payload = {
+        'version': current + 1,
+        'updated_at': datetime.now().isoformat(timespec='seconds'),
+        'mtime_ns': st.st_mtime_ns,
+        'size': st.st_size,
+    }
+    fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json',
+                                    dir=os.path.dirname(os.path.abspath(path)))
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(payload, f)
+    os.replace(tmp_path, pointer)
+    return read_data_version(path)
+
+
+def read_data_version(path: str) -> str:
+    """
+    Chuỗi phiên bản dữ liệu của file: số phiên bản từ con trỏ + mtime/size thực tế
+    (để vẫn phát hiện khi file bị thay thủ công mà không qua merge_into_current).
+    """
+    if not os.path.exists(path):
+        return 'missing'
+    st = os.stat(path)
+    version = 0
+    pointer = _version_pointer_path(path)
+    if os.path.exists(pointer):
+        try:
+            with open(pointer, 'r', encoding='utf-8') as f:
+                version = int(json.load(f).get('version', 0))
+        except (ValueError, OSError):
+            version = 0
+    return f"v{version}-{st.st_mtime_ns}-{st.st_size}"
+
+
+def merge_into_current(old_path: str, new_path: Union[str, pd.DataFrame]) -> dict:
+    """
+    Gộp new_path (file CSV hoặc DataFrame thô đã đọc sẵn) vào old_path theo khóa (Ngay7 + CTKD7),
+    cập nhật trùng, giữ thứ tự và đánh lại STT.
+
+    An toàn khi nhiều phiên gộp cùng lúc: giữ khóa file trong suốt quá trình đọc-gộp-ghi,
+    ghi nguyên tử (file tạm + os.replace) và tăng con trỏ phiên bản sau khi ghi xong.
+    """
+    with file_lock(old_path):
+        stats = _merge_into_current_unlocked(old_path, new_path)
+        bump_data_version(old_path)
+    return stats
+
+
+def _merge_into_current_unlocked(old_path: str, new_path: Union[str, pd.DataFrame]) -> dict:
+    if isinstance(new_path, pd.DataFrame):
+        df_new = new_path.copy()
+    else:
+        df_new = read_csv_any(new_path, low_memory=False)
+    if not os.path.exists(old_path):
+        _atomic_write_csv(df_new, old_path)
+        return {"rows_old": 0, "rows_new": len(df_new), "rows_added": len(df_new), "rows_updated": 0, "total_rows": len(df_new)}
+
+    df_old = read_csv_any(old_path, low_memory=False)
+
+    # Chuẩn hóa tên cột
+    df_old.columns = [str(c).strip() for c in df_old.columns]
+    df_new.columns = [str(c).strip() for c in df_new.columns]
+
+    required = ['Ngay7', 'CTKD7']
+    for col in required:
+        if col not in df_old.columns or col not in df_new.columns:
+            raise ValueError(f"Thiếu cột bắt buộc '{col}' trong file cần gộp.")
+
+    # Chuẩn hóa ngày và khóa gộp
+    def _prep(df: pd.DataFrame) -> pd.DataFrame:
+        df = df.copy()
+        df['Ngay7_parsed'] = pd.to_datetime(df['Ngay7'], format='%d/%m/%Y', errors='coerce')
+        if df['Ngay7_parsed'].isna().all():
+            df['Ngay7_parsed'] = pd.to_datetime(df['Ngay7'], dayfirst=True, errors='coerce')
+        df['_key'] = df['Ngay7_parsed'].dt.strftime('%Y-%m-%d') + '||' + df['CTKD7'].astype(str).str.strip().str.upper()
+        return df
+
+    df_old_p = _prep(df_old)
+    df_new_p = _prep(df_new)
+
+    # Xử lý duplicate _key trong cùng file (giữ lại dòng cuối cùng nếu có duplicate)
+    # Điều này tránh lỗi "cannot reindex on an axis with duplicate labels"
+    if df_old_p['_key'].duplicated().any():
+        df_old_p = df_old_p.drop_duplicates(subset='_key', keep='last')
+    
+    if df_new_p['_key'].duplicated().any():
+        df_new_p = df_new_p.drop_duplicates(subset='_key', keep='last')
+
+    old_idx = df_old_p.set_index('_key')
+    new_idx = df_new_p.set_index('_key')
+
+    matching = old_idx.index.intersection(new_idx.index)
+    new_only = new_idx.index.difference(old_idx.index)
+
+    rows_updated = len(matching)
+    if rows_updated > 0:
+        # Cập nhật các dòng trùng: chỉ update các cột có trong file mới, giữ lại các cột cũ
+        old_idx.update(new_idx.loc[matching])
+    
+    # Lấy lại dữ liệu cũ đã được cập nhật (bao gồm cả các dòng không trùng)
+    df_old_u = old_idx.reset_index()
+    
+    # Lấy các dòng mới (chỉ những dòng không có trong file cũ)
+    df_new_only = new_idx.loc[new_only].reset_index()
+
+    # Đảm bảo tất cả các cột từ cả hai file đều có trong kết quả
+    # Lấy union của tất cả các cột (loại bỏ các cột phụ trợ tạm thời)
+    temp_cols = ['Ngay7_parsed', '_key']
+    all_columns = [c for c in df_old_u.columns if c not in temp_cols] + \
+                  [c for c in df_new_only.columns if c not in temp_cols and c not in df_old_u.columns]
+    
+    # Đảm bảo cả hai DataFrame có cùng các cột (thêm NaN cho cột thiếu)
+    for col in all_columns:
+        if col not in df_old_u.columns:
+            df_old_u[col] = None
+        if col not in df_new_only.columns:
+            df_new_only[col] = None
+    
+    # Sắp xếp lại cột theo thứ tự ban đầu của file cũ, sau đó thêm các cột mới
+    old_cols_order = [c for c in df_old.columns if c in all_columns]
+    new_cols = [c for c in all_columns if c not in old_cols_order]
+    final_cols_order = old_cols_order + new_cols
+    
+    # Chỉ lấy các cột cần thiết (loại bỏ cột phụ trợ)
+    df_old_u_clean = df_old_u[[c for c in all_columns if c in df_old_u.columns]]
+    df_new_only_clean = df_new_only[[c for c in all_columns if c in df_new_only.columns]]
+
+    # Hợp nhất, giữ thứ tự: cũ trước, mới thêm nối sau
+    df_merged = pd.concat([df_old_u_clean, df_new_only_clean], ignore_index=True, sort=False)
+
+    # Sắp xếp lại cột theo thứ tự đã định
+    df_merged = df_merged[final_cols_order]
+
+    # Làm sạch cột phụ trợ trước khi sắp xếp
+    for col in ['Ngay7_parsed', '_key']:
+        if col in df_merged.columns:
+            df_merged = df_merged.drop(columns=[col])
+
+    # Sắp xếp lại theo ngày (tăng dần) để đảm bảo thứ tự đúng
+    if 'Ngay7' in df_merged.columns:
+        # Chuyển đổi ngày về datetime để sắp xếp
+        df_merged['Ngay7_temp'] = pd.to_datetime(df_merged['Ngay7'], format='%d/%m/%Y', errors='coerce', dayfirst=True)
+        # Sắp xếp theo ngày tăng dần, sau đó theo CTKD7 nếu có
+        if 'CTKD7' in df_merged.columns:
+            df_merged = df_merged.sort_values(['Ngay7_temp', 'CTKD7'], na_position='last')
+        else:
+            df_merged = df_merged.sort_values('Ngay7_temp', na_position='last')
+        # Xóa cột tạm và reset index sau khi sắp xếp
+        df_merged = df_merged.drop(columns=['Ngay7_temp'])
+        df_merged = df_merged.reset_index(drop=True)
+
+    # Đánh lại STT nếu có cột liên quan (sau khi đã sắp xếp)
+    stt_candidates = [c for c in df_merged.columns if any(k in _normalize_text(c) for k in ['STT', 'SO THU TU', 'TEXTBOX164', 'TEXTBOX'])]
+    if stt_candidates:
+        stt_col = stt_candidates[0]
+        df_merged[stt_col] = range(1, len(df_merged) + 1)
+
+    # Chuẩn lại định dạng ngày (sau khi sắp xếp)
+    if 'Ngay7' in df_merged.columns:
+        df_merged['Ngay7'] = pd.to_datetime(df_merged['Ngay7'], errors='coerce', dayfirst=True).dt.strftime('%d/%m/%Y')
+
+    _atomic_write_csv(df_merged, old_path)
+    return {
+        "rows_old": len(df_old),
+        "rows_new": len(df_new),
+        "rows_added": len(df_new_only),
+        "rows_updated": rows_updated,
+        "total_rows": len(df_merged),
+    }
+
+
+def _min_max_dates(values: pd.Series) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+    """Ngày nhỏ nhất/lớn nhất của cột Ngay7 dạng chuỗi 'DD/MM/YYYY'."""
+    dates = pd.to_datetime(values, format='%d/%m/%Y', errors='coerce').dropna()
+    if len(dates) == 0:
+        return None, None
+    return dates.min(), dates.max()
+
+
+def default_load_workers() -> int:
+    """Số process đọc file từ biến môi trường KPI_LOAD_WORKERS (mặc định 1 = tuần tự)."""
+    value = os.environ.get(LOAD_WORKERS_ENV, '').strip().lower()
+    if value in ('auto', '0'):
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(value)) if value else 1
+    except ValueError:
+        return 1
+
+
+def _map_in_processes(fn: Callable, tasks: List[tuple], workers: int) -> List:
+    """
+    Chạy fn(*task) cho từng task, giữ thứ tự kết quả. workers <= 1 hoặc 1 task → chạy tuần tự
+    (tránh chi phí khởi động process cho trường hợp ít file).
+    """
+    workers = min(workers, len(tasks))
+    if workers <= 1:
+        return [fn(*task) for task in tasks]
+    # Mỗi process nhận nhiều file một lần để giảm chi phí IPC khi có hàng trăm file nhỏ
+    chunksize = max(1, len(tasks) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(fn, *zip(*tasks), chunksize=chunksize))
+
+
+def _read_file_task(path: str, encoding: str, start_date, end_date,
+                    provinces: Optional[List[str]], columns: Optional[List[str]],
+                    transform: Optional[Callable]) -> pd.DataFrame:
+    """Đọc (và làm sạch nếu có transform) một file CSV, dùng được trong process con."""
+    df = CSVBackend(path, encoding=encoding).read_raw(start_date, end_date, provinces, columns)
+    if transform is not None and len(df) > 0:
+        df = transform(df)
+    return df
+
+
+def _scan_file_task(path: str, encoding: str) -> Dict:
+    """Đọc cột Ngay7 (và header) của một file để ghi vào manifest."""
+    backend = CSVBackend(path, encoding=encoding or detect_encoding(path))
+    columns = backend.list_columns()
+    dates = backend.read_raw(columns=['Ngay7'])['Ngay7'] if 'Ngay7' in columns else pd.Series(dtype=str)
+    date_min, date_max = _min_max_dates(dates)
+    return {
+        'date_min': date_min.strftime('%Y-%m-%d') if date_min is not None else None,
+        'date_max': date_max.strftime('%Y-%m-%d') if date_max is not None else None,
+        'rows': int(len(dates)),
+        'columns': columns,
+        'encoding': backend.encoding,
+    }
+
+
+def _merge_keys(df: pd.DataFrame) -> pd.Series:
+    """Khóa gộp 'YYYY-MM-DD||TỈNH' (không phân biệt hoa/thường) như merge_into_current."""
+    dates = pd.to_datetime(df['Ngay7'], format='%d/%m/%Y', errors='coerce')
+    return dates.dt.strftime('%Y-%m-%d') + '||' + df['CTKD7'].astype(str).str.strip().str.upper()
+
+
+def _parse_filter_date(value) -> Optional[pd.Timestamp]:
+    """Parse ngày lọc ('DD/MM/YYYY', 'YYYY-MM-DD' hoặc datetime). None nếu không có."""
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        try:
+            return pd.to_datetime(value, format='%d/%m/%Y')
+        except ValueError:
+            return pd.to_datetime(value, format='%Y-%m-%d')
+    return pd.Timestamp(value)
+
+
+class DataBackend:
+    """Interface chung cho nơi lưu dữ liệu KPI ngày"""
+
+    def exists(self) -> bool:
+        raise NotImplementedError
+
+    def read_raw(self, start_date=None, end_date=None,
+                 provinces: Optional[List[str]] = None,
+                 columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Đọc dữ liệu thô (chưa làm sạch) cùng dạng với file CSV gốc: Ngay7 là chuỗi 'DD/MM/YYYY'
+
+        Args:
+            start_date, end_date: Khoảng ngày cần đọc (None = không giới hạn)
+            provinces: Danh sách tỉnh cần đọc (None = tất cả)
+            columns: Danh sách cột cần đọc (None = tất cả; Ngay7/CTKD7 luôn được giữ)
+        """
+        raise NotImplementedError
+
+    def list_columns(self) -> List[str]:
+        """Danh sách cột hiện có (không đọc dữ liệu)"""
+        raise NotImplementedError
+
+    def date_range(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        """(ngày nhỏ nhất, ngày lớn nhất) của dữ liệu, (None, None) nếu chưa có dữ liệu"""
+        raise NotImplementedError
+
+    def upsert(self, new_data: Union[str, pd.DataFrame]) -> Dict:
+        """Gộp dữ liệu mới (đường dẫn CSV hoặc DataFrame) theo khóa (Ngay7 + CTKD7). Trả về thống kê gộp."""
+        raise NotImplementedError
+
+    def version(self) -> str:
+        """Chuỗi phiên bản dữ liệu, thay đổi mỗi khi dữ liệu thay đổi"""
+        raise NotImplementedError
+
+
+class CSVBackend(DataBackend):
+    """Backend file CSV (1.Ngày.csv)"""
+
+    def __init__(self, path: str, encoding: str = None):
+        """
+        Args:
+            path: File CSV
+            encoding: Encoding của file (None = tự phát hiện bằng detect_encoding)
+        """
+        self.path = path
+        self.encoding = encoding
+
+    def __repr__(self):
+        return f"CSVBackend({self.path!r})"
+
+    def exists(self) -> bool:
+        return os.path.exists(self.path)
+
+    def read_raw(self, start_date=None, end_date=None,
+                 provinces: Optional[List[str]] = None,
+                 columns: Optional[List[str]] = None) -> pd.DataFrame:
+        usecols = None
+        if columns:
+            wanted = set(['Ngay7', 'CTKD7'] + list(columns))
+            usecols = lambda c: str(c).strip().lstrip('\ufeff') in wanted
+        df = read_csv_any(self.path, encoding=self.encoding, usecols=usecols)
+        # CSV không hỗ trợ đọc theo khoảng → lọc sau khi đọc
+        start_ts = _parse_filter_date(start_date)
+        end_ts = _parse_filter_date(end_date)
+        if start_ts is not None or end_ts is not None:
+            dates = pd.to_datetime(df['Ngay7'], format='%d/%m/%Y', errors='coerce')
+            mask = pd.Series(True, index=df.index)
+            if start_ts is not None:
+                mask &= dates >= start_ts
+            if end_ts is not None:
+                mask &= dates <= end_ts
+            df = df[mask]
+        if provinces:
+            df = df[df['CTKD7'].isin(provinces)]
+        return df
+
+    def list_columns(self) -> List[str]:
+        header = read_csv_any(self.path, encoding=self.encoding, nrows=0)
+        return [str(c).strip().lstrip('\ufeff') for c in header.columns]
+
+    def date_range(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        # Chỉ đọc cột ngày
+        dates = self.read_raw(columns=['Ngay7'])['Ngay7']
+        return _min_max_dates(dates)
+
+    def upsert(self, new_data: Union[str, pd.DataFrame]) -> Dict:
+        return merge_into_current(self.path, new_data)
+
+    def version(self) -> str:
+        return read_data_version(self.path)
+
+
+class SQLiteBackend(DataBackend):
+    """
+    Backend SQLite (WAL) cho dữ liệu KPI ngày
+
+    - Bảng kpi_daily: mỗi cột CSV là một cột SQLite (cột mới được thêm tự động khi gộp)
+    - Ngay7 lưu dạng 'YYYY-MM-DD' để truy vấn khoảng ngày dùng index
+    - Khóa chính (Ngay7, _ctkd7_key) với _ctkd7_key = CTKD7.strip().upper() tính bằng Python
+      (Unicode, ví dụ 'Đà Nẵng' ≡ 'ĐÀ NẴNG') → cùng quy tắc khóa với merge_into_current;
+      cột khóa không trả ra ngoài. DB tạo với schema cũ (COLLATE NOCASE) được chuyển đổi
+      một lần ở lần gộp đầu tiên
+    - Cột STT (Textbox164) không lưu: tên cột ghi trong meta, read_raw đánh lại 1..n ở cột đầu
+      theo thứ tự (ngày, tỉnh) giống merge_into_current → cùng schema với đường CSV
+    - WAL cho phép nhiều phiên Streamlit đọc trong khi một phiên đang gộp: tạo backend không
+      mở kết nối; đọc/version() dùng kết nối chỉ đọc (mode=ro) nên không chờ khóa ghi,
+      schema chỉ được tạo trong đường ghi (upsert)
+    """
+
+    TABLE = 'kpi_daily'
+    KEY_COL = '_ctkd7_key'
+
+    def __init__(self, db_path: str, timeout: float = 30.0):
+        self.db_path = db_path
+        self.timeout = timeout
+
+    def _ensure_schema(self, conn):
+        """Tạo bảng/index/meta nếu chưa có (chỉ gọi trong kết nối ghi)."""
+        conn.execute("PRAGMA journal_mode=WAL")
+        if self._has_schema(conn) and self.KEY_COL not in self._table_columns(conn, with_key=True):
+            self._migrate_key_column(conn)
+        conn.execute(
+            f'CREATE TABLE IF NOT EXISTS {self.TABLE} ('
+            f'"Ngay7" TEXT NOT NULL, "CTKD7" TEXT NOT NULL, "{self.KEY_COL}" TEXT NOT NULL, '
+            f'PRIMARY KEY ("Ngay7", "{self.KEY_COL}"))'
+        )
+        conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{self.TABLE}_ctkd7_ngay7 '
+                     f'ON {self.TABLE} ("CTKD7", "Ngay7")')
+        conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', '0')")
+
+    def _migrate_key_column(self, conn):
+        """Chuyển bảng schema cũ (khóa CTKD7 COLLATE NOCASE) sang khóa _ctkd7_key."""
+        conn.create_function('kpi_province_key', 1, lambda v: str(v).strip().upper())
+        info = list(conn.execute(f'PRAGMA table_info({self.TABLE})'))
+        extra = [(row[1], row[2]) for row in info if row[1] not in ('Ngay7', 'CTKD7')]
+        old = f'{self.TABLE}_nocase_old'
+        conn.execute(f'DROP INDEX IF EXISTS idx_{self.TABLE}_ctkd7_ngay7')
+        conn.execute(f'ALTER TABLE {self.TABLE} RENAME TO {old}')
+        conn.execute(
+            f'CREATE TABLE {self.TABLE} ('
+            f'"Ngay7" TEXT NOT NULL, "CTKD7" TEXT NOT NULL, "{self.KEY_COL}" TEXT NOT NULL, '
+            + ''.join(f'{self._quote(c)} {t}, ' for c, t in extra)
+            + f'PRIMARY KEY ("Ngay7", "{self.KEY_COL}"))'
+        )
+        names = ', '.join(self._quote(c) for c in ['Ngay7', 'CTKD7'] + [c for c, _ in extra])
+        # Các dòng trùng khóa mới (khác nhau ngoài ASCII) → giữ dòng ghi sau cùng
+        conn.execute(f'INSERT OR REPLACE INTO {self.TABLE} ({names}, "{self.KEY_COL}") '
+                     f'SELECT {names}, kpi_province_key("CTKD7") FROM {old} ORDER BY rowid')
+        conn.execute(f'DROP TABLE {old}')
+
+    def __repr__(self):
+        return f"SQLiteBackend({self.db_path!r})"
+
+    @contextmanager
+    def _connect(self, readonly: bool = False):
+        if readonly:
+            # Chỉ đọc: không tạo file, không lấy khóa ghi (WAL: đọc snapshot trong lúc gộp)
+            uri = f"file:{pathname2url(os.path.abspath(self.db_path))}?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, timeout=self.timeout)
+        else:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+        try:
+            conn.execute(f"PRAGMA busy_timeout = {int(self.timeout * 1000)}")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _quote(name: str) -> str:
+        return '"' + str(name).replace('"', '""') + '"'
+
+    def _table_columns(self, conn, with_key: bool = False) -> List[str]:
+        cols = [row[1] for row in conn.execute(f'PRAGMA table_info({self.TABLE})')]
+        return cols if with_key else [c for c in cols if c != self.KEY_COL]
+
+    @staticmethod
+    def _stt_column(conn) -> Optional[str]:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'stt_column'").fetchone()
+        return row[0] if row else None
+
+    def _has_schema(self, conn) -> bool:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                            (self.TABLE,)).fetchone() is not None
+
+    def exists(self) -> bool:
+        if not os.path.exists(self.db_path):
+            return False
+        with self._connect(readonly=True) as conn:
+            return (self._has_schema(conn)
+                    and conn.execute(f'SELECT 1 FROM {self.TABLE} LIMIT 1').fetchone() is not None)
+
+    def read_raw(self, start_date=None, end_date=None,
+                 provinces: Optional[List[str]] = None,
+                 columns: Optional[List[str]] = None) -> pd.DataFrame:
+        clauses = []
+        params = []
+        start_ts = _parse_filter_date(start_date)
+        end_ts = _parse_filter_date(end_date)
+        if start_ts is not None:
+            clauses.append('"Ngay7" >= ?')
+            params.append(start_ts.strftime('%Y-%m-%d'))
+        if end_ts is not None:
+            clauses.append('"Ngay7" <= ?')
+            params.append(end_ts.strftime('%Y-%m-%d'))
+        if provinces:
+            clauses.append('"CTKD7" IN (' + ', '.join('?' * len(provinces)) + ')')
+            params.extend(provinces)
+
+        empty = pd.DataFrame(columns=['Ngay7', 'CTKD7'] + [c for c in (columns or []) if c not in ('Ngay7', 'CTKD7')])
+        if not os.path.exists(self.db_path):
+            return empty
+        with self._connect(readonly=True) as conn:
+            if not self._has_schema(conn):
+                return empty
+            table_cols = self._table_columns(conn)
+            stt_col = self._stt_column(conn)
+            if columns:
+                wanted = ['Ngay7', 'CTKD7'] + [c for c in columns if c not in ('Ngay7', 'CTKD7')]
+                select_cols = [c for c in wanted if c in table_cols]
+            else:
+                select_cols = table_cols
+            query = (f'SELECT {", ".join(self._quote(c) for c in select_cols)} FROM {self.TABLE}'
+                     + (' WHERE ' + ' AND '.join(clauses) if clauses else '')
+                     + ' ORDER BY "Ngay7", "CTKD7"')
+            df = pd.read_sql_query(query, conn, params=params)
+
+        # Trả về cùng định dạng ngày với file CSV gốc
+        df['Ngay7'] = pd.to_datetime(df['Ngay7'], format='%Y-%m-%d', errors='coerce').dt.strftime('%d/%m/%Y')
+        # STT đánh lại trên các dòng trả về (đã sắp theo ngày, tỉnh) như merge_into_current
+        if stt_col and (not columns or stt_col in columns):
+            df.insert(0, stt_col, range(1, len(df) + 1))
+        return df
+
+    def list_columns(self) -> List[str]:
+        if not os.path.exists(self.db_path):
+            return []
+        with self._connect(readonly=True) as conn:
+            if not self._has_schema(conn):
+                return []
+            stt_col = self._stt_column(conn)
+            return ([stt_col] if stt_col else []) + self._table_columns(conn)
+
+    def date_range(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        if not os.path.exists(self.db_path):
+            return None, None
+        with self._connect(readonly=True) as conn:
+            if not self._has_schema(conn):
+                return None, None
+            lo, hi = conn.execute(f'SELECT MIN("Ngay7"), MAX("Ngay7") FROM {self.TABLE}').fetchone()
+        return (pd.Timestamp(lo) if lo else None, pd.Timestamp(hi) if hi else None)
+
+    def upsert(self, new_data: Union[str, pd.DataFrame]) -> Dict:
+        df_new = read_csv_any(new_data, low_memory=False) if isinstance(new_data, str) else new_data.copy()
+        df_new.columns = [str(c).strip().lstrip('\ufeff') for c in df_new.columns]
+        for col in ['Ngay7', 'CTKD7']:
+            if col not in df_new.columns:
+                raise ValueError(f"Thiếu cột bắt buộc '{col}' trong file cần gộp.")
+
+        # Chuẩn hóa khóa gộp giống merge_into_current
+        parsed = pd.to_datetime(df_new['Ngay7'], format='%d/%m/%Y', errors='coerce')
+        if parsed.isna().all():
+            parsed = pd.to_datetime(df_new['Ngay7'], dayfirst=True, errors='coerce')
+        df_new['Ngay7'] = parsed.dt.strftime('%Y-%m-%d')
+        df_new['CTKD7'] = df_new['CTKD7'].astype(str).str.strip()
+        df_new = df_new[parsed.notna()]
+        df_new = df_new.assign(**{self.KEY_COL: df_new['CTKD7'].str.upper()})
+        df_new = df_new.drop_duplicates(subset=['Ngay7', self.KEY_COL], keep='last')
+
+        # Cột STT không lưu, chỉ ghi tên cột để read_raw đánh lại
+        stt_cols = [c for c in df_new.columns
+                    if any(k in _normalize_text(c) for k in ['STT', 'SO THU TU', 'TEXTBOX164', 'TEXTBOX'])]
+        df_new = df_new.drop(columns=stt_cols)
+        cols = list(df_new.columns)
+        # Kiểu khai báo cho cột mới: số → REAL, còn lại (kể cả số có dấu phân cách nghìn) → TEXT
+        col_types = {c: 'REAL' if pd.api.types.is_numeric_dtype(df_new[c])
+                     and not pd.api.types.is_bool_dtype(df_new[c]) else 'TEXT' for c in cols}
+        # None thay cho NaN để COALESCE giữ giá trị cũ (giống DataFrame.update)
+        values = df_new.astype(object).where(df_new.notna(), None).itertuples(index=False, name=None)
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            self._ensure_schema(conn)
+            existing_cols = self._table_columns(conn, with_key=True)
+            for col in cols:
+                if col not in existing_cols:
+                    conn.execute(f'ALTER TABLE {self.TABLE} ADD COLUMN {self._quote(col)} {col_types[col]}')
+            if stt_cols:
+                conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('stt_column', ?)", (stt_cols[0],))
+            rows_old = conn.execute(f'SELECT COUNT(*) FROM {self.TABLE}').fetchone()[0]
+
+            quoted = [self._quote(c) for c in cols]
+            updates = [f'{q} = COALESCE(excluded.{q}, {q})' for c, q in zip(cols, quoted)
+                       if c not in ('Ngay7', self.KEY_COL)]
+            sql = (f'INSERT INTO {self.TABLE} ({", ".join(quoted)}) '
+                   f'VALUES ({", ".join("?" * len(cols))}) '
+                   f'ON CONFLICT("Ngay7", "{self.KEY_COL}") DO '
+                   + (f'UPDATE SET {", ".join(updates)}' if updates else 'NOTHING'))
+            conn.executemany(sql, values)
+
+            total_rows = conn.execute(f'SELECT COUNT(*) FROM {self.TABLE}').fetchone()[0]
+            conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'version'")
+
+        rows_added = total_rows - rows_old
+        return {
+            "rows_old": rows_old,
+            "rows_new": len(df_new),
+            "rows_added": rows_added,
+            "rows_updated": len(df_new) - rows_added,
+            "total_rows": total_rows,
+        }
+
+    def version(self) -> str:
+        if not os.path.exists(self.db_path):
+            return "sqlite-0"
+        with self._connect(readonly=True) as conn:
+            has_meta = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'meta'").fetchone()
+            row = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone() if has_meta else None
+        return f"sqlite-{row[0] if row else 0}"
+
+
+class MultiFileBackend(DataBackend):
+    """
+    Backend nhiều file CSV (thư mục hoặc glob các file export ngày/tháng)
+
+    - Manifest (.kpi_manifest.json trong thư mục) lưu khoảng ngày, số dòng, cột của từng file,
+      chỉ quét lại file mới hoặc đã thay đổi (so mtime + kích thước)
+    - read_raw(start_date, end_date) chỉ đọc các file có khoảng ngày giao với khoảng yêu cầu
+    - Trùng khóa (Ngay7 + CTKD7) giữa các file: file sửa đổi sau được ưu tiên, giá trị rỗng
+      không ghi đè giá trị cũ (giống merge_into_current)
+    - upsert = chép file mới vào thư mục (không ghi lại các file cũ), đặt lại tên theo glob nếu
+      tên gốc không khớp để file mới được đọc
+    - workers > 1: các file được đọc (và làm sạch) song song trong nhiều process
+    """
+
+    MANIFEST_NAME = '.kpi_manifest.json'
+
+    def __init__(self, pattern: str, encoding: str = None, workers: int = None):
+        """
+        Args:
+            pattern: Thư mục (đọc mọi *.csv bên trong) hoặc glob, ví dụ 'data/1.Ngày*.csv'
+            encoding: Encoding của các file CSV (None = phát hiện từng file, lưu trong manifest)
+            workers: Số process đọc file song song (None = KPI_LOAD_WORKERS, mặc định 1)
+        """
+        self.pattern = pattern
+        self.encoding = encoding
+        self.workers = workers or default_load_workers()
+        if os.path.isdir(pattern):
+            self.base_dir = pattern
+            self.glob_pattern = os.path.join(pattern, '*.csv')
+        else:
+            self.base_dir = os.path.dirname(pattern) or '.'
+            self.glob_pattern = pattern
+        self.manifest_path = os.path.join(self.base_dir, self.MANIFEST_NAME)
+        self._manifest: Dict[str, Dict] = {}
+
+    def __repr__(self):
+        return f"MultiFileBackend({self.pattern!r})"
+
+    def files(self) -> List[str]:
+        """Các file CSV dữ liệu (bỏ file tạm/ẩn và file khóa của Excel)."""
+        return sorted(
+            f for f in glob.glob(self.glob_pattern)
+            if os.path.isfile(f) and not os.path.basename(f).startswith(('.', '~$'))
+        )
+
+    def exists(self) -> bool:
+        return bool(self.files())
+
+    # ==== Manifest ====
+
+    def _load_manifest_file(self) -> Dict[str, Dict]:
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                return json.load(f).get('files', {})
+        except (OSError, ValueError):
+            return {}
+
+    def manifest(self) -> Dict[str, Dict]:
+        """
+        Manifest hiện tại {tên file: {date_min, date_max, rows, columns, size, mtime_ns}}.
+        Chỉ quét lại file mới/đã đổi, ghi lại manifest nếu có thay đổi.
+        """
+        if not self._manifest:
+            self._manifest = self._load_manifest_file()
+        current, stale = {}, {}
+        for path in self.files():
+            name = os.path.relpath(path, self.base_dir)
+            st = os.stat(path)
+            entry = self._manifest.get(name)
+            if entry is None or entry.get('size') != st.st_size or entry.get('mtime_ns') != st.st_mtime_ns:
+                stale[name] = (path, st)
+            else:
+                current[name] = entry
+        if stale:
+            # Lần đầu với cả tháng backfill → quét song song
+            scanned = _map_in_processes(_scan_file_task, [(path, self.encoding) for path, _ in stale.values()],
+                                        self.workers)
+            for (name, (_, st)), entry in zip(stale.items(), scanned):
+                current[name] = dict(entry, size=st.st_size, mtime_ns=st.st_mtime_ns)
+        if stale or set(current) != set(self._manifest):
+            self._manifest = current
+            self._save_manifest()
+        return current
+
+    def _save_manifest(self):
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix='.tmp_', suffix='.json', dir=self.base_dir)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump({'updated_at': datetime.now().isoformat(timespec='seconds'),
+                           'files': self._manifest}, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.manifest_path)
+        except OSError:
+            pass  # Thư mục chỉ đọc → vẫn dùng manifest trong bộ nhớ
+
+    def select_files(self, start_date=None, end_date=None) -> List[str]:
+        """Các file có khoảng ngày giao với [start_date, end_date], theo thứ tự ưu tiên tăng dần."""
+        start_ts = _parse_filter_date(start_date)
+        end_ts = _parse_filter_date(end_date)
+        selected = []
+        for name, entry in self.manifest().items():
+            if entry['date_min'] is None:
+                continue
+            if start_ts is not None and pd.Timestamp(entry['date_max']) < start_ts:
+                continue
+            if end_ts is not None and pd.Timestamp(entry['date_min']) > end_ts:
+                continue
+            selected.append((entry['mtime_ns'], name))
+        return [os.path.join(self.base_dir, name) for _, name in sorted(selected)]
+
+    # ==== Đọc ====
+
+    def read_raw(self, start_date=None, end_date=None,
+                 provinces: Optional[List[str]] = None,
+                 columns: Optional[List[str]] = None) -> pd.DataFrame:
+        frames = self.read_frames(start_date, end_date, provinces, columns)
+        return self.combine_frames(frames, columns)
+
+    def read_frames(self, start_date=None, end_date=None,
+                    provinces: Optional[List[str]] = None,
+                    columns: Optional[List[str]] = None,
+                    transform: Optional[Callable] = None,
+                    workers: int = None) -> List[pd.DataFrame]:
+        """
+        Đọc từng file liên quan thành một DataFrame riêng (theo thứ tự ưu tiên tăng dần)
+
+        Args:
+            transform: Hàm áp dụng cho từng file ngay trong process đọc (ví dụ làm sạch → trả về
+                       frame đã có kiểu số/ngày, nhỏ hơn nhiều so với chuỗi khi truyền về).
+                       Phải là hàm cấp module (pickle được) khi workers > 1.
+            workers: Số process (None = self.workers)
+        """
+        files = self.select_files(start_date, end_date)
+        encodings = {name: entry.get('encoding') for name, entry in self._manifest.items()}
+        tasks = [(path, self.encoding or encodings.get(os.path.relpath(path, self.base_dir)),
+                  start_date, end_date, provinces, columns, transform) for path in files]
+        frames = _map_in_processes(_read_file_task, tasks, workers or self.workers)
+        return [f for f in frames if len(f) > 0]
+
+    @classmethod
+    def combine_frames(cls, frames: List[pd.DataFrame], columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """Nối các frame của read_frames (thô hoặc đã làm sạch) và gộp các dòng trùng khóa."""
+        if not frames:
+            return pd.DataFrame(columns=['Ngay7', 'CTKD7'] + [c for c in (columns or []) if c not in ('Ngay7', 'CTKD7')])
+        if len(frames) == 1:
+            return frames[0].reset_index(drop=True)
+        df = pd.concat(frames, ignore_index=True, sort=False)
+        return cls._combine_duplicates(df)
+
+    @staticmethod
+    def _combine_duplicates(df: pd.DataFrame) -> pd.DataFrame:
+        """Gộp các dòng trùng khóa: giá trị không rỗng của file sau ghi đè file trước.
+        Dùng được cho cả frame thô (Ngay7 là chuỗi) và frame đã làm sạch (Ngay7 là datetime)."""
+        key = _merge_keys(df)
+        dup = key.duplicated(keep=False) & key.notna()
+        if dup.any():
+            # groupby().last() lấy giá trị không rỗng cuối cùng của từng cột (= DataFrame.update)
+            combined = df[dup].groupby(key[dup], sort=False).last()
+            df = pd.concat([df[~dup], combined.reset_index(drop=True)], ignore_index=True, sort=False)
+        dates = pd.to_datetime(df['Ngay7'], format='%d/%m/%Y', errors='coerce')
+        order = pd.DataFrame({'d': dates, 'p': df['CTKD7'].astype(str)}).sort_values(['d', 'p'], kind='stable').index
+        return df.loc[order].reset_index(drop=True)
+
+    def list_columns(self) -> List[str]:
+        columns = []
+        for entry in self.manifest().values():
+            columns.extend(c for c in entry['columns'] if c not in columns)
+        return columns
+
+    def date_range(self) -> Tuple[Optional[pd.Timestamp], Optional[pd.Timestamp]]:
+        entries = [e for e in self.manifest().values() if e['date_min'] is not None]
+        if not entries:
+            return None, None
+        return (pd.Timestamp(min(e['date_min'] for e in entries)),
+                pd.Timestamp(max(e['date_max'] for e in entries)))
+
+    # ==== Ghi ====
+
+    def upsert(self, new_data: Union[str, pd.DataFrame]) -> Dict:
+        # DataFrame (ví dụ daemon đã đọc sẵn file inbox) → ghi thành file mới đặt tên theo glob
+        source = new_data if isinstance(new_data, str) else None
+        df_new = read_csv_any(new_data, low_memory=False) if source else new_data.copy()
+        df_new.columns = [str(c).strip().lstrip('\ufeff') for c in df_new.columns]
+        for col in ['Ngay7', 'CTKD7']:
+            if col not in df_new.columns:
+                raise ValueError(f"Thiếu cột bắt buộc '{col}' trong file cần gộp.")
+        os.makedirs(self.base_dir, exist_ok=True)
+        with file_lock(self.manifest_path):
+            # Chỉ đọc khóa của các file cũ có khoảng ngày giao với file mới
+            new_min, new_max = _min_max_dates(df_new['Ngay7'])
+            rows_old = sum(e['rows'] for e in self.manifest().values())
+            old_keys = self.read_raw(new_min, new_max, columns=['Ngay7'])
+            new_keys = set(_merge_keys(df_new))
+            rows_updated = len(new_keys & set(_merge_keys(old_keys))) if len(old_keys) else 0
+
+            dest = self._upsert_dest(source)
+            if source is None or os.path.abspath(dest) != os.path.abspath(source):
+                # Ghi file tạm rồi os.replace → người đọc không thấy file ghi dở
+                _atomic_write_csv(df_new, dest)
+            self.manifest()
+        rows_added = len(new_keys) - rows_updated
+        return {
+            "rows_old": rows_old,
+            "rows_new": len(df_new),
+            "rows_added": rows_added,
+            "rows_updated": rows_updated,
+            "total_rows": rows_old + rows_added,
+        }
+
+    def _is_data_file_name(self, name: str) -> bool:
+        """Tên file có được files() nhận không (khớp glob, không phải file ẩn/file khóa Excel)."""
+        return (fnmatch.fnmatch(name, os.path.basename(self.glob_pattern))
+                and not name.startswith(('.', '~$')))
+
+    def _upsert_dest(self, source: Optional[str]) -> str:
+        """
+        Đường dẫn file đích cho upsert trong thư mục dữ liệu
+
+        Giữ tên file nếu khớp glob; nếu không (kpi_upload_*.csv của app, file inbox của daemon...)
+        đặt tên = phần cố định trước ký tự đại diện đầu tiên + thời điểm gộp + phần cố định sau
+        ký tự đại diện cuối cùng (ví dụ '1.Ngày*.csv' → '1.Ngày_20250101_083000_000000.csv'),
+        để files()/version()/date_range() thấy file mới.
+
+        Raises:
+            ValueError: Không dựng được tên khớp glob (ví dụ glob dạng '1.Ngày_??.csv')
+        """
+        pattern = os.path.basename(self.glob_pattern)
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        name = os.path.basename(source) if source else ''
+        if not self._is_data_file_name(name):
+            first = min(i for i, ch in enumerate(pattern + '*') if ch in '*?[')
+            last = max(pattern.rfind('*'), pattern.rfind('?'), pattern.rfind(']'))
+            prefix = pattern[:first]
+            name = f"{prefix}{'_' if prefix else ''}{stamp}{pattern[last + 1:]}"
+        dest = os.path.join(self.base_dir, name)
+        if os.path.exists(dest) and (source is None or os.path.abspath(dest) != os.path.abspath(source)):
+            stem, ext = os.path.splitext(name)
+            dest = os.path.join(self.base_dir, f"{stem}_{stamp}{ext}")
+        if not self._is_data_file_name(os.path.basename(dest)):
+            raise ValueError(f"Không đặt được tên file khớp '{self.glob_pattern}' cho {source or 'dữ liệu mới'} - "
+                             f"đổi tên file hoặc dùng thư mục/glob dạng 'data/1.Ngày*.csv'")
+        return dest
+
+    def version(self) -> str:
+        # Chỉ stat các file, không đọc nội dung
+        signature = hashlib.sha1()
+        files = self.files()
+        for path in files:
+            st = os.stat(path)
+            signature.update(f"{os.path.basename(path)}|{st.st_size}|{st.st_mtime_ns};".encode('utf-8'))
+        return f"multi-{len(files)}-{signature.hexdigest()[:12]}"
+
+
+def get_backend(path: str) -> DataBackend:
+    """
+    Chọn backend theo đường dẫn:
+    - .db/.sqlite/.sqlite3 → SQLite
+    - thư mục hoặc glob (có * ? [) → nhiều file CSV
+    - còn lại → một file CSV
+    """
+    if str(path).lower().endswith(('.db', '.sqlite', '.sqlite3')):
+        return SQLiteBackend(path)
+    if os.path.isdir(path) or any(ch in str(path) for ch in '*?['):
+        return MultiFileBackend(path)
+    return CSVBackend(path)
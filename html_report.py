@@ -0,0 +1,302 @@
+"""
+HTML REPORT - BÁO CÁO NGÀY MỘT FILE HTML
+========================================
+Gom kết quả một lần chạy pipeline vào một file HTML tự chứa (không CSS/JS/ảnh bên ngoài,
+mở được khi không có mạng, gửi kèm email/chat thay cho việc mở app Streamlit):
+- Tổng quan dữ liệu + số cảnh báo theo mức độ
+- Bảng theo KPI (số cảnh báo, tỉnh suy giảm mạnh nhất)
+- Danh sách suy giảm, mỗi dòng kèm sparkline SVG của tỉnh × KPI
+- Ma trận tỉnh × KPI: sparkline + % thay đổi tô màu cùng dải màu với heatmap PNG
+- Tỉnh cần dữ liệu huyện, thời gian từng bước (nếu truyền vào)
+
+Mọi thứ lấy từ kết quả trong bộ nhớ (detector.df, bảng báo cáo, compute_change_matrix) -
+không đọc lại CSV trong reports/, PNG trong charts/ hay alerts/alerts.json. Sparkline là
+polyline SVG inline (vài trăm byte mỗi ô) thay vì ảnh PNG nhúng base64, nên cả ma trận
+63 tỉnh × 5 KPI chỉ khoảng 200 KB.
+
+Sử dụng:
+    from html_report import write_html_report
+
+    report_df = detector.generate_decline_report(detector.alerts_frame)
+    path = write_html_report(detector, report_df)   # reports/daily_report_YYYYMMDD.html
+"""
+
+import html
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+from matplotlib import colormaps
+from matplotlib.colors import to_hex
+
+from report_export import SEVERITY_FILLS, report_summary
+from visualization_module import heatmap_bounds
+from web_chart import pivot_wide
+
+SPARK_DAYS = 30              # Số ngày gần nhất vẽ trong sparkline
+SPARK_SIZE = (120, 28)       # Kích thước sparkline (px, rộng × cao)
+_SPARK_PAD = 2.5             # Lề trong sparkline để điểm cuối không bị cắt
+_NO_DATA_COLOR = '#d9d9d9'   # Ô không đủ dữ liệu (giống heatmap PNG)
+_ALERT_DOT = '#d32f2f'
+_OK_DOT = '#2c7fb8'
+
+_CSS = """
+body{font-family:Segoe UI,Roboto,Arial,sans-serif;margin:24px;color:#1a1a1a;background:#fff}
+h1{font-size:22px;margin:0 0 4px}h2{font-size:17px;margin:28px 0 8px;border-bottom:1px solid #ddd;padding-bottom:4px}
+.meta{color:#555;font-size:13px}
+.cards{display:flex;gap:10px;flex-wrap:wrap;margin-top:14px}
+.card{padding:10px 16px;border-radius:6px;min-width:120px;border:1px solid #ccc}
+.card b{display:block;font-size:22px}
+table{border-collapse:collapse;font-size:13px}
+th,td{border:1px solid #ddd;padding:3px 8px;text-align:left;vertical-align:middle}
+th{background:#f3f3f3;position:sticky;top:0}
+td.num{text-align:right;font-variant-numeric:tabular-nums}
+.spark polyline{fill:none;stroke:#555;stroke-width:1.2}
+.mx td{padding:2px 4px;white-space:nowrap}
+.mx td.alert{outline:2px solid #000;outline-offset:-2px}
+.chg{display:inline-block;min-width:46px;padding:1px 4px;border-radius:3px;text-align:right;font-size:12px;vertical-align:top}
+.note{color:#777;font-size:12px;margin-top:24px}
+"""
+
+
+def _esc(value) -> str:
+    return html.escape('' if value is None else str(value))
+
+
+def _fmt(value, fmt: str = '{:,.2f}') -> str:
+    return fmt.format(value) if value is not None and pd.notna(value) else '–'
+
+
+def sparkline_points(wide: pd.DataFrame, start: pd.Timestamp, days: int,
+                     size=SPARK_SIZE) -> Dict[str, str]:
+    """
+    Chuỗi toạ độ polyline SVG cho từng cột (tỉnh) của bảng rộng ngày × tỉnh
+
+    Trục X chung cho mọi sparkline (start → start + days) để các ô so sánh được theo thời gian;
+    trục Y co giãn theo min/max riêng từng tỉnh. Tính một lượt bằng numpy cho cả bảng.
+
+    Returns:
+        Dict tỉnh → 'x,y x,y ...' (điểm cuối cùng đứng cuối chuỗi); tỉnh không có điểm nào bị bỏ
+    """
+    if wide is None or wide.empty:
+        return {}
+    width, height = size
+    values = wide.to_numpy(dtype=float)
+    offsets = (wide.index - start) / pd.Timedelta(days=1)
+    xs = _SPARK_PAD + np.asarray(offsets, dtype=float) / max(days, 1) * (width - 2 * _SPARK_PAD)
+    with np.errstate(invalid='ignore'):
+        finite = np.isfinite(values)
+        lo = np.where(finite, values, np.inf).min(axis=0)
+        hi = np.where(finite, values, -np.inf).max(axis=0)
+        span_ = np.where(hi > lo, hi - lo, 1.0)
+        # Đường phẳng (hi == lo) nằm giữa ô
+        ys = np.where(hi > lo, height - _SPARK_PAD - (values - lo) / span_ * (height - 2 * _SPARK_PAD),
+                      height / 2.0)
+    points = {}
+    for j, column in enumerate(wide.columns):
+        valid = finite[:, j]
+        if not valid.any():
+            continue
+        points[column] = ' '.join(f'{x:.1f},{y:.1f}' for x, y in zip(xs[valid], ys[valid, j]))
+    return points
+
+
+def sparkline_svg(points: str, title: str = None, dot_color: str = _OK_DOT, size=SPARK_SIZE) -> str:
+    """SVG inline của một sparkline (nét vẽ lấy từ CSS .spark, chấm tròn ở điểm mới nhất)"""
+    if not points:
+        return ''
+    width, height = size
+    last_x, last_y = points.rsplit(' ', 1)[-1].split(',')
+    tooltip = f'<title>{_esc(title)}</title>' if title else ''
+    return (f'<svg class="spark" width="{width}" height="{height}" viewBox="0 0 {width} {height}">'
+            f'{tooltip}<polyline points="{points}"/>'
+            f'<circle cx="{last_x}" cy="{last_y}" r="2.2" fill="{dot_color}"/></svg>')
+
+
+def change_colors(values: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Màu nền cho % thay đổi (theo hướng KPI, âm = xấu đi): cùng dải màu RdYlGn và biên
+    heatmap_bounds với heatmap PNG; NaN → xám
+    """
+    bounds = heatmap_bounds(threshold)
+    n_bins = len(bounds) - 1
+    palette = np.array([to_hex(c) for c in colormaps['RdYlGn'].resampled(n_bins)(np.arange(n_bins))])
+    values = np.asarray(values, dtype=float)
+    bins = np.clip(np.searchsorted(bounds, np.nan_to_num(values), side='right') - 1, 0, n_bins - 1)
+    return np.where(np.isfinite(values), palette[bins], _NO_DATA_COLOR)
+
+
+def _spark_wides(df: pd.DataFrame, kpis: Sequence[str], days: int):
+    """Bảng rộng ngày × tỉnh của các KPI trong `days` ngày gần nhất (lọc ngày trước khi pivot)"""
+    latest = df['Ngay7'].max()
+    start = latest - timedelta(days=days)
+    recent = df[df['Ngay7'] >= start]
+    return {kpi: pivot_wide(recent, kpi) for kpi in kpis if kpi in df.columns}, start
+
+
+def _table(headers: Sequence[str], rows: List[str], css_class: str = '') -> str:
+    head = ''.join(f'<th>{_esc(h)}</th>' for h in headers)
+    cls = f' class="{css_class}"' if css_class else ''
+    return f'<table{cls}><thead><tr>{head}</tr></thead><tbody>{"".join(rows)}</tbody></table>'
+
+
+def render_html_report(detector, report_df: Optional[pd.DataFrame] = None, kpis: Sequence[str] = None,
+                       provinces_needing: List[Dict] = None, perf: pd.DataFrame = None,
+                       spark_days: int = SPARK_DAYS, title: str = None) -> str:
+    """
+    Dựng chuỗi HTML báo cáo ngày từ kết quả trong bộ nhớ
+
+    Args:
+        detector: KPIDeclineDetector đã load dữ liệu (df, config)
+        report_df: Kết quả generate_decline_report (None = không có suy giảm)
+        kpis: KPI trong ma trận tỉnh × KPI (None = critical_kpis)
+        provinces_needing: Kết quả get_provinces_needing_district_data (None = bỏ mục này)
+        perf: PerfRecorder.summary() các bước đã chạy (None = bỏ mục này)
+        spark_days: Số ngày gần nhất trong sparkline
+        title: Tiêu đề (mặc định "Báo cáo KPI ngày DD/MM/YYYY" theo ngày mới nhất của dữ liệu)
+
+    Returns:
+        Chuỗi HTML hoàn chỉnh
+    """
+    config = detector.config
+    df = detector.df
+    kpis = [k for k in (kpis or config['critical_kpis']) if k in df.columns]
+    latest = df['Ngay7'].max()
+    title = title or f"Báo cáo KPI ngày {latest.strftime('%d/%m/%Y')}"
+    summary = report_summary(report_df)
+    has_rows = report_df is not None and len(report_df) > 0
+
+    report_kpis = list(pd.unique(report_df['KPI'])) if has_rows else []
+    wides, start = _spark_wides(df, list(dict.fromkeys(kpis + report_kpis)), spark_days)
+    points = {kpi: sparkline_points(wide, start, spark_days) for kpi, wide in wides.items()}
+
+    parts = [
+        '<!DOCTYPE html><html lang="vi"><head><meta charset="utf-8">',
+        '<meta name="viewport" content="width=device-width,initial-scale=1">',
+        f'<title>{_esc(title)}</title><style>{_CSS}</style></head><body>',
+        f'<h1>{_esc(title)}</h1>',
+        f'<div class="meta">Dữ liệu {df["Ngay7"].min().strftime("%d/%m/%Y")} – {latest.strftime("%d/%m/%Y")}'
+        f' · {df["CTKD7"].nunique()} tỉnh · {len(df):,} dòng'
+        f' · so sánh {config["days_lookback"]} ngày, ngưỡng {config["decline_threshold"]}%'
+        f' · tạo lúc {datetime.now().strftime("%d/%m/%Y %H:%M")}</div>',
+    ]
+
+    # Số cảnh báo theo mức độ
+    cards = [f'<div class="card"><b>{summary["n_alerts"]}</b>cảnh báo</div>']
+    cards += [f'<div class="card" style="background:{SEVERITY_FILLS.get(label, "#fff")}">'
+              f'<b>{count}</b>{_esc(label)}</div>'
+              for label, count in summary['by_severity'].items()]
+    parts.append(f'<div class="cards">{"".join(cards)}</div>')
+
+    if has_rows:
+        parts.append('<h2>Theo KPI</h2>')
+        rows = [f'<tr><td>{_esc(item["kpi"])}</td><td class="num">{item["n_alerts"]}</td>'
+                f'<td>{_esc(item["worst_province"])}</td>'
+                f'<td class="num">{_fmt(item["worst_decline_pct"], "{:+.2f}%")}</td></tr>'
+                for item in summary['by_kpi']]
+        parts.append(_table(['KPI', 'Số cảnh báo', 'Tỉnh suy giảm mạnh nhất', 'Suy giảm'], rows))
+
+        parts.append(f'<h2>Danh sách suy giảm ({len(report_df)})</h2>')
+        rows = []
+        for kpi, province, date, current, previous, pct, severity in zip(
+                report_df['KPI'], report_df['Tỉnh'], report_df['Ngày'], report_df['Giá trị hiện tại'],
+                report_df['Giá trị trước'], report_df['Suy giảm (%)'], report_df['Mức độ']):
+            spark = sparkline_svg(points.get(kpi, {}).get(province), f'{province} · {kpi} · {spark_days} ngày',
+                                  dot_color=_ALERT_DOT)
+            rows.append(f'<tr style="background:{SEVERITY_FILLS.get(severity, "#fff")}">'
+                        f'<td>{_esc(kpi)}</td><td>{_esc(province)}</td><td>{_esc(date)}</td>'
+                        f'<td class="num">{_fmt(current)}</td><td class="num">{_fmt(previous)}</td>'
+                        f'<td class="num">{_fmt(pct, "{:+.2f}")}</td><td>{_esc(severity)}</td><td>{spark}</td></tr>')
+        parts.append(_table(['KPI', 'Tỉnh', 'Ngày', 'Giá trị hiện tại', 'Giá trị trước', 'Suy giảm (%)',
+                             'Mức độ', f'{spark_days} ngày gần nhất'], rows))
+    else:
+        parts.append('<h2>Danh sách suy giảm</h2><p>✅ Không phát hiện suy giảm nào.</p>')
+
+    if kpis:
+        parts.append(_matrix_section(detector, kpis, points, spark_days))
+
+    if provinces_needing:
+        parts.append(f'<h2>Tỉnh cần dữ liệu huyện ({len(provinces_needing)})</h2>')
+        rows = [f'<tr><td>{_esc(item["province"])}</td><td>{_esc(item["kpi"])}</td>'
+                f'<td class="num">{_fmt(item["decline_pct"], "{:+.2f}%")}</td>'
+                f'<td>{_esc(item.get("severity"))}</td></tr>' for item in provinces_needing]
+        parts.append(_table(['Tỉnh', 'KPI', 'Suy giảm', 'Mức độ'], rows))
+
+    if perf is not None and len(perf):
+        steps = perf[perf['depth'] == 0]
+        parts.append('<h2>Thời gian từng bước</h2>')
+        rows = [f'<tr><td>{_esc(name)}</td><td class="num">{wall * 1000:,.1f} ms</td>'
+                f'<td class="num">{_fmt(n_rows, "{:,.0f}")}</td></tr>'
+                for name, wall, n_rows in zip(steps['name'], steps['wall_s'], steps['rows'])]
+        parts.append(_table(['Bước', 'Thời gian', 'Số dòng'], rows))
+
+    parts.append('<p class="note">File tự chứa, không cần mạng. Sparkline: trục ngày chung '
+                 f'{spark_days} ngày gần nhất, trục giá trị co giãn theo từng ô; chấm = giá trị mới nhất.</p>')
+    parts.append('</body></html>')
+    return '\n'.join(parts)
+
+
+def _matrix_section(detector, kpis: Sequence[str], points: Dict[str, Dict[str, str]], spark_days: int) -> str:
+    """Ma trận tỉnh × KPI: sparkline + % thay đổi tô màu, viền đen = có cảnh báo, ✕ = vi phạm ngưỡng"""
+    matrix = detector.compute_change_matrix(kpis)
+    signed = matrix['signed_change_pct']
+    if signed.empty:
+        return ''
+    # Tỉnh xấu nhất (thay đổi âm nhất trên mọi KPI) lên đầu, giống heatmap PNG
+    order = signed.min(axis=1).sort_values(na_position='last', kind='stable').index
+    signed = signed.loc[order]
+    values = signed.to_numpy(dtype=float)
+    colors = change_colors(values, detector.config['decline_threshold'])
+    alert = matrix['alert'].loc[order].to_numpy(dtype=bool)
+    breached = matrix['limit_breached'].loc[order].to_numpy(dtype=bool)
+    latest = matrix['latest_value'].loc[order].to_numpy(dtype=float)
+    compare = matrix['compare_value'].loc[order].to_numpy(dtype=float)
+
+    rows = []
+    for i, province in enumerate(signed.index):
+        cells = [f'<td>{_esc(province)}</td>']
+        for j, kpi in enumerate(signed.columns):
+            v = values[i, j]
+            text_color = '#fff' if np.isfinite(v) and abs(v) >= 10 else '#1a1a1a'
+            label = f'{v:+.1f}%' if np.isfinite(v) else '–'
+            tip = f'{province} · {kpi}: {_fmt(latest[i, j])} (trước {_fmt(compare[i, j])}, {label})'
+            spark = sparkline_svg(points.get(kpi, {}).get(province), tip,
+                                  dot_color=_ALERT_DOT if alert[i, j] else _OK_DOT)
+            mark = ' ✕' if breached[i, j] else ''
+            cls = ' class="alert"' if alert[i, j] else ''
+            cells.append(f'<td{cls}>{spark}<span class="chg" style="background:{colors[i, j]};'
+                         f'color:{text_color}">{label}{mark}</span></td>')
+        rows.append(f'<tr>{"".join(cells)}</tr>')
+
+    return (f'<h2>Ma trận tỉnh × KPI ({len(signed)} tỉnh, {spark_days} ngày gần nhất)</h2>'
+            '<div class="meta">% thay đổi theo hướng KPI (âm = xấu đi), cùng dải màu heatmap; '
+            'viền đen = có cảnh báo, ✕ = vi phạm ngưỡng</div>'
+            + _table(['Tỉnh'] + list(signed.columns), rows, css_class='mx'))
+
+
+def write_html_report(detector, report_df: Optional[pd.DataFrame] = None, out_dir: str = None,
+                      filename: str = None, **kwargs) -> str:
+    """
+    Ghi báo cáo HTML ra file (mặc định <output_dir>/daily_report_YYYYMMDD.html, ghi đè file cùng ngày)
+
+    Args:
+        detector, report_df, **kwargs: Như render_html_report
+        out_dir: Thư mục đích (None = detector.config['output_dir'])
+        filename: Tên file (None = daily_report_YYYYMMDD.html)
+
+    Returns:
+        Đường dẫn file đã ghi
+    """
+    out_dir = out_dir or detector.config['output_dir']
+    filename = filename or f"daily_report_{datetime.now().strftime('%Y%m%d')}.html"
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, filename)
+    content = render_html_report(detector, report_df, **kwargs)
+    # Ghi file tạm rồi đổi tên: người đang mở link không thấy file ghi dở
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,282 @@
+"""
+INSTRUMENTATION - ĐO THỜI GIAN / BỘ NHỚ THEO TỪNG BƯỚC
+======================================================
+Ghi lại wall time, CPU time, bộ nhớ (RSS, tracemalloc nếu bật) và số dòng cho
+từng bước (span) của pipeline để biết bước nào làm chậm lần chạy buổi sáng.
+
+Sử dụng:
+    from instrumentation import start_recording, span, traced
+
+    recorder = start_recording('pipeline')
+    with span('load') as s:
+        df = detector.load_and_clean_data()
+        s.set(rows=len(df))
+    recorder.print_summary()
+    recorder.save_json()
+
+- Khi không có recorder nào đang chạy, span()/traced() gần như không tốn chi phí.
+- tracemalloc làm chậm đáng kể nên chỉ bật khi track_memory=True
+  hoặc biến môi trường KPI_TRACE_MEMORY=1.
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+try:
+    import psutil
+    HAS_PSUTIL = True
+except ImportError:
+    HAS_PSUTIL = False
+
+try:
+    import resource
+    HAS_RESOURCE = True
+except ImportError:  # Windows
+    HAS_RESOURCE = False
+
+DEFAULT_PERF_DIR = os.path.join('reports', 'perf')
+
+_active_recorder: ContextVar[Optional['PerfRecorder']] = ContextVar('kpi_perf_recorder', default=None)
+
+
+def _rss_mb() -> Optional[float]:
+    """RSS hiện tại của process (MB), None nếu không đo được."""
+    if HAS_PSUTIL:
+        return psutil.Process().memory_info().rss / 1e6
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1e6
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """RSS lớn nhất từ khi process khởi động (MB)."""
+    if HAS_RESOURCE:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux trả về KB, macOS trả về byte
+        return peak / 1e6 if sys.platform == 'darwin' else peak / 1e3
+    if HAS_PSUTIL:
+        info = psutil.Process().memory_info()
+        peak = getattr(info, 'peak_wset', None)
+        return peak / 1e6 if peak else None
+    return None
+
+
+class Span:
+    """Một bước được đo. Dùng như context manager hoặc gọi start()/stop() thủ công."""
+
+    def __init__(self, recorder: Optional['PerfRecorder'], name: str, rows: int = None, **meta):
+        self.recorder = recorder
+        self.name = name
+        self.meta = meta
+        self.rows = int(rows) if rows is not None else None
+        self._peak_seen = 0
+
+    def set(self, rows: int = None, **meta) -> 'Span':
+        """Gắn số dòng đã xử lý và metadata bổ sung."""
+        if rows is not None:
+            self.rows = int(rows)
+        self.meta.update(meta)
+        return self
+
+    def start(self) -> 'Span':
+        if self.recorder is not None:
+            self.recorder._begin(self)
+        return self
+
+    def stop(self, rows: int = None, **meta) -> Optional[Dict]:
+        self.set(rows, **meta)
+        if self.recorder is not None:
+            return self.recorder._end(self)
+        return None
+
+    def __enter__(self) -> 'Span':
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.meta['error'] = exc_type.__name__
+        self.stop()
+        return False
+
+
+class PerfRecorder:
+    """Thu thập các span của một lần chạy."""
+
+    def __init__(self, name: str = 'pipeline', track_memory: bool = None):
+        self.name = name
+        if track_memory is None:
+            track_memory = os.environ.get('KPI_TRACE_MEMORY') == '1'
+        self.track_memory = track_memory
+        self.started_at = datetime.now()
+        self.records: List[Dict] = []
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()  # stack span đang mở theo từng thread
+        self._started_tracemalloc = False
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+
+    def span(self, name: str, rows: int = None, **meta) -> Span:
+        return Span(self, name, rows=rows, **meta)
+
+    def _get_stack(self) -> List[Span]:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _begin(self, s: Span):
+        stack = self._get_stack()
+        s._parent = stack[-1].name if stack else None
+        s._depth = len(stack)
+        stack.append(s)
+        if self.track_memory and tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            # Đẩy peak hiện tại cho các span cha trước khi reset
+            for parent in stack:
+                parent._peak_seen = max(parent._peak_seen, peak)
+            tracemalloc.reset_peak()
+            s._mem_start = current
+            s._peak_seen = current
+        s._wall0 = time.perf_counter()
+        s._cpu0 = time.process_time()
+
+    def _end(self, s: Span) -> Dict:
+        wall = time.perf_counter() - s._wall0
+        cpu = time.process_time() - s._cpu0
+        stack = self._get_stack()
+        if s in stack:
+            stack.remove(s)
+        record = {
+            'name': s.name,
+            'parent': s._parent,
+            'depth': s._depth,
+            'start_s': round(s._wall0 - self._t0, 6),
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'rows': s.rows,
+            'rss_mb': _round(_rss_mb()),
+            'peak_rss_mb': _round(_peak_rss_mb()),
+            'py_peak_mb': None,
+            'meta': {k: _jsonable(v) for k, v in s.meta.items()},
+        }
+        if self.track_memory and tracemalloc.is_tracing() and hasattr(s, '_mem_start'):
+            _, peak = tracemalloc.get_traced_memory()
+            s._peak_seen = max(s._peak_seen, peak)
+            record['py_peak_mb'] = _round((s._peak_seen - s._mem_start) / 1e6)
+            for parent in stack:
+                parent._peak_seen = max(parent._peak_seen, s._peak_seen)
+        with self._lock:
+            self.records.append(record)
+        return record
+
+    def stop(self):
+        """Dừng tracemalloc nếu recorder đã bật nó."""
+        if self._started_tracemalloc and tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def summary(self) -> pd.DataFrame:
+        """Bảng các span theo thứ tự bắt đầu."""
+        columns = ['name', 'parent', 'depth', 'start_s', 'wall_s', 'cpu_s', 'rows',
+                   'rss_mb', 'peak_rss_mb', 'py_peak_mb']
+        if not self.records:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame(self.records)[columns].sort_values('start_s').reset_index(drop=True)
+
+    def to_dict(self) -> Dict:
+        return {
+            'name': self.name,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'total_wall_s': round(time.perf_counter() - self._t0, 6),
+            'track_memory': self.track_memory,
+            'spans': sorted(self.records, key=lambda r: r['start_s']),
+        }
+
+    def save_json(self, path: str = None) -> str:
+        """Ghi kết quả ra JSON (mặc định reports/perf/perf_<name>_<thời gian>.json)."""
+        if path is None:
+            stamp = self.started_at.strftime('%Y%m%d_%H%M%S')
+            path = os.path.join(DEFAULT_PERF_DIR, f'perf_{self.name}_{stamp}.json')
+        out_dir = os.path.dirname(path)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+    def print_summary(self):
+        """In bảng thời gian theo từng bước (thụt lề theo cấp span)."""
+        print("\n" + "="*60)
+        print(f"⏱️  THỜI GIAN THEO BƯỚC ({self.name})")
+        print("="*60)
+        for rec in self.summary().to_dict('records'):
+            label = '  ' * int(rec['depth']) + str(rec['name'])
+            rows = f"{int(rec['rows']):>9,} dòng" if pd.notna(rec['rows']) else ' ' * 14
+            mem = f"  py+{rec['py_peak_mb']:.1f}MB" if pd.notna(rec['py_peak_mb']) else ''
+            print(f"   {label:<38} {rec['wall_s'] * 1000:9.1f} ms  cpu {rec['cpu_s'] * 1000:9.1f} ms  {rows}{mem}")
+
+
+def _round(value: Optional[float], ndigits: int = 2) -> Optional[float]:
+    return round(value, ndigits) if value is not None else None
+
+
+def _jsonable(value):
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    return str(value)
+
+
+def start_recording(name: str = 'pipeline', track_memory: bool = None) -> PerfRecorder:
+    """Tạo recorder mới và đặt làm recorder đang hoạt động (theo context/thread hiện tại)."""
+    recorder = PerfRecorder(name, track_memory=track_memory)
+    _active_recorder.set(recorder)
+    return recorder
+
+
+def stop_recording() -> Optional[PerfRecorder]:
+    """Bỏ recorder đang hoạt động và trả về nó."""
+    recorder = _active_recorder.get()
+    if recorder is not None:
+        recorder.stop()
+    _active_recorder.set(None)
+    return recorder
+
+
+def active_recorder() -> Optional[PerfRecorder]:
+    return _active_recorder.get()
+
+
+def span(name: str, rows: int = None, **meta) -> Span:
+    """Span gắn với recorder đang hoạt động (không làm gì nếu chưa start_recording)."""
+    return Span(_active_recorder.get(), name, rows=rows, **meta)
+
+
+def traced(name: str = None) -> Callable:
+    """Decorator đo toàn bộ thời gian của một hàm/method."""
+    def decorator(fn: Callable) -> Callable:
+        span_name = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            recorder = _active_recorder.get()
+            if recorder is None:
+                return fn(*args, **kwargs)
+            with recorder.span(span_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
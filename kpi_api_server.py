@@ -0,0 +1,514 @@
+"""
+KPI API SERVER - API HTTP/JSON CỤC BỘ TRUY VẤN DỮ LIỆU KPI
+==========================================================
+Giữ MỘT KPIDeclineDetector đã load trong bộ nhớ và phục vụ nhiều client cùng lúc
+(asyncio, chỉ dùng thư viện chuẩn) mà không đọc lại CSV cho mỗi request:
+
+    GET /health                                   trạng thái server
+    GET /version                                  phiên bản dữ liệu, số dòng, khoảng ngày
+    GET /provinces                                danh sách tỉnh
+    GET /kpis                                     danh sách cột KPI
+    GET /series?kpi=CSSR&province=Ninh thuan&start=2025-10-01&end=2025-10-31
+    GET /alerts?kpi=CSSR,CDR&province=...&lookback=7
+    GET /report                                   báo cáo suy giảm các KPI quan trọng
+
+- Thêm format=arrow vào /series, /alerts, /report để nhận Arrow IPC stream (cần pyarrow)
+- Response được cache theo (phiên bản dữ liệu, đường dẫn, tham số); khi dữ liệu gốc
+  thay đổi (merge từ app.py / daemon / kpi_monitor) server tự load lại và bỏ cache cũ
+- ETag = phiên bản dữ liệu → client gửi If-None-Match để nhận 304 khi dữ liệu chưa đổi
+
+Sử dụng:
+    python kpi_api_server.py --file 1.Ngày.csv --port 8765
+    python kpi_monitor.py serve --port 8765
+    curl "http://127.0.0.1:8765/alerts?kpi=CSSR&province=Ninh thuan"
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+import pandas as pd
+
+from data_backend import DATA_FILE_PATH, get_backend
+from kpi_decline_detection_pipeline import ALERT_COLUMNS, CONFIG, KPIDeclineDetector
+
+try:
+    import pyarrow as pa
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+MAX_HEADER_BYTES = 16 * 1024
+KEEP_ALIVE_TIMEOUT = 15.0
+ARROW_CONTENT_TYPE = 'application/vnd.apache.arrow.stream'
+JSON_CONTENT_TYPE = 'application/json; charset=utf-8'
+NON_KPI_COLUMNS = ('Ngay7', 'CTKD7', 'Textbox164', 'STT')
+
+HTTP_REASONS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+                405: 'Method Not Allowed', 413: 'Payload Too Large', 500: 'Internal Server Error',
+                503: 'Service Unavailable'}
+
+
+class APIError(Exception):
+    """Lỗi trả về cho client (kèm HTTP status)"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _parse_date(value: Optional[str]) -> Optional[pd.Timestamp]:
+    """Nhận 'YYYY-MM-DD' hoặc 'DD/MM/YYYY'."""
+    if not value:
+        return None
+    fmt = '%d/%m/%Y' if '/' in value else '%Y-%m-%d'
+    try:
+        return pd.to_datetime(value, format=fmt)
+    except ValueError as e:
+        raise APIError(400, f"Ngày không hợp lệ: {value}") from e
+
+
+def _json_default(value):
+    if isinstance(value, (pd.Timestamp, datetime)):
+        return value.strftime('%Y-%m-%d')
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return None if np.isnan(value) else float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    return str(value)
+
+
+def _records(df: pd.DataFrame) -> List[Dict]:
+    """DataFrame → list dict cho JSON (ngày dạng YYYY-MM-DD, NaN → null)."""
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d')
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _arrow_bytes(df: pd.DataFrame) -> bytes:
+    if not HAS_PYARROW:
+        raise APIError(400, "format=arrow cần pyarrow (pip install pyarrow)")
+    # Gộp chunk (cột chuỗi nối từ nhiều KPI) → một record batch, stream gọn hơn
+    table = pa.Table.from_pandas(df, preserve_index=False).combine_chunks()
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+class KPIQueryService:
+    """
+    Truy vấn trên dữ liệu đã load trong bộ nhớ (không phụ thuộc HTTP)
+
+    Không thread-safe: server gọi tất cả truy vấn trên một worker thread duy nhất.
+    """
+
+    def __init__(self, file_path: str = DATA_FILE_PATH, config: Dict = None,
+                 detector: KPIDeclineDetector = None, version_check_interval: float = 2.0,
+                 cache_size: int = 256, quiet: bool = True):
+        """
+        Args:
+            file_path: Dữ liệu gốc (CSV hoặc SQLite .db)
+            config: Cấu hình detector (None = CONFIG)
+            detector: Detector đã load sẵn dữ liệu (None = tự load)
+            version_check_interval: Khoảng tối thiểu giữa hai lần kiểm tra phiên bản dữ liệu (giây)
+            cache_size: Số response tối đa giữ trong cache (LRU)
+            quiet: Ẩn log chi tiết của pipeline
+        """
+        self.file_path = file_path
+        self.backend = get_backend(file_path)
+        self.detector = detector or KPIDeclineDetector(file_path, config=config or CONFIG)
+        self.config = self.detector.config
+        self.version_check_interval = version_check_interval
+        self.cache_size = cache_size
+        self.quiet = quiet
+        self.data_version = 'unloaded' if self.detector.df is None else self.backend.version()
+        self.loaded_at = None if self.detector.df is None else datetime.now()
+        self._last_check = 0.0
+        self._cache: 'OrderedDict[Tuple, Tuple[bytes, str]]' = OrderedDict()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'reloads': 0}
+
+    @contextlib.contextmanager
+    def _pipeline_output(self):
+        if not self.quiet:
+            yield
+            return
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            yield
+
+    # ==== Phiên bản dữ liệu / cache ====
+
+    def refresh(self, force: bool = False) -> str:
+        """Load lại nếu dữ liệu gốc đã đổi phiên bản. Trả về phiên bản hiện tại."""
+        now = time.monotonic()
+        if not force and self.detector.df is not None and now - self._last_check < self.version_check_interval:
+            return self.data_version
+        self._last_check = now
+        if not self.backend.exists():
+            raise APIError(503, f"Không tìm thấy dữ liệu: {self.file_path}")
+        version = self.backend.version()
+        if force or self.detector.df is None or version != self.data_version:
+            with self._pipeline_output():
+                self.detector.load_and_clean_data()
+            # Đọc lại phiên bản sau khi load để không bỏ sót lần ghi xen giữa
+            self.data_version = self.backend.version()
+            self.loaded_at = datetime.now()
+            self._cache.clear()
+            self.stats['reloads'] += 1
+        return self.data_version
+
+    def cached(self, key: Tuple) -> Optional[Tuple[bytes, str]]:
+        hit = self._cache.get((self.data_version,) + key)
+        if hit is not None:
+            self._cache.move_to_end((self.data_version,) + key)
+            self.stats['cache_hits'] += 1
+        return hit
+
+    def store(self, key: Tuple, body: bytes, content_type: str):
+        self._cache[(self.data_version,) + key] = (body, content_type)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # ==== Truy vấn ====
+
+    @property
+    def df(self) -> pd.DataFrame:
+        return self.detector.df
+
+    def provinces(self) -> List[str]:
+        return sorted(str(p) for p in self.df['CTKD7'].dropna().unique())
+
+    def kpis(self) -> List[str]:
+        return [c for c in self.df.columns if c not in NON_KPI_COLUMNS]
+
+    def match_kpi(self, name: str) -> str:
+        from analyze_any_province_kpi import fuzzy_match_kpi
+        matched, _ = fuzzy_match_kpi(name, self.kpis())
+        if matched is None:
+            raise APIError(404, f"Không tìm thấy KPI '{name}'")
+        return matched
+
+    def match_province(self, name: str) -> str:
+        """Khớp tên tỉnh: đúng (không phân biệt hoa/thường) rồi đến chứa chuỗi, như analyze_province_kpi."""
+        provinces = self.provinces()
+        lower = name.strip().lower()
+        for p in provinces:
+            if p.lower() == lower:
+                return p
+        for p in provinces:
+            if lower in p.lower() or p.lower() in lower:
+                return p
+        raise APIError(404, f"Không tìm thấy tỉnh '{name}'")
+
+    def info(self) -> Dict:
+        df = self.df
+        return {
+            'file': self.file_path,
+            'version': self.data_version,
+            'loaded_at': self.loaded_at.isoformat(timespec='seconds') if self.loaded_at else None,
+            'rows': int(len(df)),
+            'provinces': int(df['CTKD7'].nunique()),
+            'date_min': df['Ngay7'].min(),
+            'date_max': df['Ngay7'].max(),
+        }
+
+    def series(self, kpi: str, provinces: Optional[List[str]] = None,
+               start: Optional[pd.Timestamp] = None, end: Optional[pd.Timestamp] = None) -> pd.DataFrame:
+        """Chuỗi giá trị KPI theo ngày (dạng dài: Ngay7, CTKD7, <kpi>)."""
+        kpi = self.match_kpi(kpi)
+        df = self.df
+        mask = pd.Series(True, index=df.index)
+        if provinces:
+            mask &= df['CTKD7'].isin([self.match_province(p) for p in provinces])
+        if start is not None:
+            mask &= df['Ngay7'] >= start
+        if end is not None:
+            mask &= df['Ngay7'] <= end
+        out = df.loc[mask, ['Ngay7', 'CTKD7', kpi]]
+        return out.sort_values(['CTKD7', 'Ngay7'], kind='stable').reset_index(drop=True)
+
+    def alerts(self, kpis: Optional[List[str]] = None, provinces: Optional[List[str]] = None,
+               lookback_days: int = None) -> pd.DataFrame:
+        """Cảnh báo suy giảm hiện tại (mặc định: các KPI quan trọng, tất cả tỉnh)."""
+        if kpis:
+            kpis = [self.match_kpi(k) for k in kpis]
+        else:
+            kpis = [k for k in self.config['critical_kpis'] if k in self.df.columns]
+        if provinces:
+            provinces = [self.match_province(p) for p in provinces]
+        with self._pipeline_output():
+            frames = [self.detector.detect_declines_frame(kpi, lookback_days=lookback_days, provinces=provinces)
+                      for kpi in kpis]
+        frames = [f for f in frames if len(f)]
+        if not frames:
+            return pd.DataFrame(columns=ALERT_COLUMNS)
+        alerts = pd.concat(frames, ignore_index=True)
+        # KPI có/không có ngưỡng trộn số và None → cột số (NaN = không có ngưỡng) như trước
+        alerts['limit'] = pd.to_numeric(alerts['limit'])
+        return alerts
+
+    def report(self) -> pd.DataFrame:
+        """Báo cáo suy giảm giống generate_decline_report (không ghi file)."""
+        alerts = self.alerts()
+        with self._pipeline_output():
+            report_df = self.detector.generate_decline_report(alerts)
+        if report_df is None:
+            return pd.DataFrame(columns=['KPI', 'Tỉnh', 'Ngày', 'Giá trị hiện tại', 'Giá trị trước',
+                                         'Suy giảm (%)', 'Mức độ'])
+        return report_df.reset_index(drop=True)
+
+
+def _param_list(params: Dict[str, List[str]], name: str) -> Optional[List[str]]:
+    values = [v.strip() for raw in params.get(name, []) for v in raw.split(',') if v.strip()]
+    return values or None
+
+
+def _param(params: Dict[str, List[str]], name: str) -> Optional[str]:
+    values = params.get(name)
+    return values[-1].strip() if values else None
+
+
+class KPIAPIServer:
+    """HTTP server asyncio tối giản (GET/HEAD, keep-alive) trên KPIQueryService"""
+
+    def __init__(self, service: KPIQueryService, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+                 access_log: bool = True):
+        self.service = service
+        self.host = host
+        self.port = port
+        self.access_log = access_log
+        # Một worker thread: pandas + detector không thread-safe, event loop vẫn rảnh
+        # để nhận kết nối và trả response đã cache
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='kpi-api')
+        # Request giống nhau đang tính → các client sau chờ cùng một kết quả
+        self._inflight: Dict[Tuple, asyncio.Future] = {}
+        self._server = None
+        self.routes = {
+            '/health': self._health,
+            '/version': self._version,
+            '/provinces': self._provinces,
+            '/kpis': self._kpis,
+            '/series': self._series,
+            '/alerts': self._alerts,
+            '/report': self._report,
+        }
+
+    # ==== Endpoint (chạy trên worker thread) ====
+
+    def _health(self, params) -> Dict:
+        return {'status': 'ok', 'version': self.service.data_version, **self.service.stats,
+                'cache_entries': len(self.service._cache)}
+
+    def _version(self, params) -> Dict:
+        return self.service.info()
+
+    def _provinces(self, params) -> Dict:
+        return {'provinces': self.service.provinces()}
+
+    def _kpis(self, params) -> Dict:
+        return {'kpis': self.service.kpis()}
+
+    def _series(self, params):
+        kpi = _param(params, 'kpi')
+        if not kpi:
+            raise APIError(400, "Thiếu tham số kpi")
+        return self.service.series(kpi, _param_list(params, 'province'),
+                                   _parse_date(_param(params, 'start')), _parse_date(_param(params, 'end')))
+
+    def _alerts(self, params):
+        lookback = _param(params, 'lookback')
+        try:
+            lookback = int(lookback) if lookback else None
+        except ValueError as e:
+            raise APIError(400, f"lookback không hợp lệ: {lookback}") from e
+        return self.service.alerts(_param_list(params, 'kpi'), _param_list(params, 'province'), lookback)
+
+    def _report(self, params):
+        return self.service.report()
+
+    def handle(self, path: str, params: Dict[str, List[str]]) -> Tuple[bytes, str]:
+        """Tính (hoặc lấy từ cache) body + content type cho một request."""
+        service = self.service
+        service.stats['requests'] += 1
+        handler = self.routes.get(path)
+        if handler is None:
+            raise APIError(404, f"Không có endpoint {path}")
+        if path == '/health':
+            body = json.dumps(handler(params), ensure_ascii=False, default=_json_default)
+            return body.encode('utf-8'), JSON_CONTENT_TYPE
+        service.refresh()
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        hit = service.cached(key)
+        if hit is not None:
+            return hit
+        result = handler(params)
+        if isinstance(result, pd.DataFrame):
+            if _param(params, 'format') == 'arrow':
+                body, content_type = _arrow_bytes(result), ARROW_CONTENT_TYPE
+            else:
+                payload = {'version': service.data_version, 'count': len(result), 'data': _records(result)}
+                body = json.dumps(payload, ensure_ascii=False, default=_json_default).encode('utf-8')
+                content_type = JSON_CONTENT_TYPE
+        else:
+            body = json.dumps(result, ensure_ascii=False, default=_json_default).encode('utf-8')
+            content_type = JSON_CONTENT_TYPE
+        service.store(key, body, content_type)
+        return body, content_type
+
+    # ==== HTTP ====
+
+    async def _dispatch(self, path: str, params: Dict[str, List[str]]) -> Tuple[bytes, str]:
+        key = (path, tuple(sorted((k, tuple(v)) for k, v in params.items())))
+        pending = self._inflight.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, self.handle, path, params)
+        self._inflight[key] = future
+        try:
+            return await asyncio.shield(future)
+        finally:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    async def _write(self, writer: asyncio.StreamWriter, status: int, body: bytes,
+                     content_type: str = JSON_CONTENT_TYPE, keep_alive: bool = True,
+                     head: bool = False):
+        headers = [
+            f"HTTP/1.1 {status} {HTTP_REASONS.get(status, 'OK')}",
+            f"Content-Type: {content_type}",
+            f"Content-Length: {len(body)}",
+            f'ETag: "{self.service.data_version}"',
+            "Cache-Control: no-cache",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        writer.write(('\r\n'.join(headers) + '\r\n\r\n').encode('latin-1'))
+        if not head and status != 304:
+            writer.write(body)
+        await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    raw = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, 413, b'{"error": "header too large"}', keep_alive=False)
+                    return
+                lines = raw.decode('latin-1').split('\r\n')
+                try:
+                    method, target, protocol = lines[0].split(' ', 2)
+                except ValueError:
+                    await self._write(writer, 400, b'{"error": "bad request line"}', keep_alive=False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    if ':' in line:
+                        name, value = line.split(':', 1)
+                        headers[name.strip().lower()] = value.strip()
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection != 'close' and (protocol == 'HTTP/1.1' or connection == 'keep-alive')
+
+                started = time.perf_counter()
+                status, body, content_type = await self._respond(method, target, headers)
+                await self._write(writer, status, body, content_type, keep_alive, head=(method == 'HEAD'))
+                if self.access_log:
+                    print(f"{datetime.now().strftime('%H:%M:%S')} {method} {target} {status} "
+                          f"{len(body)}B {(time.perf_counter() - started) * 1000:.1f}ms", file=sys.stderr)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+            with contextlib.suppress(Exception):
+                await writer.wait_closed()
+
+    async def _respond(self, method: str, target: str, headers: Dict[str, str]) -> Tuple[int, bytes, str]:
+        if method not in ('GET', 'HEAD'):
+            return 405, b'{"error": "method not allowed"}', JSON_CONTENT_TYPE
+        url = urlsplit(target)
+        params = parse_qs(url.query, keep_blank_values=False)
+        path = url.path.rstrip('/') or '/'
+        try:
+            body, content_type = await self._dispatch(path, params)
+        except APIError as e:
+            body = json.dumps({'error': e.message}, ensure_ascii=False).encode('utf-8')
+            return e.status, body, JSON_CONTENT_TYPE
+        except Exception as e:
+            body = json.dumps({'error': f"{type(e).__name__}: {e}"}, ensure_ascii=False).encode('utf-8')
+            return 500, body, JSON_CONTENT_TYPE
+        if path != '/health' and headers.get('if-none-match', '').strip('"') == self.service.data_version:
+            return 304, b'', content_type
+        return 200, body, content_type
+
+    async def start(self):
+        """Load dữ liệu (một lần) rồi mở cổng."""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.service.refresh, True)
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port,
+                                                  limit=MAX_HEADER_BYTES)
+        sock = self._server.sockets[0].getsockname()
+        self.port = sock[1]
+        print(f"🌐 KPI API: http://{self.host}:{self.port}  (dữ liệu {self.service.file_path}, "
+              f"phiên bản {self.service.data_version})")
+        return self._server
+
+    async def serve_forever(self):
+        server = await self.start()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._executor.shutdown(wait=False)
+
+
+def serve(file_path: str = DATA_FILE_PATH, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT,
+          config: Dict = None, detector: KPIDeclineDetector = None, quiet: bool = True,
+          access_log: bool = True):
+    """Chạy server đến khi Ctrl+C."""
+    service = KPIQueryService(file_path, config=config, detector=detector, quiet=quiet)
+    server = KPIAPIServer(service, host=host, port=port, access_log=access_log)
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    print("\n🛑 Đã dừng KPI API")
+
+
+def build_arg_parser(parser: argparse.ArgumentParser = None) -> argparse.ArgumentParser:
+    parser = parser or argparse.ArgumentParser(description='API HTTP/JSON cục bộ truy vấn dữ liệu KPI')
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help='Địa chỉ lắng nghe (mặc định chỉ máy local; 0.0.0.0 để mở cho mạng nội bộ)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Cổng (0 = tự chọn)')
+    parser.add_argument('--no-access-log', action='store_true', help='Không in log từng request')
+    return parser
+
+
+def main():
+    parser = build_arg_parser()
+    parser.add_argument('--file', default=os.environ.get('KPI_SQLITE_DB') or DATA_FILE_PATH,
+                        help='Dữ liệu gốc (CSV hoặc SQLite .db)')
+    args = parser.parse_args()
+    serve(args.file, host=args.host, port=args.port, access_log=not args.no_access_log)
+
+
+if __name__ == "__main__":
+    main()
@@ -8,31 +8,67 @@ Workflow:
 4. Tạo báo cáo và alert
 """
 
+import functools
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
 from typing import Dict, List, Tuple, Optional
 import warnings
 warnings.filterwarnings('ignore')
 
-# Optional imports
-try:
-    import seaborn as sns
-    HAS_SEABORN = True
-except ImportError:
-    HAS_SEABORN = False
-    print("⚠️  seaborn không được cài đặt. Một số tính năng visualization có thể bị hạn chế.")
-
 # Import các module hỗ trợ
+# matplotlib/seaborn/visualization_module chỉ được import khi thực sự vẽ chart
+# (xem _get_visualization_class) để lệnh phát hiện/tra cứu khởi động nhanh
 try:
-    from visualization_module import KPIVisualization
     from alert_system import AlertSystem
 except ImportError:
     print("⚠️  Các module hỗ trợ chưa được import. Chạy file này trong cùng thư mục.")
-    KPIVisualization = None
     AlertSystem = None
 
+try:
+    from snapshot_store import KPISnapshotStore
+except ImportError:
+    KPISnapshotStore = None
+
+from data_backend import DataBackend, MultiFileBackend, get_backend
+from instrumentation import span, start_recording, stop_recording, traced
+
+def _get_visualization_class():
+    """Import KPIVisualization (kéo theo matplotlib/seaborn/mplcursors) ở lần vẽ chart đầu tiên."""
+    try:
+        from visualization_module import KPIVisualization
+    except ImportError as e:
+        print(f"⚠️  Visualization module không khả dụng: {e}")
+        return None
+    return KPIVisualization
+
+
+def _clean_numeric_series(series: pd.Series) -> pd.Series:
+    """Làm sạch cột số: xử lý dấu phẩy, dấu ngoặc kép"""
+    series = series.astype(str)
+    series = series.str.replace('"', '', regex=False)
+    series = series.str.replace(',', '', regex=False)
+    return pd.to_numeric(series, errors='coerce')
+
+
+def _clean_raw_frame(df: pd.DataFrame, numeric_cols: List[str]) -> pd.DataFrame:
+    """
+    Làm sạch dữ liệu thô: parse ngày, chuẩn hóa cột số, bỏ dòng không có tỉnh.
+    Hàm cấp module để chạy được trong process con khi đọc nhiều file song song.
+    """
+    # Parse ngày
+    df['Ngay7'] = pd.to_datetime(df['Ngay7'], format='%d/%m/%Y', errors='coerce')
+    
+    # Làm sạch các cột số
+    for col in numeric_cols:
+        if col in df.columns:
+            df[col] = _clean_numeric_series(df[col])
+    
+    # Lọc bỏ dòng không có tỉnh
+    return df[df['CTKD7'].notna()].copy()
+
+
 # Cấu hình
 CONFIG = {
     'decline_threshold': 2.0,  # % suy giảm để trigger alert
@@ -40,6 +76,10 @@ CONFIG = {
     'critical_kpis': ['MTCL_2024', 'CSSR', 'CDR', 'ERAB_SR_2022', 'HOSR_4G_2024'],  # KPI quan trọng
     'output_dir': 'reports',
     'charts_dir': 'charts',
+    'snapshot_db': 'reports/kpi_snapshots.db',  # Kho snapshot aggregate theo ngày (SQLite)
+    'snapshot_overlap_days': 7,  # Mỗi lần chạy ghi lại N ngày cuối đã có trong snapshot (dữ liệu export lại)
+    'chart_bundle': True,  # Vẽ sẵn bộ biểu đồ cho dashboard sau mỗi lần chạy main()
+    'bundle_max_province_charts': 10,  # Tổng số ảnh xu hướng (KPI, tỉnh) vẽ sẵn, nặng nhất trước (0 = không vẽ)
     # Quy tắc theo KPI: hướng tốt/xấu và ngưỡng mục tiêu
     # ví dụ theo file PDF: CDR <= 0.35% (tức là giá trị nhỏ hơn thì tốt)
     'kpi_rules': {
@@ -66,16 +106,47 @@ CONFIG = {
     }
 }
 
+# Cột của bảng alert dạng cột (detect_declines_frame); detect_declines trả từng dòng dạng dict
+ALERT_COLUMNS = ['province', 'kpi', 'latest_date', 'latest_value', 'compare_value', 'decline_pct',
+                 'severity', 'days_lookback', 'limit', 'limit_breached', 'direction']
+# Mức độ theo % suy giảm (âm): dưới ngưỡng đầu tiên khớp, không khớp ngưỡng nào = 'Nhẹ'
+SEVERITY_LEVELS = [(-10, 'Cực kỳ nghiêm trọng'), (-5, 'Nghiêm trọng'), (-2, 'Cảnh báo')]
+SEVERITY_DEFAULT = 'Nhẹ'
+
 
 class KPIDeclineDetector:
     """Class chính để phát hiện suy giảm KPI"""
     
-    def __init__(self, file_path: str, config: Dict = None):
+    def __init__(self, file_path: str, config: Dict = None, backend: DataBackend = None):
+        """
+        Args:
+            file_path: Đường dẫn dữ liệu (file CSV hoặc file SQLite .db/.sqlite)
+            config: Cấu hình (None = CONFIG)
+            backend: Backend lưu trữ (None = tự chọn theo đuôi file_path; không có file_path
+                     thì không có backend - chỉ dùng được với df gán sẵn, xem from_dataframe)
+        """
         self.file_path = file_path
+        self.backend = backend or (get_backend(file_path) if file_path is not None else None)
         self.config = config or CONFIG
         self.df = None
         self.province_trends = {}
         self.decline_alerts = []
+        self.alerts_frame = None
+        
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame, file_path: str = None, config: Dict = None):
+        """
+        Tạo detector từ DataFrame đã làm sạch sẵn (không đọc lại dữ liệu)
+
+        Args:
+            df: DataFrame đã qua load_and_clean_data (Ngay7 là datetime)
+            file_path: Đường dẫn dữ liệu gốc (để tạo lại backend nếu cần; None = không có backend,
+                       load_and_clean_data không dùng được)
+            config: Cấu hình (None = CONFIG)
+        """
+        detector = cls(file_path, config=config)
+        detector.df = df
+        return detector
         
     def _get_kpi_rule(self, kpi_column: str) -> Optional[Dict]:
         """Tìm rule theo tên KPI (không phân biệt hoa/thường, bỏ khoảng trắng/ký tự lạ)."""
@@ -114,24 +185,53 @@ class KPIDeclineDetector:
             return value > limit
         return value < limit
 
-    def load_and_clean_data(self):
-        """Đọc và làm sạch dữ liệu"""
+    @traced('load_and_clean_data')
+    def load_and_clean_data(self, start_date: str = None, end_date: str = None,
+                            provinces: List[str] = None, last_days: int = None,
+                            workers: int = None):
+        """
+        Đọc và làm sạch dữ liệu
+
+        Args:
+            start_date, end_date: Chỉ đọc khoảng ngày này (None = toàn bộ). Với SQLite
+                                  backend đây là truy vấn có tham số dùng index, với thư mục
+                                  nhiều file chỉ các file giao với khoảng ngày được đọc.
+            provinces: Chỉ đọc các tỉnh này (None = tất cả)
+            last_days: Chỉ đọc N ngày gần nhất tính từ ngày mới nhất trong dữ liệu
+                       (bỏ qua nếu đã có start_date). Lưu ý giá trị so sánh của
+                       detect_declines khi đó chỉ tính trên khoảng đã đọc.
+            workers: Số process đọc + làm sạch song song khi dữ liệu là thư mục nhiều file
+                     (None = KPI_LOAD_WORKERS, mặc định 1)
+        """
+        if self.backend is None:
+            raise ValueError("Detector không có nguồn dữ liệu (tạo bằng from_dataframe không kèm file_path)")
         print("📖 Đang đọc dữ liệu...")
         
-        # Đọc CSV
-        self.df = pd.read_csv(self.file_path, encoding='utf-8')
-        
-        # Parse ngày
-        self.df['Ngay7'] = pd.to_datetime(self.df['Ngay7'], format='%d/%m/%Y', errors='coerce')
+        if last_days and start_date is None:
+            _, max_date = self.backend.date_range()
+            if max_date is not None:
+                start_date = max_date - timedelta(days=last_days - 1)
         
-        # Làm sạch các cột số
-        numeric_cols = self._get_numeric_columns()
-        for col in numeric_cols:
-            if col in self.df.columns:
-                self.df[col] = self._clean_numeric_column(self.df[col])
-        
-        # Lọc bỏ dòng không có tỉnh
-        self.df = self.df[self.df['CTKD7'].notna()].copy()
+        if isinstance(self.backend, MultiFileBackend):
+            # Nhiều file: mỗi process đọc + làm sạch một phần file, chỉ các frame đã có kiểu
+            # (float/datetime, nhỏ hơn chuỗi thô) được gửi về và nối lại
+            workers = workers or self.backend.workers
+            with span('load.read_clean_files', backend=repr(self.backend), workers=workers) as s:
+                frames = self.backend.read_frames(
+                    start_date, end_date, provinces,
+                    transform=functools.partial(_clean_raw_frame, numeric_cols=self._get_numeric_columns()),
+                    workers=workers)
+                self.df = self.backend.combine_frames(frames)
+                s.set(rows=len(self.df), files=len(frames))
+        else:
+            # Đọc dữ liệu thô từ backend (CSV hoặc SQLite)
+            with span('load.read_raw', backend=repr(self.backend)) as s:
+                self.df = self.backend.read_raw(start_date=start_date, end_date=end_date,
+                                                provinces=provinces)
+                s.set(rows=len(self.df))
+            
+            with span('load.clean', rows=len(self.df)):
+                self.df = self._clean_raw(self.df)
         
         print(f"✅ Đã load {len(self.df)} dòng dữ liệu")
         print(f"   - Từ {self.df['Ngay7'].min().date()} đến {self.df['Ngay7'].max().date()}")
@@ -139,6 +239,55 @@ class KPIDeclineDetector:
         
         return self.df
     
+    def _clean_raw(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Làm sạch dữ liệu thô: parse ngày, chuẩn hóa cột số, bỏ dòng không có tỉnh"""
+        return _clean_raw_frame(df, self._get_numeric_columns())
+    
+    def apply_increment(self, new_raw: pd.DataFrame) -> Dict:
+        """
+        Gộp dữ liệu thô mới vào self.df trong bộ nhớ (không đọc lại toàn bộ file)
+        
+        Cùng quy tắc với merge_into_current: khóa (ngày + tỉnh không phân biệt hoa/thường),
+        dòng trùng được cập nhật bằng các giá trị không rỗng của dữ liệu mới, dòng mới nối thêm.
+        
+        Returns:
+            Dict: rows_added, rows_updated, provinces (tỉnh bị ảnh hưởng), dates (ngày bị ảnh hưởng)
+        """
+        new_raw = new_raw.copy()
+        new_raw.columns = [str(c).strip().lstrip('\ufeff') for c in new_raw.columns]
+        for col in ('Ngay7', 'CTKD7'):
+            if col not in new_raw.columns:
+                raise ValueError(f"Thiếu cột bắt buộc '{col}' trong dữ liệu mới.")
+        new_df = self._clean_raw(new_raw)
+        new_df = new_df[new_df['Ngay7'].notna()]
+        
+        def _keys(df: pd.DataFrame) -> pd.Series:
+            return df['Ngay7'].dt.strftime('%Y-%m-%d') + '||' + df['CTKD7'].astype(str).str.strip().str.upper()
+        
+        new_df = new_df.set_index(_keys(new_df))
+        new_df = new_df[~new_df.index.duplicated(keep='last')]
+        
+        if self.df is None or len(self.df) == 0:
+            old_df = new_df.iloc[0:0]
+        else:
+            old_df = self.df.set_index(_keys(self.df))
+            old_df = old_df[~old_df.index.duplicated(keep='last')]
+        
+        matching = old_df.index.intersection(new_df.index)
+        new_only = new_df.index.difference(old_df.index)
+        if len(matching) > 0:
+            old_df.update(new_df.loc[matching])
+        merged = pd.concat([old_df, new_df.loc[new_only]], sort=False)
+        merged = merged.sort_values(['Ngay7', 'CTKD7'], kind='stable').reset_index(drop=True)
+        self.df = merged
+        
+        return {
+            'rows_added': int(len(new_only)),
+            'rows_updated': int(len(matching)),
+            'provinces': sorted(new_df['CTKD7'].astype(str).unique().tolist()),
+            'dates': sorted(new_df['Ngay7'].dropna().unique().tolist()),
+        }
+    
     def _get_numeric_columns(self) -> List[str]:
         """Lấy danh sách các cột số"""
         return [
@@ -153,10 +302,7 @@ class KPIDeclineDetector:
     
     def _clean_numeric_column(self, series: pd.Series) -> pd.Series:
         """Làm sạch cột số: xử lý dấu phẩy, dấu ngoặc kép"""
-        series = series.astype(str)
-        series = series.str.replace('"', '', regex=False)
-        series = series.str.replace(',', '', regex=False)
-        return pd.to_numeric(series, errors='coerce')
+        return _clean_numeric_series(series)
     
     def calculate_trends(self, kpi_column: str, province: str = None) -> pd.DataFrame:
         """
@@ -205,98 +351,208 @@ class KPIDeclineDetector:
         
         return daily_avg
     
-    def detect_declines(self, kpi_column: str, lookback_days: int = None) -> List[Dict]:
+    def _compute_province_changes(self, kpi_column: str, lookback_days: int,
+                                  provinces: List[str] = None) -> pd.DataFrame:
+        """
+        Tính (một lượt vector hóa) giá trị mới nhất, giá trị so sánh và % thay đổi cho từng tỉnh
+
+        Logic giống vòng lặp theo tỉnh trước đây:
+        - Bỏ qua các ngày có KPI = 0 hoặc null
+        - Cần ít nhất 2 điểm dữ liệu
+        - Giá trị so sánh = trung bình các ngày <= (ngày mới nhất - lookback_days)
+
+        Returns:
+            DataFrame index = tỉnh (theo thứ tự xuất hiện trong dữ liệu), các cột:
+            latest_date, latest_value, compare_value, change_pct, is_worse, limit_breached
+        """
+        kpi_rule = self._get_kpi_rule(kpi_column)
+        columns = ['latest_date', 'latest_value', 'compare_value', 'change_pct',
+                   'is_worse', 'limit_breached']
+
+        # QUAN TRỌNG: Lấy dữ liệu, bỏ qua các ngày có KPI = 0 hoặc null
+        values = self.df[kpi_column]
+        mask = values.notna() & (values != 0)
+        if provinces:
+            # Fast path: chỉ xét các tỉnh được yêu cầu
+            mask &= self.df['CTKD7'].isin(provinces)
+        data = self.df.loc[mask, ['Ngay7', 'CTKD7', kpi_column]]
+        if len(data) == 0:
+            return pd.DataFrame(columns=columns)
+        data = data.sort_values('Ngay7', kind='stable').reset_index(drop=True)
+
+        grouped = data.groupby('CTKD7', sort=False, observed=True)
+        n_points = grouped.size()
+        # Dòng đầu tiên tại ngày mới nhất của mỗi tỉnh
+        latest_rows = data.loc[grouped['Ngay7'].idxmax()].set_index('CTKD7')
+
+        # Giá trị so sánh: trung bình các ngày <= ngày mới nhất - lookback_days
+        compare_date = data['CTKD7'].map(latest_rows['Ngay7']) - timedelta(days=lookback_days)
+        compare_value = (data[data['Ngay7'] <= compare_date]
+                         .groupby('CTKD7', sort=False, observed=True)[kpi_column].mean())
+
+        result = pd.DataFrame({
+            'latest_date': latest_rows['Ngay7'],
+            'latest_value': latest_rows[kpi_column].astype(float),
+        })
+        result['compare_value'] = compare_value.astype(float)
+        result = result[(n_points.reindex(result.index) >= 2) & result['compare_value'].notna()]
+
+        # Giữ thứ tự tỉnh như self.df['CTKD7'].unique() (ổn định khi sắp xếp alert)
+        order = [p for p in self.df['CTKD7'].unique() if p in result.index]
+        result = result.reindex(order)
+
+        # Đánh giá xu hướng xấu đi theo hướng KPI (giống _is_worsening / _is_limit_breached)
+        change_pct = (result['latest_value'] - result['compare_value']) / result['compare_value'] * 100.0
+        result['change_pct'] = change_pct.where(result['compare_value'] != 0, 0.0)
+        if kpi_rule and kpi_rule.get('direction') == 'lower_better':
+            result['is_worse'] = result['change_pct'] > 0
+        else:
+            result['is_worse'] = result['change_pct'] < 0
+        if kpi_rule and 'limit' in kpi_rule:
+            if kpi_rule.get('direction', 'higher_better') == 'lower_better':
+                result['limit_breached'] = result['latest_value'] > kpi_rule['limit']
+            else:
+                result['limit_breached'] = result['latest_value'] < kpi_rule['limit']
+        else:
+            result['limit_breached'] = None
+        return result[columns]
+
+    def compute_change_matrix(self, kpis: List[str] = None, lookback_days: int = None,
+                              provinces: List[str] = None) -> Dict[str, pd.DataFrame]:
+        """
+        Ma trận tỉnh × KPI của % thay đổi cho nhiều KPI cùng lúc (cùng quy tắc với detect_declines)
+
+        Dữ liệu được đưa về dạng dài (ngày, tỉnh, KPI, giá trị) rồi groupby (tỉnh, KPI) một lượt,
+        thay vì gọi _compute_province_changes cho từng KPI.
+
+        Args:
+            kpis: Các KPI (None = critical_kpis trong config); KPI không có trong dữ liệu bị bỏ qua
+            lookback_days: Số ngày để so sánh (default: từ config)
+            provinces: Chỉ xét các tỉnh này (None = tất cả)
+
+        Returns:
+            Dict các DataFrame (index = tỉnh theo thứ tự trong dữ liệu, cột = KPI):
+            - latest_value, compare_value, change_pct: NaN khi không đủ dữ liệu để so sánh
+            - signed_change_pct: % thay đổi theo hướng KPI (âm = xấu đi, kể cả KPI lower_better)
+            - limit_breached: True khi giá trị mới nhất vi phạm ngưỡng (False nếu KPI không có ngưỡng)
+            - alert: True ở các ô mà detect_declines sẽ cảnh báo
+        """
+        kpis = [k for k in (kpis or self.config['critical_kpis']) if k in self.df.columns]
+        lookback_days = lookback_days or self.config['days_lookback']
+        threshold = self.config['decline_threshold']
+        keys = ['CTKD7', 'KPI']
+
+        with span('change_matrix', kpis=len(kpis), lookback_days=lookback_days) as s:
+            data = self.df[['Ngay7', 'CTKD7'] + kpis]
+            if provinces:
+                data = data[data['CTKD7'].isin(provinces)]
+            long = data.melt(id_vars=['Ngay7', 'CTKD7'], value_vars=kpis, var_name='KPI',
+                             value_name='value')
+            # Bỏ qua các ngày có KPI = 0 hoặc null (giống _compute_province_changes)
+            long = long[long['value'].notna() & (long['value'] != 0)]
+            long = long.sort_values('Ngay7', kind='stable').reset_index(drop=True)
+
+            grouped = long.groupby(keys, sort=False, observed=True)
+            n_points = grouped.size()
+            latest_rows = long.loc[grouped['Ngay7'].idxmax()].set_index(keys)
+            compare_date = grouped['Ngay7'].transform('max') - timedelta(days=lookback_days)
+            compare_value = (long[long['Ngay7'] <= compare_date]
+                             .groupby(keys, sort=False, observed=True)['value'].mean())
+
+            present = set(latest_rows.index.get_level_values(0))
+            order = [p for p in self.df['CTKD7'].unique() if p in present]
+
+            def to_matrix(series: pd.Series, fill=np.nan) -> pd.DataFrame:
+                matrix = series.unstack('KPI').reindex(index=order, columns=kpis)
+                return matrix if fill is np.nan else matrix.fillna(fill)
+
+            latest_value = to_matrix(latest_rows['value'].astype(float))
+            compare = to_matrix(compare_value.astype(float))
+            valid = to_matrix(n_points >= 2, fill=False).astype(bool) & compare.notna()
+            compare = compare.where(valid)
+            change_pct = ((latest_value - compare) / compare * 100.0).where(compare != 0, 0.0).where(valid)
+
+            # Hướng và ngưỡng của từng KPI (vector theo cột)
+            rules = {k: self._get_kpi_rule(k) or {} for k in kpis}
+            lower_better = pd.Series({k: rules[k].get('direction') == 'lower_better' for k in kpis})
+            limit = pd.Series({k: rules[k].get('limit', np.nan) for k in kpis}, dtype=float)
+            signed = change_pct.mul(np.where(lower_better, -1.0, 1.0), axis=1)
+            values = latest_value.to_numpy()
+            with np.errstate(invalid='ignore'):
+                breached = np.where(lower_better.to_numpy(), values > limit.to_numpy(), values < limit.to_numpy())
+            breached = pd.DataFrame(breached, index=latest_value.index, columns=kpis) & limit.notna() & valid
+            alert = (valid & (compare > 0) & (signed < 0) & (change_pct.abs() >= threshold)
+                     & (breached | limit.isna()))
+            s.set(rows=len(long), provinces=len(order), alerts=int(alert.to_numpy().sum()))
+
+        return {
+            'latest_value': latest_value.where(valid),
+            'compare_value': compare,
+            'change_pct': change_pct,
+            'signed_change_pct': signed,
+            'limit_breached': breached.astype(bool),
+            'alert': alert.astype(bool),
+        }
+
+    def detect_declines(self, kpi_column: str, lookback_days: int = None,
+                        provinces: List[str] = None) -> List[Dict]:
         """
         Phát hiện các tỉnh có KPI suy giảm mạnh
         
         Args:
             kpi_column: Tên cột KPI
             lookback_days: Số ngày để so sánh (default: từ config)
+            provinces: Chỉ phân tích các tỉnh này (None = tất cả tỉnh)
         
         Returns:
             List các alert dict
         """
+        return self.detect_declines_frame(kpi_column, lookback_days, provinces).to_dict('records')
+
+    def detect_declines_frame(self, kpi_column: str, lookback_days: int = None,
+                              provinces: List[str] = None) -> pd.DataFrame:
+        """
+        Giống detect_declines nhưng trả kết quả dạng cột (mỗi dòng một alert), không dựng dict từng tỉnh
+
+        Returns:
+            DataFrame cột ALERT_COLUMNS, sắp xếp theo decline_pct tăng dần (suy giảm mạnh nhất trước)
+        """
         lookback_days = lookback_days or self.config['days_lookback']
         threshold = self.config['decline_threshold']
         kpi_rule = self._get_kpi_rule(kpi_column)
         
         print(f"\n🔍 Đang phân tích suy giảm cho {kpi_column}...")
         
-        alerts = []
-        provinces = self.df['CTKD7'].unique()
+        with span('detect_declines', kpi=kpi_column, lookback_days=lookback_days) as s:
+            changes = self._compute_province_changes(kpi_column, lookback_days, provinces)
+            s.set(rows=len(self.df), provinces=len(changes))
+        # Chỉ đánh giá khi giá trị so sánh > 0
+        changes = changes[changes['compare_value'] > 0]
+        should_alert = changes['is_worse'] & (changes['change_pct'].abs() >= threshold)
+        has_limit = bool(kpi_rule) and 'limit' in kpi_rule
+        if has_limit:
+            # Chỉ alert khi VỪA xấu đi VỪA vi phạm ngưỡng
+            should_alert &= changes['limit_breached'].astype(bool)
+        hits = changes[should_alert]
         
-        for province in provinces:
-            # QUAN TRỌNG: Lấy dữ liệu của tỉnh, bỏ qua các ngày có KPI = 0 hoặc null
-            province_data = self.df[
-                (self.df['CTKD7'] == province) & 
-                (self.df[kpi_column].notna()) &
-                (self.df[kpi_column] != 0)  # Bỏ qua ngày có KPI = 0
-            ].copy()
-            
-            if len(province_data) < 2:
-                continue
-            
-            # Sắp xếp theo ngày
-            province_data = province_data.sort_values('Ngay7')
-            
-            # Lấy ngày gần nhất
-            latest_date = province_data['Ngay7'].max()
-            latest_value = province_data[province_data['Ngay7'] == latest_date][kpi_column].values[0]
-            
-            # Bỏ qua nếu giá trị gần nhất = 0
-            if latest_value == 0:
-                continue
-            
-            # Lấy giá trị so sánh (lookback_days trước)
-            compare_date = latest_date - timedelta(days=lookback_days)
-            # Bỏ qua các ngày có KPI = 0 trong period so sánh
-            compare_data = province_data[
-                (province_data['Ngay7'] <= compare_date) &
-                (province_data[kpi_column].notna()) &
-                (province_data[kpi_column] != 0)  # Bỏ qua giá trị 0
-            ]
-            
-            if len(compare_data) == 0:
-                continue
-            
-            # Lấy giá trị trung bình của period trước (chỉ tính các ngày có KPI > 0)
-            compare_value = compare_data[kpi_column].mean()
-            
-            # Đánh giá xu hướng xấu đi theo hướng KPI
-            if compare_value > 0:
-                is_worse, change_pct = self._is_worsening(latest_value, compare_value, kpi_rule)
-                limit_breached = self._is_limit_breached(latest_value, kpi_rule)
-
-                should_alert = False
-                if kpi_rule and limit_breached is not None:
-                    # Chỉ alert khi VỪA xấu đi VỪA vi phạm ngưỡng
-                    if is_worse and abs(change_pct) >= threshold and limit_breached:
-                        should_alert = True
-                else:
-                    # Không có rule → dùng logic cũ theo higher_better
-                    if is_worse and abs(change_pct) >= threshold:
-                        should_alert = True
-
-                if should_alert:
-                    # map decline_pct về hướng “xấu đi” âm như trước để giữ tương thích
-                    decline_like_pct = -abs(change_pct)
-                    alert = {
-                        'province': province,
-                        'kpi': kpi_column,
-                        'latest_date': latest_date,
-                        'latest_value': latest_value,
-                        'compare_value': compare_value,
-                        'decline_pct': round(decline_like_pct, 2),
-                        'severity': self._get_severity(decline_like_pct),
-                        'days_lookback': lookback_days,
-                        'limit': kpi_rule.get('limit') if kpi_rule else None,
-                        'limit_breached': bool(limit_breached) if limit_breached is not None else None,
-                        'direction': kpi_rule.get('direction') if kpi_rule else 'higher_better'
-                    }
-                    alerts.append(alert)
+        # map decline_pct về hướng “xấu đi” âm như trước để giữ tương thích
+        decline_like_pct = -hits['change_pct'].abs().to_numpy(dtype=float)
+        alerts = pd.DataFrame({
+            'province': hits.index.to_numpy(dtype=object),
+            'kpi': kpi_column,
+            'latest_date': hits['latest_date'].to_numpy(),
+            'latest_value': hits['latest_value'].to_numpy(dtype=float),
+            'compare_value': hits['compare_value'].to_numpy(dtype=float),
+            'decline_pct': np.round(decline_like_pct, 2),
+            'severity': self._get_severities(decline_like_pct),
+            'days_lookback': lookback_days,
+            'limit': kpi_rule.get('limit') if kpi_rule else None,
+            'limit_breached': hits['limit_breached'].astype(bool).to_numpy(dtype=object) if has_limit else None,
+            'direction': kpi_rule.get('direction') if kpi_rule else 'higher_better',
+        }, columns=ALERT_COLUMNS)
         
         # Sắp xếp theo mức độ suy giảm
-        alerts.sort(key=lambda x: x['decline_pct'])
+        alerts = alerts.sort_values('decline_pct', kind='stable', ignore_index=True)
         
         print(f"   ⚠️  Phát hiện {len(alerts)} tỉnh có suy giảm")
         
@@ -304,14 +560,16 @@ class KPIDeclineDetector:
     
     def _get_severity(self, decline_pct: float) -> str:
         """Xác định mức độ nghiêm trọng"""
-        if decline_pct < -10:
-            return 'Cực kỳ nghiêm trọng'
-        elif decline_pct < -5:
-            return 'Nghiêm trọng'
-        elif decline_pct < -2:
-            return 'Cảnh báo'
-        else:
-            return 'Nhẹ'
+        for bound, label in SEVERITY_LEVELS:
+            if decline_pct < bound:
+                return label
+        return SEVERITY_DEFAULT
+
+    def _get_severities(self, decline_pct: np.ndarray) -> np.ndarray:
+        """_get_severity cho cả mảng % suy giảm"""
+        decline_pct = np.asarray(decline_pct, dtype=float)
+        return np.select([decline_pct < bound for bound, _ in SEVERITY_LEVELS],
+                         [label for _, label in SEVERITY_LEVELS], SEVERITY_DEFAULT).astype(object)
     
     def analyze_all_kpis(self) -> Dict[str, List[Dict]]:
         """Phân tích tất cả KPI quan trọng"""
@@ -320,41 +578,61 @@ class KPIDeclineDetector:
         print("="*60)
         
         all_alerts = {}
+        frames = []
         
         for kpi in self.config['critical_kpis']:
             if kpi not in self.df.columns:
                 print(f"⚠️  Không tìm thấy cột: {kpi}")
                 continue
             
-            alerts = self.detect_declines(kpi)
-            if alerts:
-                all_alerts[kpi] = alerts
+            alerts = self.detect_declines_frame(kpi)
+            if len(alerts):
+                frames.append(alerts)
+                all_alerts[kpi] = alerts.to_dict('records')
         
         self.decline_alerts = all_alerts
+        # Cùng kết quả dạng cột cho generate_decline_report / export (không dựng lại từ dict)
+        self.alerts_frame = (pd.concat(frames, ignore_index=True) if frames
+                             else pd.DataFrame(columns=ALERT_COLUMNS))
         return all_alerts
     
-    def generate_decline_report(self) -> pd.DataFrame:
-        """Tạo báo cáo tổng hợp các suy giảm"""
-        if not self.decline_alerts:
+    def generate_decline_report(self, alerts: pd.DataFrame = None) -> pd.DataFrame:
+        """
+        Tạo báo cáo tổng hợp các suy giảm (tính theo cột trên bảng alert, không duyệt từng alert)
+
+        Args:
+            alerts: Bảng alert dạng cột (cột ALERT_COLUMNS, ví dụ alerts_frame sau analyze_all_kpis
+                    hoặc detect_declines_frame); None = dựng một lần từ decline_alerts
+
+        Returns:
+            DataFrame báo cáo, None nếu không có suy giảm
+        """
+        if alerts is None:
+            records = [alert for kpi_alerts in (self.decline_alerts or {}).values() for alert in kpi_alerts]
+            alerts = pd.DataFrame.from_records(records, columns=ALERT_COLUMNS)
+        if len(alerts) == 0:
             print("ℹ️  Không có suy giảm nào được phát hiện")
             return None
         
-        # Tạo DataFrame từ alerts
-        report_data = []
-        for kpi, alerts in self.decline_alerts.items():
-            for alert in alerts:
-                report_data.append({
-                    'KPI': kpi,
-                    'Tỉnh': alert['province'],
-                    'Ngày': alert['latest_date'].strftime('%d/%m/%Y'),
-                    'Giá trị hiện tại': round(alert['latest_value'], 2),
-                    'Giá trị trước': round(alert['compare_value'], 2),
-                    'Suy giảm (%)': alert['decline_pct'],
-                    'Mức độ': alert['severity']
-                })
-        
-        report_df = pd.DataFrame(report_data)
-        report_df = report_df.sort_values('Suy giảm (%)')
+        # Alert thường chỉ có vài ngày khác nhau → format từng ngày duy nhất một lần rồi map
+        codes, dates = pd.factorize(pd.to_datetime(alerts['latest_date']))
+        date_labels = np.append(pd.DatetimeIndex(dates).strftime('%d/%m/%Y').to_numpy(dtype=object), np.nan)
+        
+        # round() của Python như báo cáo cũ: Series.round nhân 100 rồi làm tròn nên có thể lệch 0.01
+        # ở các giá trị sát nửa (ví dụ 2.675: round → 2.67, Series.round → 2.68)
+        def _round2(values: pd.Series) -> pd.Series:
+            return pd.Series([round(v, 2) for v in values.astype(float)], index=values.index, dtype=float)
+
+        report_df = pd.DataFrame({
+            'KPI': alerts['kpi'],
+            'Tỉnh': alerts['province'],
+            'Ngày': pd.Series(date_labels[codes], index=alerts.index),
+            'Giá trị hiện tại': _round2(alerts['latest_value']),
+            'Giá trị trước': _round2(alerts['compare_value']),
+            'Suy giảm (%)': alerts['decline_pct'].astype(float),
+            'Mức độ': alerts['severity'],
+        })
+        report_df = report_df.sort_values('Suy giảm (%)', kind='stable')
         
         return report_df
     
@@ -381,6 +659,7 @@ class KPIDeclineDetector:
             lookback_days = self.config['days_lookback']
         
         # Sử dụng visualization module nếu có
+        KPIVisualization = _get_visualization_class()
         if KPIVisualization:
             viz = KPIVisualization(output_dir=self.config['charts_dir'])
             # Truyền ngưỡng nếu có
@@ -404,6 +683,8 @@ class KPIDeclineDetector:
             return viz.save_chart(fig, filename)
         else:
             # Fallback: tự tạo chart
+            import matplotlib.pyplot as plt
+            from chart_lod import downsample, marker_kwargs, set_adaptive_date_axis
             df_filtered = self.df.copy()
             if provinces:
                 df_filtered = df_filtered[df_filtered['CTKD7'].isin(provinces)]
@@ -423,17 +704,17 @@ class KPIDeclineDetector:
             # Plot từng tỉnh với styling đẹp
             for idx, province in enumerate(trend_data['CTKD7'].unique()):
                 province_trend = trend_data[trend_data['CTKD7'] == province]
-                ax.plot(province_trend['Ngay7'], province_trend[kpi_column], 
-                        marker='o', label=province, 
-                        linewidth=3.5, markersize=12,
-                        alpha=0.9, markerfacecolor='white',
-                        markeredgewidth=2.5, color=colors[idx])
+                x_plot, y_plot = downsample(province_trend['Ngay7'], province_trend[kpi_column])
+                ax.plot(x_plot, y_plot,
+                        label=province,
+                        linewidth=3.5,
+                        alpha=0.9, color=colors[idx],
+                        **marker_kwargs(len(y_plot), markersize=12,
+                                        markerfacecolor='white', markeredgewidth=2.5))
             
-            # Format ngày
-            from matplotlib.dates import DateFormatter, DayLocator
+            # Format ngày (tick thích ứng theo độ dài khoảng ngày)
             from matplotlib.ticker import MaxNLocator, FuncFormatter
-            ax.xaxis.set_major_locator(DayLocator(interval=1))
-            ax.xaxis.set_major_formatter(DateFormatter('%d/%m/%Y'))
+            set_adaptive_date_axis(ax)
             ax.yaxis.set_major_locator(MaxNLocator(nbins=20))
             
             def format_y_axis(value, pos):
@@ -473,7 +754,6 @@ class KPIDeclineDetector:
             if output_path is None:
                 output_path = f"{self.config['charts_dir']}/trend_{kpi_column}_{datetime.now().strftime('%Y%m%d')}.png"
             
-            import os
             os.makedirs(os.path.dirname(output_path), exist_ok=True)
             plt.savefig(output_path, dpi=300, bbox_inches='tight')
             print(f"✅ Đã lưu chart: {output_path}")
@@ -481,11 +761,80 @@ class KPIDeclineDetector:
             plt.close()
             return output_path
 
+    def create_small_multiples_chart(self, kpi_column: str, provinces: List[str] = None,
+                                     alert_provinces: List[str] = None,
+                                     lookback_days: int = None, workers: int = 1,
+                                     exclude_dates: List[str] = None,
+                                     date_range_filter: tuple = None) -> Optional[str]:
+        """
+        Lưới small multiples (mỗi tỉnh một ô, chung trục) cho một KPI
+
+        Args:
+            kpi_column: Tên cột KPI
+            provinces: Danh sách tỉnh (None = tất cả)
+            alert_provinces: Tỉnh tô đỏ (None = các tỉnh có cảnh báo trong decline_alerts)
+            lookback_days: Số ngày gần nhất để highlight (None = dùng từ config)
+            workers: Số process vẽ các tile song song
+
+        Returns:
+            Đường dẫn file PNG (None nếu không có module visualization hoặc không có dữ liệu)
+        """
+        print(f"\n📈 Đang tạo small multiples cho {kpi_column}...")
+        KPIVisualization = _get_visualization_class()
+        if not KPIVisualization:
+            print("⚠️  Không có visualization_module, bỏ qua small multiples")
+            return None
+        if alert_provinces is None:
+            alert_provinces = [a['province'] for a in (self.decline_alerts or {}).get(kpi_column, [])]
+        kpi_rule = self._get_kpi_rule(kpi_column)
+        viz = KPIVisualization(output_dir=self.config['charts_dir'])
+        return viz.create_small_multiples_chart(
+            df=self.df,
+            kpi_column=kpi_column,
+            group_by='CTKD7',
+            provinces=provinces,
+            alert_provinces=alert_provinces,
+            lookback_days=lookback_days or self.config['days_lookback'],
+            exclude_dates=exclude_dates,
+            date_range_filter=date_range_filter,
+            threshold_line=kpi_rule.get('limit') if kpi_rule else None,
+            workers=workers,
+        )
+
+    def create_kpi_heatmap(self, kpis: List[str] = None, lookback_days: int = None,
+                           provinces: List[str] = None, filename: str = None) -> Optional[str]:
+        """
+        Heatmap tổng quan tỉnh × KPI (một ảnh thay cho một trend chart mỗi KPI)
+
+        Args:
+            kpis: Các KPI (None = critical_kpis trong config)
+            lookback_days: Số ngày để so sánh (default: từ config)
+            provinces: Chỉ xét các tỉnh này (None = tất cả)
+            filename: Tên file PNG (mặc định heatmap_kpi_YYYYMMDD.png)
+
+        Returns:
+            Đường dẫn file PNG (None nếu không có module visualization hoặc không có dữ liệu)
+        """
+        print("\n🗺️  Đang tạo heatmap KPI × tỉnh...")
+        KPIVisualization = _get_visualization_class()
+        if not KPIVisualization:
+            print("⚠️  Không có visualization_module, bỏ qua heatmap")
+            return None
+        matrix = self.compute_change_matrix(kpis, lookback_days, provinces)
+        if matrix['signed_change_pct'].empty:
+            print("⚠️  Không có dữ liệu để vẽ heatmap")
+            return None
+        viz = KPIVisualization(output_dir=self.config['charts_dir'])
+        fig, _ = viz.create_kpi_heatmap(matrix, threshold=self.config['decline_threshold'])
+        filename = filename or f"heatmap_kpi_{datetime.now().strftime('%Y%m%d')}.png"
+        return viz.save_chart(fig, filename)
+
     def create_trend_charts_interactive(self, kpi_column: str, provinces: List[str] = None,
                                          exclude_dates: List[str] = None,
                                          date_range_filter: tuple = None,
                                          output_filename: str = None):
         """Chế độ tương tác: click để loại bỏ ngày và lưu bằng phím 's'."""
+        KPIVisualization = _get_visualization_class()
         if KPIVisualization is None:
             print("⚠️  Visualization module không khả dụng")
             return None
@@ -501,6 +850,32 @@ class KPIDeclineDetector:
         )
         return fig
     
+    def save_snapshot(self, kpi_columns: List[str] = None, since: str = None,
+                      full: bool = False) -> Optional[Dict]:
+        """
+        Lưu aggregate theo (ngày, tỉnh, KPI) của lần chạy hiện tại vào kho snapshot
+
+        Mặc định chỉ ghi các ngày từ (ngày mới nhất đã lưu - snapshot_overlap_days) trở đi, nên
+        thời gian chạy và WAL không tăng theo độ dài lịch sử. Lần đầu (kho rỗng) ghi toàn bộ.
+
+        Args:
+            kpi_columns: Danh sách KPI cần lưu (None = các cột số đã biết + KPI quan trọng)
+            since: Chỉ ghi lại các ngày >= since (None = tự tính từ snapshot gần nhất)
+            full: Ghi lại toàn bộ lịch sử (ví dụ sau khi gộp dữ liệu tháng cũ)
+        """
+        if KPISnapshotStore is None:
+            print("⚠️  snapshot_store không khả dụng, bỏ qua lưu snapshot")
+            return None
+        if kpi_columns is None:
+            kpi_columns = list(dict.fromkeys(self._get_numeric_columns() + self.config['critical_kpis']))
+        store = KPISnapshotStore(self.config.get('snapshot_db', CONFIG['snapshot_db']))
+        if since is None and not full:
+            last_saved = store.latest_data_date()
+            if last_saved is not None:
+                overlap = self.config.get('snapshot_overlap_days', CONFIG['snapshot_overlap_days'])
+                since = last_saved - timedelta(days=overlap)
+        return store.save_snapshot(self.df, kpi_columns, source=str(self.file_path), since=since)
+
     def should_fetch_district_data(self, province: str, kpi: str) -> bool:
         """
         Quyết định có cần tải dữ liệu cấp huyện không
@@ -613,54 +988,84 @@ def main():
     print("🚀 PIPELINE PHÁT HIỆN SUY GIẢM KPI")
     print("="*60)
     
+    # Đo thời gian / bộ nhớ từng bước (KPI_TRACE_MEMORY=1 để bật tracemalloc)
+    recorder = start_recording('pipeline')
+    
     # Khởi tạo detector
     detector = KPIDeclineDetector('1.Ngày.csv')
     
+    # Phiên bản dữ liệu đọc trước khi load: dữ liệu bị gộp trong lúc chạy → bộ biểu đồ vẽ sẵn
+    # mang phiên bản cũ và app tự vẽ trực tiếp thay vì hiển thị ảnh lỗi thời
+    data_version = detector.backend.version()
+    
     # Step 1: Load và clean data
-    detector.load_and_clean_data()
+    with span('1_load') as s:
+        detector.load_and_clean_data()
+        s.set(rows=len(detector.df))
     
     # Step 2: Phân tích tất cả KPI quan trọng
-    all_alerts = detector.analyze_all_kpis()
+    with span('2_analyze', rows=len(detector.df)):
+        all_alerts = detector.analyze_all_kpis()
+    
+    # Step 2.5: Lưu snapshot aggregate để tra cứu theo ngày / so sánh tuần trước
+    try:
+        with span('2.5_snapshot'):
+            detector.save_snapshot()
+    except Exception as e:
+        print(f"⚠️  Lỗi khi lưu snapshot: {e}")
     
-    # Step 3: Tạo báo cáo
+    # Step 3: Tạo báo cáo (từ bảng alert dạng cột) và xuất CSV/Parquet/XLSX + JSON tóm tắt một lượt
+    report_span = span('3_report').start()
+    report_df = None
     if all_alerts:
-        report_df = detector.generate_decline_report()
+        report_df = detector.generate_decline_report(detector.alerts_frame)
         print("\n" + "="*60)
         print("📋 BÁO CÁO SUY GIẢM KPI")
         print("="*60)
         print(report_df.to_string(index=False))
-        
-        # Lưu báo cáo (an toàn khi file đang bị mở/khóa bởi Excel)
-        import os
-        date_str = datetime.now().strftime('%Y%m%d')
-        os.makedirs('reports', exist_ok=True)
-        report_path = f"reports/decline_report_{date_str}.csv"
-        try:
-            report_df.to_csv(report_path, index=False, encoding='utf-8-sig')
-            print(f"\n✅ Đã lưu báo cáo: {report_path}")
-        except PermissionError:
-            # Ghi sang thư mục theo ngày với tên có timestamp để tránh xung đột khóa file
-            dated_dir = os.path.join('reports', date_str)
-            os.makedirs(dated_dir, exist_ok=True)
-            ts = datetime.now().strftime('%H%M%S')
-            alt_path = os.path.join(dated_dir, f"decline_report_{date_str}_{ts}.csv")
-            report_df.to_csv(alt_path, index=False, encoding='utf-8-sig')
-            print(f"\n⚠️  File {report_path} đang bị khóa (có thể đang mở trong Excel).\n   → Đã lưu tạm vào: {alt_path}")
     else:
         print("\n✅ Không phát hiện suy giảm nghiêm trọng nào")
+    try:
+        from report_export import export_decline_report
+        report_paths = export_decline_report(report_df, detector.config['output_dir'])
+        for fmt, path in report_paths.items():
+            print(f"✅ Đã lưu báo cáo ({fmt}): {path}")
+        report_span.set(rows=len(report_df) if report_df is not None else 0, files=len(report_paths))
+    except Exception as e:
+        print(f"⚠️  Lỗi khi xuất báo cáo: {e}")
+    report_span.stop()
     
     # Step 4: Tạo trend charts cho các KPI có vấn đề
     print("\n" + "="*60)
     print("📊 TẠO TREND CHARTS")
     print("="*60)
     
-    for kpi in detector.config['critical_kpis']:
-        if kpi in all_alerts and all_alerts[kpi]:
-            # Lấy danh sách tỉnh có vấn đề
-            provinces_with_issues = [alert['province'] for alert in all_alerts[kpi]]
-            detector.create_trend_charts(kpi, provinces_with_issues)
+    with span('4_charts') as s:
+        # Một heatmap tổng quan cho mọi KPI quan trọng, rồi trend chart chi tiết cho KPI có vấn đề
+        heatmap_path = detector.create_kpi_heatmap()
+        n_charts = 1
+        for kpi in detector.config['critical_kpis']:
+            if kpi in all_alerts and all_alerts[kpi]:
+                # Lấy danh sách tỉnh có vấn đề
+                provinces_with_issues = [alert['province'] for alert in all_alerts[kpi]]
+                detector.create_trend_charts(kpi, provinces_with_issues)
+                n_charts += 1
+        s.set(charts=n_charts)
+    
+    # Step 4b: Vẽ sẵn các biểu đồ dashboard xem nhiều nhất (app dùng khi phiên bản dữ liệu khớp)
+    try:
+        if detector.config.get('chart_bundle', True):
+            from chart_bundle import build_chart_bundle
+            with span('4b_bundle'):
+                # Heatmap KPI quan trọng vừa vẽ ở bước 4 → sao chép vào bộ, không vẽ lại
+                critical = tuple(k for k in detector.config['critical_kpis'] if k in detector.df.columns)
+                build_chart_bundle(detector, data_version, all_alerts,
+                                   heatmap_images={critical: heatmap_path} if heatmap_path else None)
+    except Exception as e:
+        print(f"⚠️  Lỗi khi vẽ sẵn biểu đồ cho dashboard: {e}")
     
     # Step 5: Gửi alerts
+    alerts_span = span('5_alerts', alerts=sum(len(a) for a in all_alerts.values())).start()
     if AlertSystem:
         print("\n" + "="*60)
         print("📢 GỬI ALERTS")
@@ -679,7 +1084,10 @@ def main():
                     compare_value=alert['compare_value']
                 )
     
+    alerts_span.stop()
+    
     # Step 6: Xác định tỉnh cần tải dữ liệu huyện
+    district_span = span('6_district').start()
     print("\n" + "="*60)
     print("📥 XÁC ĐỊNH TỈNH CẦN DỮ LIỆU HUYỆN")
     print("="*60)
@@ -711,14 +1119,41 @@ def main():
                 print(district_analysis.head().to_string(index=False))
     else:
         print("\n✅ Không có tỉnh nào cần tải dữ liệu huyện")
+    district_span.stop()
+    
+    # Step 7: Báo cáo HTML một file từ kết quả trong bộ nhớ (không đọc lại CSV/PNG/alerts.json)
+    try:
+        from html_report import write_html_report
+        with span('7_html') as s:
+            html_path = write_html_report(detector, report_df, provinces_needing=provinces_needing,
+                                          perf=recorder.summary())
+            s.set(bytes=os.path.getsize(html_path))
+        print(f"🌐 Đã lưu báo cáo HTML: {html_path}")
+    except Exception as e:
+        print(f"⚠️  Lỗi khi tạo báo cáo HTML: {e}")
     
     print("\n" + "="*60)
     print("✅ Pipeline hoàn thành!")
     print("="*60)
     
+    stop_recording()
+    recorder.print_summary()
+    try:
+        perf_path = recorder.save_json(os.path.join(detector.config['output_dir'], 'perf',
+                                                    f"perf_{recorder.started_at.strftime('%Y%m%d_%H%M%S')}.json"))
+        print(f"⏱️  Đã lưu thời gian từng bước: {perf_path}")
+    except OSError as e:
+        print(f"⚠️  Lỗi khi lưu thời gian từng bước: {e}")
+    
     return detector, all_alerts
 
 
 if __name__ == "__main__":
-    detector, alerts = main()
+    import sys
+    from profiling import profile_run, profiling_mode, strip_profile_flag
+    
+    # Profile tùy chọn: --profile[=pyinstrument] hoặc KPI_PROFILE=1
+    _, profile_flag = strip_profile_flag(sys.argv[1:])
+    with profile_run('pipeline', profiling_mode(profile_flag)):
+        detector, alerts = main()
 
@@ -0,0 +1,469 @@
+"""
+KPI MONITOR - CLI CHẠY NỀN (KHÔNG CẦN STREAMLIT)
+================================================
+Các lệnh con dùng chung một bộ dữ liệu đã load (đọc file đúng một lần mỗi lần chạy):
+
+    python kpi_monitor.py scan   [--kpis CSSR,CDR] [--fail-on-alert] [--json alerts.json]
+    python kpi_monitor.py report [--output reports/decline_report.csv] [--formats csv,parquet,xlsx,json] [--html]
+    python kpi_monitor.py chart  [--kpis CSSR] [--all-provinces] [--workers 4]
+    python kpi_monitor.py merge  new_day.csv [more.csv ...] [--into 1.Ngày.csv]
+    python kpi_monitor.py bench  [--sizes small,medium] [--repeat 3]
+    python kpi_monitor.py daemon [--inbox inbox] [--interval 10]
+    python kpi_monitor.py serve  [--host 127.0.0.1] [--port 8765]
+
+Nối nhiều lệnh bằng '+' để dùng lại dữ liệu đã load và kết quả quét:
+
+    python kpi_monitor.py --file 1.Ngày.csv scan --kpis CSSR,CDR + report + chart --workers 4
+
+Tùy chọn chung (đặt trước lệnh con đầu tiên): --file, --lookback, --threshold, --last-days,
+--load-workers, --quiet, --profile
+
+--file nhận một file CSV, file SQLite (.db) hoặc thư mục/glob nhiều file export ngày/tháng
+(ví dụ --file "data/1.Ngày*.csv"); với --last-days 14 chỉ các file chứa 14 ngày gần nhất được đọc,
+với --load-workers 8 các file được đọc + làm sạch song song trong 8 process.
+
+Mã thoát (dùng cho cron / Task Scheduler):
+    0  thành công (không có cảnh báo, hoặc không dùng --fail-on-alert)
+    1  có cảnh báo suy giảm (chỉ khi scan --fail-on-alert)
+    2  sai tham số
+    3  lỗi dữ liệu (không có file, thiếu cột, KPI không tồn tại, gộp lỗi)
+    4  lỗi khác
+"""
+
+import argparse
+import contextlib
+import copy
+import json
+import os
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+EXIT_OK = 0
+EXIT_ALERTS = 1
+EXIT_USAGE = 2
+EXIT_DATA_ERROR = 3
+EXIT_ERROR = 4
+
+CHAIN_SEPARATOR = '+'
+
+
+class DataError(Exception):
+    """Lỗi dữ liệu đầu vào (mã thoát 3)"""
+
+
+def _default_data_path() -> str:
+    """SQLite nếu đặt KPI_SQLITE_DB, thư mục nhiều file nếu đặt KPI_DATA_DIR, nếu không thì 1.Ngày.csv"""
+    from data_backend import DATA_FILE_PATH
+    return os.environ.get('KPI_SQLITE_DB') or os.environ.get('KPI_DATA_DIR') or DATA_FILE_PATH
+
+
+def _split_list(value: Optional[str]) -> Optional[List[str]]:
+    if not value:
+        return None
+    return [v.strip() for v in value.split(',') if v.strip()]
+
+
+class MonitorSession:
+    """Dữ liệu và kết quả quét dùng chung giữa các lệnh con trong một lần chạy."""
+
+    def __init__(self, file_path: str, lookback_days: int = None, threshold: float = None,
+                 quiet: bool = False, last_days: int = None, load_workers: int = None):
+        from kpi_decline_detection_pipeline import CONFIG
+        self.file_path = file_path
+        self.config = copy.deepcopy(CONFIG)
+        if lookback_days is not None:
+            self.config['days_lookback'] = lookback_days
+        if threshold is not None:
+            self.config['decline_threshold'] = threshold
+        self.quiet = quiet
+        self.last_days = last_days
+        self.load_workers = load_workers
+        self._detector = None
+        self.alerts: Optional[Dict[str, List[Dict]]] = None
+
+    @contextlib.contextmanager
+    def pipeline_output(self):
+        """Ẩn log chi tiết của pipeline khi --quiet."""
+        if not self.quiet:
+            yield
+            return
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            yield
+
+    @property
+    def detector(self):
+        """Detector đã load dữ liệu (load đúng một lần)."""
+        if self._detector is None:
+            from kpi_decline_detection_pipeline import KPIDeclineDetector
+            from data_backend import get_backend
+            if not get_backend(self.file_path).exists():
+                raise DataError(f"Không tìm thấy dữ liệu: {self.file_path}")
+            detector = KPIDeclineDetector(self.file_path, config=self.config)
+            with self.pipeline_output():
+                try:
+                    detector.load_and_clean_data(last_days=self.last_days, workers=self.load_workers)
+                except (KeyError, ValueError) as e:
+                    raise DataError(f"Dữ liệu không hợp lệ ({self.file_path}): {e}") from e
+            self._detector = detector
+        return self._detector
+
+    def resolve_kpis(self, kpis: Optional[List[str]]) -> List[str]:
+        """KPI cần xử lý: danh sách truyền vào (khớp gần đúng) hoặc các KPI quan trọng trong CONFIG."""
+        from analyze_any_province_kpi import fuzzy_match_kpi
+        columns = list(self.detector.df.columns)
+        if not kpis:
+            return [k for k in self.config['critical_kpis'] if k in columns]
+        resolved = []
+        for kpi in kpis:
+            matched, _ = fuzzy_match_kpi(kpi, columns)
+            if matched is None:
+                raise DataError(f"Không tìm thấy KPI '{kpi}'")
+            resolved.append(matched)
+        return resolved
+
+    def scan(self, kpis: Optional[List[str]] = None,
+             provinces: Optional[List[str]] = None) -> Dict[str, List[Dict]]:
+        """Phát hiện suy giảm cho các KPI. Kết quả được giữ lại cho report/chart."""
+        detector = self.detector
+        all_alerts = {}
+        with self.pipeline_output():
+            for kpi in self.resolve_kpis(kpis):
+                alerts = detector.detect_declines(kpi, provinces=provinces)
+                if alerts:
+                    all_alerts[kpi] = alerts
+        detector.decline_alerts = all_alerts
+        self.alerts = all_alerts
+        return all_alerts
+
+    def ensure_scanned(self, kpis: Optional[List[str]] = None) -> Dict[str, List[Dict]]:
+        if self.alerts is None:
+            return self.scan(kpis)
+        return self.alerts
+
+
+# ==== Lệnh con ====
+
+def cmd_scan(session: MonitorSession, args) -> int:
+    all_alerts = session.scan(_split_list(args.kpis), _split_list(args.provinces))
+    n_alerts = sum(len(a) for a in all_alerts.values())
+    print(f"🔍 Quét {session.file_path}: {n_alerts} cảnh báo trên {len(all_alerts)} KPI")
+    for kpi, alerts in all_alerts.items():
+        for alert in alerts:
+            print(f"   ⚠️  {kpi:<16} {alert['province']:<24} {alert['decline_pct']:>8.2f}%  {alert['severity']}")
+    if args.json:
+        payload = {
+            'generated_at': datetime.now().isoformat(timespec='seconds'),
+            'file': session.file_path,
+            'lookback_days': session.config['days_lookback'],
+            'threshold': session.config['decline_threshold'],
+            'alerts': [dict(a, latest_date=a['latest_date'].strftime('%Y-%m-%d'))
+                       for alerts in all_alerts.values() for a in alerts],
+        }
+        out_dir = os.path.dirname(args.json)
+        if out_dir:
+            os.makedirs(out_dir, exist_ok=True)
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(payload, f, ensure_ascii=False, indent=2, default=float)
+        print(f"💾 Đã lưu cảnh báo: {args.json}")
+    if args.fail_on_alert and n_alerts:
+        return EXIT_ALERTS
+    return EXIT_OK
+
+
+def cmd_report(session: MonitorSession, args) -> int:
+    from report_export import REPORT_FORMATS, export_decline_report
+    formats = [f.lower() for f in (_split_list(args.formats) or ['csv'])]
+    unknown = [f for f in formats if f not in REPORT_FORMATS]
+    if unknown:
+        print(f"❌ Không hỗ trợ định dạng: {', '.join(unknown)} (chọn trong {', '.join(REPORT_FORMATS)})",
+              file=sys.stderr)
+        return EXIT_USAGE
+    session.ensure_scanned(_split_list(args.kpis))
+    with session.pipeline_output():
+        report_df = session.detector.generate_decline_report()
+    if report_df is None or len(report_df) == 0:
+        print("✅ Không có suy giảm nào để báo cáo")
+        if 'json' not in formats and not args.html:
+            return EXIT_OK
+    output = args.output or os.path.join(
+        session.config['output_dir'], f"decline_report_{datetime.now().strftime('%Y%m%d')}.csv")
+    # Mọi định dạng ghi một lượt, cùng tên file với đuôi tương ứng
+    paths = export_decline_report(report_df, os.path.dirname(output),
+                                  basename=os.path.splitext(os.path.basename(output))[0], formats=formats)
+    n_rows = len(report_df) if report_df is not None else 0
+    for fmt, path in paths.items():
+        print(f"📋 Đã lưu báo cáo {fmt} ({n_rows} dòng): {path}")
+    if args.html:
+        from html_report import write_html_report
+        with session.pipeline_output():
+            html_path = write_html_report(session.detector, report_df, out_dir=os.path.dirname(output) or '.',
+                                          kpis=session.resolve_kpis(_split_list(args.kpis)),
+                                          provinces_needing=session.detector.get_provinces_needing_district_data())
+        print(f"🌐 Đã lưu báo cáo HTML ({n_rows} dòng): {html_path}")
+    return EXIT_OK
+
+
+# Chart chạy song song: mỗi process nhận DataFrame một lần qua initializer
+_worker_detector = None
+
+
+def _init_chart_worker(df, file_path, config):
+    global _worker_detector
+    import matplotlib
+    matplotlib.use('Agg')
+    from kpi_decline_detection_pipeline import KPIDeclineDetector
+    _worker_detector = KPIDeclineDetector.from_dataframe(df, file_path=file_path, config=config)
+
+
+def _render_chart(kpi: str, provinces: Optional[List[str]], quiet: bool) -> str:
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, \
+            (contextlib.redirect_stdout(devnull) if quiet else contextlib.nullcontext()):
+        return _worker_detector.create_trend_charts(kpi, provinces)
+
+
+def cmd_chart(session: MonitorSession, args) -> int:
+    import matplotlib
+    matplotlib.use('Agg')  # Chạy nền, không mở cửa sổ
+    kpis = session.resolve_kpis(_split_list(args.kpis))
+    provinces = _split_list(args.provinces)
+    if args.small_multiples:
+        return _chart_small_multiples(session, kpis, provinces, args.workers)
+    if args.heatmap:
+        with session.pipeline_output():
+            path = session.detector.create_kpi_heatmap(kpis, provinces=provinces)
+        if path:
+            print(f"📈 {path}")
+        return EXIT_OK
+    jobs = []
+    if provinces or args.all_provinces:
+        jobs = [(kpi, provinces) for kpi in kpis]
+    else:
+        # Mặc định: chỉ vẽ các tỉnh đang có cảnh báo
+        all_alerts = session.ensure_scanned(kpis)
+        jobs = [(kpi, [a['province'] for a in all_alerts[kpi]]) for kpi in kpis if all_alerts.get(kpi)]
+    if not jobs:
+        print("✅ Không có chart nào cần vẽ (không có cảnh báo)")
+        return EXIT_OK
+
+    detector = session.detector
+    workers = max(1, min(args.workers, len(jobs)))
+    paths = []
+    if workers == 1:
+        _init_chart_worker(detector.df, session.file_path, session.config)
+        for kpi, provs in jobs:
+            paths.append(_render_chart(kpi, provs, session.quiet))
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_chart_worker,
+                                 initargs=(detector.df, session.file_path, session.config)) as pool:
+            futures = [pool.submit(_render_chart, kpi, provs, session.quiet) for kpi, provs in jobs]
+            paths = [f.result() for f in futures]
+    for path in paths:
+        print(f"📈 {path}")
+    print(f"✅ Đã vẽ {len(paths)} chart ({workers} process)")
+    return EXIT_OK
+
+
+def _chart_small_multiples(session: MonitorSession, kpis: List[str],
+                           provinces: Optional[List[str]], workers: int) -> int:
+    """Một lưới small multiples cho mỗi KPI (mọi tỉnh hoặc --provinces), tỉnh có cảnh báo tô đỏ."""
+    all_alerts = session.ensure_scanned(kpis)
+    paths = []
+    with session.pipeline_output():
+        for kpi in kpis:
+            alert_provinces = [a['province'] for a in all_alerts.get(kpi, [])]
+            path = session.detector.create_small_multiples_chart(
+                kpi, provinces, alert_provinces=alert_provinces, workers=max(1, workers))
+            if path:
+                paths.append(path)
+    for path in paths:
+        print(f"📈 {path}")
+    print(f"✅ Đã vẽ {len(paths)} lưới small multiples")
+    return EXIT_OK
+
+
+def cmd_merge(session: MonitorSession, args) -> int:
+    from data_backend import get_backend
+    target = args.into or session.file_path
+    backend = get_backend(target)
+    for new_path in args.files:
+        if not os.path.exists(new_path):
+            raise DataError(f"Không tìm thấy file cần gộp: {new_path}")
+        try:
+            stats = backend.upsert(new_path)
+        except (ValueError, RuntimeError) as e:
+            raise DataError(f"Gộp {new_path} thất bại: {e}") from e
+        print(f"➕ {new_path} → {target}: thêm {stats.get('rows_added', 0)}, "
+              f"cập nhật {stats.get('rows_updated', 0)}, tổng {stats.get('total_rows', '?')} dòng")
+    print(f"🔖 Phiên bản dữ liệu: {backend.version()}")
+    if os.path.abspath(target) == os.path.abspath(session.file_path):
+        # Lệnh sau trong chuỗi phải thấy dữ liệu mới
+        session._detector = None
+        session.alerts = None
+    return EXIT_OK
+
+
+def cmd_daemon(session: MonitorSession, args) -> int:
+    from kpi_monitor_daemon import KPIMonitorDaemon
+    # Dùng lại dữ liệu đã load (ví dụ sau 'merge + scan') thay vì đọc lại file
+    daemon = KPIMonitorDaemon(session.file_path, inbox_dir=args.inbox,
+                              kpis=session.resolve_kpis(_split_list(args.kpis)),
+                              poll_interval=args.interval, settle_seconds=args.settle,
+                              config=session.config, detector=session.detector)
+    daemon.run_forever()
+    return EXIT_OK
+
+
+def cmd_serve(session: MonitorSession, args) -> int:
+    from kpi_api_server import serve
+    # Dùng lại dữ liệu đã load, server tự load lại khi dữ liệu gốc đổi phiên bản
+    serve(session.file_path, host=args.host, port=args.port, config=session.config,
+          detector=session.detector, quiet=True, access_log=not args.no_access_log)
+    return EXIT_OK
+
+
+def cmd_bench(session: MonitorSession, args) -> int:
+    from benchmark_kpi import SCENARIOS, SIZES, run_benchmarks
+    sizes = _split_list(args.sizes) or ['small']
+    scenarios = _split_list(args.scenarios) or list(SCENARIOS)
+    unknown = [s for s in sizes if s not in SIZES] + [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        print(f"❌ Không hỗ trợ: {', '.join(unknown)}", file=sys.stderr)
+        return EXIT_USAGE
+    run_benchmarks(sizes, scenarios, repeat=args.repeat, output_dir=args.output_dir)
+    return EXIT_OK
+
+
+# ==== Parser ====
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='kpi_monitor',
+        description="Giám sát KPI chạy nền. Nối nhiều lệnh bằng ' + ' để dùng chung dữ liệu đã load.")
+    parser.add_argument('--file', default=None,
+                        help='File CSV, SQLite (.db) hoặc thư mục/glob nhiều file CSV. '
+                             'Mặc định: KPI_SQLITE_DB, KPI_DATA_DIR hoặc 1.Ngày.csv')
+    parser.add_argument('--lookback', type=int, default=None, help='Số ngày so sánh (mặc định theo CONFIG)')
+    parser.add_argument('--threshold', type=float, default=None, help='Ngưỡng suy giảm %% (mặc định theo CONFIG)')
+    parser.add_argument('--last-days', type=int, default=None,
+                        help='Chỉ đọc N ngày gần nhất (với thư mục nhiều file: chỉ đọc file liên quan)')
+    parser.add_argument('--load-workers', type=int, default=None,
+                        help='Số process đọc song song khi --file là thư mục nhiều file (mặc định KPI_LOAD_WORKERS hoặc 1)')
+    parser.add_argument('--quiet', action='store_true', help='Ẩn log chi tiết của pipeline')
+    parser.add_argument('--profile', nargs='?', const='cprofile', default=None,
+                        help='Profile lần chạy (cprofile|pyinstrument), ghi vào profiles/')
+    add_subcommands(parser)
+    return parser
+
+
+def add_subcommands(parser: argparse.ArgumentParser):
+    sub = parser.add_subparsers(dest='command', metavar='{scan,report,chart,merge,bench,daemon,serve}')
+    sub.required = True
+
+    p = sub.add_parser('scan', help='Phát hiện suy giảm')
+    p.add_argument('--kpis', help='Danh sách KPI, phân tách bằng dấu phẩy (mặc định: KPI quan trọng)')
+    p.add_argument('--provinces', help='Chỉ quét các tỉnh này (phân tách bằng dấu phẩy)')
+    p.add_argument('--json', help='Ghi cảnh báo ra file JSON')
+    p.add_argument('--fail-on-alert', action='store_true', help='Thoát với mã 1 nếu có cảnh báo')
+    p.set_defaults(func=cmd_scan)
+
+    p = sub.add_parser('report', help='Xuất báo cáo suy giảm (CSV/Parquet/XLSX + JSON tóm tắt)')
+    p.add_argument('--kpis', help='KPI cần quét nếu chưa chạy scan trước đó')
+    p.add_argument('--output', help='Đường dẫn file CSV (mặc định reports/decline_report_YYYYMMDD.csv); '
+                                    'định dạng khác dùng cùng tên với đuôi tương ứng')
+    p.add_argument('--formats', help='Định dạng cần xuất, phân tách bằng dấu phẩy: csv,parquet,xlsx,json '
+                                     '(mặc định: csv)')
+    p.add_argument('--html', action='store_true',
+                   help='Ghi thêm báo cáo HTML một file (daily_report_YYYYMMDD.html, có sparkline tỉnh × KPI)')
+    p.set_defaults(func=cmd_report)
+
+    p = sub.add_parser('chart', help='Vẽ trend chart PNG')
+    p.add_argument('--kpis', help='KPI cần vẽ (mặc định: KPI quan trọng có cảnh báo)')
+    p.add_argument('--provinces', help='Tỉnh cần vẽ (mặc định: tỉnh có cảnh báo)')
+    p.add_argument('--all-provinces', action='store_true', help='Vẽ tất cả tỉnh')
+    p.add_argument('--workers', type=int, default=1, help='Số process vẽ song song')
+    p.add_argument('--small-multiples', action='store_true',
+                   help='Mỗi KPI một lưới: mỗi tỉnh một ô, chung trục, tỉnh cảnh báo tô đỏ')
+    p.add_argument('--heatmap', action='store_true',
+                   help='Một heatmap tỉnh × KPI (% thay đổi theo hướng KPI, vi phạm ngưỡng, cảnh báo)')
+    p.set_defaults(func=cmd_chart)
+
+    p = sub.add_parser('merge', help='Gộp file ngày mới vào dữ liệu hiện tại')
+    p.add_argument('files', nargs='+', help='Các file CSV cần gộp (theo thứ tự)')
+    p.add_argument('--into', help='Dữ liệu đích (mặc định: --file)')
+    p.set_defaults(func=cmd_merge)
+
+    p = sub.add_parser('bench', help='Chạy benchmark trên dữ liệu giả lập')
+    p.add_argument('--sizes', default='small', help='small,medium,large')
+    p.add_argument('--scenarios', default=None, help='load,load_files,scan,chart,merge')
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--output-dir', default='benchmark_results')
+    p.set_defaults(func=cmd_bench)
+
+    from kpi_monitor_daemon import build_arg_parser
+    p = sub.add_parser('daemon', help='Chạy nền: theo dõi inbox, gộp file mới và gửi cảnh báo')
+    build_arg_parser(p)
+    p.set_defaults(func=cmd_daemon)
+
+    from kpi_api_server import build_arg_parser as build_serve_parser
+    p = sub.add_parser('serve', help='API HTTP/JSON cục bộ (series, alerts, report)')
+    build_serve_parser(p)
+    p.set_defaults(func=cmd_serve)
+
+
+def parse_chain(argv: List[str]) -> List[argparse.Namespace]:
+    """Tách argv theo ' + ' thành nhiều lệnh con; tùy chọn chung lấy từ đoạn đầu tiên."""
+    segments, current = [], []
+    for arg in argv:
+        if arg == CHAIN_SEPARATOR:
+            segments.append(current)
+            current = []
+        else:
+            current.append(arg)
+    segments.append(current)
+
+    parser = build_parser()
+    first = parser.parse_args(segments[0])
+    chain = [first]
+    for segment in segments[1:]:
+        if not segment:
+            parser.error("Thiếu lệnh con sau '+'")
+        ns = parser.parse_args(segment)
+        # Tùy chọn chung chỉ có hiệu lực ở đoạn đầu
+        for opt in ('file', 'lookback', 'threshold', 'last_days', 'load_workers', 'quiet', 'profile'):
+            setattr(ns, opt, getattr(first, opt))
+        chain.append(ns)
+    return chain
+
+
+def run(argv: List[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        chain = parse_chain(argv)
+    except SystemExit as e:
+        return EXIT_USAGE if e.code else EXIT_OK
+
+    first = chain[0]
+    from profiling import profile_run, profiling_mode
+
+    exit_code = EXIT_OK
+    with profile_run('kpi_monitor', profiling_mode(first.profile)):
+        session = MonitorSession(first.file or _default_data_path(), lookback_days=first.lookback,
+                                 threshold=first.threshold, quiet=first.quiet, last_days=first.last_days,
+                                 load_workers=first.load_workers)
+        for args in chain:
+            try:
+                code = args.func(session, args)
+            except DataError as e:
+                print(f"❌ {e}", file=sys.stderr)
+                return EXIT_DATA_ERROR
+            except Exception as e:
+                print(f"❌ Lỗi khi chạy '{args.command}': {e}", file=sys.stderr)
+                return EXIT_ERROR
+            exit_code = max(exit_code, code)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,306 @@
+"""
+KPI MONITOR DAEMON - THEO DÕI THƯ MỤC INBOX VÀ QUÉT TỰ ĐỘNG
+===========================================================
+Chạy nền liên tục thay cho quy trình "thả file → mở app → bấm gộp → bấm quét":
+1. Load dữ liệu một lần và giữ DataFrame đã làm sạch trong bộ nhớ
+2. Theo dõi thư mục inbox (watchdog/inotify nếu đã cài, nếu không thì polling)
+3. File CSV mới → gộp vào dữ liệu gốc (có khóa, ghi nguyên tử) + gộp tăng dần vào bộ nhớ
+4. Chỉ phát hiện lại suy giảm cho các tỉnh có trong file mới
+5. Gửi cảnh báo MỚI qua AlertSystem (không gửi lại cảnh báo đã gửi)
+
+Sử dụng:
+    python kpi_monitor_daemon.py --inbox inbox --file 1.Ngày.csv --interval 10
+    python kpi_monitor.py daemon --inbox inbox
+
+File đã xử lý được chuyển vào inbox/processed/YYYYMMDD/, file lỗi vào inbox/failed/.
+"""
+
+import argparse
+import os
+import shutil
+import signal
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from data_backend import DATA_FILE_PATH, get_backend, read_csv_any
+from kpi_decline_detection_pipeline import KPIDeclineDetector
+
+try:
+    from alert_system import AlertSystem
+except ImportError:
+    AlertSystem = None
+
+# Optional: watchdog (inotify/FSEvents/ReadDirectoryChangesW) để phản ứng ngay khi có file
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    HAS_WATCHDOG = True
+except ImportError:
+    HAS_WATCHDOG = False
+
+INBOX_PATTERNS = ('.csv',)
+# File tạm của Excel/trình duyệt đang ghi dở
+IGNORED_PREFIXES = ('~$', '.')
+IGNORED_SUFFIXES = ('.tmp', '.part', '.crdownload')
+
+
+class KPIMonitorDaemon:
+    """Daemon giữ dữ liệu KPI trong bộ nhớ và xử lý file mới trong inbox"""
+
+    def __init__(self, data_path: str = DATA_FILE_PATH, inbox_dir: str = 'inbox',
+                 kpis: Optional[List[str]] = None, poll_interval: float = 10.0,
+                 settle_seconds: float = 2.0, config: Dict = None,
+                 detector: KPIDeclineDetector = None, alert_system=None):
+        """
+        Args:
+            data_path: Dữ liệu gốc (CSV hoặc SQLite .db) để gộp file mới vào
+            inbox_dir: Thư mục theo dõi
+            kpis: KPI cần quét (None = critical_kpis trong CONFIG)
+            poll_interval: Chu kỳ kiểm tra inbox (giây)
+            settle_seconds: File phải không đổi kích thước trong khoảng này mới được xử lý
+            config: Cấu hình detector (None = CONFIG)
+            detector: Detector đã load sẵn dữ liệu (None = tự load)
+            alert_system: AlertSystem để gửi cảnh báo (None = tạo mới nếu có module)
+        """
+        self.data_path = data_path
+        self.backend = get_backend(data_path)
+        self.inbox_dir = inbox_dir
+        self.processed_dir = os.path.join(inbox_dir, 'processed')
+        self.failed_dir = os.path.join(inbox_dir, 'failed')
+        self.poll_interval = poll_interval
+        self.settle_seconds = settle_seconds
+        self.detector = detector or KPIDeclineDetector(data_path, config=config)
+        self.kpis = kpis
+        if alert_system is None and AlertSystem is not None:
+            alert_system = AlertSystem()
+        self.alert_system = alert_system
+
+        self.data_version = None
+        # Trạng thái cảnh báo hiện tại: (kpi, tỉnh) → alert
+        self.current_alerts: Dict[Tuple[str, str], Dict] = {}
+        # Cảnh báo đã gửi: (kpi, tỉnh, ngày) để không gửi lại
+        self._sent = set()
+        # Kích thước/mtime lần trước của file trong inbox để biết file đã ghi xong chưa
+        self._pending: Dict[str, Tuple[int, int, float]] = {}
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._observer = None
+        os.makedirs(self.inbox_dir, exist_ok=True)
+
+    # ==== Dữ liệu ====
+
+    def _kpi_list(self) -> List[str]:
+        kpis = self.kpis or self.detector.config['critical_kpis']
+        return [k for k in kpis if k in self.detector.df.columns]
+
+    def load(self):
+        """Load toàn bộ dữ liệu (lần đầu hoặc khi dữ liệu gốc bị thay đổi từ bên ngoài)."""
+        if self.detector.df is None or self.data_version is not None:
+            self.detector.load_and_clean_data()
+        self.data_version = self.backend.version()
+        self.current_alerts = {}
+        self.rescan()
+
+    def rescan(self, provinces: Optional[List[str]] = None) -> List[Dict]:
+        """
+        Phát hiện lại suy giảm (chỉ cho provinces nếu có) và gửi các cảnh báo mới
+
+        Returns:
+            Danh sách cảnh báo mới được gửi
+        """
+        fresh = []
+        for kpi in self._kpi_list():
+            alerts = self.detector.detect_declines(kpi, provinces=provinces)
+            # Bỏ trạng thái cũ của các tỉnh vừa quét lại
+            for key in [k for k in self.current_alerts if k[0] == kpi
+                        and (provinces is None or k[1] in provinces)]:
+                del self.current_alerts[key]
+            for alert in alerts:
+                self.current_alerts[(kpi, alert['province'])] = alert
+                sent_key = (kpi, alert['province'], alert['latest_date'])
+                if sent_key not in self._sent:
+                    self._sent.add(sent_key)
+                    fresh.append(alert)
+        self.detector.decline_alerts = {}
+        for (kpi, _), alert in self.current_alerts.items():
+            self.detector.decline_alerts.setdefault(kpi, []).append(alert)
+        self._emit(fresh)
+        return fresh
+
+    def _emit(self, alerts: List[Dict]):
+        if not alerts:
+            return
+        print(f"\n📢 {len(alerts)} cảnh báo mới")
+        if self.alert_system is None:
+            for alert in alerts:
+                print(f"   ⚠️  {alert['province']}: {alert['kpi']} {alert['decline_pct']:.2f}%")
+            return
+        for alert in alerts:
+            self.alert_system.send_decline_alert(
+                province=alert['province'],
+                kpi=alert['kpi'],
+                decline_pct=alert['decline_pct'],
+                latest_value=alert['latest_value'],
+                compare_value=alert['compare_value']
+            )
+
+    # ==== Inbox ====
+
+    @staticmethod
+    def _is_candidate(name: str) -> bool:
+        lower = name.lower()
+        return (lower.endswith(INBOX_PATTERNS)
+                and not name.startswith(IGNORED_PREFIXES)
+                and not lower.endswith(IGNORED_SUFFIXES))
+
+    def _ready_files(self) -> List[str]:
+        """File trong inbox đã ghi xong (kích thước/mtime không đổi trong settle_seconds)."""
+        now = time.time()
+        seen = {}
+        ready = []
+        with os.scandir(self.inbox_dir) as it:
+            for entry in it:
+                if not entry.is_file() or not self._is_candidate(entry.name):
+                    continue
+                stat = entry.stat()
+                signature = (stat.st_size, stat.st_mtime_ns)
+                previous = self._pending.get(entry.path)
+                if previous and previous[:2] == signature:
+                    first_seen = previous[2]
+                else:
+                    first_seen = now
+                seen[entry.path] = signature + (first_seen,)
+                if previous and previous[:2] == signature and now - first_seen >= self.settle_seconds:
+                    ready.append(entry.path)
+        self._pending = seen
+        return sorted(ready, key=lambda p: (os.path.getmtime(p), p))
+
+    def _move(self, path: str, dest_root: str) -> str:
+        dest_dir = os.path.join(dest_root, datetime.now().strftime('%Y%m%d'))
+        os.makedirs(dest_dir, exist_ok=True)
+        dest = os.path.join(dest_dir, os.path.basename(path))
+        if os.path.exists(dest):
+            stem, ext = os.path.splitext(os.path.basename(path))
+            dest = os.path.join(dest_dir, f"{stem}_{datetime.now().strftime('%H%M%S_%f')}{ext}")
+        shutil.move(path, dest)
+        self._pending.pop(path, None)
+        return dest
+
+    def process_file(self, path: str) -> Dict:
+        """
+        Gộp một file mới: ghi vào dữ liệu gốc, cập nhật bộ nhớ, quét lại các tỉnh bị ảnh hưởng
+
+        Chỉ ném lỗi khi đọc/gộp thất bại (dữ liệu gốc chưa đổi → file vào failed/). Lỗi sau khi đã
+        gộp (cập nhật bộ nhớ/quét) không ném ra: file vẫn vào processed/ để không bị gộp lại lần nữa,
+        dữ liệu trong bộ nhớ được load lại toàn bộ ở vòng kiểm tra sau (phiên bản dữ liệu đã đổi).
+        """
+        print(f"\n📥 File mới: {path}")
+        # Đọc file một lần, dùng chung cho gộp vào dữ liệu gốc và gộp vào bộ nhớ
+        new_raw = read_csv_any(path, low_memory=False)
+        stats = self.backend.upsert(new_raw)
+        try:
+            delta = self.detector.apply_increment(new_raw)
+            # Chỉ ghi nhận phiên bản mới khi bộ nhớ đã khớp dữ liệu gốc
+            self.data_version = self.backend.version()
+            print(f"   ➕ Thêm {delta['rows_added']}, cập nhật {delta['rows_updated']} dòng "
+                  f"({len(delta['provinces'])} tỉnh) → phiên bản {self.data_version}")
+            fresh = self.rescan(delta['provinces'])
+        except Exception as e:
+            print(f"⚠️  Đã gộp {path} vào dữ liệu gốc nhưng lỗi sau khi gộp: {e}")
+            return {'file': path, 'merge': stats, 'delta': None, 'new_alerts': 0, 'error': str(e)}
+        return {'file': path, 'merge': stats, 'delta': delta, 'new_alerts': len(fresh)}
+
+    def poll_once(self) -> List[Dict]:
+        """Một vòng kiểm tra: phát hiện dữ liệu gốc bị sửa từ bên ngoài, xử lý file đã sẵn sàng."""
+        results = []
+        version = self.backend.version()
+        if version != self.data_version:
+            # Ví dụ: gộp từ app.py → load lại toàn bộ thay vì dùng dữ liệu cũ trong bộ nhớ
+            print(f"\n🔄 Dữ liệu gốc thay đổi ({self.data_version} → {version}), load lại...")
+            self.load()
+        for path in self._ready_files():
+            try:
+                results.append(self.process_file(path))
+                self._move(path, self.processed_dir)
+            except Exception as e:
+                # process_file chỉ ném lỗi khi chưa gộp được gì → an toàn để thử lại file
+                print(f"❌ Lỗi khi gộp {path}: {e}")
+                self._move(path, self.failed_dir)
+        return results
+
+    # ==== Vòng lặp ====
+
+    def _start_watcher(self):
+        if not HAS_WATCHDOG:
+            return
+        daemon = self
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory:
+                    daemon._wakeup.set()
+
+        self._observer = Observer()
+        self._observer.schedule(_Handler(), self.inbox_dir, recursive=False)
+        self._observer.start()
+
+    def stop(self):
+        self._stop.set()
+        self._wakeup.set()
+
+    def run_forever(self, max_cycles: int = None):
+        """Chạy đến khi Ctrl+C / SIGTERM (hoặc đủ max_cycles vòng)."""
+        if self.data_version is None:
+            self.load()
+        self._start_watcher()
+        try:
+            signal.signal(signal.SIGTERM, lambda *_: self.stop())
+        except ValueError:
+            pass  # Không phải main thread
+        mode = 'watchdog' if self._observer else f'polling {self.poll_interval:g}s'
+        print(f"\n👀 Đang theo dõi {os.path.abspath(self.inbox_dir)} ({mode}). Ctrl+C để dừng.")
+        cycles = 0
+        try:
+            while not self._stop.is_set():
+                self.poll_once()
+                cycles += 1
+                if max_cycles is not None and cycles >= max_cycles:
+                    break
+                # Có file đang chờ ổn định → kiểm tra lại sớm hơn
+                timeout = min(self.poll_interval, self.settle_seconds) if self._pending else self.poll_interval
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if self._observer is not None:
+                self._observer.stop()
+                self._observer.join(timeout=5)
+            print("\n🛑 Đã dừng daemon")
+
+
+def build_arg_parser(parser: argparse.ArgumentParser = None) -> argparse.ArgumentParser:
+    parser = parser or argparse.ArgumentParser(description='Daemon theo dõi inbox và quét suy giảm KPI')
+    parser.add_argument('--inbox', default='inbox', help='Thư mục theo dõi file CSV mới')
+    parser.add_argument('--interval', type=float, default=10.0, help='Chu kỳ kiểm tra (giây)')
+    parser.add_argument('--settle', type=float, default=2.0,
+                        help='File phải không đổi trong khoảng này (giây) mới được xử lý')
+    parser.add_argument('--kpis', default=None,
+                        help='KPI cần quét, phân tách bằng dấu phẩy (mặc định: KPI quan trọng)')
+    return parser
+
+
+def main():
+    parser = build_arg_parser()
+    parser.add_argument('--file', default=os.environ.get('KPI_SQLITE_DB') or DATA_FILE_PATH,
+                        help='Dữ liệu gốc (CSV hoặc SQLite .db)')
+    args = parser.parse_args()
+    kpis = [k.strip() for k in args.kpis.split(',')] if args.kpis else None
+    KPIMonitorDaemon(args.file, inbox_dir=args.inbox, kpis=kpis, poll_interval=args.interval,
+                     settle_seconds=args.settle).run_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+PROFILING - CHỤP PROFILE CỦA MỘT LẦN CHẠY THỰC TẾ
+=================================================
+Bật bằng biến môi trường hoặc cờ dòng lệnh, mỗi lần chạy ghi một file vào profiles/:
+- KPI_PROFILE=1 (hoặc cprofile)  → profiles/<tên>_<thời gian>.prof (+ .txt top hàm theo cumulative)
+- KPI_PROFILE=pyinstrument       → profiles/<tên>_<thời gian>.html (cần pip install pyinstrument,
+                                   nếu chưa cài sẽ dùng cProfile)
+- Cờ CLI: --profile hoặc --profile=pyinstrument
+
+Sử dụng:
+    KPI_PROFILE=1 python kpi_decline_detection_pipeline.py
+    python analyze_any_province_kpi.py "Ninh thuan" CSSR --profile
+    KPI_PROFILE=pyinstrument streamlit run app.py   # profile từng lần rerun
+
+Xem file .prof: python -m pstats profiles/xxx.prof  hoặc  snakeviz profiles/xxx.prof
+"""
+
+import cProfile
+import io
+import os
+import pstats
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+try:
+    from pyinstrument import Profiler as PyinstrumentProfiler
+    HAS_PYINSTRUMENT = True
+except ImportError:
+    HAS_PYINSTRUMENT = False
+
+PROFILE_ENV = 'KPI_PROFILE'
+PROFILES_DIR = 'profiles'
+PROFILE_MODES = ('cprofile', 'pyinstrument')
+
+
+def profiling_mode(flag: Optional[str] = None) -> Optional[str]:
+    """
+    Xác định chế độ profile từ cờ CLI (ưu tiên) hoặc biến môi trường KPI_PROFILE
+
+    Returns:
+        'cprofile', 'pyinstrument' hoặc None (không profile)
+    """
+    value = flag if flag is not None else os.environ.get(PROFILE_ENV, '')
+    value = str(value).strip().lower()
+    if value in ('', '0', 'false', 'no', 'off'):
+        return None
+    if value == 'pyinstrument':
+        if HAS_PYINSTRUMENT:
+            return 'pyinstrument'
+        print("⚠️  pyinstrument chưa được cài đặt (pip install pyinstrument). Dùng cProfile thay thế.")
+    return 'cprofile'
+
+
+def strip_profile_flag(argv: List[str]) -> Tuple[List[str], Optional[str]]:
+    """Bỏ cờ --profile / --profile=<mode> khỏi argv. Trả về (argv còn lại, giá trị cờ hoặc None)."""
+    rest, flag = [], None
+    for arg in argv:
+        if arg == '--profile':
+            flag = 'cprofile'
+        elif arg.startswith('--profile='):
+            flag = arg.split('=', 1)[1] or 'cprofile'
+        else:
+            rest.append(arg)
+    return rest, flag
+
+
+class ProfileSession:
+    """Một lần profile (cProfile hoặc pyinstrument) cho luồng hiện tại."""
+
+    def __init__(self, name: str, mode: str = 'cprofile', out_dir: str = PROFILES_DIR):
+        self.name = name
+        self.mode = mode
+        self.out_dir = out_dir
+        self.started_at = datetime.now()
+        self.path = None
+        self._profiler = None
+
+    @property
+    def running(self) -> bool:
+        return self._profiler is not None
+
+    def start(self) -> bool:
+        """Bắt đầu profile. Trả về False nếu không bật được (ví dụ đã có profiler khác đang chạy)."""
+        try:
+            if self.mode == 'pyinstrument':
+                self._profiler = PyinstrumentProfiler()
+                self._profiler.start()
+            else:
+                self._profiler = cProfile.Profile()
+                self._profiler.enable()
+        except (ValueError, RuntimeError) as e:
+            # Python 3.12+: chỉ một profiler được hoạt động tại một thời điểm
+            print(f"⚠️  Không bật được profiler: {e}")
+            self._profiler = None
+            return False
+        return True
+
+    def stop(self) -> Optional[str]:
+        """Dừng profile và ghi file. Trả về đường dẫn file profile chính."""
+        if self._profiler is None:
+            return None
+        profiler, self._profiler = self._profiler, None
+        os.makedirs(self.out_dir, exist_ok=True)
+        stamp = self.started_at.strftime('%Y%m%d_%H%M%S_%f')[:-3]
+        base = os.path.join(self.out_dir, f'{self.name}_{stamp}')
+
+        if self.mode == 'pyinstrument':
+            profiler.stop()
+            self.path = base + '.html'
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            with open(base + '.txt', 'w', encoding='utf-8') as f:
+                f.write(profiler.output_text(unicode=True, color=False))
+        else:
+            profiler.disable()
+            self.path = base + '.prof'
+            profiler.dump_stats(self.path)
+            # Bản text top 40 hàm theo cumulative time để đính kèm ticket
+            buffer = io.StringIO()
+            pstats.Stats(profiler, stream=buffer).sort_stats('cumulative').print_stats(40)
+            with open(base + '.txt', 'w', encoding='utf-8') as f:
+                f.write(buffer.getvalue())
+        return self.path
+
+
+@contextmanager
+def profile_run(name: str, mode: Optional[str] = None, out_dir: str = PROFILES_DIR):
+    """
+    Profile khối lệnh nếu mode khác None (mode=None → không làm gì)
+
+    Ví dụ:
+        with profile_run('pipeline', profiling_mode(flag)):
+            main()
+    """
+    if mode is None:
+        yield None
+        return
+    session = ProfileSession(name, mode, out_dir)
+    started = session.start()
+    try:
+        yield session
+    finally:
+        if started:
+            path = session.stop()
+            print(f"🧪 Đã lưu profile ({mode}): {path}")
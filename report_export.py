@@ -0,0 +1,253 @@
+"""
+REPORT EXPORT - XUẤT BÁO CÁO SUY GIẢM NHIỀU ĐỊNH DẠNG
+=====================================================
+Ghi báo cáo của generate_decline_report ra nhiều định dạng trong một lần gọi:
+- CSV (UTF-8-BOM, mở thẳng bằng Excel - giống file trước đây)
+- Parquet (cột ngày kiểu date, cần pyarrow) cho phân tích/nạp kho dữ liệu
+- XLSX có tô màu theo mức độ (conditional formatting, cần xlsxwriter hoặc openpyxl)
+- JSON tóm tắt gọn cho hệ thống khác (số cảnh báo theo mức độ/KPI, tỉnh tệ nhất)
+
+Định dạng thiếu thư viện được bỏ qua kèm thông báo. File đang bị khóa (ví dụ đang mở
+trong Excel) → ghi sang reports/YYYYMMDD/<tên>_HHMMSS.<đuôi> như trước.
+
+Sử dụng:
+    from report_export import export_decline_report
+
+    report_df = detector.generate_decline_report(detector.alerts_frame)
+    paths = export_decline_report(report_df, 'reports')
+    # {'csv': 'reports/decline_report_20250101.csv', 'parquet': ..., 'xlsx': ..., 'json': ...}
+"""
+
+import json
+import os
+from datetime import datetime
+from typing import Callable, Dict, Iterable, Optional
+
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_PYARROW = True
+except ImportError:
+    HAS_PYARROW = False
+
+try:
+    import xlsxwriter  # noqa: F401
+    HAS_XLSXWRITER = True
+except ImportError:
+    HAS_XLSXWRITER = False
+
+try:
+    import openpyxl  # noqa: F401
+    HAS_OPENPYXL = True
+except ImportError:
+    HAS_OPENPYXL = False
+
+REPORT_FORMATS = ('csv', 'parquet', 'xlsx', 'json')
+SUMMARY_TOP_N = 10  # Số dòng suy giảm mạnh nhất trong JSON tóm tắt
+
+# Màu nền dòng XLSX theo mức độ (cùng thứ tự nghiêm trọng giảm dần)
+SEVERITY_FILLS = {
+    'Cực kỳ nghiêm trọng': '#F8CBAD',
+    'Nghiêm trọng': '#FCE4B6',
+    'Cảnh báo': '#FFF2CC',
+    'Nhẹ': '#E2EFDA',
+}
+_SEVERITY_COLUMN = 'Mức độ'
+_DATE_COLUMN = 'Ngày'
+
+
+def _typed_dates(report_df: pd.DataFrame) -> pd.DataFrame:
+    """Bản sao (index 0..n-1) với cột Ngày kiểu datetime (CSV giữ chuỗi DD/MM/YYYY như cũ)"""
+    typed = report_df.reset_index(drop=True)
+    if _DATE_COLUMN in typed.columns and not pd.api.types.is_datetime64_any_dtype(typed[_DATE_COLUMN]):
+        typed[_DATE_COLUMN] = pd.to_datetime(typed[_DATE_COLUMN], format='%d/%m/%Y', errors='coerce')
+    return typed
+
+
+def _write_with_fallback(path: str, write: Callable[[str], None]) -> str:
+    """Ghi file; nếu bị khóa (PermissionError) thì ghi vào thư mục theo ngày với tên có giờ"""
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    try:
+        write(path)
+        return path
+    except PermissionError:
+        date_str = datetime.now().strftime('%Y%m%d')
+        dated_dir = os.path.join(out_dir, date_str)
+        os.makedirs(dated_dir, exist_ok=True)
+        stem, ext = os.path.splitext(os.path.basename(path))
+        alt_path = os.path.join(dated_dir, f"{stem}_{datetime.now().strftime('%H%M%S')}{ext}")
+        write(alt_path)
+        print(f"⚠️  File {path} đang bị khóa (có thể đang mở trong Excel).\n   → Đã lưu tạm vào: {alt_path}")
+        return alt_path
+
+
+def _write_xlsx(typed: pd.DataFrame, path: str):
+    """XLSX một sheet (typed: báo cáo có cột Ngày kiểu datetime): header cố định, autofilter,
+    tô màu cả dòng theo cột Mức độ"""
+    n_rows, n_cols = typed.shape
+    sheet = 'Suy giam'
+    severity_idx = list(typed.columns).index(_SEVERITY_COLUMN) if _SEVERITY_COLUMN in typed.columns else None
+    widths = [max(len(str(col)), 12) + 2 for col in typed.columns]
+
+    if HAS_XLSXWRITER:
+        with pd.ExcelWriter(path, engine='xlsxwriter', datetime_format='dd/mm/yyyy',
+                            date_format='dd/mm/yyyy') as writer:
+            typed.to_excel(writer, sheet_name=sheet, index=False)
+            ws = writer.sheets[sheet]
+            ws.freeze_panes(1, 0)
+            ws.autofilter(0, 0, n_rows, n_cols - 1)
+            for i, width in enumerate(widths):
+                ws.set_column(i, i, width)
+            if severity_idx is not None and n_rows:
+                col_letter = _column_letter(severity_idx)
+                for label, color in SEVERITY_FILLS.items():
+                    fmt = writer.book.add_format({'bg_color': color})
+                    ws.conditional_format(1, 0, n_rows, n_cols - 1, {
+                        'type': 'formula', 'criteria': f'=${col_letter}2="{label}"', 'format': fmt})
+        return
+
+    from openpyxl.formatting.rule import FormulaRule
+    from openpyxl.styles import PatternFill
+    with pd.ExcelWriter(path, engine='openpyxl', datetime_format='dd/mm/yyyy',
+                        date_format='dd/mm/yyyy') as writer:
+        typed.to_excel(writer, sheet_name=sheet, index=False)
+        ws = writer.sheets[sheet]
+        ws.freeze_panes = 'A2'
+        last_cell = f"{_column_letter(n_cols - 1)}{n_rows + 1}"
+        ws.auto_filter.ref = f"A1:{last_cell}"
+        for i, width in enumerate(widths):
+            ws.column_dimensions[_column_letter(i)].width = width
+        if _DATE_COLUMN in typed.columns:
+            # openpyxl bỏ qua datetime_format của ExcelWriter → đặt định dạng ngày từng ô
+            date_col = _column_letter(list(typed.columns).index(_DATE_COLUMN))
+            for (cell,) in ws[f"{date_col}2:{date_col}{n_rows + 1}"]:
+                cell.number_format = 'dd/mm/yyyy'
+        if severity_idx is not None and n_rows:
+            col_letter = _column_letter(severity_idx)
+            for label, color in SEVERITY_FILLS.items():
+                fill = PatternFill(start_color=color.lstrip('#'), end_color=color.lstrip('#'), fill_type='solid')
+                ws.conditional_formatting.add(f"A2:{last_cell}", FormulaRule(
+                    formula=[f'${col_letter}2="{label}"'], fill=fill))
+
+
+def _column_letter(idx: int) -> str:
+    """Chỉ số cột (0 = A) → chữ cột Excel"""
+    letters = ''
+    idx += 1
+    while idx:
+        idx, rem = divmod(idx - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+    return letters
+
+
+def report_summary(report_df: Optional[pd.DataFrame], top_n: int = SUMMARY_TOP_N) -> Dict:
+    """
+    Tóm tắt gọn của báo cáo cho hệ thống khác
+
+    Returns:
+        {'generated_at', 'n_alerts', 'latest_date', 'by_severity': {mức độ: số cảnh báo},
+         'by_kpi': [{'kpi', 'n_alerts', 'worst_province', 'worst_decline_pct'}],
+         'top': [{'kpi', 'province', 'date', 'decline_pct', 'severity'}]}
+    """
+    summary = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'n_alerts': 0,
+        'latest_date': None,
+        'by_severity': {label: 0 for label in SEVERITY_FILLS},
+        'by_kpi': [],
+        'top': [],
+    }
+    if report_df is None or len(report_df) == 0:
+        return summary
+
+    typed = _typed_dates(report_df)
+    summary['n_alerts'] = int(len(typed))
+    latest = typed[_DATE_COLUMN].max()
+    summary['latest_date'] = latest.strftime('%Y-%m-%d') if pd.notna(latest) else None
+    counts = typed[_SEVERITY_COLUMN].value_counts()
+    summary['by_severity'].update({str(k): int(v) for k, v in counts.items()})
+
+    # Suy giảm mạnh nhất = decline_pct nhỏ nhất (âm nhất) của mỗi KPI
+    grouped = typed.groupby('KPI', sort=False)
+    worst = typed.loc[grouped['Suy giảm (%)'].idxmin()].set_index('KPI')
+    n_by_kpi = grouped.size()
+    summary['by_kpi'] = [
+        {'kpi': str(kpi), 'n_alerts': int(n_by_kpi[kpi]),
+         'worst_province': str(worst.at[kpi, 'Tỉnh']),
+         'worst_decline_pct': float(worst.at[kpi, 'Suy giảm (%)'])}
+        for kpi in worst.sort_values('Suy giảm (%)', kind='stable').index
+    ]
+
+    top = typed.nsmallest(top_n, 'Suy giảm (%)', keep='first')
+    summary['top'] = [
+        {'kpi': kpi, 'province': province, 'date': date.strftime('%Y-%m-%d') if pd.notna(date) else None,
+         'decline_pct': float(pct), 'severity': severity}
+        for kpi, province, date, pct, severity in zip(top['KPI'], top['Tỉnh'], top[_DATE_COLUMN],
+                                                      top['Suy giảm (%)'], top[_SEVERITY_COLUMN])
+    ]
+    return summary
+
+
+def export_decline_report(report_df: Optional[pd.DataFrame], out_dir: str = 'reports',
+                          basename: str = None, formats: Iterable[str] = REPORT_FORMATS) -> Dict[str, str]:
+    """
+    Ghi báo cáo ra các định dạng được chọn
+
+    Args:
+        report_df: Kết quả generate_decline_report (None/rỗng → chỉ ghi JSON tóm tắt nếu được chọn)
+        out_dir: Thư mục đích
+        basename: Tên file không đuôi (mặc định decline_report_YYYYMMDD; JSON là decline_summary_YYYYMMDD)
+        formats: Các định dạng trong REPORT_FORMATS
+
+    Returns:
+        Dict định dạng → đường dẫn đã ghi (định dạng bị bỏ qua không có trong dict)
+    """
+    formats = [f.strip().lower() for f in formats]
+    unknown = [f for f in formats if f not in REPORT_FORMATS]
+    if unknown:
+        raise ValueError(f"Định dạng không hỗ trợ: {', '.join(unknown)} (chọn trong {', '.join(REPORT_FORMATS)})")
+    date_str = datetime.now().strftime('%Y%m%d')
+    basename = basename or f"decline_report_{date_str}"
+    has_rows = report_df is not None and len(report_df) > 0
+    # Chuyển cột ngày một lần, dùng chung cho Parquet/XLSX/JSON
+    typed = _typed_dates(report_df) if has_rows else None
+    paths = {}
+
+    if has_rows and 'csv' in formats:
+        paths['csv'] = _write_with_fallback(
+            os.path.join(out_dir, f"{basename}.csv"),
+            lambda p: report_df.to_csv(p, index=False, encoding='utf-8-sig'))
+
+    if has_rows and 'parquet' in formats:
+        if HAS_PYARROW:
+            paths['parquet'] = _write_with_fallback(
+                os.path.join(out_dir, f"{basename}.parquet"),
+                lambda p: typed.to_parquet(p, index=False))
+        else:
+            print("⚠️  Bỏ qua Parquet: cần pyarrow (pip install pyarrow)")
+
+    if has_rows and 'xlsx' in formats:
+        if HAS_XLSXWRITER or HAS_OPENPYXL:
+            paths['xlsx'] = _write_with_fallback(
+                os.path.join(out_dir, f"{basename}.xlsx"),
+                lambda p: _write_xlsx(typed, p))
+        else:
+            print("⚠️  Bỏ qua XLSX: cần xlsxwriter hoặc openpyxl (pip install xlsxwriter)")
+
+    if 'json' in formats:
+        summary = report_summary(typed)
+        summary['files'] = {fmt: os.path.basename(path) for fmt, path in paths.items()}
+        json_name = basename.replace('decline_report', 'decline_summary', 1)
+        if json_name == basename:
+            json_name = f"{basename}_summary"
+
+        def _write_json(p):
+            with open(p, 'w', encoding='utf-8') as f:
+                json.dump(summary, f, ensure_ascii=False, separators=(',', ':'))
+
+        paths['json'] = _write_with_fallback(os.path.join(out_dir, f"{json_name}.json"), _write_json)
+
+    return paths
@@ -0,0 +1,258 @@
+"""
+SNAPSHOT STORE - LƯU TRỮ SNAPSHOT KPI THEO NGÀY
+================================================
+Lưu aggregate theo (ngày, tỉnh, KPI) của mỗi lần chạy pipeline vào SQLite
+để tra cứu "giá trị tại ngày X" và so sánh tuần-qua-tuần mà không cần
+đọc lại toàn bộ dữ liệu gốc.
+"""
+
+import os
+import sqlite3
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    run_at TEXT NOT NULL,
+    source TEXT,
+    data_min_date TEXT,
+    data_max_date TEXT,
+    n_rows INTEGER
+);
+-- Aggregate theo ngày dữ liệu: mỗi lần chạy upsert giá trị mới nhất đã biết
+CREATE TABLE IF NOT EXISTS kpi_daily (
+    data_date TEXT NOT NULL,
+    province TEXT NOT NULL,
+    kpi TEXT NOT NULL,
+    value REAL,
+    n_rows INTEGER,
+    run_id INTEGER,
+    PRIMARY KEY (data_date, province, kpi)
+);
+CREATE INDEX IF NOT EXISTS idx_kpi_daily_kpi_date ON kpi_daily (kpi, data_date);
+CREATE INDEX IF NOT EXISTS idx_kpi_daily_prov_kpi_date ON kpi_daily (province, kpi, data_date);
+-- Trạng thái mới nhất của từng (tỉnh, KPI) tại mỗi lần chạy
+CREATE TABLE IF NOT EXISTS run_latest (
+    run_id INTEGER NOT NULL,
+    province TEXT NOT NULL,
+    kpi TEXT NOT NULL,
+    latest_date TEXT,
+    latest_value REAL,
+    PRIMARY KEY (run_id, province, kpi)
+);
+"""
+
+
+def _to_iso_date(value) -> Optional[str]:
+    """Chuẩn hóa ngày (datetime, 'DD/MM/YYYY' hoặc 'YYYY-MM-DD') về chuỗi 'YYYY-MM-DD'."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        try:
+            ts = pd.to_datetime(value, format='%d/%m/%Y')
+        except ValueError:
+            ts = pd.to_datetime(value, format='%Y-%m-%d')
+    else:
+        ts = pd.Timestamp(value)
+    if pd.isna(ts):
+        return None
+    return ts.strftime('%Y-%m-%d')
+
+
+class KPISnapshotStore:
+    """Kho snapshot KPI (SQLite) theo ngày, tỉnh và KPI"""
+
+    def __init__(self, db_path: str):
+        """
+        Args:
+            db_path: File SQLite (pipeline dùng CONFIG['snapshot_db'])
+        """
+        self.db_path = db_path
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Mở kết nối, commit khi thành công và luôn đóng kết nối (tránh giữ khóa file trên Windows)."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def save_snapshot(self, df: pd.DataFrame, kpi_columns: List[str],
+                      group_by: str = 'CTKD7', date_column: str = 'Ngay7',
+                      source: str = None, since: str = None) -> Dict:
+        """
+        Lưu aggregate (mean) theo (ngày, tỉnh, KPI) của DataFrame đã làm sạch
+
+        Args:
+            df: DataFrame đã qua load_and_clean_data (Ngay7 là datetime)
+            kpi_columns: Danh sách cột KPI cần lưu
+            group_by: Cột tỉnh
+            date_column: Cột ngày
+            source: Nguồn dữ liệu (đường dẫn file) để ghi vào bảng runs
+            since: Chỉ ghi lại các ngày >= since (None = ghi tất cả). Dùng khi chạy lại
+                   hằng ngày để không phải upsert toàn bộ lịch sử.
+
+        Returns:
+            Dict thống kê: run_id, số dòng aggregate đã ghi
+        """
+        kpis = [k for k in kpi_columns if k in df.columns]
+        data = df[[date_column, group_by] + kpis]
+        if since is not None:
+            data = data[data[date_column] >= pd.Timestamp(_to_iso_date(since))]
+
+        # QUAN TRỌNG: Bỏ qua giá trị 0 hoặc null giống calculate_trends
+        long_df = data.melt(id_vars=[date_column, group_by], value_vars=kpis,
+                            var_name='kpi', value_name='value')
+        long_df = long_df[long_df['value'].notna() & (long_df['value'] != 0)]
+        agg = (long_df.groupby([date_column, group_by, 'kpi'], observed=True)['value']
+                      .agg(['mean', 'count']).reset_index())
+        agg['data_date'] = agg[date_column].dt.strftime('%Y-%m-%d')
+
+        run_at = datetime.now().isoformat(timespec='seconds')
+        min_date = agg['data_date'].min() if len(agg) else None
+        max_date = agg['data_date'].max() if len(agg) else None
+
+        with self._connect() as conn:
+            cur = conn.execute(
+                "INSERT INTO runs (run_at, source, data_min_date, data_max_date, n_rows) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (run_at, source, min_date, max_date, int(len(df)))
+            )
+            run_id = cur.lastrowid
+            conn.executemany(
+                "INSERT INTO kpi_daily (data_date, province, kpi, value, n_rows, run_id) "
+                "VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(data_date, province, kpi) DO UPDATE SET "
+                "value = excluded.value, n_rows = excluded.n_rows, run_id = excluded.run_id",
+                zip(agg['data_date'], agg[group_by].astype(str), agg['kpi'],
+                    agg['mean'].astype(float), agg['count'].astype(int), [run_id] * len(agg))
+            )
+            # Giá trị mới nhất của từng (tỉnh, KPI) tại lần chạy này
+            if len(agg):
+                latest = agg.sort_values('data_date').groupby([group_by, 'kpi'], observed=True).tail(1)
+                conn.executemany(
+                    "INSERT OR REPLACE INTO run_latest (run_id, province, kpi, latest_date, latest_value) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    zip([run_id] * len(latest), latest[group_by].astype(str), latest['kpi'],
+                        latest['data_date'], latest['mean'].astype(float))
+                )
+
+        print(f"💾 Đã lưu snapshot #{run_id}: {len(agg)} giá trị ({len(kpis)} KPI) → {self.db_path}")
+        return {'run_id': run_id, 'rows_written': int(len(agg)), 'kpis': kpis}
+
+    def value_as_of(self, province: str, kpi: str, as_of) -> Optional[Dict]:
+        """Giá trị gần nhất của (tỉnh, KPI) tại hoặc trước ngày as_of."""
+        as_of_iso = _to_iso_date(as_of)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT data_date, value FROM kpi_daily "
+                "WHERE province = ? AND kpi = ? AND data_date <= ? "
+                "ORDER BY data_date DESC LIMIT 1",
+                (province, kpi, as_of_iso)
+            ).fetchone()
+        if row is None:
+            return None
+        return {'province': province, 'kpi': kpi,
+                'date': pd.Timestamp(row[0]), 'value': row[1]}
+
+    def snapshot_as_of(self, kpi: str, as_of, provinces: Optional[List[str]] = None) -> pd.DataFrame:
+        """Giá trị gần nhất của KPI cho mỗi tỉnh tại hoặc trước ngày as_of."""
+        as_of_iso = _to_iso_date(as_of)
+        query = (
+            "SELECT d.province, d.data_date, d.value FROM kpi_daily d "
+            "JOIN (SELECT province, MAX(data_date) AS max_date FROM kpi_daily "
+            "      WHERE kpi = ? AND data_date <= ? GROUP BY province) m "
+            "ON d.province = m.province AND d.data_date = m.max_date "
+            "WHERE d.kpi = ?"
+        )
+        with self._connect() as conn:
+            result = pd.read_sql_query(query, conn, params=(kpi, as_of_iso, kpi))
+        if provinces:
+            result = result[result['province'].isin(provinces)].copy()
+        result['data_date'] = pd.to_datetime(result['data_date'])
+        return result.sort_values('province').reset_index(drop=True)
+
+    def week_over_week(self, kpi: str, as_of=None, days: int = 7,
+                       provinces: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        So sánh giá trị tại as_of với giá trị tại (as_of - days) cho từng tỉnh
+
+        Returns:
+            DataFrame: province, current_date, current_value, previous_date,
+                       previous_value, change_pct
+        """
+        if as_of is None:
+            as_of = self.latest_data_date(kpi)
+            if as_of is None:
+                return pd.DataFrame(columns=['province', 'current_date', 'current_value',
+                                             'previous_date', 'previous_value', 'change_pct'])
+        as_of_ts = pd.Timestamp(_to_iso_date(as_of))
+        current = self.snapshot_as_of(kpi, as_of_ts, provinces)
+        previous = self.snapshot_as_of(kpi, as_of_ts - timedelta(days=days), provinces)
+        current.columns = ['province', 'current_date', 'current_value']
+        previous.columns = ['province', 'previous_date', 'previous_value']
+        result = current.merge(previous, on='province', how='left')
+        result['change_pct'] = (
+            (result['current_value'] - result['previous_value']) / result['previous_value'] * 100.0
+        ).round(2)
+        return result
+
+    def get_series(self, province: str, kpi: str, start_date=None, end_date=None) -> pd.DataFrame:
+        """Chuỗi giá trị (ngày, value) của (tỉnh, KPI) trong khoảng ngày."""
+        start_iso = _to_iso_date(start_date) or '0000-00-00'
+        end_iso = _to_iso_date(end_date) or '9999-99-99'
+        with self._connect() as conn:
+            result = pd.read_sql_query(
+                "SELECT data_date, value FROM kpi_daily "
+                "WHERE province = ? AND kpi = ? AND data_date BETWEEN ? AND ? "
+                "ORDER BY data_date",
+                conn, params=(province, kpi, start_iso, end_iso)
+            )
+        result['data_date'] = pd.to_datetime(result['data_date'])
+        return result
+
+    def latest_data_date(self, kpi: str = None) -> Optional[pd.Timestamp]:
+        """Ngày dữ liệu mới nhất đã lưu (theo KPI nếu có)."""
+        with self._connect() as conn:
+            if kpi:
+                row = conn.execute("SELECT MAX(data_date) FROM kpi_daily WHERE kpi = ?", (kpi,)).fetchone()
+            else:
+                row = conn.execute("SELECT MAX(data_date) FROM kpi_daily").fetchone()
+        return pd.Timestamp(row[0]) if row and row[0] else None
+
+    def list_runs(self, limit: int = 20) -> pd.DataFrame:
+        """Danh sách các lần chạy gần nhất."""
+        with self._connect() as conn:
+            return pd.read_sql_query(
+                "SELECT * FROM runs ORDER BY run_id DESC LIMIT ?", conn, params=(limit,)
+            )
+
+    def previous_run_latest(self, kpi: str, run_id: int = None) -> pd.DataFrame:
+        """Giá trị mới nhất của từng tỉnh cho KPI tại lần chạy trước run_id (mặc định: lần chạy trước lần cuối)."""
+        with self._connect() as conn:
+            if run_id is None:
+                row = conn.execute("SELECT MAX(run_id) FROM runs").fetchone()
+                run_id = row[0] if row else None
+            if run_id is None:
+                return pd.DataFrame(columns=['province', 'latest_date', 'latest_value'])
+            prev = conn.execute(
+                "SELECT MAX(run_id) FROM run_latest WHERE run_id < ? AND kpi = ?", (run_id, kpi)
+            ).fetchone()
+            if not prev or prev[0] is None:
+                return pd.DataFrame(columns=['province', 'latest_date', 'latest_value'])
+            return pd.read_sql_query(
+                "SELECT province, latest_date, latest_value FROM run_latest "
+                "WHERE run_id = ? AND kpi = ? ORDER BY province",
+                conn, params=(prev[0], kpi)
+            )
@@ -0,0 +1,136 @@
+"""
+SINH DỮ LIỆU KPI GIẢ LẬP
+========================
+Tạo dữ liệu có cùng cấu trúc với 1.Ngày.csv (Textbox164, Ngay7, CTKD7, các cột KPI)
+để benchmark và thử nghiệm mà không cần dữ liệu thật.
+
+Dữ liệu là tất định theo seed: cùng tham số → cùng file, để so sánh kết quả
+benchmark giữa các commit.
+
+Sử dụng:
+    python synthetic_kpi_data.py --provinces 63 --days 365 --output synthetic/1.Ngày.csv
+"""
+
+import argparse
+import os
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+
+# (tên KPI, giá trị nền, độ lệch tương đối) - lấy theo các KPI quan trọng trong CONFIG
+BASE_KPIS = [
+    ('MTCL_2024', 95.0, 0.02),
+    ('CSSR', 99.0, 0.005),
+    ('CDR', 0.3, 0.10),
+    ('ERAB_SR_2022', 99.5, 0.003),
+    ('HOSR_4G_2024', 98.0, 0.01),
+    ('ID4G_USR_DL_THP', 16000.0, 0.05),
+    ('VN_CALL_DR', 0.4, 0.10),
+    ('COVERAGE_4G', 96.0, 0.01),
+]
+
+
+def _kpi_specs(n_kpis: int) -> List[tuple]:
+    """Danh sách (tên, nền, độ lệch) gồm n_kpis KPI; thêm KPI_EXTRA_xx nếu cần nhiều hơn BASE_KPIS."""
+    specs = list(BASE_KPIS[:n_kpis])
+    for i in range(len(specs), n_kpis):
+        specs.append((f'KPI_EXTRA_{i:02d}', 1000.0 * (i + 1), 0.03))
+    return specs
+
+
+def generate_kpi_dataset(n_provinces: int = 63, n_days: int = 365, n_kpis: int = 6,
+                         start_date: str = '2024-01-01', zero_rate: float = 0.01,
+                         null_rate: float = 0.01, thousands_sep: bool = True,
+                         decline_rate: float = 0.1, seed: int = 42) -> pd.DataFrame:
+    """
+    Sinh DataFrame dạng thô giống 1.Ngày.csv (giá trị KPI là chuỗi như file export)
+
+    Args:
+        n_provinces: Số tỉnh (CTKD7)
+        n_days: Số ngày liên tiếp tính từ start_date
+        n_kpis: Số cột KPI
+        start_date: Ngày đầu tiên ('YYYY-MM-DD')
+        zero_rate: Tỷ lệ ô KPI = 0 (ngày lỗi dữ liệu)
+        null_rate: Tỷ lệ ô KPI rỗng
+        thousands_sep: Định dạng số có dấu phẩy hàng nghìn ("16,234.50") như file export
+        decline_rate: Tỷ lệ (tỉnh, KPI) bị suy giảm dần ở 14 ngày cuối để có cảnh báo
+        seed: Seed cho bộ sinh ngẫu nhiên
+
+    Returns:
+        DataFrame thô: Textbox164, Ngay7 ('DD/MM/YYYY'), CTKD7, các cột KPI (chuỗi)
+    """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range(start_date, periods=n_days, freq='D')
+    provinces = [f'Tinh {i:02d}' for i in range(n_provinces)]
+    n_rows = n_days * n_provinces
+
+    # Sắp xếp theo ngày rồi tỉnh giống file export
+    date_idx = np.repeat(np.arange(n_days), n_provinces)
+    prov_idx = np.tile(np.arange(n_provinces), n_days)
+
+    data = {
+        'Textbox164': np.arange(1, n_rows + 1),
+        'Ngay7': dates.strftime('%d/%m/%Y').to_numpy()[date_idx],
+        'CTKD7': np.array(provinces, dtype=object)[prov_idx],
+    }
+
+    # Hệ số suy giảm: tăng dần từ 0 → 8% trong 14 ngày cuối
+    ramp = np.clip((np.arange(n_days) - (n_days - 14)) / 14.0, 0.0, 1.0) * 0.08
+
+    for name, base, rel_sd in _kpi_specs(n_kpis):
+        prov_level = base * (1 + rng.normal(0, rel_sd, n_provinces))
+        values = prov_level[prov_idx] * (1 + rng.normal(0, rel_sd / 2, n_rows))
+
+        declining = rng.random(n_provinces) < decline_rate
+        lower_better = name in ('CDR', 'VN_CALL_DR')
+        factor = ramp[date_idx] * declining[prov_idx]
+        values = values * (1 + factor) if lower_better else values * (1 - factor)
+
+        values[rng.random(n_rows) < zero_rate] = 0.0
+        if thousands_sep:
+            text = np.array([f'{v:,.2f}' for v in values], dtype=object)
+        else:
+            text = np.array([f'{v:.2f}' for v in values], dtype=object)
+        text[rng.random(n_rows) < null_rate] = ''
+        data[name] = text
+
+    return pd.DataFrame(data)
+
+
+def write_kpi_csv(path: str, df: Optional[pd.DataFrame] = None, encoding: str = 'utf-8-sig',
+                  **kwargs) -> str:
+    """Ghi dữ liệu giả lập ra CSV (sinh mới nếu không truyền df). Trả về đường dẫn file."""
+    if df is None:
+        df = generate_kpi_dataset(**kwargs)
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    df.to_csv(path, index=False, encoding=encoding)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sinh dữ liệu KPI giả lập dạng 1.Ngày.csv')
+    parser.add_argument('--provinces', type=int, default=63, help='Số tỉnh')
+    parser.add_argument('--days', type=int, default=365, help='Số ngày')
+    parser.add_argument('--kpis', type=int, default=6, help='Số cột KPI')
+    parser.add_argument('--start-date', default='2024-01-01', help="Ngày đầu tiên 'YYYY-MM-DD'")
+    parser.add_argument('--zero-rate', type=float, default=0.01, help='Tỷ lệ giá trị 0')
+    parser.add_argument('--null-rate', type=float, default=0.01, help='Tỷ lệ giá trị rỗng')
+    parser.add_argument('--no-thousands-sep', action='store_true', help='Không dùng dấu phẩy hàng nghìn')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default=os.path.join('synthetic', '1.Ngày.csv'))
+    args = parser.parse_args()
+
+    path = write_kpi_csv(
+        args.output,
+        n_provinces=args.provinces, n_days=args.days, n_kpis=args.kpis,
+        start_date=args.start_date, zero_rate=args.zero_rate, null_rate=args.null_rate,
+        thousands_sep=not args.no_thousands_sep, seed=args.seed,
+    )
+    print(f"✅ Đã tạo {args.provinces * args.days} dòng ({args.provinces} tỉnh × {args.days} ngày) → {path}")
+
+
+if __name__ == "__main__":
+    main()
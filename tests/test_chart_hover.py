@@ -0,0 +1,43 @@
+import os
+import sys
+from types import SimpleNamespace
+
+import matplotlib
+import numpy as np
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt  # noqa: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from chart_hover import LineHoverIndex, throttle  # noqa: E402
+
+
+def test_query_hits_steep_neighbouring_segment():
+    fig, ax = plt.subplots()
+    x = np.arange(61.0)
+    y = np.where(x < 30, 0.0, 10.0)
+    ax.plot(x, y)
+    ax.set_xlim(0, 60)
+    ax.set_ylim(-1, 11)
+    fig.canvas.draw()
+    index = LineHoverIndex(ax)
+    index.set_series('step', x, y)
+
+    # Con trỏ bên phải bước nhảy 29 → 30, nằm trong khoảng x của đoạn 30 → 31
+    step_px, mid_py = ax.transData.transform((29.5, 5.0))
+    for dx in (4.9, 6.9):
+        hit = index.query(step_px + dx, mid_py)
+        assert hit is not None and hit.label == 'step'
+    assert index.query(step_px + 40, mid_py) is None
+    plt.close(fig)
+
+
+def test_throttle_flushes_trailing_event():
+    calls = []
+    handler = throttle(lambda event: calls.append(event.x), min_interval=60)
+    for x in range(3):
+        handler(SimpleNamespace(x=x, y=0, canvas=None))
+    assert calls == [0]
+    handler.flush()
+    assert calls == [0, 2]
@@ -0,0 +1,169 @@
+import os
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_backend import MultiFileBackend, SQLiteBackend, file_lock, merge_into_current, read_csv_any  # noqa: E402
+
+
+def _write_day_csv(path, dates, provinces=('Tinh 01', 'Tinh 02')):
+    rows = [{'Ngay7': d, 'CTKD7': p, 'CSSR': 99.0} for d in dates for p in provinces]
+    pd.DataFrame(rows).to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def test_multifile_upsert_renames_to_match_glob(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    _write_day_csv(data_dir / '1.Ngày_01.csv', ['01/01/2024', '02/01/2024'])
+    backend = MultiFileBackend(str(data_dir / '1.Ngày*.csv'))
+    version_before = backend.version()
+    assert backend.date_range()[1] == pd.Timestamp('2024-01-02')
+
+    upload = tmp_path / 'kpi_upload_abc123.csv'
+    _write_day_csv(upload, ['03/01/2024'])
+    result = backend.upsert(str(upload))
+
+    assert result['rows_added'] == 2
+    assert len(backend.files()) == 2
+    assert all(os.path.basename(f).startswith('1.Ngày') for f in backend.files())
+    assert backend.version() != version_before
+    assert backend.date_range() == (pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-03'))
+
+
+def test_multifile_upsert_rejects_unmatchable_glob(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    _write_day_csv(data_dir / 'kpi_01.csv', ['01/01/2024'])
+    backend = MultiFileBackend(str(data_dir / 'kpi_??.csv'))
+
+    upload = tmp_path / 'kpi_upload_abc123.csv'
+    _write_day_csv(upload, ['02/01/2024'])
+    with pytest.raises(ValueError):
+        backend.upsert(str(upload))
+    assert len(backend.files()) == 1
+
+
+def test_sqlite_reads_while_merge_holds_write_lock(tmp_path):
+    db = str(tmp_path / 'kpi.db')
+    upload = tmp_path / 'day.csv'
+    _write_day_csv(upload, ['01/01/2024', '02/01/2024'])
+    SQLiteBackend(db).upsert(str(upload))
+
+    writer = sqlite3.connect(db)
+    writer.execute('BEGIN IMMEDIATE')
+    try:
+        backend = SQLiteBackend(db, timeout=1)
+        assert backend.version() == 'sqlite-1'
+        assert len(backend.read_raw()) == 4
+        assert backend.date_range()[1] == pd.Timestamp('2024-01-02')
+    finally:
+        writer.rollback()
+        writer.close()
+
+
+def test_sqlite_missing_db_is_not_created_by_reads(tmp_path):
+    db = str(tmp_path / 'missing.db')
+    backend = SQLiteBackend(db)
+    assert not backend.exists()
+    assert backend.version() == 'sqlite-0'
+    assert backend.read_raw().empty
+    assert not os.path.exists(db)
+
+
+def test_sqlite_province_key_folds_unicode_case(tmp_path):
+    db = str(tmp_path / 'kpi.db')
+    backend = SQLiteBackend(db)
+    first = tmp_path / 'a.csv'
+    second = tmp_path / 'b.csv'
+    _write_day_csv(first, ['01/01/2024'], provinces=('Đà Nẵng',))
+    _write_day_csv(second, ['01/01/2024'], provinces=(' ĐÀ NẴNG',))
+    backend.upsert(str(first))
+    stats = backend.upsert(str(second))
+
+    assert stats['rows_updated'] == 1
+    df = backend.read_raw()
+    assert len(df) == 1
+    assert '_ctkd7_key' not in df.columns
+    assert '_ctkd7_key' not in backend.list_columns()
+
+
+def test_sqlite_migrates_nocase_schema(tmp_path):
+    db = str(tmp_path / 'kpi.db')
+    with sqlite3.connect(db) as conn:
+        conn.execute('CREATE TABLE kpi_daily ("Ngay7" TEXT NOT NULL, "CTKD7" TEXT NOT NULL COLLATE NOCASE, '
+                     '"CSSR" REAL, PRIMARY KEY ("Ngay7", "CTKD7"))')
+        conn.executemany('INSERT INTO kpi_daily VALUES (?, ?, ?)',
+                         [('2024-01-01', 'Đà Nẵng', 98.0), ('2024-01-01', 'ĐÀ NẴNG', 97.0)])
+        conn.execute('CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)')
+        conn.execute("INSERT INTO meta VALUES ('version', '3')")
+    conn.close()
+
+    upload = tmp_path / 'day.csv'
+    _write_day_csv(upload, ['02/01/2024'], provinces=('Đà Nẵng',))
+    backend = SQLiteBackend(db)
+    backend.upsert(str(upload))
+
+    df = backend.read_raw()
+    assert len(df) == 2
+    assert df.loc[df['Ngay7'] == '01/01/2024', 'CSSR'].tolist() == [97.0]
+    assert backend.version() == 'sqlite-4'
+
+
+def _merge_day(args):
+    target, upload, day = args
+    _write_day_csv(upload, [day])
+    return merge_into_current(target, upload)['rows_added']
+
+
+def _hold_lock_and_die(path):
+    with file_lock(path):
+        os._exit(0)
+
+
+def test_concurrent_merges_keep_every_row(tmp_path):
+    target = str(tmp_path / '1.Ngày.csv')
+    _write_day_csv(target, ['01/01/2024'])
+    jobs = [(target, str(tmp_path / f'day_{d:02d}.csv'), f'{d:02d}/01/2024') for d in range(2, 10)]
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        added = list(pool.map(_merge_day, jobs))
+
+    assert added == [2] * len(jobs)
+    df = read_csv_any(target)
+    assert len(df) == 2 * (len(jobs) + 1)
+    assert df['Ngay7'].nunique() == len(jobs) + 1
+    assert not [f for f in os.listdir(tmp_path) if f.startswith('.tmp_')]
+
+
+def test_file_lock_is_exclusive_and_released_when_holder_dies(tmp_path):
+    path = str(tmp_path / 'data.csv')
+    with file_lock(path):
+        with pytest.raises(TimeoutError):
+            with file_lock(path, timeout=0.3, poll=0.05):
+                pass
+
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        pool.submit(_hold_lock_and_die, path).exception()
+    start = time.monotonic()
+    with file_lock(path, timeout=2):
+        pass
+    assert time.monotonic() - start < 1
+
+
+def test_multifile_upsert_accepts_dataframe(tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    _write_day_csv(data_dir / '1.Ngày_01.csv', ['01/01/2024'])
+    backend = MultiFileBackend(str(data_dir / '1.Ngày*.csv'))
+    frame = pd.DataFrame({'Ngay7': ['02/01/2024'], 'CTKD7': ['Tinh 01'], 'CSSR': [98.0]})
+
+    result = backend.upsert(frame)
+
+    assert result['rows_added'] == 1
+    assert len(backend.files()) == 2
+    assert backend.date_range()[1] == pd.Timestamp('2024-01-02')
@@ -0,0 +1,171 @@
+import os
+import sys
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from kpi_decline_detection_pipeline import CONFIG, KPIDeclineDetector  # noqa: E402
+
+KPIS = ['CSSR', 'CDR', 'SU_CO_LON']
+
+
+def _synthetic_frame(seed=0, n_provinces=25, n_days=45):
+    """Dữ liệu đã làm sạch: có ngày trống, giá trị 0/NaN, tỉnh ít điểm, tỉnh chỉ có ngày gần đây."""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range('2024-01-01', periods=n_days, freq='D')
+    rows = []
+    for i in range(n_provinces):
+        province = f'Tinh {i:02d}'
+        if i == 0:
+            days = dates[-1:]                     # Chỉ 1 điểm
+        elif i == 1:
+            days = dates[-3:]                     # Không có ngày trong khoảng so sánh
+        else:
+            days = dates[rng.random(n_days) > 0.15]
+        # Một số tỉnh sụt mạnh ở ngày cuối (vượt cả ngưỡng 5%)
+        dip = 8.0 if i % 4 == 2 else 0.0
+        for day in days:
+            rows.append({
+                'Ngay7': day,
+                'CTKD7': province,
+                'CSSR': 99.0 + rng.normal(0, 1.5) - (dip if day == days[-1] else 0.0),
+                'CDR': abs(0.3 + rng.normal(0, 0.08)),
+                'SU_CO_LON': float(rng.integers(0, 3)),
+            })
+    df = pd.DataFrame(rows)
+    for kpi in KPIS:
+        df.loc[rng.random(len(df)) < 0.08, kpi] = np.nan
+        df.loc[rng.random(len(df)) < 0.05, kpi] = 0.0
+    # Thứ tự dòng không theo ngày, giống dữ liệu gộp từ nhiều file
+    return df.sample(frac=1.0, random_state=seed).reset_index(drop=True)
+
+
+def _detector(df, threshold):
+    config = dict(CONFIG, decline_threshold=threshold)
+    return KPIDeclineDetector.from_dataframe(df, config=config)
+
+
+def _reference_changes(detector, kpi, lookback_days):
+    """Cách tính cũ: lọc DataFrame cho từng tỉnh rồi so sánh ngày mới nhất với trung bình kỳ trước."""
+    df = detector.df
+    rule = detector._get_kpi_rule(kpi)
+    changes = {}
+    for province in df['CTKD7'].unique():
+        data = df[(df['CTKD7'] == province) & df[kpi].notna() & (df[kpi] != 0)].sort_values('Ngay7')
+        if len(data) < 2:
+            continue
+        latest_date = data['Ngay7'].max()
+        latest_value = data.loc[data['Ngay7'] == latest_date, kpi].values[0]
+        compare = data[data['Ngay7'] <= latest_date - timedelta(days=lookback_days)]
+        if len(compare) == 0:
+            continue
+        compare_value = compare[kpi].mean()
+        is_worse, change_pct = detector._is_worsening(latest_value, compare_value, rule)
+        changes[province] = {
+            'latest_date': latest_date, 'latest_value': latest_value, 'compare_value': compare_value,
+            'is_worse': is_worse, 'change_pct': change_pct,
+            'limit_breached': detector._is_limit_breached(latest_value, rule),
+        }
+    return changes
+
+
+def _reference_alerts(detector, kpi, lookback_days):
+    threshold = detector.config['decline_threshold']
+    rule = detector._get_kpi_rule(kpi)
+    alerts = []
+    for province, c in _reference_changes(detector, kpi, lookback_days).items():
+        if not c['compare_value'] > 0:
+            continue
+        should_alert = c['is_worse'] and abs(c['change_pct']) >= threshold
+        if rule and c['limit_breached'] is not None:
+            should_alert = should_alert and c['limit_breached']
+        if should_alert:
+            decline_pct = -abs(c['change_pct'])
+            alerts.append({
+                'province': province,
+                'latest_date': c['latest_date'],
+                'latest_value': c['latest_value'],
+                'compare_value': c['compare_value'],
+                'decline_pct': round(decline_pct, 2),
+                'severity': detector._get_severity(decline_pct),
+                'limit_breached': bool(c['limit_breached']) if c['limit_breached'] is not None else None,
+                'direction': rule.get('direction') if rule else 'higher_better',
+            })
+    alerts.sort(key=lambda a: a['decline_pct'])
+    return alerts
+
+
+@pytest.mark.parametrize('seed', [0, 1])
+@pytest.mark.parametrize('threshold', [0.5, 2.0, 5.0])
+@pytest.mark.parametrize('lookback_days', [1, 3, 7, 30])
+@pytest.mark.parametrize('kpi', KPIS)
+def test_detect_declines_matches_per_province_reference(kpi, lookback_days, threshold, seed):
+    detector = _detector(_synthetic_frame(seed), threshold)
+    expected = _reference_alerts(detector, kpi, lookback_days)
+    alerts = detector.detect_declines(kpi, lookback_days=lookback_days)
+
+    assert [a['province'] for a in alerts] == [e['province'] for e in expected]
+    for alert, exp in zip(alerts, expected):
+        assert alert['kpi'] == kpi
+        assert alert['days_lookback'] == lookback_days
+        assert alert['latest_date'] == exp['latest_date']
+        assert alert['latest_value'] == pytest.approx(exp['latest_value'])
+        assert alert['compare_value'] == pytest.approx(exp['compare_value'])
+        assert alert['decline_pct'] == exp['decline_pct']
+        assert alert['severity'] == exp['severity']
+        assert alert['limit_breached'] == exp['limit_breached']
+        assert alert['direction'] == exp['direction']
+
+
+def test_detect_declines_province_filter_matches_full_scan():
+    detector = _detector(_synthetic_frame(), 0.5)
+    full = detector.detect_declines('CSSR', lookback_days=3)
+    wanted = [a['province'] for a in full][:3] + ['Tinh 00', 'Tinh 01']
+    subset = detector.detect_declines('CSSR', lookback_days=3, provinces=wanted)
+    assert subset == [a for a in full if a['province'] in wanted]
+
+
+@pytest.mark.parametrize('lookback_days', [1, 7, 30])
+@pytest.mark.parametrize('threshold', [0.5, 5.0])
+def test_change_matrix_matches_per_province_reference(lookback_days, threshold):
+    detector = _detector(_synthetic_frame(), threshold)
+    matrix = detector.compute_change_matrix(KPIS + ['KHONG_CO'], lookback_days=lookback_days)
+
+    assert list(matrix['change_pct'].columns) == KPIS
+    df = detector.df
+    has_value = (df[KPIS].notna() & (df[KPIS] != 0)).any(axis=1)
+    present = set(df.loc[has_value, 'CTKD7'])
+    assert list(matrix['change_pct'].index) == [p for p in df['CTKD7'].unique() if p in present]
+    for kpi in KPIS:
+        rule = detector._get_kpi_rule(kpi) or {}
+        sign = -1.0 if rule.get('direction') == 'lower_better' else 1.0
+        expected = _reference_changes(detector, kpi, lookback_days)
+        for province in matrix['change_pct'].index:
+            c = expected.get(province)
+            if c is None:
+                assert np.isnan(matrix['change_pct'].at[province, kpi])
+                assert np.isnan(matrix['compare_value'].at[province, kpi])
+                assert not matrix['alert'].at[province, kpi]
+                continue
+            assert matrix['latest_value'].at[province, kpi] == pytest.approx(c['latest_value'])
+            assert matrix['compare_value'].at[province, kpi] == pytest.approx(c['compare_value'])
+            assert matrix['change_pct'].at[province, kpi] == pytest.approx(c['change_pct'])
+            assert matrix['signed_change_pct'].at[province, kpi] == pytest.approx(sign * c['change_pct'])
+            assert matrix['limit_breached'].at[province, kpi] == bool(c['limit_breached'])
+
+        alerted = {a['province'] for a in _reference_alerts(detector, kpi, lookback_days)}
+        assert set(matrix['alert'].index[matrix['alert'][kpi]]) == alerted
+
+
+def test_decline_report_rounds_like_python_round():
+    detector = _detector(_synthetic_frame(), 0.5)
+    alerts = detector.detect_declines_frame('CSSR', lookback_days=3).head(2).copy()
+    alerts['latest_value'] = [2.675, 97.575]
+    alerts['compare_value'] = [1.005, 0.125]
+    report = detector.generate_decline_report(alerts).sort_index()
+    assert report['Giá trị hiện tại'].tolist() == [round(2.675, 2), round(97.575, 2)]
+    assert report['Giá trị trước'].tolist() == [round(1.005, 2), round(0.125, 2)]
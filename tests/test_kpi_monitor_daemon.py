@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_backend import read_csv_any  # noqa: E402
+from kpi_monitor_daemon import KPIMonitorDaemon  # noqa: E402
+
+
+class _Alerts:
+    def send_decline_alert(self, **kwargs):
+        pass
+
+
+def _write_day_csv(path, dates, provinces=('Tinh 01', 'Tinh 02')):
+    rows = [{'Ngay7': d, 'CTKD7': p, 'CSSR': 99.0} for d in dates for p in provinces]
+    pd.DataFrame(rows).to_csv(path, index=False, encoding='utf-8-sig')
+
+
+def _daemon(tmp_path):
+    data = str(tmp_path / '1.Ngày.csv')
+    _write_day_csv(data, ['01/01/2024', '02/01/2024'])
+    daemon = KPIMonitorDaemon(data, str(tmp_path / 'inbox'), kpis=['CSSR'], settle_seconds=0,
+                              alert_system=_Alerts())
+    daemon.load()
+    return daemon, data
+
+
+def _drop_in_inbox(daemon, tmp_path, day):
+    path = os.path.join(daemon.inbox_dir, 'day.csv')
+    _write_day_csv(path, [day])
+    daemon._ready_files()  # Lần đầu chỉ ghi nhận kích thước, lần sau mới xử lý
+    return path
+
+
+def test_processed_file_is_merged_once(tmp_path):
+    daemon, data = _daemon(tmp_path)
+    _drop_in_inbox(daemon, tmp_path, '03/01/2024')
+    results = daemon.poll_once()
+
+    assert results[0]['delta']['rows_added'] == 2
+    assert len(read_csv_any(data)) == 6
+    assert len(daemon.detector.df) == 6
+    assert daemon.data_version == daemon.backend.version()
+    assert os.listdir(daemon.processed_dir)
+
+
+def test_failure_after_merge_goes_to_processed_and_reloads(tmp_path, monkeypatch):
+    daemon, data = _daemon(tmp_path)
+    _drop_in_inbox(daemon, tmp_path, '03/01/2024')
+
+    def _broken(new_raw):
+        raise RuntimeError('boom')
+    monkeypatch.setattr(daemon.detector, 'apply_increment', _broken)
+    results = daemon.poll_once()
+
+    assert results[0]['error'] == 'boom'
+    assert not os.path.exists(daemon.failed_dir) or not os.listdir(daemon.failed_dir)
+    assert os.listdir(daemon.processed_dir)
+    assert len(read_csv_any(data)) == 6
+
+    # Phiên bản dữ liệu gốc đã đổi → vòng sau load lại toàn bộ
+    monkeypatch.undo()
+    daemon.poll_once()
+    assert len(daemon.detector.df) == 6
+    assert daemon.data_version == daemon.backend.version()
+
+
+def test_unreadable_file_goes_to_failed(tmp_path):
+    daemon, data = _daemon(tmp_path)
+    path = os.path.join(daemon.inbox_dir, 'bad.csv')
+    pd.DataFrame({'A': [1]}).to_csv(path, index=False)
+    daemon._ready_files()
+    daemon.poll_once()
+
+    assert os.listdir(daemon.failed_dir)
+    assert len(read_csv_any(data)) == 4
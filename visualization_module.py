@@ -11,6 +11,11 @@ from typing import List, Optional
 import os
 import sys
 
+from chart_hover import LineHoverIndex, throttle
+from chart_lod import (DEFAULT_MAX_POINTS, MARKER_FULL_MAX_POINTS, SeriesLOD, downsample,
+                       draw_line_batch, marker_kwargs, set_adaptive_date_axis)
+from instrumentation import span, traced
+
 # Optional hover tooltips
 try:
     import mplcursors
@@ -37,6 +42,111 @@ except (OSError, ValueError):
     except (OSError, ValueError):
         plt.style.use('default')
 
+# Small multiples: mỗi tỉnh một ô nhỏ, chung trục X/Y
+SMALL_MULTIPLES_PANEL_SIZE = (2.6, 1.7)   # inch mỗi ô (rộng, cao)
+SMALL_MULTIPLES_MAX_POINTS = 120          # Ô rộng ~250 pixel: nhiều điểm hơn không nhìn thấy khác biệt
+# Số ô tối thiểu để vẽ tile song song: mỗi ô ~25 ms (đã giảm mẫu, gần như không phụ thuộc số ngày),
+# mỗi process con tốn ~1 s khởi động/import + tile riêng. Đo 63 tỉnh × 90 ngày: 1 process 1.5 s,
+# 4 process 2.4 s → dưới ngưỡng này luôn vẽ tuần tự dù truyền workers > 1
+SMALL_MULTIPLES_POOL_MIN_PANELS = 200
+_SM_MARGINS = (0.48, 0.18, 0.24, 0.30)    # Lề trong mỗi ô (trái, phải, trên, dưới) - inch
+_SM_TITLE_HEIGHT = 0.6                    # Chiều cao dòng tiêu đề (chỉ ở tile đầu tiên) - inch
+_SM_LINE_COLOR = '#2c7fb8'
+_SM_ALERT_COLOR = '#d32f2f'
+_SM_ALERT_FACE = '#fdecea'
+_SM_TICK_RC = {
+    'xtick.labelsize': 7, 'ytick.labelsize': 7,
+    'xtick.major.size': 2, 'ytick.major.size': 2,
+    'xtick.major.pad': 1, 'ytick.major.pad': 1,
+}
+
+
+def heatmap_bounds(threshold: float) -> List[float]:
+    """
+    Biên các dải màu của heatmap % thay đổi: đối xứng quanh 0 tại ngưỡng cảnh báo và các mức
+    nghiêm trọng (-threshold, -5, -10 giống _get_severity), chặn ở ±cap
+    """
+    edges = sorted({float(threshold), 5.0, 10.0})
+    cap = max(20.0, edges[-1] * 2)
+    return [-cap] + [-e for e in reversed(edges)] + [0.0] + edges + [cap]
+
+
+def _render_small_multiples_tile(panels: list, panel_offset: int, n_panels: int, options: dict) -> np.ndarray:
+    """
+    Vẽ một tile (một số hàng liên tiếp) của lưới small multiples, trả ảnh RGBA
+
+    Hàm cấp module (không dùng pyplot) để chạy được trong process con; các tile có cùng
+    bề rộng nên ghép theo chiều dọc thành ảnh hoàn chỉnh.
+
+    Args:
+        panels: List (tên tỉnh, x dạng date2num, y, có cảnh báo) theo thứ tự trong lưới
+        panel_offset: Vị trí của ô đầu tiên trong toàn lưới
+        n_panels: Tổng số ô của lưới (để biết ô nào ở hàng dưới cùng và hiện nhãn trục X)
+        options: ncols, panel_size, dpi, title, xlim, ylim, xticks, xtick_labels,
+                 yticks, ytick_labels, highlight, threshold
+    """
+    from matplotlib import rc_context
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.collections import LineCollection
+    from matplotlib.figure import Figure
+    from matplotlib.ticker import NullFormatter
+
+    # Kiểu tick đặt một lần qua rcParams: tick_params trên từng ô tạo lại toàn bộ tick (rất chậm)
+    with rc_context(_SM_TICK_RC):
+        ncols = options['ncols']
+        cell_w, cell_h = options['panel_size']
+        n_rows = -(-len(panels) // ncols)
+        title = options.get('title') if panel_offset == 0 else None
+        title_h = _SM_TITLE_HEIGHT if title else 0.0
+        fig_w, fig_h = ncols * cell_w, n_rows * cell_h + title_h
+        fig = Figure(figsize=(fig_w, fig_h), dpi=options['dpi'], facecolor='white')
+        FigureCanvasAgg(fig)
+        if title:
+            fig.text(0.5, 1 - title_h / 2 / fig_h, title, ha='center', va='center',
+                     fontsize=15, fontweight='bold', color='#2c3e50')
+
+        left, right, top, bottom = _SM_MARGINS
+        ax_w, ax_h = (cell_w - left - right) / fig_w, (cell_h - top - bottom) / fig_h
+        for i, (name, x, y, is_alert) in enumerate(panels):
+            row, col = divmod(i, ncols)
+            ax = fig.add_axes([(col * cell_w + left) / fig_w,
+                               (fig_h - title_h - (row + 1) * cell_h + bottom) / fig_h, ax_w, ax_h])
+            color = _SM_ALERT_COLOR if is_alert else _SM_LINE_COLOR
+            if is_alert:
+                ax.set_facecolor(_SM_ALERT_FACE)
+                for spine in ax.spines.values():
+                    spine.set_visible(True)
+                    spine.set_color(_SM_ALERT_COLOR)
+            if options.get('highlight'):
+                ax.axvspan(*options['highlight'], color='#fff3cd', alpha=0.8, lw=0, zorder=0)
+            if options.get('threshold') is not None:
+                ax.axhline(options['threshold'], color='#e74c3c', linestyle='--', linewidth=0.8, zorder=1)
+            # Một LineCollection cho cả ô (không tạo Line2D/marker cho từng điểm)
+            if len(x) > 1:
+                ax.add_collection(LineCollection([np.column_stack([x, y])], colors=[color],
+                                                 linewidths=1.6 if is_alert else 1.1, zorder=3))
+            elif len(x) == 1:
+                ax.plot(x, y, 'o', markersize=3, color=color, zorder=3)
+
+            ax.set_xlim(options['xlim'])
+            ax.set_ylim(options['ylim'])
+            ax.set_xticks(options['xticks'])
+            ax.set_yticks(options['yticks'])
+            if panel_offset + i + ncols >= n_panels:
+                ax.set_xticklabels(options['xtick_labels'])
+            else:
+                ax.xaxis.set_major_formatter(NullFormatter())
+            if col == 0:
+                ax.set_yticklabels(options['ytick_labels'])
+            else:
+                ax.yaxis.set_major_formatter(NullFormatter())
+            ax.set_title(name, fontsize=8, pad=2, color=color if is_alert else '#2c3e50',
+                         fontweight='bold' if is_alert else 'normal')
+
+        fig.canvas.draw()
+    return np.asarray(fig.canvas.buffer_rgba()).copy()
+
+
 class KPIVisualization:
     """Class tạo các biểu đồ KPI"""
     
@@ -44,42 +154,24 @@ class KPIVisualization:
         self.output_dir = output_dir
         os.makedirs(output_dir, exist_ok=True)
     
-    def create_pivot_line_chart(self, df: pd.DataFrame, 
-                                kpi_column: str,
-                                group_by: str = 'CTKD7',
-                                date_column: str = 'Ngay7',
-                                provinces: Optional[List[str]] = None,
-                                title: Optional[str] = None,
-                                figsize: tuple = (16, 10),
-                                lookback_days: Optional[int] = None,
-                                start_date: Optional[str] = None,
-                                end_date: Optional[str] = None,
-                                exclude_dates: Optional[List[str]] = None,
-                                date_range_filter: Optional[tuple] = None,
-                                threshold_line: Optional[float] = None,
-                                lower_better: Optional[bool] = None,
-                                enable_hover: bool = True):
+    def prepare_pivot_data(self, df: pd.DataFrame,
+                           kpi_column: str,
+                           group_by: str = 'CTKD7',
+                           date_column: str = 'Ngay7',
+                           provinces: Optional[List[str]] = None,
+                           exclude_dates: Optional[List[str]] = None,
+                           date_range_filter: Optional[tuple] = None) -> pd.DataFrame:
         """
-        Tạo line chart giống pivot chart trong Excel
-        
-        Args:
-            df: DataFrame với dữ liệu
-            kpi_column: Tên cột KPI cần vẽ
-            group_by: Cột để group (thường là CTKD7 - tỉnh)
-            date_column: Cột ngày
-            provinces: Danh sách tỉnh cần vẽ (None = tất cả)
-            title: Tiêu đề chart
-            figsize: Kích thước figure
-            lookback_days: Số ngày gần nhất để highlight (None = không highlight)
-            start_date: Ngày bắt đầu highlight (format: 'DD/MM/YYYY' hoặc 'YYYY-MM-DD') - ưu tiên hơn lookback_days
-            end_date: Ngày kết thúc highlight (format: 'DD/MM/YYYY' hoặc 'YYYY-MM-DD') - ưu tiên hơn lookback_days
-            exclude_dates: Danh sách ngày cần loại bỏ thủ công (format: ['DD/MM/YYYY', ...] hoặc ['YYYY-MM-DD', ...])
-                          Ví dụ: ['16/10/2025', '20/10/2025'] hoặc ['2025-10-16', '2025-10-20']
-            date_range_filter: Tuple (start, end) để chỉ hiển thị khoảng ngày này (format: ('DD/MM/YYYY', 'DD/MM/YYYY'))
-                              Ví dụ: ('01/10/2025', '31/10/2025')
+        Lọc và pivot dữ liệu cho create_pivot_line_chart (mean theo ngày + tỉnh, chỉ giữ giá trị > 0)
+
+        Tách riêng để chế độ tương tác giữ kết quả trong bộ nhớ thay vì lọc lại toàn bộ DataFrame.
+
+        Returns:
+            DataFrame các cột [date_column, group_by, kpi_column]
         """
         # Lọc dữ liệu (bỏ qua giá trị 0 và null)
         # QUAN TRỌNG: Đảm bảo df được copy và filter từ đầu
+        filter_span = span('pivot.filter', kpi=kpi_column, rows=len(df)).start()
         df_filtered = df.copy()
         
         # Đảm bảo cột ngày là datetime
@@ -163,51 +255,15 @@ class KPIVisualization:
         print(f"🔍 Đang kiểm tra {len(df_filtered)} dòng để tìm các ngày có KPI = 0...")
         
         # Bước 2: Kiểm tra từng nhóm (ngày + tỉnh) một cách chặt chẽ
-        # Tạo một hàm kiểm tra để đảm bảo TẤT CẢ giá trị trong nhóm đều > 0 và không null
-        def is_group_valid(group_series):
-            """
-            Kiểm tra xem nhóm có hợp lệ không
-            Nhóm hợp lệ = TẤT CẢ giá trị phải > 0 và không null
-            
-            QUAN TRỌNG: Nếu có BẤT KỲ giá trị = 0, null, hoặc <= 0 → LOẠI BỎ
-            Lý do: Ngày có KPI = 0 thường là ngày lỗi dữ liệu
-            Ví dụ: Ngày giảm đột ngột (100 → 55) rồi ngày sau tăng lại (55 → 100)
-            → Đây là lỗi dữ liệu, không phải suy giảm thực sự → Cần loại bỏ
-            """
-            # Chuyển sang numeric nếu chưa
-            numeric_values = pd.to_numeric(group_series, errors='coerce')
-            
-            # Kiểm tra có null không (bao gồm cả NaN sau khi convert)
-            if numeric_values.isna().any():
-                return False
-            
-            # Kiểm tra có giá trị = 0 không (chặt chẽ nhất)
-            # Đây là dấu hiệu rõ ràng nhất của lỗi dữ liệu
-            if (numeric_values == 0).any():
-                return False
-            
-            # Kiểm tra có giá trị < 0 không
-            if (numeric_values < 0).any():
-                return False
-            
-            # Kiểm tra có giá trị <= 0 không (double check)
-            if (numeric_values <= 0).any():
-                return False
-            
-            # Kiểm tra tất cả giá trị phải > 0 (final check)
-            if not (numeric_values > 0).all():
-                return False
-            
-            # Kiểm tra min value phải > 0
-            if numeric_values.min() <= 0:
-                return False
-            
-            return True
-        
-        # Groupby và kiểm tra từng nhóm
-        groups_validity = df_filtered.groupby([date_column, group_by])[kpi_column].apply(
-            is_group_valid
-        ).reset_index(name='is_valid')
+        # Nhóm hợp lệ = TẤT CẢ giá trị phải > 0 và không null (NaN > 0 là False)
+        # → có BẤT KỲ giá trị = 0, null, hoặc <= 0 thì LOẠI BỎ cả nhóm
+        # Tính vectorized một lượt cho mọi nhóm (không gọi hàm Python cho từng nhóm)
+        groups_validity = (
+            df_filtered[kpi_column].gt(0)
+            .groupby([df_filtered[date_column], df_filtered[group_by]], observed=True)
+            .all()
+            .reset_index(name='is_valid')
+        )
         
         # Lấy danh sách các nhóm hợp lệ
         valid_groups = groups_validity[groups_validity['is_valid']][[date_column, group_by]]
@@ -369,6 +425,58 @@ class KPIVisualization:
             pivot_data = pd.DataFrame(columns=[date_column, group_by, kpi_column])
             print("⚠️  Không có dữ liệu hợp lệ để vẽ chart")
         
+        filter_span.stop(points=len(pivot_data))
+        return pivot_data
+
+    @traced('create_pivot_line_chart')
+    def create_pivot_line_chart(self, df: pd.DataFrame, 
+                                kpi_column: str,
+                                group_by: str = 'CTKD7',
+                                date_column: str = 'Ngay7',
+                                provinces: Optional[List[str]] = None,
+                                title: Optional[str] = None,
+                                figsize: tuple = (16, 10),
+                                lookback_days: Optional[int] = None,
+                                start_date: Optional[str] = None,
+                                end_date: Optional[str] = None,
+                                exclude_dates: Optional[List[str]] = None,
+                                date_range_filter: Optional[tuple] = None,
+                                threshold_line: Optional[float] = None,
+                                lower_better: Optional[bool] = None,
+                                enable_hover: bool = True,
+                                max_points: Optional[int] = DEFAULT_MAX_POINTS,
+                                lod_method: str = 'lttb',
+                                pivot_data: Optional[pd.DataFrame] = None,
+                                batch_lines: bool = True):
+        """
+        Tạo line chart giống pivot chart trong Excel
+        
+        Args:
+            df: DataFrame với dữ liệu
+            kpi_column: Tên cột KPI cần vẽ
+            group_by: Cột để group (thường là CTKD7 - tỉnh)
+            date_column: Cột ngày
+            provinces: Danh sách tỉnh cần vẽ (None = tất cả)
+            title: Tiêu đề chart
+            figsize: Kích thước figure
+            lookback_days: Số ngày gần nhất để highlight (None = không highlight)
+            start_date: Ngày bắt đầu highlight (format: 'DD/MM/YYYY' hoặc 'YYYY-MM-DD') - ưu tiên hơn lookback_days
+            end_date: Ngày kết thúc highlight (format: 'DD/MM/YYYY' hoặc 'YYYY-MM-DD') - ưu tiên hơn lookback_days
+            exclude_dates: Danh sách ngày cần loại bỏ thủ công (format: ['DD/MM/YYYY', ...] hoặc ['YYYY-MM-DD', ...])
+                          Ví dụ: ['16/10/2025', '20/10/2025'] hoặc ['2025-10-16', '2025-10-20']
+            date_range_filter: Tuple (start, end) để chỉ hiển thị khoảng ngày này (format: ('DD/MM/YYYY', 'DD/MM/YYYY'))
+                              Ví dụ: ('01/10/2025', '31/10/2025')
+            max_points: Số điểm tối đa mỗi đường; khoảng ngày dài được giảm mẫu (None = vẽ đủ mọi ngày)
+            lod_method: 'lttb' (giữ điểm ngày gốc và các điểm trũng) hoặc 'mean' (trung bình tuần/tháng)
+            pivot_data: Kết quả prepare_pivot_data đã tính sẵn (bỏ qua bước lọc; provinces/exclude_dates/
+                        date_range_filter khi đó không được áp dụng lại)
+            batch_lines: True = mọi tỉnh vẽ bằng một LineCollection + một scatter (nhanh, tooltip qua
+                         chỉ mục hover); False = một Line2D mỗi tỉnh (cần cho pick/set_data từng đường)
+        """
+        if pivot_data is None:
+            pivot_data = self.prepare_pivot_data(df, kpi_column, group_by, date_column, provinces,
+                                                 exclude_dates, date_range_filter)
+        
         # Tính toán khoảng highlight: ưu tiên start_date/end_date, nếu không có thì dùng lookback_days
         highlight_start_date = None
         highlight_end_date = None
@@ -407,6 +515,7 @@ class KPIVisualization:
                 highlight_start_date = max_date - timedelta(days=lookback_days - 1)
         
         # Tạo chart với kích thước lớn hơn
+        plot_span = span('pivot.plot', rows=len(pivot_data)).start()
         fig, ax = plt.subplots(figsize=(18, 10))
         
         # Màu sắc riêng cho từng tỉnh (đủ nhiều màu)
@@ -420,51 +529,61 @@ class KPIVisualization:
         
         # Vẽ line cho từng tỉnh với styling đẹp hơn
         line_artists = []
-        # Cache cho hover nhanh (không tốn CPU mỗi khi di chuột)
-        hover_cache = []  # list[{label, xnum, xraw, y}]
-        for idx, province in enumerate(provinces_list):
-            province_data = pivot_data[pivot_data[group_by] == province].copy()
-            province_data = province_data.sort_values(date_column)
-            
-            # QUAN TRỌNG: Lọc lại một lần nữa trước khi vẽ để đảm bảo không có giá trị 0 hoặc <= 0
-            province_data = province_data[
-                (province_data[kpi_column].notna()) & 
-                (province_data[kpi_column] != 0) &
-                (province_data[kpi_column] > 0)  # Đảm bảo giá trị > 0
-            ].copy()
-            
-            if len(province_data) == 0:
-                continue  # Bỏ qua tỉnh này nếu không có dữ liệu hợp lệ
+        # Chỉ mục toạ độ màn hình cho hover nhanh (không duyệt từng line mỗi khi di chuột)
+        hover_index = LineHoverIndex(ax)
+        # Mức chi tiết: mỗi đường tối đa max_points điểm dù khoảng ngày dài bao nhiêu
+        lod = SeriesLOD.from_long(pivot_data, date_column, group_by, kpi_column,
+                                  max_points=max_points, method=lod_method)
+        import matplotlib.dates as mdates
+        legend_handles = None
+        if batch_lines:
+            # Một mảng (ngày × tỉnh) → một LineCollection + một scatter, không lọc DataFrame từng tỉnh
+            drawn_idx = [i for i, p in enumerate(provinces_list) if p in lod.daily.columns]
+            drawn = [provinces_list[i] for i in drawn_idx]
+            colors = [palette[i] for i in drawn_idx]
+            series = lod.arrays(drawn)
+            long_line = max((len(y) for _, y in series), default=0) > MARKER_FULL_MAX_POINTS
+            _, _, legend_handles = draw_line_batch(
+                ax, series, colors, labels=drawn,
+                linewidths=2.0 if long_line else 3.5, markersize=12,
+                markerfacecolor='white', markeredgewidth=2.5, alpha=0.9, zorder=3)
+            # Hover dùng đúng các điểm đã vẽ (sau LTTB) → vùng bắt chuột trùng hình đường
+            for province, (x_plot, y_plot) in zip(drawn, series):
+                hover_index.set_series(province, x_plot, y_plot)
+        else:
+            for idx, province in enumerate(provinces_list):
+                if province not in lod.daily.columns:
+                    continue
+                # pivot_data đã chỉ còn giá trị > 0; dropna bỏ các ngày tỉnh này không có dữ liệu
+                daily_values = lod.daily[province].dropna()
+                if len(daily_values) == 0:
+                    continue  # Bỏ qua tỉnh này nếu không có dữ liệu hợp lệ
+                x_plot, y_plot = lod.series(province)
             
-            # Vẽ line với marker đẹp hơn
-            line = ax.plot(province_data[date_column], 
-                   province_data[kpi_column],
-                   marker='o', 
-                   label=province,
-                   linewidth=3.5,
-                   markersize=12,
-                   alpha=0.9,
-                   markerfacecolor='white',
-                   markeredgewidth=2.5,
-                   markeredgecolor=palette[idx],
-                   color=palette[idx],
-                   zorder=3)
-            try:
-                line[0].set_pickradius(8)
-                line_artists.append(line[0])
-                # Chuẩn bị cache cho motion event
-                import matplotlib.dates as mdates
-                xraw = province_data[date_column].values
+                # Vẽ line; marker đầy đủ khi ít điểm, nhỏ dần/bỏ khi đường dài
+                line = ax.plot(x_plot, y_plot,
+                       label=province,
+                       linewidth=3.5 if len(y_plot) <= MARKER_FULL_MAX_POINTS else 2.0,
+                       alpha=0.9,
+                       color=palette[idx],
+                       zorder=3,
+                       **marker_kwargs(len(y_plot), markersize=12,
+                                       markerfacecolor='white',
+                                       markeredgewidth=2.5,
+                                       markeredgecolor=palette[idx]))
                 try:
-                    xnum = mdates.date2num(pd.to_datetime(xraw))
+                    line[0].set_pickradius(8)
+                    line_artists.append(line[0])
+                    # Hover dùng đúng các điểm đã vẽ (sau LTTB) → vùng bắt chuột trùng hình đường
+                    hover_index.set_series(province, mdates.date2num(x_plot), y_plot)
                 except Exception:
-                    xnum = np.asarray(xraw, dtype=float)
-                yval = province_data[kpi_column].values.astype(float)
-                hover_cache.append({'label': province, 'xnum': xnum, 'xraw': xraw, 'y': yval})
-            except Exception:
-                pass
+                    pass
+        
+        plot_span.stop(lines=len(legend_handles) if batch_lines else len(line_artists),
+                       level=lod.resolution(), batch=batch_lines)
         
         # Formatting đẹp hơn
+        format_span = span('pivot.format').start()
         title_text = title or f'Trend Analysis: {kpi_column}'
         ax.set_title(title_text, fontsize=18, fontweight='bold', pad=25, color='#2c3e50')
         ax.set_xlabel('Ngày', fontsize=14, fontweight='bold', color='#34495e', labelpad=15)
@@ -480,10 +599,8 @@ class KPIVisualization:
                 label_txt += " (cao hơn tốt)"
             ax.text(0.99, 0.02, label_txt, transform=ax.transAxes, fontsize=9, color='#e74c3c', ha='right', va='bottom')
         
-        # Format ngày trên trục X chi tiết hơn
-        from matplotlib.dates import DateFormatter, DayLocator, AutoDateLocator
-        ax.xaxis.set_major_locator(DayLocator(interval=1))  # Hiển thị mỗi ngày
-        ax.xaxis.set_major_formatter(DateFormatter('%d/%m/%Y'))  # Format: DD/MM/YYYY
+        # Trục X: mỗi ngày một tick khi khoảng ≤ 1 tháng, dài hơn thì giãn theo tuần/tháng/năm
+        set_adaptive_date_axis(ax)
         
         # Format chi tiết trục Y - nhiều ticks hơn
         from matplotlib.ticker import MaxNLocator, FuncFormatter, MultipleLocator
@@ -500,7 +617,7 @@ class KPIVisualization:
         ax.yaxis.set_minor_locator(MaxNLocator(nbins=40))
         
         # Legend đẹp hơn
-        legend = ax.legend(bbox_to_anchor=(1.02, 1), loc='upper left', 
+        legend = ax.legend(handles=legend_handles, bbox_to_anchor=(1.02, 1), loc='upper left', 
                  fontsize=11, framealpha=0.95, 
                  edgecolor='#34495e', fancybox=True, shadow=True,
                  title='Tỉnh/Thành phố', title_fontsize=12)
@@ -555,6 +672,8 @@ class KPIVisualization:
         except Exception:
             plt.tight_layout(rect=[0, 0, 0.96, 1])
 
+        format_span.stop()
+        
         # Hover tooltip (nếu có mplcursors)
         if enable_hover and HAS_MPLCURSORS and line_artists:
             cursor = mplcursors.cursor(line_artists, hover=True)
@@ -576,39 +695,30 @@ class KPIVisualization:
                     toolbar.set_message(f"(x, y) = ({date_str}, {y[i]:.2f}) | {province_name}")
 
         # Thêm handler nhẹ: khi rê gần bất kỳ đường line nào → hiện tỉnh + (ngày, giá trị)
-        cache_by_label = {it['label']: it for it in hover_cache}
-        def _status_on_line(event):
-            if event.inaxes is not ax:
-                return
-            toolbar = getattr(fig.canvas, 'toolbar', None)
-            if not (toolbar and hasattr(toolbar, 'set_message')):
-                return
-            try:
-                for ln in line_artists:
-                    hit, _ = ln.contains(event)
-                    if hit:
-                        label = ln.get_label()
-                        item = cache_by_label.get(label)
-                        if item is not None and event.xdata is not None:
-                            # Trên trục ngày, event.xdata đã ở dạng date2num → dùng trực tiếp để tránh sai lệch
-                            try:
-                                xevt = float(event.xdata)
-                            except Exception:
-                                xevt = None
-                            idx = int(np.argmin(np.abs(item['xnum'] - xevt)))
-                            try:
-                                date_str = pd.to_datetime(item['xraw'][idx]).strftime('%d/%m/%Y')
-                            except Exception:
-                                date_str = str(item['xraw'][idx])
-                            yv = float(item['y'][idx])
-                            toolbar.set_message(f"(x, y) = ({date_str}, {yv:.2f}) | {label}")
-                        else:
-                            toolbar.set_message(f"Line: {label}")
-                        return
-                # nếu không trúng line nào, giữ nguyên hoặc xoá message tùy backend
-            except Exception:
-                pass
-        fig.canvas.mpl_connect('motion_notify_event', _status_on_line)
+        # Chế độ batch không có Line2D cho mplcursors → một annotation dùng chung, dời theo con trỏ
+        tooltip = None
+        if enable_hover and batch_lines:
+            tooltip = ax.annotate('', xy=(0, 0), xytext=(12, 12), textcoords='offset points',
+                                  bbox=dict(boxstyle='round', fc='white', alpha=0.9),
+                                  fontsize=10, zorder=10, visible=False)
+        if enable_hover:
+            @throttle
+            def _status_on_line(event):
+                if event.inaxes is not ax:
+                    return
+                hit = hover_index.query(event.x, event.y)
+                if hit is None:
+                    return  # không trúng line nào: giữ nguyên message/tooltip
+                date_str = mdates.num2date(hit.x).strftime('%d/%m/%Y')
+                if tooltip is not None:
+                    tooltip.xy = (hit.x, hit.y)
+                    tooltip.set_text(f"{hit.label}\n{date_str}\n{kpi_column}: {hit.y:.2f}")
+                    tooltip.set_visible(True)
+                    fig.canvas.draw_idle()
+                toolbar = getattr(fig.canvas, 'toolbar', None)
+                if toolbar and hasattr(toolbar, 'set_message'):
+                    toolbar.set_message(f"(x, y) = ({date_str}, {hit.y:.2f}) | {hit.label}")
+            fig.canvas.mpl_connect('motion_notify_event', _status_on_line)
         
         return fig, ax
 
@@ -624,24 +734,32 @@ class KPIVisualization:
         """
         Chế độ tương tác: click vào điểm để loại bỏ ngày lỗi trực tiếp trên biểu đồ.
         - Chuột trái: chọn/bỏ chọn ngày tại điểm đang click
-        - Phím r: vẽ lại biểu đồ với các ngày đã loại bỏ
+        - Phím r: áp dụng loại bỏ các ngày đã chọn (cập nhật ngay trên biểu đồ hiện tại)
+        - Phím u: bỏ chọn tất cả và hiển thị lại đầy đủ
         - Phím s: lưu chart (PNG) và đóng
         - Phím q hoặc đóng cửa sổ: thoát (không lưu nếu chưa nhấn s)
+
+        Dữ liệu đã lọc/pivot được giữ trong bộ nhớ: loại bỏ ngày chỉ cập nhật dữ liệu
+        các Line2D hiện có (set_data) rồi draw_idle, không lọc lại DataFrame hay dựng lại trục/legend.
         """
-        # Dùng pipeline filter giống create_pivot_line_chart, nhưng giữ lại pivot_data ban đầu
+        # Lọc + pivot một lần, giữ lại cho các lần loại bỏ ngày sau đó
+        pivot_data = self.prepare_pivot_data(df, kpi_column, group_by, date_column, provinces,
+                                             exclude_dates, date_range_filter)
         base_fig, base_ax = self.create_pivot_line_chart(
             df=df,
             kpi_column=kpi_column,
             group_by=group_by,
             date_column=date_column,
-            provinces=provinces,
             title=title,
             lookback_days=None,
             start_date=None,
             end_date=None,
-            exclude_dates=exclude_dates,
-            date_range_filter=date_range_filter
+            enable_hover=False,  # Tooltip/status riêng của chế độ tương tác (theo các ngày đã loại bỏ)
+            pivot_data=pivot_data,
+            batch_lines=False  # Cần Line2D từng tỉnh để pick điểm và set_data khi loại bỏ ngày
         )
+        lod = SeriesLOD.from_long(pivot_data, date_column, group_by, kpi_column)
+        import matplotlib.dates as mdates
         # Thu nhỏ kích thước cho chế độ tương tác (vừa phải hơn)
         try:
             base_fig.set_size_inches(12, 7, forward=True)
@@ -650,8 +768,8 @@ class KPIVisualization:
         except Exception:
             pass
 
-        # Thu thập dữ liệu hiển thị để xác định ngày khi click
-        lines = base_ax.get_lines()
+        # Thu thập dữ liệu hiển thị để xác định ngày khi click (bỏ qua các đường phụ như axvline)
+        lines = [ln for ln in base_ax.get_lines() if ln.get_label() in lod.daily.columns]
         for ln in lines:
             ln.set_picker(5)
             try:
@@ -680,65 +798,71 @@ class KPIVisualization:
                     toolbar.set_message(f"(x, y) = ({date_str}, {y[i]:.2f}) | {province_name}")
 
         # Hiển thị tên tỉnh + (ngày, giá trị) khi rê gần line trong chế độ tương tác
+        hover_index = LineHoverIndex(base_ax)
+
+        def index_lines():
+            # Chỉ mục theo dữ liệu đang vẽ của từng line (đã giảm mẫu, đã loại ngày)
+            for ln in lines:
+                hover_index.set_series(ln.get_label(), mdates.date2num(ln.get_xdata()),
+                                       np.asarray(ln.get_ydata(), dtype=float))
+
+        index_lines()
+
+        @throttle
         def _status_on_line_interactive(event):
             if event.inaxes is not base_ax:
                 return
             toolbar = getattr(base_fig.canvas, 'toolbar', None)
             if not (toolbar and hasattr(toolbar, 'set_message')):
                 return
-            try:
-                for ln in lines:
-                    hit, _ = ln.contains(event)
-                    if hit:
-                        label = ln.get_label()
-                        xdata = ln.get_xdata()
-                        ydata = ln.get_ydata()
-                        if event.xdata is not None:
-                            # event.xdata đã là date2num nếu trục là ngày
-                            try:
-                                xevt = float(event.xdata)
-                            except Exception:
-                                xevt = None
-                            try:
-                                import matplotlib.dates as mdates
-                                xnum = mdates.date2num(pd.to_datetime(xdata))
-                            except Exception:
-                                xnum = np.asarray(xdata, dtype=float)
-                            idx = int(np.argmin(np.abs(xnum - xevt)))
-                            try:
-                                date_str = pd.to_datetime(xdata[idx]).strftime('%d/%m/%Y')
-                            except Exception:
-                                date_str = str(xdata[idx])
-                            toolbar.set_message(f"(x, y) = ({date_str}, {float(ydata[idx]):.2f}) | {label}")
-                        else:
-                            toolbar.set_message(f"Line: {label}")
-                        return
-            except Exception:
-                pass
+            hit = hover_index.query(event.x, event.y)
+            if hit is None:
+                return
+            date_str = mdates.num2date(hit.x).strftime('%d/%m/%Y')
+            toolbar.set_message(f"(x, y) = ({date_str}, {hit.y:.2f}) | {hit.label}")
         base_fig.canvas.mpl_connect('motion_notify_event', _status_on_line_interactive)
 
         selected_dates = set()
         highlight_artists = []
+        base_title = title or f'Trend Analysis: {kpi_column}'
 
         def toggle_highlight(xdate):
-            # Vẽ nền mờ cho ngày đang chọn
-            import matplotlib.dates as mdates
-            span = base_ax.axvspan(xdate, xdate, color='#ffeb3b', alpha=0.35, zorder=0)
+            # Vẽ nền mờ cho ngày đang chọn (rộng 1 ngày quanh điểm)
+            center = pd.Timestamp(xdate)
+            span = base_ax.axvspan(center - pd.Timedelta(hours=12), center + pd.Timedelta(hours=12),
+                                   color='#ffeb3b', alpha=0.35, zorder=0)
             highlight_artists.append(span)
-            base_fig.canvas.draw_idle()
 
         def clear_highlights():
             while highlight_artists:
                 artist = highlight_artists.pop()
                 artist.remove()
 
+        def set_title(suffix: str):
+            base_ax.set_title(f"{base_title}  |  {suffix}",
+                              fontsize=18, fontweight='bold', pad=25, color='#2c3e50')
+
+        def apply_exclusions():
+            # Ẩn các ngày đã chọn bằng mask trên bảng pivot trong bộ nhớ, cập nhật dữ liệu từng line
+            daily = lod.daily
+            if selected_dates:
+                daily = daily[~daily.index.isin(pd.to_datetime(sorted(selected_dates)))]
+            for ln in lines:
+                values = daily[ln.get_label()].dropna()
+                x_plot, y_plot = downsample(values.index, values.to_numpy(dtype=float), lod.max_points)
+                ln.set_data(x_plot, y_plot)
+            index_lines()
+            base_ax.relim()
+            base_ax.autoscale_view()
+            clear_highlights()
+
         def on_pick(event):
             # Lấy ngày tại chỉ số điểm được pick
             line = event.artist
             ind = event.ind[0]
             xdata = line.get_xdata()
             if ind < len(xdata):
-                xdate = xdata[ind]
+                xdate = pd.Timestamp(xdata[ind])
                 # Toggle
                 if xdate in selected_dates:
                     selected_dates.remove(xdate)
@@ -748,48 +872,21 @@ class KPIVisualization:
                 for d in selected_dates:
                     toggle_highlight(d)
 
-                base_ax.set_title((title or f'Trend Analysis: {kpi_column}') + 
-                                   f"  |  Đã chọn loại bỏ: {len(selected_dates)} ngày",
-                                   fontsize=18, fontweight='bold', pad=25, color='#2c3e50')
+                set_title(f"Đã chọn loại bỏ: {len(selected_dates)} ngày")
                 base_fig.canvas.draw_idle()
 
         def on_key(event):
             if event.key == 'r':
-                # Vẽ lại với exclude_dates = selected_dates
-                clear_highlights()
-                for artist in base_ax.lines + base_ax.collections:
-                    try:
-                        artist.remove()
-                    except Exception:
-                        pass
-                # Tạo chart mới với exclude
-                exclude_strs = []
-                for d in sorted(selected_dates):
-                    try:
-                        exclude_strs.append(pd.to_datetime(d).strftime('%d/%m/%Y'))
-                    except Exception:
-                        exclude_strs.append(str(d))
+                exclude_strs = [d.strftime('%d/%m/%Y') for d in sorted(selected_dates)]
                 print(f"🚫 Loại bỏ tạm thời các ngày: {exclude_strs}")
-                # Gọi lại create_pivot_line_chart để vẽ lại trục và line
-                plt.close(base_fig)
-                fig2, ax2 = self.create_pivot_line_chart(
-                    df=df,
-                    kpi_column=kpi_column,
-                    group_by=group_by,
-                    date_column=date_column,
-                    provinces=provinces,
-                    title=title,
-                    exclude_dates=exclude_strs,
-                    date_range_filter=date_range_filter
-                )
-                try:
-                    fig2.set_size_inches(12, 7, forward=True)
-                    fig2.subplots_adjust(left=0.097, right=0.823, top=0.895, bottom=0.16, wspace=0.2, hspace=0.2)
-                except Exception:
-                    pass
-                fig2.canvas.mpl_connect('pick_event', on_pick)
-                fig2.canvas.mpl_connect('key_press_event', on_key)
-                fig2.show()
+                apply_exclusions()
+                set_title(f"Đã loại bỏ: {len(selected_dates)} ngày")
+                base_fig.canvas.draw_idle()
+            elif event.key == 'u':
+                selected_dates.clear()
+                apply_exclusions()
+                base_ax.set_title(base_title, fontsize=18, fontweight='bold', pad=25, color='#2c3e50')
+                base_fig.canvas.draw_idle()
             elif event.key == 's':
                 if output_filename is None:
                     filename = f"trend_{kpi_column}_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.png"
@@ -806,12 +903,212 @@ class KPIVisualization:
 
         # Hướng dẫn nhanh
         base_ax.text(0.01, 1.02,
-                     "Click điểm để chọn/bỏ ngày | r: vẽ lại | s: lưu | q: thoát",
+                     "Click điểm để chọn/bỏ ngày | r: loại bỏ | u: khôi phục | s: lưu | q: thoát",
                      transform=base_ax.transAxes, fontsize=10, color='#555555')
 
         plt.show()
         return base_fig, base_ax
-    
+
+    def create_small_multiples_chart(self, df: pd.DataFrame,
+                                     kpi_column: str,
+                                     group_by: str = 'CTKD7',
+                                     date_column: str = 'Ngay7',
+                                     provinces: Optional[List[str]] = None,
+                                     alert_provinces: Optional[List[str]] = None,
+                                     title: Optional[str] = None,
+                                     ncols: Optional[int] = None,
+                                     lookback_days: Optional[int] = None,
+                                     exclude_dates: Optional[List[str]] = None,
+                                     date_range_filter: Optional[tuple] = None,
+                                     threshold_line: Optional[float] = None,
+                                     max_points: Optional[int] = SMALL_MULTIPLES_MAX_POINTS,
+                                     panel_size: tuple = SMALL_MULTIPLES_PANEL_SIZE,
+                                     dpi: int = 100,
+                                     workers: int = 1,
+                                     filename: Optional[str] = None,
+                                     pivot_data: Optional[pd.DataFrame] = None) -> Optional[str]:
+        """
+        Lưới small multiples: mỗi tỉnh một ô nhỏ, chung trục X/Y, tỉnh cảnh báo tô đỏ
+
+        Thay cho một trục 18×10 với 60+ đường chồng nhau (bảng màu tab20 bị lặp). Các ô được
+        dựng từ cùng một mảng pivot (ngày × tỉnh), mỗi ô một LineCollection, lưới chia thành
+        các tile theo hàng rồi ghép lại thành một ảnh PNG; chỉ vẽ song song khi lưới đủ lớn
+        (≥ SMALL_MULTIPLES_POOL_MIN_PANELS ô) để bù chi phí khởi động process.
+
+        Args:
+            alert_provinces: Các tỉnh cần tô đỏ (thường là tỉnh có cảnh báo)
+            ncols: Số cột của lưới (None = tự chọn theo số tỉnh)
+            lookback_days: Tô nền khoảng n ngày gần nhất trong mỗi ô
+            max_points: Số điểm tối đa mỗi ô (giảm mẫu LTTB; None = vẽ đủ)
+            panel_size: Kích thước mỗi ô (inch)
+            workers: Số process tối đa vẽ tile song song (1 = tuần tự); bị giới hạn theo số CPU
+                     và bỏ qua khi lưới nhỏ hơn SMALL_MULTIPLES_POOL_MIN_PANELS ô
+            filename: Tên file PNG (mặc định small_multiples_<KPI>_YYYYMMDD.png)
+            Các tham số còn lại giống create_pivot_line_chart
+
+        Returns:
+            Đường dẫn file PNG, None nếu không có dữ liệu
+        """
+        import matplotlib.dates as mdates
+        from matplotlib.image import imsave
+        from matplotlib.ticker import MaxNLocator
+        from chart_lod import lttb_indices
+
+        if pivot_data is None:
+            pivot_data = self.prepare_pivot_data(df, kpi_column, group_by, date_column, provinces,
+                                                 exclude_dates, date_range_filter)
+        if len(pivot_data) == 0:
+            print(f"⚠️  Không có dữ liệu hợp lệ để vẽ small multiples cho {kpi_column}")
+            return None
+
+        prepare_span = span('small_multiples.prepare', kpi=kpi_column).start()
+        wide = SeriesLOD.from_long(pivot_data, date_column, group_by, kpi_column).daily
+        values = wide.to_numpy(dtype=float)
+        x_all = mdates.date2num(wide.index)
+        alerts = set(alert_provinces or [])
+        panels = []
+        for j, province in enumerate(wide.columns):
+            valid = np.isfinite(values[:, j])
+            x, y = x_all[valid], values[valid, j]
+            if max_points is not None and len(y) > max_points:
+                keep = lttb_indices(x, y, max_points)
+                x, y = x[keep], y[keep]
+            panels.append((str(province), x, y, province in alerts))
+
+        # Trục chung cho mọi ô
+        y_min, y_max = np.nanmin(values), np.nanmax(values)
+        pad = (y_max - y_min) * 0.05 or abs(y_max) * 0.05 or 1.0
+        ylim = (y_min - pad, y_max + pad)
+        xlim = (x_all[0] - 0.5, x_all[-1] + 0.5)
+        xticks = np.unique(np.round(np.linspace(x_all[0], x_all[-1], 3)))
+        date_fmt = '%d/%m' if x_all[-1] - x_all[0] <= 366 else '%m/%Y'
+        yticks = [t for t in MaxNLocator(nbins=3).tick_values(*ylim) if ylim[0] <= t <= ylim[1]]
+        highlight = None
+        if lookback_days:
+            highlight = (x_all[-1] - lookback_days + 0.5, x_all[-1] + 0.5)
+
+        n_panels = len(panels)
+        if ncols is None:
+            ncols = int(np.ceil(np.sqrt(n_panels * 1.6)))
+        ncols = max(1, min(ncols, n_panels))
+        n_rows = -(-n_panels // ncols)
+        options = {
+            'ncols': ncols, 'panel_size': panel_size, 'dpi': dpi,
+            'title': title or f'{kpi_column} theo tỉnh ({n_panels} tỉnh, {len(alerts & set(wide.columns))} cảnh báo)',
+            'xlim': xlim, 'ylim': ylim,
+            'xticks': xticks, 'xtick_labels': [mdates.num2date(t).strftime(date_fmt) for t in xticks],
+            'yticks': yticks, 'ytick_labels': [f'{t:,.0f}' if abs(t) >= 1000 else f'{t:.4g}' for t in yticks],
+            'highlight': highlight, 'threshold': threshold_line,
+        }
+        # Chia lưới theo hàng: mỗi process một tile liền khối (lưới nhỏ: một process nhanh hơn)
+        if n_panels < SMALL_MULTIPLES_POOL_MIN_PANELS:
+            workers = 1
+        workers = max(1, min(workers, n_rows, os.cpu_count() or 1))
+        rows_per_tile = -(-n_rows // workers)
+        step = rows_per_tile * ncols
+        tasks = [(panels[start:start + step], start, n_panels, options)
+                 for start in range(0, n_panels, step)]
+        prepare_span.stop(rows=len(pivot_data), panels=n_panels, tiles=len(tasks))
+
+        with span('small_multiples.render', tiles=len(tasks), workers=workers):
+            if workers <= 1 or len(tasks) == 1:
+                tiles = [_render_small_multiples_tile(*task) for task in tasks]
+            else:
+                from concurrent.futures import ProcessPoolExecutor
+                with ProcessPoolExecutor(max_workers=len(tasks)) as pool:
+                    tiles = list(pool.map(_render_small_multiples_tile, *zip(*tasks)))
+
+        filename = filename or f"small_multiples_{kpi_column}_{pd.Timestamp.now().strftime('%Y%m%d')}.png"
+        filepath = self._chart_path(filename)
+        with span('small_multiples.save'):
+            imsave(filepath, np.concatenate(tiles, axis=0), dpi=dpi)
+        print(f"✅ Đã lưu chart: {filepath}")
+        return filepath
+
+    def create_kpi_heatmap(self, matrix: dict,
+                           threshold: float = 2.0,
+                           title: Optional[str] = None,
+                           sort_rows: bool = True,
+                           annotate: Optional[bool] = None):
+        """
+        Heatmap tỉnh × KPI: tỉnh nào đang xấu ở KPI nào
+
+        Args:
+            matrix: Kết quả KPIDeclineDetector.compute_change_matrix (cần signed_change_pct,
+                    limit_breached, alert)
+            threshold: Ngưỡng suy giảm (%) - dải màu theo ngưỡng và các mức nghiêm trọng
+                       (-threshold, -5, -10 giống _get_severity)
+            title: Tiêu đề chart
+            sort_rows: Tỉnh xấu nhất (thay đổi âm nhất trên mọi KPI) lên đầu
+            annotate: Ghi giá trị trong ô (None = chỉ khi bảng ≤ 400 ô)
+
+        Ô đỏ = xấu đi theo hướng KPI, xanh = tốt lên, xám = không đủ dữ liệu;
+        ✕ = vi phạm ngưỡng (limit), viền đen = ô có cảnh báo.
+        """
+        from matplotlib.collections import PatchCollection
+        from matplotlib.colors import BoundaryNorm
+        from matplotlib.lines import Line2D
+        from matplotlib.patches import Rectangle
+
+        signed = matrix['signed_change_pct']
+        breached = matrix['limit_breached']
+        alert = matrix['alert']
+        if sort_rows and len(signed):
+            order = signed.min(axis=1).sort_values(na_position='last', kind='stable').index
+            signed, breached, alert = signed.loc[order], breached.loc[order], alert.loc[order]
+        values = signed.to_numpy(dtype=float)
+        n_rows, n_cols = values.shape
+
+        # Dải màu theo quy tắc cảnh báo thay vì min/max dữ liệu: ô vượt ngưỡng luôn có màu rõ
+        bounds = heatmap_bounds(threshold)
+        cap = bounds[-1]
+        cmap = plt.get_cmap('RdYlGn', len(bounds) - 1).copy()
+        cmap.set_bad('#d9d9d9')
+        norm = BoundaryNorm(bounds, cmap.N)
+
+        fig, ax = plt.subplots(figsize=(min(24, 3 + 1.1 * n_cols), min(40, 1.8 + 0.28 * n_rows)))
+        image = ax.imshow(np.ma.masked_invalid(np.clip(values, -cap, cap)), cmap=cmap, norm=norm,
+                          aspect='auto', interpolation='nearest')
+
+        rows, cols = np.nonzero(breached.to_numpy(dtype=bool))
+        ax.scatter(cols, rows, marker='x', s=36, linewidths=1.6, color='#1a1a1a', zorder=3)
+        rows, cols = np.nonzero(alert.to_numpy(dtype=bool))
+        ax.add_collection(PatchCollection([Rectangle((c - 0.5, r - 0.5), 1, 1) for r, c in zip(rows, cols)],
+                                          facecolor='none', edgecolor='#000000', linewidth=1.8, zorder=4))
+
+        if annotate is None:
+            annotate = n_rows * n_cols <= 400
+        if annotate:
+            for (r, c), v in np.ndenumerate(values):
+                if np.isfinite(v):
+                    ax.text(c, r, f'{v:+.1f}', ha='center', va='center', fontsize=7,
+                            color='white' if abs(v) >= 10 else '#1a1a1a', zorder=5)
+
+        ax.set_xticks(range(n_cols))
+        ax.set_xticklabels(signed.columns, rotation=45, ha='right', fontsize=10)
+        ax.set_yticks(range(n_rows))
+        ax.set_yticklabels(signed.index, fontsize=9)
+        ax.set_xticks(np.arange(-0.5, n_cols, 1), minor=True)
+        ax.set_yticks(np.arange(-0.5, n_rows, 1), minor=True)
+        ax.grid(False, which='major')
+        ax.grid(True, which='minor', color='white', linewidth=0.8)
+        ax.tick_params(which='minor', length=0)
+
+        n_alerts = int(alert.to_numpy().sum())
+        ax.set_title(title or f'KPI × tỉnh: {n_alerts} cảnh báo ({n_rows} tỉnh, {n_cols} KPI)',
+                     fontsize=15, fontweight='bold', color='#2c3e50', pad=24)
+        colorbar = fig.colorbar(image, ax=ax, ticks=bounds[1:-1], fraction=0.04, pad=0.02)
+        colorbar.set_label('% thay đổi theo hướng KPI (âm = xấu đi)', fontsize=10)
+        handles = [
+            Line2D([], [], marker='x', linestyle='none', color='#1a1a1a', label='Vi phạm ngưỡng'),
+            Line2D([], [], marker='s', linestyle='none', markerfacecolor='none',
+                   markeredgecolor='#000000', markersize=10, label='Có cảnh báo'),
+        ]
+        ax.legend(handles=handles, loc='lower right', bbox_to_anchor=(1.0, 1.0), ncol=2, fontsize=9,
+                  frameon=False, borderaxespad=0.2)
+        fig.tight_layout()
+        return fig, ax
+
     def create_comparison_chart(self, df: pd.DataFrame,
                                kpi_column: str,
                                compare_dates: List[str],
@@ -902,12 +1199,17 @@ class KPIVisualization:
         
         return fig, ax
     
-    def save_chart(self, fig, filename: str):
-        """Lưu chart vào charts/YYYYMMDD/filename để quản lý gọn gàng."""
+    def _chart_path(self, filename: str) -> str:
+        """Đường dẫn charts/YYYYMMDD/filename (tạo thư mục ngày nếu chưa có)."""
         date_folder = pd.Timestamp.now().strftime('%Y%m%d')
         out_dir = os.path.join(self.output_dir, date_folder)
         os.makedirs(out_dir, exist_ok=True)
-        filepath = os.path.join(out_dir, filename)
+        return os.path.join(out_dir, filename)
+
+    @traced('save_chart')
+    def save_chart(self, fig, filename: str):
+        """Lưu chart vào charts/YYYYMMDD/filename để quản lý gọn gàng."""
+        filepath = self._chart_path(filename)
         fig.savefig(filepath, dpi=300, bbox_inches='tight')
         print(f"✅ Đã lưu chart: {filepath}")
         plt.close(fig)
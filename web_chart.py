@@ -0,0 +1,389 @@
+"""
+WEB CHART - BIỂU ĐỒ TƯƠNG TÁC CHẠY TRÊN TRÌNH DUYỆT
+===================================================
+st.pyplot vẽ ảnh trên server và mỗi lần đổi widget là vẽ lại toàn bộ. Module này tạo
+một component HTML/JS tự chứa (canvas, không cần CDN) nhận payload JSON gọn của bảng
+pivot ngày × tỉnh, mọi tương tác chạy trong trình duyệt, không gây Streamlit rerun:
+- Rê chuột: tooltip tỉnh + ngày + giá trị (tìm kiếm nhị phân theo ngày, throttle theo khung hình)
+- Lăn chuột: zoom trục ngày quanh con trỏ; kéo: dịch; double-click: về toàn bộ khoảng
+- Click điểm: chọn/bỏ loại trừ ngày đó (ẩn khỏi mọi tỉnh, như chế độ tương tác desktop),
+  danh sách ngày đã loại hiển thị dạng DD/MM/YYYY để chép vào bộ lọc
+- Click tên tỉnh trong chú thích: ẩn/hiện đường
+
+Server chỉ tạo payload một lần cho mỗi (phiên bản dữ liệu, KPI) - app.py cache chuỗi JSON;
+các lần rerun sau chỉ ghép chuỗi HTML.
+
+Sử dụng:
+    from web_chart import build_payload, chart_height, chart_options, payload_json, pivot_wide, render_html
+
+    wide = pivot_wide(df, 'CSSR')
+    options = chart_options(title='CSSR', excluded_dates=['16/10/2025'])
+    html = render_html(payload_json(build_payload(wide, 'CSSR')), options)
+    streamlit.components.v1.html(html, height=chart_height(options))
+"""
+
+import json
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_HEIGHT = 460      # Chiều cao vùng vẽ (px)
+LEGEND_HEIGHT = 120       # Chiều cao tối đa phần chú thích + danh sách ngày đã loại
+PAYLOAD_DECIMALS = 3      # Làm tròn giá trị để payload gọn
+_EPOCH = pd.Timestamp('1970-01-01')
+
+
+def pivot_wide(df: pd.DataFrame, kpi_column: str, group_by: str = 'CTKD7',
+               date_column: str = 'Ngay7', provinces: Optional[Iterable[str]] = None) -> pd.DataFrame:
+    """
+    Bảng rộng ngày × tỉnh của một KPI (mean theo ngày + tỉnh, bỏ giá trị null và = 0)
+
+    Returns:
+        DataFrame index = ngày (datetime, tăng dần), cột = tỉnh (sắp xếp theo tên)
+    """
+    cols = [date_column, group_by, kpi_column]
+    data = df[cols]
+    if provinces is not None:
+        data = data[data[group_by].isin(list(provinces))]
+    dates = data[date_column]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, format='%d/%m/%Y', errors='coerce')
+    values = pd.to_numeric(data[kpi_column], errors='coerce')
+    valid = dates.notna() & values.notna() & (values != 0)
+    wide = (values[valid]
+            .groupby([dates[valid], data[group_by][valid]], observed=True)
+            .mean()
+            .unstack(group_by))
+    wide.index.name = date_column
+    wide.columns.name = None
+    return wide.sort_index().reindex(sorted(wide.columns, key=str), axis=1)
+
+
+def build_payload(wide: pd.DataFrame, kpi_column: str, decimals: int = PAYLOAD_DECIMALS) -> Dict:
+    """
+    Payload gọn cho component: ngày dạng số ngày kể từ 1970-01-01, giá trị đã làm tròn (null = thiếu)
+
+    {'kpi': ..., 'days': [20300, ...], 'series': [{'name': 'Tinh 01', 'values': [97.5, null, ...]}]}
+    """
+    index = pd.DatetimeIndex(wide.index)
+    days = ((index - _EPOCH) // pd.Timedelta(days=1)).astype(int).tolist()
+    series = []
+    for name in wide.columns:
+        values = np.round(wide[name].to_numpy(dtype=float), decimals)
+        series.append({
+            'name': str(name),
+            'values': [None if np.isnan(v) else float(v) for v in values],
+        })
+    return {'kpi': kpi_column, 'days': days, 'series': series}
+
+
+def payload_json(payload: Dict) -> str:
+    """JSON không khoảng trắng thừa, giữ nguyên tiếng Việt."""
+    return json.dumps(payload, ensure_ascii=False, separators=(',', ':'), allow_nan=False)
+
+
+def _to_day(value) -> Optional[int]:
+    """Ngày (chuỗi DD/MM/YYYY, YYYY-MM-DD, date, Timestamp) → số ngày kể từ 1970-01-01."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        fmt = '%d/%m/%Y' if '/' in value else '%Y-%m-%d'
+        ts = pd.to_datetime(value, format=fmt, errors='coerce')
+    else:
+        ts = pd.to_datetime(value, errors='coerce')
+    if pd.isna(ts):
+        return None
+    return int((ts.normalize() - _EPOCH) // pd.Timedelta(days=1))
+
+
+def chart_options(title: Optional[str] = None, excluded_dates: Iterable = (),
+                  date_range: Optional[tuple] = None, lookback_days: Optional[int] = None,
+                  height: int = DEFAULT_HEIGHT) -> Dict:
+    """Trạng thái ban đầu của component (ngày loại trừ, khoảng ngày hiển thị, vùng highlight)."""
+    options = {'title': title or '', 'height': int(height), 'lookback': int(lookback_days or 0)}
+    options['excluded'] = [d for d in (_to_day(v) for v in excluded_dates) if d is not None]
+    if date_range and len(date_range) == 2:
+        start, end = _to_day(date_range[0]), _to_day(date_range[1])
+        if start is not None and end is not None:
+            options['range'] = [min(start, end), max(start, end)]
+    return options
+
+
+def chart_height(options: Dict) -> int:
+    """Chiều cao iframe cần cho component (vùng vẽ + chú thích)."""
+    return int(options.get('height', DEFAULT_HEIGHT)) + LEGEND_HEIGHT + 40
+
+
+def render_html(payload: str, options: Optional[Dict] = None) -> str:
+    """Ghép payload JSON (chuỗi, thường lấy từ cache) và options vào template HTML."""
+    options = options or chart_options()
+    head, rest = _TEMPLATE.split('__PAYLOAD__', 1)
+    middle, tail = rest.split('__OPTIONS__', 1)
+    # '</' trong chuỗi JSON (ví dụ tên tỉnh) không được phép đóng thẻ <script>
+    return ''.join([head, payload.replace('</', '<\\/'), middle,
+                    payload_json(options).replace('</', '<\\/'), tail])
+
+
+_TEMPLATE = r"""<!DOCTYPE html>
+<html><head><meta charset="utf-8">
+<style>
+  body { margin: 0; font-family: "Source Sans Pro", Arial, sans-serif; color: #2c3e50; }
+  #wrap { position: relative; }
+  #title { font-weight: 600; font-size: 15px; margin: 2px 0 4px 4px; }
+  #hint { font-size: 11px; color: #7f8c8d; margin-left: 4px; }
+  canvas { display: block; width: 100%; cursor: crosshair; }
+  #tip { position: absolute; pointer-events: none; background: rgba(255,255,255,0.95);
+         border: 1px solid #95a5a6; border-radius: 4px; padding: 4px 6px; font-size: 12px;
+         white-space: nowrap; display: none; box-shadow: 0 1px 3px rgba(0,0,0,0.2); }
+  #legend { max-height: __LEGEND__px; overflow-y: auto; font-size: 12px; margin: 4px; }
+  #legend span { display: inline-block; margin: 1px 8px 1px 0; cursor: pointer; user-select: none; }
+  #legend span.off { opacity: 0.35; text-decoration: line-through; }
+  #legend i { display: inline-block; width: 14px; height: 3px; margin-right: 4px; vertical-align: middle; }
+  #excl { font-size: 12px; margin: 4px; }
+  #excl input { width: 60%; font-size: 12px; }
+  #excl button { font-size: 12px; margin-left: 4px; }
+</style></head>
+<body>
+<div id="title"></div>
+<div id="hint">Lăn chuột: zoom · Kéo: dịch · Double-click: toàn bộ · Click điểm: loại/bỏ loại ngày · Click tên tỉnh: ẩn/hiện</div>
+<div id="wrap"><canvas id="cv"></canvas><div id="tip"></div></div>
+<div id="excl"></div>
+<div id="legend"></div>
+<script>
+(function () {
+  var DATA = __PAYLOAD__;
+  var OPT = __OPTIONS__;
+  var PALETTE = ['#1f77b4','#ff7f0e','#2ca02c','#d62728','#9467bd','#8c564b','#e377c2','#7f7f7f',
+                 '#bcbd22','#17becf','#aec7e8','#ffbb78','#98df8a','#ff9896','#c5b0d5','#c49c94',
+                 '#f7b6d2','#c7c7c7','#dbdb8d','#9edae5'];
+  var DAY_MS = 86400000, PAD = {l: 64, r: 12, t: 10, b: 46}, RADIUS = 8;
+  var days = DATA.days, series = DATA.series, n = days.length;
+  var excluded = {}; (OPT.excluded || []).forEach(function (d) { excluded[d] = true; });
+  var hidden = {};
+  var full = n ? [days[0] - 0.5, days[n - 1] + 0.5] : [0, 1];
+  var view = OPT.range ? [OPT.range[0] - 0.5, OPT.range[1] + 0.5] : full.slice();
+  var cv = document.getElementById('cv'), ctx = cv.getContext('2d'), tip = document.getElementById('tip');
+  var H = OPT.height || 460, W = 800, dpr = window.devicePixelRatio || 1, yr = [0, 1];
+  document.getElementById('title').textContent = OPT.title || DATA.kpi;
+
+  function fmt(d) {
+    var t = new Date(d * DAY_MS);
+    function p(v) { return (v < 10 ? '0' : '') + v; }
+    return p(t.getUTCDate()) + '/' + p(t.getUTCMonth() + 1) + '/' + t.getUTCFullYear();
+  }
+  function color(i) { return PALETTE[i % PALETTE.length]; }
+  function lowerBound(x) {  // chỉ số đầu tiên có days[i] >= x
+    var lo = 0, hi = n;
+    while (lo < hi) { var m = (lo + hi) >> 1; if (days[m] < x) lo = m + 1; else hi = m; }
+    return lo;
+  }
+  function px(d) { return PAD.l + (d - view[0]) / (view[1] - view[0]) * (W - PAD.l - PAD.r); }
+  function py(v) { return PAD.t + (1 - (v - yr[0]) / (yr[1] - yr[0])) * (H - PAD.t - PAD.b); }
+  function dayAt(x) { return view[0] + (x - PAD.l) / (W - PAD.l - PAD.r) * (view[1] - view[0]); }
+
+  function visibleRange() { return [Math.max(0, lowerBound(view[0])), Math.min(n, lowerBound(view[1]))]; }
+
+  function updateY(i0, i1) {
+    var lo = Infinity, hi = -Infinity;
+    series.forEach(function (s, k) {
+      if (hidden[k]) return;
+      for (var i = i0; i < i1; i++) {
+        var v = s.values[i];
+        if (v === null || excluded[days[i]]) continue;
+        if (v < lo) lo = v; if (v > hi) hi = v;
+      }
+    });
+    if (!isFinite(lo)) { lo = 0; hi = 1; }
+    var pad = (hi - lo) * 0.06 || Math.abs(hi) * 0.05 || 1;
+    yr = [lo - pad, hi + pad];
+  }
+
+  function niceStep(span, target) {
+    var raw = span / target, mag = Math.pow(10, Math.floor(Math.log10(raw))), r = raw / mag;
+    return (r < 1.5 ? 1 : r < 3 ? 2 : r < 7 ? 5 : 10) * mag;
+  }
+
+  function xTicks() {  // mỗi ngày khi khoảng ngắn, giãn dần theo tuần/tháng/năm
+    var span = view[1] - view[0], maxTicks = Math.max(2, Math.floor((W - PAD.l - PAD.r) / 80));
+    var steps = [1, 2, 7, 14], ticks = [], d;
+    for (var s = 0; s < steps.length; s++) {
+      if (span / steps[s] <= maxTicks) {
+        var offset = steps[s] >= 7 ? 4 : 0;  // ngày 4 (05/01/1970) là thứ Hai → tick tuần rơi vào thứ Hai
+        for (d = Math.ceil(view[0]); d <= view[1]; d++) {
+          if (((d - offset) % steps[s] + steps[s]) % steps[s] === 0) ticks.push(d);
+        }
+        return ticks;
+      }
+    }
+    var months = [1, 2, 3, 6, 12, 24, 60], t0 = new Date(view[0] * DAY_MS), m;
+    for (var k = 0; k < months.length; k++) {
+      if (span / (30.44 * months[k]) <= maxTicks) {
+        m = t0.getUTCFullYear() * 12 + t0.getUTCMonth();
+        m = Math.ceil(m / months[k]) * months[k];
+        for (; ; m += months[k]) {
+          d = Date.UTC(Math.floor(m / 12), m % 12, 1) / DAY_MS;
+          if (d > view[1]) break;
+          if (d >= view[0]) ticks.push(d);
+        }
+        return ticks;
+      }
+    }
+    return ticks;
+  }
+
+  function draw() {
+    W = cv.clientWidth || 800;
+    cv.width = Math.round(W * dpr); cv.height = Math.round(H * dpr); cv.style.height = H + 'px';
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.clearRect(0, 0, W, H);
+    var r = visibleRange(), i0 = Math.max(0, r[0] - 1), i1 = Math.min(n, r[1] + 1);
+    updateY(r[0], r[1]);
+
+    // Vùng highlight lookback (các ngày gần nhất)
+    if (OPT.lookback && n) {
+      var hs = days[n - 1] - OPT.lookback + 0.5, he = days[n - 1] + 0.5;
+      ctx.fillStyle = 'rgba(255,215,0,0.18)';
+      var x0 = Math.max(PAD.l, px(hs)), x1 = Math.min(W - PAD.r, px(he));
+      if (x1 > x0) ctx.fillRect(x0, PAD.t, x1 - x0, H - PAD.t - PAD.b);
+    }
+    // Lưới + nhãn trục
+    ctx.strokeStyle = '#e5e8eb'; ctx.fillStyle = '#34495e'; ctx.lineWidth = 1; ctx.font = '11px sans-serif';
+    var ys = niceStep(yr[1] - yr[0], 8), y;
+    ctx.textAlign = 'right'; ctx.textBaseline = 'middle';
+    for (y = Math.ceil(yr[0] / ys) * ys; y <= yr[1]; y += ys) {
+      ctx.beginPath(); ctx.moveTo(PAD.l, py(y)); ctx.lineTo(W - PAD.r, py(y)); ctx.stroke();
+      ctx.fillText(y.toFixed(2), PAD.l - 6, py(y));
+    }
+    ctx.textAlign = 'center'; ctx.textBaseline = 'top';
+    var monthly = view[1] - view[0] > 180;
+    xTicks().forEach(function (d) {
+      var x = px(d);
+      ctx.beginPath(); ctx.moveTo(x, PAD.t); ctx.lineTo(x, H - PAD.b); ctx.stroke();
+      var label = fmt(d);
+      ctx.fillText(monthly ? label.slice(3) : label, x, H - PAD.b + 6);
+    });
+    ctx.strokeStyle = '#34495e';
+    ctx.beginPath(); ctx.moveTo(PAD.l, PAD.t); ctx.lineTo(PAD.l, H - PAD.b); ctx.lineTo(W - PAD.r, H - PAD.b); ctx.stroke();
+
+    // Đường từng tỉnh (bỏ ngày đã loại, ngắt nét tại giá trị thiếu)
+    ctx.save();
+    ctx.beginPath(); ctx.rect(PAD.l, PAD.t, W - PAD.l - PAD.r, H - PAD.t - PAD.b); ctx.clip();
+    var pts = r[1] - r[0], marker = pts <= 45 ? 3 : (pts <= 120 ? 1.5 : 0);
+    series.forEach(function (s, k) {
+      if (hidden[k]) return;
+      ctx.strokeStyle = color(k); ctx.fillStyle = color(k); ctx.lineWidth = pts <= 45 ? 2 : 1.3;
+      ctx.beginPath();
+      var pen = false;
+      for (var i = i0; i < i1; i++) {
+        var v = s.values[i];
+        if (excluded[days[i]]) continue;
+        if (v === null) { pen = false; continue; }
+        if (pen) ctx.lineTo(px(days[i]), py(v)); else { ctx.moveTo(px(days[i]), py(v)); pen = true; }
+      }
+      ctx.stroke();
+      if (marker) {
+        for (var j = i0; j < i1; j++) {
+          var w = s.values[j];
+          if (w === null || excluded[days[j]]) continue;
+          ctx.beginPath(); ctx.arc(px(days[j]), py(w), marker, 0, 6.2832); ctx.fill();
+        }
+      }
+    });
+    ctx.restore();
+  }
+
+  // Điểm gần con trỏ nhất: tìm nhị phân theo ngày rồi chỉ xét 2 ngày lân cận của mỗi tỉnh
+  function nearest(mx, my) {
+    if (!n) return null;
+    var i = lowerBound(dayAt(mx)), cand = [i - 1, i], best = null;
+    series.forEach(function (s, k) {
+      if (hidden[k]) return;
+      cand.forEach(function (j) {
+        if (j < 0 || j >= n || excluded[days[j]] || s.values[j] === null) return;
+        var dx = px(days[j]) - mx, dy = py(s.values[j]) - my, dist = Math.sqrt(dx * dx + dy * dy);
+        if (dist <= RADIUS * 1.5 && (!best || dist < best.dist)) best = {k: k, j: j, dist: dist};
+      });
+    });
+    return best;
+  }
+
+  var frame = null, lastMove = null, drag = null, moved = false;
+  function onHover() {
+    frame = null;
+    var e = lastMove, rect = cv.getBoundingClientRect(), mx = e.clientX - rect.left, my = e.clientY - rect.top;
+    if (drag) {
+      var shift = (drag.x - mx) / (W - PAD.l - PAD.r) * (drag.view[1] - drag.view[0]);
+      if (Math.abs(drag.x - mx) > 3) moved = true;
+      view = [drag.view[0] + shift, drag.view[1] + shift]; draw(); tip.style.display = 'none'; return;
+    }
+    var hit = nearest(mx, my);
+    if (!hit) { tip.style.display = 'none'; return; }
+    var s = series[hit.k];
+    // Tên tỉnh/KPI lấy từ file dữ liệu → chỉ gán dạng text, không chèn HTML
+    tip.innerHTML = '<b></b><br><span></span><br><span></span>';
+    tip.children[0].textContent = s.name; tip.children[0].style.color = color(hit.k);
+    tip.children[2].textContent = fmt(days[hit.j]);
+    tip.children[4].textContent = DATA.kpi + ': ' + s.values[hit.j].toFixed(2);
+    tip.style.display = 'block';
+    tip.style.left = Math.min(mx + 12, W - tip.offsetWidth - 4) + 'px';
+    tip.style.top = Math.max(0, my - tip.offsetHeight - 8) + 'px';
+  }
+  cv.addEventListener('mousemove', function (e) {  // throttle: tối đa 1 lần mỗi khung hình
+    lastMove = e; if (!frame) frame = requestAnimationFrame(onHover);
+  });
+  cv.addEventListener('mouseleave', function () { tip.style.display = 'none'; drag = null; });
+  cv.addEventListener('mousedown', function (e) {
+    var rect = cv.getBoundingClientRect(); drag = {x: e.clientX - rect.left, view: view.slice()}; moved = false;
+  });
+  window.addEventListener('mouseup', function () { drag = null; });
+  cv.addEventListener('wheel', function (e) {
+    e.preventDefault();
+    var rect = cv.getBoundingClientRect(), at = dayAt(e.clientX - rect.left);
+    var k = e.deltaY > 0 ? 1.25 : 0.8, lo = at - (at - view[0]) * k, hi = at + (view[1] - at) * k;
+    if (hi - lo < 3) return;
+    view = [Math.max(full[0] - 30, lo), Math.min(full[1] + 30, hi)]; draw();
+  }, {passive: false});
+  cv.addEventListener('dblclick', function () { view = full.slice(); draw(); });
+  cv.addEventListener('click', function (e) {
+    if (moved) return;
+    var rect = cv.getBoundingClientRect(), hit = nearest(e.clientX - rect.left, e.clientY - rect.top);
+    if (!hit) return;
+    var d = days[hit.j];
+    if (excluded[d]) delete excluded[d]; else excluded[d] = true;
+    tip.style.display = 'none'; renderExcluded(); draw();
+  });
+
+  function renderExcluded() {
+    var box = document.getElementById('excl'), list = Object.keys(excluded).map(Number).sort(function (a, b) { return a - b; });
+    box.innerHTML = '';
+    if (!list.length) return;
+    box.appendChild(document.createTextNode('Đã loại ' + list.length + ' ngày: '));
+    var input = document.createElement('input'); input.readOnly = true;
+    input.value = list.map(fmt).join(', ');
+    input.addEventListener('focus', function () { input.select(); });
+    var reset = document.createElement('button'); reset.textContent = 'Bỏ loại tất cả';
+    reset.addEventListener('click', function () { excluded = {}; renderExcluded(); draw(); });
+    box.appendChild(input); box.appendChild(reset);
+  }
+
+  function renderLegend() {
+    var box = document.getElementById('legend');
+    series.forEach(function (s, k) {
+      var item = document.createElement('span');
+      item.innerHTML = '<i style="background:' + color(k) + '"></i>';
+      item.appendChild(document.createTextNode(s.name));
+      item.addEventListener('click', function () {
+        if (hidden[k]) delete hidden[k]; else hidden[k] = true;
+        item.className = hidden[k] ? 'off' : ''; draw();
+      });
+      box.appendChild(item);
+    });
+  }
+
+  renderLegend(); renderExcluded(); draw();
+  window.addEventListener('resize', draw);
+})();
+</script>
+</body></html>
+""".replace('__LEGEND__', str(LEGEND_HEIGHT))